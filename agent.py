@@ -0,0 +1,250 @@
+#!/usr/bin/env python
+"""
+EzTaskRunner worker agent runner script.
+
+A worker agent registers with a coordinator (the EzTaskRunner web server),
+advertises its capacity and labels, leases matching runs from the
+coordinator's run queue, executes them with run_script and streams output
+and results back. Several agents can run on one machine for local testing.
+"""
+import os
+import sys
+import json
+import time
+import socket
+import logging
+import argparse
+import threading
+import urllib.error
+import urllib.request
+from pathlib import Path
+
+# Agents only execute runs; set before the first import from the app package so
+# nothing in it starts a scheduler, loads tasks or replays the run queue
+os.environ['RUN_MODE'] = 'agent'
+
+from app.version import __version__
+
+def parse_args():
+    """Parse command line arguments."""
+    parser = argparse.ArgumentParser(description='Run an EzTaskRunner worker agent')
+    parser.add_argument('--coordinator', default='http://127.0.0.1:5000', help='Base URL of the EzTaskRunner server')
+    parser.add_argument('--name', default=socket.gethostname(), help='Agent name shown on the coordinator')
+    parser.add_argument('--labels', default='', help='Comma-separated labels this agent offers (e.g. powershell,bigmem)')
+    parser.add_argument('--capacity', type=int, default=1, help='Number of runs to execute concurrently')
+    parser.add_argument('--token', default=os.environ.get('AGENT_TOKEN'), help='Shared agent token (default: AGENT_TOKEN)')
+    parser.add_argument('--poll-interval', type=float, default=2.0, help='Seconds between lease requests when idle')
+    parser.add_argument('--version', action='store_true', help='Show version information and exit')
+    return parser.parse_args()
+
+class CoordinatorClient:
+    """Minimal JSON-over-HTTP client for the coordinator's agent API."""
+
+    def __init__(self, base_url, token=None, timeout=10):
+        self.base_url = base_url.rstrip('/')
+        self.token = token
+        self.timeout = timeout
+
+    def post(self, path, data=None):
+        """
+        POST a JSON document to the agent API.
+
+        Args:
+            path: Path below /api/agents
+            data: JSON-serializable request body
+
+        Returns:
+            Tuple of (HTTP status, decoded JSON response)
+        """
+        request = urllib.request.Request(
+            f"{self.base_url}/api/agents{path}",
+            data=json.dumps(data or {}).encode('utf-8'),
+            headers={'Content-Type': 'application/json'},
+            method='POST'
+        )
+        if self.token:
+            request.add_header('X-Agent-Token', self.token)
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                return response.status, json.loads(response.read() or b'{}')
+        except urllib.error.HTTPError as e:
+            try:
+                return e.code, json.loads(e.read() or b'{}')
+            except ValueError:
+                return e.code, {"error": str(e)}
+
+class OutputStreamer:
+    """Buffers a run's output lines and ships them to the coordinator periodically."""
+
+    def __init__(self, client, agent, run_id, flush_interval=1.0):
+        self.client = client
+        self.agent = agent
+        self.run_id = run_id
+        self.flush_interval = flush_interval
+        self.buffer = []
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._run, name=f"Output-{run_id[:8]}", daemon=True)
+
+    def write(self, line):
+        with self.lock:
+            self.buffer.append(line)
+
+    def flush(self):
+        with self.lock:
+            chunk, self.buffer = ''.join(self.buffer), []
+        if chunk:
+            self.client.post(f"/runs/{self.run_id}/output", {"agent_id": self.agent.agent_id, "output": chunk})
+
+    def _run(self):
+        while not self.stopped.wait(self.flush_interval):
+            try:
+                self.flush()
+            except Exception as e:
+                self.agent.logger.warning(f"Could not stream output for run {self.run_id}: {str(e)}")
+
+    def start(self):
+        self.thread.start()
+
+    def close(self):
+        self.stopped.set()
+        self.thread.join()
+        self.flush()
+
+class Agent:
+    """A worker agent leasing and executing runs from a coordinator."""
+
+    def __init__(self, client, name, labels, capacity, poll_interval):
+        self.client = client
+        self.name = name
+        self.labels = [label.strip() for label in labels.split(',') if label.strip()]
+        self.capacity = max(1, capacity)
+        self.poll_interval = poll_interval
+        self.agent_id = None
+        self.lease_seconds = 30
+        self.active_runs = set()
+        self.lock = threading.Lock()
+        self.logger = logging.getLogger("EzTaskRunner.Agent")
+
+    def register(self):
+        """Register with the coordinator, retrying until it is reachable."""
+        while True:
+            try:
+                status, reply = self.client.post('/register', {
+                    "name": self.name,
+                    "labels": self.labels,
+                    "capacity": self.capacity
+                })
+                if status == 200:
+                    self.agent_id = reply['agent_id']
+                    self.lease_seconds = reply.get('lease_seconds', self.lease_seconds)
+                    self.logger.info(f"Registered as {self.agent_id} with labels {self.labels}, capacity {self.capacity}")
+                    return
+                self.logger.error(f"Registration rejected ({status}): {reply.get('error')}")
+            except Exception as e:
+                self.logger.warning(f"Coordinator not reachable: {str(e)}")
+            time.sleep(self.poll_interval)
+
+    def heartbeat_loop(self):
+        """Renew the leases on active runs well before they expire."""
+        while True:
+            time.sleep(max(1.0, self.lease_seconds / 3))
+            with self.lock:
+                run_ids = list(self.active_runs)
+            try:
+                status, reply = self.client.post(f"/{self.agent_id}/heartbeat", {"run_ids": run_ids})
+                if status == 404:
+                    self.logger.warning("Coordinator no longer knows this agent, registering again")
+                    self.register()
+                elif reply.get('lost'):
+                    self.logger.warning(f"Leases lost for runs {reply['lost']}; their results will be discarded")
+            except Exception as e:
+                self.logger.warning(f"Heartbeat failed: {str(e)}")
+
+    def execute(self, run):
+        """Execute one leased run and report the result."""
+        from app.utils import run_script
+
+        run_id = run['run_id']
+        payload = run['payload']
+        script_path = payload.get('script_path')
+        dequeued_at = time.time()
+
+        # Prefer the agent's own copy of the script when the relative path exists here
+        scripts_dir = Path(os.environ.get('SCRIPTS_DIR', 'scripts')).resolve()
+        if payload.get('script_relpath') and (scripts_dir / payload['script_relpath']).exists():
+            script_path = str(scripts_dir / payload['script_relpath'])
+
+        self.logger.info(f"Executing run {run_id} for task {run['job_id']}: {script_path}")
+        streamer = OutputStreamer(self.client, self, run_id)
+        streamer.start()
+        try:
+            result = run_script(
+                script_path,
+                job_id=run['job_id'],
+                max_runtime_minutes=payload.get('max_runtime', 60),
+                on_output=streamer.write
+            )
+        finally:
+            streamer.close()
+        result.setdefault('timeline', {})['dequeued_at'] = dequeued_at
+
+        try:
+            status, reply = self.client.post(f"/runs/{run_id}/complete", {"agent_id": self.agent_id, "result": result})
+            if status != 200:
+                self.logger.warning(f"Result for run {run_id} rejected ({status}): {reply.get('error')}")
+        except Exception as e:
+            self.logger.error(f"Could not report result for run {run_id}: {str(e)}")
+        finally:
+            with self.lock:
+                self.active_runs.discard(run_id)
+
+    def run_forever(self):
+        """Lease and execute runs until interrupted."""
+        self.register()
+        threading.Thread(target=self.heartbeat_loop, name="Heartbeat", daemon=True).start()
+
+        while True:
+            with self.lock:
+                free = self.capacity - len(self.active_runs)
+            runs = []
+            if free > 0:
+                try:
+                    status, reply = self.client.post(f"/{self.agent_id}/lease", {"max_runs": free})
+                    if status == 404:
+                        self.register()
+                    runs = reply.get('runs', [])
+                except Exception as e:
+                    self.logger.warning(f"Lease request failed: {str(e)}")
+
+            for run in runs:
+                with self.lock:
+                    self.active_runs.add(run['run_id'])
+                threading.Thread(target=self.execute, args=(run,), name=f"Run-{run['run_id'][:8]}", daemon=True).start()
+
+            if not runs:
+                time.sleep(self.poll_interval)
+
+if __name__ == '__main__':
+    # Parse command line arguments
+    args = parse_args()
+
+    # Show version information if requested
+    if args.version:
+        print(f"EzTaskRunner agent v{__version__}")
+        sys.exit(0)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    print(f"EzTaskRunner agent v{__version__} '{args.name}' connecting to {args.coordinator}")
+
+    agent = Agent(
+        CoordinatorClient(args.coordinator, token=args.token),
+        args.name,
+        args.labels,
+        args.capacity,
+        args.poll_interval
+    )
+    try:
+        agent.run_forever()
+    except KeyboardInterrupt:
+        print("Agent stopped")
@@ -2,21 +2,62 @@
 EzTaskRunner - A simple task scheduling application.
 
 This package contains all application modules and serves as the application entry point.
+The application instance is created on first access of ``app.app`` rather than at import
+time, so processes that only use helpers from the package (the remote agent, ``app.version``)
+do not start a scheduler, load tasks or create the data directories.
 """
 import logging
+import threading
 from app.core import create_app
 
-# Create and configure the application instance
-app = create_app()
-
 # Set up logger
 logger = logging.getLogger("EzTaskRunner")
-logger.info("EzTaskRunner application initialized")
 
-# Initialize tasks
-with app.app_context():
-    # Import here to avoid circular imports
-    from app.task_manager import load_tasks_from_disk
-    
-    # Load tasks from disk (cleanup_running_tasks is called within this function)
-    load_tasks_from_disk()
\ No newline at end of file
+_app = None
+_app_lock = threading.RLock()
+_creating = False
+
+def _build_app():
+    """Create and configure the application instance and start its background services."""
+    global _app, _creating
+    _creating = True
+    try:
+        application = create_app()
+    finally:
+        _creating = False
+    _app = application
+    logger.info("EzTaskRunner application initialized")
+
+    # Initialize tasks (web processes read tasks from disk on demand instead)
+    if application.config['RUN_MODE'] in ('standalone', 'worker'):
+        with application.app_context():
+            # Import here to avoid circular imports
+            from app.task_manager import load_tasks_from_disk
+            
+            # Load tasks from disk (cleanup_running_tasks is called within this function)
+            load_tasks_from_disk()
+            
+            # Apply the history retention policy in the background
+            from app.history_retention import start_retention_worker
+            start_retention_worker(application)
+            
+            # Compress history and run logs stored uncompressed by earlier versions
+            from app.utils.compression import start_recompression
+            start_recompression(application)
+            
+            # Index run output and the logs for search as they are written
+            from app.search_index import start_search_indexer
+            start_search_indexer(application)
+    return application
+
+def __getattr__(name):
+    """Create the application on the first ``from app import app``."""
+    if name != 'app':
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    with _app_lock:
+        if _app is None:
+            if _creating:
+                # Same as importing from a partially initialized module before
+                raise ImportError("cannot import name 'app' while the application is being created")
+            _build_app()
+        return _app
@@ -0,0 +1,161 @@
+"""
+Circuit breaker for EzTaskRunner.
+
+Pauses tasks that keep failing. A task's circuit opens after a number of
+consecutive failures, or when its error rate within a window crosses a
+threshold. While the circuit is open, scheduled fires are skipped without
+running anything. Once the cool-down has passed, the next fire runs as a
+half-open probe: a success closes the circuit again and a failure re-opens it.
+
+The breaker state is stored on the task under the 'circuit' key so it is
+persisted with the task and shown on the dashboard. Outcomes in the window
+are kept as success/failure counts per time bucket, so the stored state
+stays small however often the task runs.
+"""
+import time
+from typing import Dict, Any, Optional, Tuple
+
+# Circuit states
+CIRCUIT_CLOSED = "closed"
+CIRCUIT_OPEN = "open"
+CIRCUIT_HALF_OPEN = "half_open"
+
+# Defaults for the per-task thresholds
+DEFAULT_FAILURE_THRESHOLD = 5
+DEFAULT_ERROR_RATE = 50
+DEFAULT_MIN_RUNS = 10
+DEFAULT_WINDOW_MINUTES = 60
+DEFAULT_COOLDOWN_MINUTES = 15
+
+# Outcomes are counted per minute, or per 1/MAX_OUTCOME_BUCKETS of longer windows
+OUTCOME_BUCKET_SECONDS = 60
+MAX_OUTCOME_BUCKETS = 60
+
+def get_circuit(task: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Get a task's circuit breaker state, creating a closed circuit if needed.
+
+    Args:
+        task: The task dictionary
+
+    Returns:
+        dict: The circuit state stored on the task
+    """
+    return task.setdefault("circuit", {
+        "state": CIRCUIT_CLOSED,
+        "consecutive_failures": 0,
+        "outcomes": []
+    })
+
+def check_circuit(task: Dict[str, Any], now: Optional[float] = None) -> Tuple[bool, Optional[str]]:
+    """
+    Decide whether a scheduled fire of a task may run.
+
+    Moves an open circuit to half-open once its cool-down has passed, in
+    which case the fire is let through as the probe run.
+
+    Args:
+        task: The task dictionary (its circuit state may be updated)
+        now: Optional current epoch time
+
+    Returns:
+        Tuple of (allowed, reason the fire is skipped)
+    """
+    if not task.get("circuit_breaker_enabled", False):
+        return True, None
+
+    circuit = task.get("circuit")
+    if not circuit or circuit.get("state") == CIRCUIT_CLOSED:
+        return True, None
+
+    now = now or time.time()
+    cooldown = task.get("circuit_cooldown_minutes", DEFAULT_COOLDOWN_MINUTES) * 60
+
+    if circuit["state"] == CIRCUIT_OPEN:
+        if now < circuit.get("opened_at", 0) + cooldown:
+            return False, f"Circuit breaker open: {circuit.get('reason', 'too many failures')}"
+        circuit["state"] = CIRCUIT_HALF_OPEN
+        circuit["probe_started_at"] = now
+        return True, None
+
+    if circuit["state"] == CIRCUIT_HALF_OPEN:
+        # Only one probe at a time; allow a new one if the last never reported back
+        if now < circuit.get("probe_started_at", 0) + cooldown:
+            return False, "Circuit breaker half-open: waiting for the probe run"
+        circuit["probe_started_at"] = now
+        return True, None
+
+    return True, None
+
+def record_outcome(task: Dict[str, Any], success: bool, now: Optional[float] = None) -> Optional[str]:
+    """
+    Record a run outcome and open or close the task's circuit accordingly.
+
+    Args:
+        task: The task dictionary (its circuit state is updated)
+        success: Whether the run succeeded
+        now: Optional current epoch time
+
+    Returns:
+        The new circuit state if it changed, otherwise None
+    """
+    if not task.get("circuit_breaker_enabled", False):
+        return None
+
+    now = now or time.time()
+    circuit = get_circuit(task)
+    previous_state = circuit["state"]
+
+    # Keep only the outcome buckets inside the error-rate window
+    window = task.get("circuit_window_minutes", DEFAULT_WINDOW_MINUTES) * 60
+    bucket_seconds = max(OUTCOME_BUCKET_SECONDS, window // MAX_OUTCOME_BUCKETS)
+    bucket_start = int(now // bucket_seconds * bucket_seconds)
+    buckets = [b for b in _outcome_buckets(circuit) if b[0] >= now - window]
+    if not buckets or buckets[-1][0] < bucket_start:
+        buckets.append([bucket_start, 0, 0])
+    buckets[-1][1 if success else 2] += 1
+    circuit["outcomes"] = buckets
+    circuit["consecutive_failures"] = 0 if success else circuit.get("consecutive_failures", 0) + 1
+
+    if success:
+        if previous_state != CIRCUIT_CLOSED:
+            circuit.update({"state": CIRCUIT_CLOSED, "closed_at": now, "reason": None})
+            circuit.pop("probe_started_at", None)
+    elif previous_state == CIRCUIT_HALF_OPEN:
+        _open(circuit, now, "probe run failed")
+    elif previous_state == CIRCUIT_CLOSED:
+        threshold = task.get("circuit_failure_threshold", DEFAULT_FAILURE_THRESHOLD)
+        error_rate = task.get("circuit_error_rate", DEFAULT_ERROR_RATE)
+        min_runs = task.get("circuit_min_runs", DEFAULT_MIN_RUNS)
+        runs = sum(b[1] + b[2] for b in buckets)
+        failures = sum(b[2] for b in buckets)
+
+        if threshold and circuit["consecutive_failures"] >= threshold:
+            _open(circuit, now, f"{circuit['consecutive_failures']} consecutive failures")
+        elif error_rate and runs >= min_runs and failures * 100 >= error_rate * runs:
+            _open(circuit, now, f"{failures} of the last {runs} runs failed")
+
+    return circuit["state"] if circuit["state"] != previous_state else None
+
+def reset_circuit(task: Dict[str, Any]) -> None:
+    """
+    Close a task's circuit and forget its recorded outcomes.
+
+    Args:
+        task: The task dictionary
+    """
+    task["circuit"] = {
+        "state": CIRCUIT_CLOSED,
+        "consecutive_failures": 0,
+        "outcomes": []
+    }
+
+def _outcome_buckets(circuit: Dict[str, Any]) -> list:
+    """Get a circuit's [start, successes, failures] buckets, converting [time, success] pairs."""
+    return [list(o) if len(o) == 3 else [o[0], int(bool(o[1])), int(not o[1])]
+            for o in circuit.get("outcomes", [])]
+
+def _open(circuit: Dict[str, Any], now: float, reason: str) -> None:
+    """Open a circuit."""
+    circuit.update({"state": CIRCUIT_OPEN, "opened_at": now, "reason": reason})
+    circuit.pop("probe_started_at", None)
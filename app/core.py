@@ -9,20 +9,28 @@ from flask import Flask, render_template, flash, g, redirect, url_for
 from datetime import datetime
 
 from app.scheduler import init_scheduler
+from app.run_queue import init_run_queue
+from app.log_pipeline import parse_log_levels, parse_rate_limits, start_logging_pipeline
 from app.version import __version__
 
+# Secret key used when SECRET_KEY is not set; only fit for a single-process development setup
+DEFAULT_SECRET_KEY = 'dev-key-for-development-only'
+
 def create_app(config=None):
     """Create and configure the Flask application."""
     app = Flask(__name__)
     
     # Configure the application
     app.config.from_mapping(
-        SECRET_KEY=os.environ.get('SECRET_KEY', 'dev-key-for-development-only'),
+        SECRET_KEY=os.environ.get('SECRET_KEY') or DEFAULT_SECRET_KEY,
         # Use raw strings for path defaults to avoid Unicode escape issues on Windows
         SCRIPTS_DIR=Path(os.environ.get('SCRIPTS_DIR', r'scripts')).resolve(),
         LOG_DIR=Path(os.environ.get('LOG_DIR', r'logs')).resolve(),
         TASK_HISTORY_DIR=Path(os.environ.get('TASK_HISTORY_DIR', r'task_history')).resolve(),
         TASKS_DIR=Path(os.environ.get('TASKS_DIR', r'tasks')).resolve(),
+        STATE_DIR=Path(os.environ.get('STATE_DIR', r'state')).resolve(),
+        RUNS_DIR=Path(os.environ.get('RUNS_DIR', os.path.join(os.environ.get('STATE_DIR', r'state'), 'runs'))).resolve(),
+        EXPORT_DIR=Path(os.environ.get('EXPORT_DIR', os.path.join(os.environ.get('STATE_DIR', r'state'), 'exports'))).resolve(),  # Columnar history exports
         
         # Email notification settings
         EMAIL_NOTIFICATIONS_ENABLED=os.environ.get('EMAIL_NOTIFICATIONS_ENABLED', 'False').lower() == 'true',
@@ -32,26 +40,100 @@ def create_app(config=None):
         EMAIL_SMTP_PASS=os.environ.get('EMAIL_SMTP_PASS', '0e03c13c3eba5c'),
         EMAIL_SENDER=os.environ.get('EMAIL_SENDER', 'EzTaskRunner <eztaskrunner@example.com>'),
         EMAIL_RECIPIENTS=os.environ.get('EMAIL_RECIPIENTS', 'admin@example.com').split(','),
+        EMAIL_SMTP_STARTTLS=os.environ.get('EMAIL_SMTP_STARTTLS', 'True').lower() == 'true',
+        EMAIL_DIGEST_SECONDS=int(os.environ.get('EMAIL_DIGEST_SECONDS', 30)),  # Failures within this window share one email
+        EMAIL_RATE_LIMIT_PER_HOUR=int(os.environ.get('EMAIL_RATE_LIMIT_PER_HOUR', 10)),  # Emails per recipient, 0 = unlimited
+        EMAIL_SMTP_IDLE_SECONDS=int(os.environ.get('EMAIL_SMTP_IDLE_SECONDS', 60)),  # Close the reused connection after this
         SERVER_NAME=os.environ.get('SERVER_NAME', None),  # Needed for url_for with _external=True
         
+        # Process layout: 'standalone' runs the web UI, scheduler and executors in one
+        # process; 'web' serves only the UI and forwards work to a separate 'worker'
+        RUN_MODE=os.environ.get('RUN_MODE', 'standalone').lower(),
+        WORKER_HOST=os.environ.get('WORKER_HOST', '127.0.0.1'),
+        WORKER_PORT=int(os.environ.get('WORKER_PORT', 5055)),
+        
+        # Remote worker agents: shared token sent in the X-Agent-Token header (optional)
+        # and seconds an agent may go without a heartbeat before its runs are re-queued
+        AGENT_TOKEN=os.environ.get('AGENT_TOKEN') or None,
+        AGENT_LEASE_SECONDS=int(os.environ.get('AGENT_LEASE_SECONDS', 30)),
+        
+        # JSON API (/api/v1): token required in the X-API-Token header (optional)
+        API_TOKEN=os.environ.get('API_TOKEN') or None,
+        
+        # Auto-retry: random spread applied to backoff delays, and the number of
+        # retries allowed per task and in total within the budget window
+        RETRY_JITTER=float(os.environ.get('RETRY_JITTER', 0.2)),
+        RETRY_BUDGET_PER_TASK=int(os.environ.get('RETRY_BUDGET_PER_TASK', 10)),
+        RETRY_BUDGET_GLOBAL=int(os.environ.get('RETRY_BUDGET_GLOBAL', 50)),
+        RETRY_BUDGET_WINDOW_MINUTES=int(os.environ.get('RETRY_BUDGET_WINDOW_MINUTES', 60)),
+        
+        # History retention: full history records are kept this many days (0 = forever),
+        # then folded into daily rollups kept this many days (0 = no rollups); tasks can
+        # override both. The retention worker runs every interval in slices of at most
+        # the slice time, so it never holds up the server for long. Retention deletes
+        # history and run files, so it is off until enabled
+        HISTORY_RETENTION_ENABLED=os.environ.get('HISTORY_RETENTION_ENABLED', 'False').lower() == 'true',
+        HISTORY_RETENTION_DAYS=int(os.environ.get('HISTORY_RETENTION_DAYS', 14)),
+        HISTORY_ROLLUP_DAYS=int(os.environ.get('HISTORY_ROLLUP_DAYS', 365)),
+        HISTORY_RETENTION_INTERVAL_MINUTES=int(os.environ.get('HISTORY_RETENTION_INTERVAL_MINUTES', 60)),
+        HISTORY_RETENTION_SLICE_SECONDS=float(os.environ.get('HISTORY_RETENTION_SLICE_SECONDS', 0.2)),
+        
+        # Compression of task history and collected run logs: 'auto' uses zstd when the
+        # 'zstandard' package is installed and gzip otherwise; 'none' stores plain files
+        STORAGE_COMPRESSION=os.environ.get('STORAGE_COMPRESSION', 'auto').lower(),
+        
+        # Full-text search over run output and the application logs; the indexed text is
+        # capped at this many megabytes, dropping the oldest documents first
+        SEARCH_INDEX_ENABLED=os.environ.get('SEARCH_INDEX_ENABLED', 'True').lower() == 'true',
+        SEARCH_INDEX_MAX_MB=int(os.environ.get('SEARCH_INDEX_MAX_MB', 100)),
+        
+        # Seconds between the system metric samples published to the status feed (0 = none)
+        EVENT_METRICS_SECONDS=float(os.environ.get('EVENT_METRICS_SECONDS', 5)),
+        
         # Logging settings
         LOG_LEVEL=os.environ.get('LOG_LEVEL', 'INFO'),  # Can be DEBUG, INFO, WARNING, ERROR, CRITICAL
+        # Per-logger levels overriding LOG_LEVEL, e.g. 'EzTaskRunner.Tasks=DEBUG,werkzeug=INFO'
+        LOG_LEVELS=parse_log_levels(os.environ.get('LOG_LEVELS', '')),
+        # Log files rotate at this size (0 = no size rotation), or at LOG_ROTATE_WHEN
+        # ('midnight', 'H', 'D', ... as accepted by TimedRotatingFileHandler) when set
+        LOG_MAX_MB=float(os.environ.get('LOG_MAX_MB', 50)),
+        LOG_ROTATE_WHEN=os.environ.get('LOG_ROTATE_WHEN', ''),
+        LOG_BACKUP_COUNT=int(os.environ.get('LOG_BACKUP_COUNT', 10)),
+        LOG_COMPRESS_ROTATED=os.environ.get('LOG_COMPRESS_ROTATED', 'True').lower() == 'true',
+        # Limits for repetitive records, per logging call site: 'EzTaskRunner=20/60'
+        # keeps 20 records every 60 seconds, 'EzTaskRunner.Tools=10%' one in ten
+        LOG_RATE_LIMITS=parse_rate_limits(os.environ.get('LOG_RATE_LIMITS', '')),
+        # 'text' or 'json' (one JSON object per line, with run_id and job_id fields)
+        LOG_FORMAT=os.environ.get('LOG_FORMAT', 'text').lower(),
         
         # Version information
         VERSION=__version__
     )
     
+    # Web processes and the worker authenticate each other with the secret key, so
+    # anyone knowing it could send the worker commands; refuse the public default
+    if app.config['RUN_MODE'] in ('web', 'worker') and app.config['SECRET_KEY'] == DEFAULT_SECRET_KEY:
+        raise RuntimeError(f"SECRET_KEY must be set to a private value in RUN_MODE={app.config['RUN_MODE']}")
+    
     # Ensure required directories exist
     os.makedirs(app.config['SCRIPTS_DIR'], exist_ok=True)
     os.makedirs(app.config['LOG_DIR'], exist_ok=True)
     os.makedirs(app.config['TASK_HISTORY_DIR'], exist_ok=True)
     os.makedirs(app.config['TASKS_DIR'], exist_ok=True)
+    os.makedirs(app.config['STATE_DIR'], exist_ok=True)
+    os.makedirs(app.config['RUNS_DIR'], exist_ok=True)
+    os.makedirs(app.config['EXPORT_DIR'], exist_ok=True)
     
     # Configure logging
     setup_logging(app)
     
-    # Initialize scheduler
-    scheduler = init_scheduler(app)
+    # Initialize the durable run queue shared by all processes
+    init_run_queue(app)
+    
+    # Initialize scheduler (web processes leave scheduling to the worker,
+    # remote agents only execute runs leased from the coordinator)
+    if app.config['RUN_MODE'] in ('standalone', 'worker'):
+        init_scheduler(app)
     
     # Register blueprints
     register_blueprints(app)
@@ -89,72 +171,17 @@ def create_app(config=None):
 
 def setup_logging(app):
     """Set up logging for the application."""
-    log_dir = app.config['LOG_DIR']
-    
     # Get the configured log level from app config
     log_level_name = app.config.get('LOG_LEVEL', 'INFO')
     
     # Convert string log level to logging constant
     log_level = getattr(logging, log_level_name.upper(), logging.INFO)
     
-    # Create specific log files
-    main_log_file = log_dir / 'eztaskrunner.log'
-    tools_log_file = log_dir / 'tools.log'
-    errors_log_file = log_dir / 'errors.log'
-    tasks_log_file = log_dir / 'tasks.log'
-    
-    # Set up formatting
-    standard_formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-    detailed_formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(pathname)s:%(lineno)d - %(message)s')
-    
-    # Configure root logger with main log file and console output
-    root_handler = logging.FileHandler(main_log_file)
-    root_handler.setFormatter(standard_formatter)
-    
-    console_handler = logging.StreamHandler()
-    console_handler.setFormatter(standard_formatter)
-    
-    # Create tools logger handler
-    tools_handler = logging.FileHandler(tools_log_file)
-    tools_handler.setFormatter(standard_formatter)
-    
-    # Create error logger handler with more detailed formatting
-    errors_handler = logging.FileHandler(errors_log_file)
-    errors_handler.setLevel(logging.ERROR)
-    errors_handler.setFormatter(detailed_formatter)
-    
-    # Create tasks logger handler
-    tasks_handler = logging.FileHandler(tasks_log_file)
-    tasks_handler.setFormatter(standard_formatter)
-    
-    # Set up root logger with main handlers
-    logging.basicConfig(
-        level=log_level,  # Use the configured log level
-        handlers=[root_handler, console_handler, errors_handler]
-    )
-    
-    # Create and configure application logger
-    app_logger = logging.getLogger('EzTaskRunner')
-    app_logger.setLevel(log_level)  # Use the configured log level
-    app_logger.addHandler(tools_handler)
-    
-    # Create and configure tasks logger
-    tasks_logger = logging.getLogger('EzTaskRunner.Tasks')
-    tasks_logger.setLevel(log_level)  # Use the configured log level
-    tasks_logger.addHandler(tasks_handler)
-    
-    # Create and configure tools logger
-    tools_logger = logging.getLogger('EzTaskRunner.Tools')
-    tools_logger.setLevel(log_level)  # Use the configured log level
-    tools_logger.propagate = False  # Don't propagate to root logger
-    tools_logger.addHandler(tools_handler)
+    # Records are queued by the logging thread and written by a background listener
+    start_logging_pipeline(app.config, log_level)
     
     # Log initial message
-    app_logger.info(f"Logging system initialized with log level {log_level_name} and separate logs for tools, errors, and tasks")
-    
-    # Reduce verbosity of some loggers
-    logging.getLogger('werkzeug').setLevel(logging.WARNING)
-    logging.getLogger('apscheduler').setLevel(logging.WARNING)
+    logging.getLogger('EzTaskRunner').info(f"Logging system initialized with log level {log_level_name} and separate logs for tools, errors, and tasks")
 
 def register_blueprints(app):
     """Register all application blueprints."""
@@ -170,11 +197,19 @@ def register_blueprints(app):
     # Import settings blueprint
     from app.routes.settings import settings_bp
     
+    # Import worker agents blueprint
+    from app.routes.agents import agents_bp
+    
+    # Import JSON API blueprint
+    from app.routes.api import api_bp
+    
     # Register blueprints
     app.register_blueprint(tasks_bp)
     app.register_blueprint(files_bp)
     app.register_blueprint(monitoring_bp)
     app.register_blueprint(settings_bp)
+    app.register_blueprint(agents_bp)
+    app.register_blueprint(api_bp)
     
     # Register additional routes
     @app.route('/')
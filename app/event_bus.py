@@ -0,0 +1,197 @@
+"""
+Event bus for EzTaskRunner.
+
+Publishes task state transitions (QUEUED, RUNNING, SUCCESS, FAILED,
+STOPPED, ...) and system metric samples to the status feed (/api/events),
+so pages are told about changes instead of polling for them.
+
+Events are numbered in the order they are published and the latest
+EVENT_BUFFER_SIZE are kept. A client subscribes with the ID of the last event
+it has seen and receives only the events after it; a client that has missed
+events dropped from the buffer, or that saw the events of an earlier process,
+gets a reset and should reload its state.
+
+Events are published in the process that executes the runs: the worker, in
+split mode, where web processes fetch them from the worker.
+"""
+import collections
+import logging
+import threading
+import time
+import uuid
+from typing import Dict, Any, Optional, Tuple
+
+from flask import current_app
+
+from app.run_context import get_run_id
+
+logger = logging.getLogger("EzTaskRunner")
+
+# Events kept for subscribers that fall behind
+EVENT_BUFFER_SIZE = 1000
+
+# Metric samples are only taken while a subscriber was seen within this many seconds
+SUBSCRIBER_IDLE_SECONDS = 60
+
+def _parse_event_id(event_id: Optional[str]) -> Tuple[Optional[str], int]:
+    """Split an event ID ('<bus id>:<sequence number>') into its parts."""
+    bus_id, _, seq = (event_id or '').rpartition(':')
+    try:
+        return bus_id or None, int(seq)
+    except ValueError:
+        return None, 0
+
+class EventBus:
+    """Numbered, bounded buffer of events that subscribers can wait on."""
+
+    def __init__(self, size: int = EVENT_BUFFER_SIZE):
+        # Identifies this process's sequence of events
+        self.bus_id = uuid.uuid4().hex[:12]
+        self._events = collections.deque(maxlen=size)
+        self._seq = 0
+        self._condition = threading.Condition()
+        self._task_status: Dict[str, Optional[str]] = {}
+        self._last_subscriber = 0.0
+        self._sampler = None
+
+    def publish(self, event_type: str, data: Dict[str, Any]) -> str:
+        """
+        Publish an event to all subscribers.
+
+        Args:
+            event_type: The event type ('task', 'task_deleted' or 'metrics')
+            data: The event data
+
+        Returns:
+            The event ID
+        """
+        with self._condition:
+            self._seq += 1
+            event = {'id': f"{self.bus_id}:{self._seq}", 'seq': self._seq, 'type': event_type,
+                     'time': time.time(), **data}
+            self._events.append(event)
+            self._condition.notify_all()
+        return event['id']
+
+    def publish_task_status(self, job_id: str, task: Dict[str, Any]) -> Optional[str]:
+        """
+        Publish a task's status if it changed since it was last published.
+
+        Args:
+            job_id: The job ID
+            task: The task data dictionary as saved
+
+        Returns:
+            The event ID, or None if the status did not change
+        """
+        status = task.get('status')
+        with self._condition:
+            previous = self._task_status.get(job_id)
+            if previous == status and job_id in self._task_status:
+                return None
+            self._task_status[job_id] = status
+        return self.publish('task', {
+            'job_id': job_id,
+            'task_name': task.get('task_name'),
+            'script_path': task.get('script_path'),
+            'status': status,
+            'previous_status': previous,
+            'last_run': task.get('last_run'),
+            'run_id': get_run_id()
+        })
+
+    def forget_task(self, job_id: str) -> str:
+        """Publish the deletion of a task."""
+        with self._condition:
+            self._task_status.pop(job_id, None)
+        return self.publish('task_deleted', {'job_id': job_id})
+
+    def events_since(self, event_id: Optional[str], timeout: float = 0) -> Dict[str, Any]:
+        """
+        Get the events published after an event, waiting for one if there are none yet.
+
+        Args:
+            event_id: The ID of the last event the subscriber has seen; None
+                for only the events published from now on
+            timeout: Seconds to wait for an event
+
+        Returns:
+            dict: 'events', 'last_event_id' (to pass next time) and 'reset',
+            True if events were missed and the subscriber should reload its state
+        """
+        bus_id, since = _parse_event_id(event_id)
+        with self._condition:
+            self._last_subscriber = time.time()
+            reset = False
+            if event_id is None:
+                since = self._seq
+            elif bus_id != self.bus_id or since > self._seq:
+                # Events of an earlier process (e.g. before a worker restart)
+                reset, since = True, self._seq
+            elif self._events and since < self._events[0]['seq'] - 1:
+                # Missed events have been dropped from the buffer
+                reset, since = True, self._seq
+
+            if not reset and timeout > 0:
+                self._condition.wait_for(lambda: self._seq > since, timeout)
+
+            events = [event for event in self._events if event['seq'] > since]
+            return {
+                'events': events,
+                'last_event_id': f"{self.bus_id}:{self._seq}",
+                'reset': reset
+            }
+
+    def start_metrics_sampler(self, interval: float) -> None:
+        """
+        Publish a system metrics sample every interval while there are subscribers.
+
+        Args:
+            interval: Seconds between samples (0 = no samples)
+        """
+        if interval <= 0:
+            return
+        with self._condition:
+            if self._sampler:
+                return
+            self._sampler = threading.Thread(target=self._sample_metrics, args=(interval,),
+                                             name="EventMetricsSampler", daemon=True)
+        self._sampler.start()
+
+    def _sample_metrics(self, interval: float) -> None:
+        from app.utils import get_system_metrics
+
+        while True:
+            time.sleep(interval)
+            if time.time() - self._last_subscriber > SUBSCRIBER_IDLE_SECONDS:
+                continue
+            try:
+                # CPU usage since the previous sample, without blocking
+                metrics = get_system_metrics(cpu_interval=None)
+                if 'error' not in metrics:
+                    self.publish('metrics', metrics)
+            except Exception as e:
+                logger.error(f"Error sampling system metrics: {str(e)}")
+
+# Event bus of this process
+event_bus = EventBus()
+
+def get_events(event_id: Optional[str], timeout: float = 0) -> Dict[str, Any]:
+    """
+    Get the events published after an event, from the worker in web mode.
+
+    Args:
+        event_id: The ID of the last event the subscriber has seen, or None
+        timeout: Seconds to wait for an event
+
+    Returns:
+        dict: 'success', and 'events', 'last_event_id' and 'reset' as returned
+        by EventBus.events_since, or 'error'
+    """
+    if current_app.config.get('RUN_MODE') == 'web':
+        from app.worker import notify_worker, WORKER_TIMEOUT
+        # Leave the worker time to answer before the command times out
+        return notify_worker('events', event_id=event_id, timeout=min(timeout, WORKER_TIMEOUT - 1))
+
+    event_bus.start_metrics_sampler(current_app.config.get('EVENT_METRICS_SECONDS', 5))
+    return {"success": True, **event_bus.events_since(event_id, timeout)}
@@ -0,0 +1,384 @@
+"""
+Columnar history export and analytics for EzTaskRunner.
+
+Converts the per-run JSON files in the task history into column files that
+analytics tools can read directly:
+
+- Parquet, when pyarrow is installed
+- compressed NumPy column arrays (.npz), when numpy is installed
+- gzip-compressed JSON columns otherwise
+
+History files are streamed in batches of EXPORT_BATCH_ROWS runs, each batch
+written as one part file of the export. Exports are incremental: the export
+state remembers the modification time of the newest history file exported,
+and the next export only converts newer files, adding new parts.
+
+The analytics functions aggregate the exported columns (duration percentiles
+by task and by hour of day, failure heatmaps by weekday and hour), using
+vectorized NumPy operations when numpy is installed.
+"""
+import gzip
+import json
+import logging
+import math
+import os
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Any, List, Optional
+
+from app.utils.compression import load_json_file, strip_compression_suffix
+from app.utils.run_timeline import compute_phases, percentile
+
+logger = logging.getLogger("EzTaskRunner")
+
+# Columns of the export: (name, type); missing numbers are exported as NaN
+COLUMNS = [
+    ("job_id", "str"),
+    ("run_id", "str"),
+    ("timestamp", "float"),        # Run start, epoch seconds
+    ("weekday", "int"),            # 0 = Monday
+    ("hour", "int"),
+    ("status", "str"),             # success, failed or skipped
+    ("success", "int"),
+    ("attempt", "int"),
+    ("execution_time", "float"),
+    ("queue_wait", "float"),
+    ("peak_rss_mb", "float"),
+    ("cpu_percent", "float"),      # System CPU at the end of the resource-check buffer
+    ("memory_percent", "float")
+]
+
+# Runs per part file
+EXPORT_BATCH_ROWS = 50000
+
+# History files modified more recently than this are left for the next export,
+# so a file that is still being written is never exported half-written
+SETTLE_SECONDS = 2
+
+# Percentiles of the analytics
+ANALYTICS_PERCENTILES = (50, 95, 99)
+
+STATE_FILE = "export_state.json"
+
+# One export at a time per process
+_export_lock = threading.Lock()
+
+def get_export_format() -> str:
+    """
+    Get the column file format available in this environment.
+
+    Returns:
+        str: 'parquet', 'npz' or 'json.gz'
+    """
+    try:
+        import pyarrow  # noqa: F401
+        return "parquet"
+    except ImportError:
+        pass
+    try:
+        import numpy  # noqa: F401
+        return "npz"
+    except ImportError:
+        return "json.gz"
+
+def history_row(job_id: str, entry: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Convert a history entry into an export row.
+
+    Args:
+        job_id: The job ID (from the history file name)
+        entry: The history entry
+
+    Returns:
+        dict: The row, keyed by column name
+    """
+    from app.utils.constants import STATUS_SKIPPED
+
+    try:
+        started = datetime.fromisoformat(entry.get("timestamp", ""))
+    except (TypeError, ValueError):
+        started = None
+    resource_check = entry.get("buffer_resource_check") or {}
+
+    def number(value):
+        return float(value) if isinstance(value, (int, float)) else math.nan
+
+    if entry.get("status") == STATUS_SKIPPED:
+        status = "skipped"
+    else:
+        status = "success" if entry.get("success") else "failed"
+
+    return {
+        "job_id": job_id,
+        "run_id": entry.get("run_id") or "",
+        "timestamp": started.timestamp() if started else math.nan,
+        "weekday": started.weekday() if started else -1,
+        "hour": started.hour if started else -1,
+        "status": status,
+        "success": int(status == "success"),
+        "attempt": int(entry.get("attempt") or 1),
+        "execution_time": number(entry.get("execution_time")),
+        "queue_wait": number(compute_phases(entry.get("timeline")).get("queue")),
+        "peak_rss_mb": number(entry.get("peak_rss_mb")),
+        "cpu_percent": number(resource_check.get("cpu_percent")),
+        "memory_percent": number(resource_check.get("memory_percent"))
+    }
+
+def _write_part(columns: Dict[str, list], path_base: Path, export_format: str) -> Path:
+    """Write one part file of column values and return its path."""
+    if export_format == "parquet":
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        types = {"str": pa.string(), "float": pa.float64(), "int": pa.int64()}
+        schema = pa.schema([(name, types[kind]) for name, kind in COLUMNS])
+        path = path_base.with_suffix(".parquet")
+        pq.write_table(pa.Table.from_pydict(columns, schema=schema), path, compression="zstd")
+    elif export_format == "npz":
+        import numpy as np
+        types = {"str": str, "float": np.float64, "int": np.int64}
+        path = path_base.with_suffix(".npz")
+        np.savez_compressed(path, **{name: np.asarray(columns[name], dtype=types[kind]) for name, kind in COLUMNS})
+    else:
+        path = path_base.with_suffix(".json.gz")
+        with gzip.open(path, "wt", encoding="utf-8") as f:
+            # JSON has no NaN; missing numbers are written as null
+            json.dump({name: [None if isinstance(v, float) and math.isnan(v) else v for v in values]
+                       for name, values in columns.items()}, f)
+    return path
+
+def _read_export_state(export_dir: Path) -> Dict[str, Any]:
+    try:
+        with open(export_dir / STATE_FILE, "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {"last_mtime_ns": 0, "rows": 0, "parts": []}
+
+def export_history(history_dir, export_dir, batch_rows: int = EXPORT_BATCH_ROWS) -> Dict[str, Any]:
+    """
+    Export the history files added since the last export.
+
+    Args:
+        history_dir: The task history directory
+        export_dir: Directory of the export's part files and state
+        batch_rows: Runs per part file
+
+    Returns:
+        dict: 'success', 'format', 'rows_exported', 'new_parts', 'total_rows'
+        and 'parts', or 'error' if the export failed
+    """
+    export_dir = Path(export_dir)
+    with _export_lock:
+        try:
+            os.makedirs(export_dir, exist_ok=True)
+            state = _read_export_state(export_dir)
+            export_format = get_export_format()
+            watermark = state.get("last_mtime_ns", 0)
+            settled_before = time.time_ns() - SETTLE_SECONDS * 1_000_000_000
+
+            # Oldest first, so the watermark only moves past exported files
+            pending = []
+            with os.scandir(history_dir) as entries:
+                for entry in entries:
+                    if not strip_compression_suffix(entry.name).endswith(".json") or "_" not in entry.name:
+                        continue
+                    mtime_ns = entry.stat().st_mtime_ns
+                    if watermark < mtime_ns <= settled_before:
+                        pending.append((mtime_ns, entry.path, entry.name))
+            pending.sort()
+
+            new_parts = []
+            rows_exported = 0
+            for start in range(0, len(pending), batch_rows):
+                batch = pending[start:start + batch_rows]
+                columns = {name: [] for name, _ in COLUMNS}
+                for _, path, name in batch:
+                    try:
+                        entry = load_json_file(path)
+                    except (OSError, ValueError) as e:
+                        logger.warning(f"Skipping unreadable history file {name}: {str(e)}")
+                        continue
+                    row = history_row(name.rsplit("_", 1)[0], entry)
+                    for column, values in columns.items():
+                        values.append(row[column])
+
+                if columns["job_id"]:
+                    part_number = len(state["parts"]) + 1
+                    path = _write_part(columns, export_dir / f"history-part-{part_number:05d}", export_format)
+                    state["parts"].append(path.name)
+                    new_parts.append(path.name)
+                    rows_exported += len(columns["job_id"])
+                    state["rows"] = state.get("rows", 0) + len(columns["job_id"])
+
+                # Record progress after every part, so a failed export resumes here
+                state["last_mtime_ns"] = batch[-1][0]
+                state["exported_at"] = datetime.now().isoformat()
+                with open(export_dir / STATE_FILE, "w") as f:
+                    json.dump(state, f, indent=2)
+
+            if rows_exported:
+                logger.info(f"Exported {rows_exported} history runs to {len(new_parts)} {export_format} part files in {export_dir}")
+            return {
+                "success": True,
+                "format": export_format,
+                "rows_exported": rows_exported,
+                "new_parts": new_parts,
+                "total_rows": state.get("rows", 0),
+                "parts": state["parts"]
+            }
+        except Exception as e:
+            logger.error(f"Error exporting task history: {str(e)}")
+            return {"success": False, "error": str(e)}
+
+def load_history_columns(export_dir) -> Dict[str, Any]:
+    """
+    Load the exported columns from all part files.
+
+    Args:
+        export_dir: Directory of the export's part files
+
+    Returns:
+        dict: Column name to values; NumPy arrays if numpy is installed,
+        otherwise lists (missing numbers are NaN either way)
+    """
+    export_dir = Path(export_dir)
+    columns = {name: [] for name, _ in COLUMNS}
+    for part in _read_export_state(export_dir).get("parts", []):
+        path = export_dir / part
+        try:
+            if part.endswith(".parquet"):
+                import pyarrow.parquet as pq
+                part_columns = pq.read_table(path).to_pydict()
+            elif part.endswith(".npz"):
+                import numpy as np
+                with np.load(path) as data:
+                    part_columns = {name: data[name].tolist() for name, _ in COLUMNS}
+            else:
+                with gzip.open(path, "rt", encoding="utf-8") as f:
+                    part_columns = json.load(f)
+        except ImportError as e:
+            logger.warning(f"Cannot read export part {part}: {str(e)}")
+            continue
+        for name, kind in COLUMNS:
+            values = part_columns[name]
+            if kind == "float":
+                values = [math.nan if v is None else v for v in values]
+            columns[name].extend(values)
+
+    try:
+        import numpy as np
+    except ImportError:
+        return columns
+    types = {"str": str, "float": np.float64, "int": np.int64}
+    return {name: np.asarray(columns[name], dtype=types[kind]) for name, kind in COLUMNS}
+
+def _grouped_percentiles(keys, values) -> Dict[Any, Dict[str, float]]:
+    """Count and percentiles of the non-NaN values per key."""
+    try:
+        import numpy as np
+    except ImportError:
+        groups = {}
+        for key, value in zip(keys, values):
+            if not math.isnan(value):
+                groups.setdefault(key, []).append(value)
+        stats = {}
+        for key, group in groups.items():
+            group.sort()
+            stats[key] = {"count": len(group), **{f"p{p}": percentile(group, p) for p in ANALYTICS_PERCENTILES}}
+        return stats
+
+    keys, values = np.asarray(keys), np.asarray(values, dtype=np.float64)
+    measured = ~np.isnan(values)
+    keys, values = keys[measured], values[measured]
+    if not len(values):
+        return {}
+    # Sort by key, then value, so each group is a sorted slice
+    order = np.lexsort((values, keys))
+    keys, values = keys[order], values[order]
+    unique, starts, counts = np.unique(keys, return_index=True, return_counts=True)
+    stats = {}
+    for key, start, count in zip(unique.tolist(), starts, counts):
+        group = values[start:start + count]
+        # inverted_cdf is the nearest-rank percentile used elsewhere in EzTaskRunner
+        pcts = np.percentile(group, ANALYTICS_PERCENTILES, method="inverted_cdf")
+        stats[key] = {"count": int(count), **{f"p{p}": float(v) for p, v in zip(ANALYTICS_PERCENTILES, pcts)}}
+    return stats
+
+def _failure_heatmap(weekdays, hours, statuses) -> Dict[str, List[List[int]]]:
+    """Runs and failures per weekday (rows) and hour (columns)."""
+    try:
+        import numpy as np
+    except ImportError:
+        runs = [[0] * 24 for _ in range(7)]
+        failures = [[0] * 24 for _ in range(7)]
+        for weekday, hour, status in zip(weekdays, hours, statuses):
+            if weekday < 0 or status == "skipped":
+                continue
+            runs[weekday][hour] += 1
+            failures[weekday][hour] += status == "failed"
+        return {"runs": runs, "failures": failures}
+
+    weekdays, hours, statuses = np.asarray(weekdays), np.asarray(hours), np.asarray(statuses)
+    executed = (weekdays >= 0) & (statuses != "skipped")
+    runs = np.zeros((7, 24), dtype=np.int64)
+    failures = np.zeros((7, 24), dtype=np.int64)
+    np.add.at(runs, (weekdays[executed], hours[executed]), 1)
+    failed = executed & (statuses == "failed")
+    np.add.at(failures, (weekdays[failed], hours[failed]), 1)
+    return {"runs": runs.tolist(), "failures": failures.tolist()}
+
+def compute_history_analytics(columns: Dict[str, Any], since: Optional[float] = None,
+                              job_id: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Aggregate exported history columns.
+
+    Args:
+        columns: Columns from load_history_columns
+        since: Optional epoch time; only runs started at or after it are included
+        job_id: Optional job ID; only this task's runs are included
+
+    Returns:
+        dict: 'runs', 'failed', 'skipped', 'success_rate', duration percentiles
+        'by_task' and 'by_hour', and the weekday x hour 'failure_heatmap'
+    """
+    try:
+        import numpy as np
+    except ImportError:
+        np = None
+
+    if np is not None:
+        mask = np.ones(len(columns["job_id"]), dtype=bool)
+        if since is not None:
+            mask &= columns["timestamp"] >= since
+        if job_id:
+            mask &= columns["job_id"] == job_id
+        columns = {name: values[mask] for name, values in columns.items()}
+        skipped_runs = columns["status"] == "skipped"
+        failed = int(np.count_nonzero(columns["status"] == "failed"))
+        skipped = int(np.count_nonzero(skipped_runs))
+        # Skipped runs have no duration, so they drop out of the percentiles
+        durations = np.where(skipped_runs, np.nan, columns["execution_time"])
+    else:
+        selected = [
+            i for i in range(len(columns["job_id"]))
+            if (since is None or columns["timestamp"][i] >= since) and (not job_id or columns["job_id"][i] == job_id)
+        ]
+        columns = {name: [values[i] for i in selected] for name, values in columns.items()}
+        failed = columns["status"].count("failed")
+        skipped = columns["status"].count("skipped")
+        durations = [math.nan if status == "skipped" else duration
+                     for status, duration in zip(columns["status"], columns["execution_time"])]
+
+    executed = len(columns["status"]) - skipped
+    by_hour = _grouped_percentiles(columns["hour"], durations)
+    by_hour.pop(-1, None)  # Runs without a start time
+    return {
+        "runs": executed,
+        "failed": failed,
+        "skipped": skipped,
+        "success_rate": (executed - failed) * 100 / executed if executed else None,
+        "by_task": _grouped_percentiles(columns["job_id"], durations),
+        "by_hour": by_hour,
+        "failure_heatmap": _failure_heatmap(columns["weekday"], columns["hour"], columns["status"])
+    }
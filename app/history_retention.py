@@ -0,0 +1,412 @@
+"""
+History retention for EzTaskRunner.
+
+Task history files are kept in full for a number of days, then folded into
+daily rollups per task (run, failure and skip counts, a quantile sketch of
+durations, total execution and CPU time, peak memory) and deleted. Rollups
+are kept for a longer period and then dropped too.
+
+Both periods are set globally (HISTORY_RETENTION_DAYS, HISTORY_ROLLUP_DAYS)
+and can be overridden per task (history_retention_days, history_rollup_days).
+Files left in the runs directory (run profiles, and the files of runs whose
+result was never saved) are deleted after HISTORY_RETENTION_DAYS as well.
+Retention deletes data, so it is off unless HISTORY_RETENTION_ENABLED is set.
+
+A background worker applies the policy periodically. Each pass works through
+the history directory in slices limited to a time budget, pausing between
+slices, so a large history never stalls the server. Rollups are written
+before the files they summarize are deleted. The outcome of the last pass and
+the bytes reclaimed are recorded in a state file shown on the monitoring page.
+
+Rollups are stored in the 'rollups' directory of the task history directory,
+one JSON file per task.
+"""
+import json
+import os
+import time
+import atexit
+import logging
+import threading
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict, Any, Optional, List
+
+from app.runtime_baseline import new_sketch, add_to_sketch, sketch_quantile
+from app.utils.compression import load_json_file, strip_compression_suffix
+
+logger = logging.getLogger("EzTaskRunner")
+
+# Seconds after startup before the first pass
+STARTUP_DELAY = 60
+
+# Seconds to pause between the slices of a pass
+SLICE_PAUSE = 1.0
+
+ROLLUPS_DIR = "rollups"
+STATE_FILE = "retention_state.json"
+
+def get_retention_policy(task: Optional[Dict[str, Any]], config) -> Dict[str, int]:
+    """
+    Get the retention policy of a task.
+
+    Args:
+        task: The task dictionary, or None for history of deleted tasks
+        config: The application config
+
+    Returns:
+        dict: 'retention_days' (full records; 0 = keep forever) and
+        'rollup_days' (daily rollups; 0 = no rollups)
+    """
+    policy = {
+        'retention_days': config.get('HISTORY_RETENTION_DAYS', 14),
+        'rollup_days': config.get('HISTORY_ROLLUP_DAYS', 365)
+    }
+    for key, field in (('retention_days', 'history_retention_days'), ('rollup_days', 'history_rollup_days')):
+        if task and task.get(field) is not None:
+            policy[key] = task[field]
+    return policy
+
+def parse_history_file_name(name: str):
+    """
+    Get the job ID and run time from a history file name
+    ({job_id}_{YYYYmmddHHMMSS}.json, optionally compressed).
+
+    Returns:
+        tuple: (job_id, datetime), or (None, None) for other files
+    """
+    name = strip_compression_suffix(name)
+    if not name.endswith('.json') or '_' not in name:
+        return None, None
+    job_id, stamp = name[:-len('.json')].rsplit('_', 1)
+    try:
+        return job_id, datetime.strptime(stamp, "%Y%m%d%H%M%S")
+    except ValueError:
+        return None, None
+
+def new_rollup_day() -> Dict[str, Any]:
+    """Create an empty daily rollup."""
+    return {
+        'runs': 0,
+        'failures': 0,
+        'skipped': 0,
+        'total_execution_time': 0.0,
+        'total_cpu_seconds': 0.0,
+        'peak_rss_mb': None,
+        'duration_sketch': new_sketch()
+    }
+
+def add_to_rollup_day(day: Dict[str, Any], entry: Dict[str, Any]) -> None:
+    """
+    Add a history entry to a daily rollup.
+
+    Args:
+        day: The daily rollup (updated in place)
+        entry: The history entry
+    """
+    from app.utils.constants import STATUS_SKIPPED
+
+    if entry.get('status') == STATUS_SKIPPED:
+        day['skipped'] += 1
+        return
+
+    day['runs'] += 1
+    if not entry.get('success'):
+        day['failures'] += 1
+    if isinstance(entry.get('execution_time'), (int, float)):
+        day['total_execution_time'] += entry['execution_time']
+        add_to_sketch(day['duration_sketch'], entry['execution_time'], decay=1.0)
+    if isinstance(entry.get('cpu_seconds'), (int, float)):
+        day['total_cpu_seconds'] += entry['cpu_seconds']
+    if isinstance(entry.get('peak_rss_mb'), (int, float)):
+        day['peak_rss_mb'] = max(day['peak_rss_mb'] or 0, entry['peak_rss_mb'])
+
+def load_rollups(history_dir, job_id: str) -> Dict[str, Any]:
+    """
+    Load the daily rollups of a task.
+
+    Args:
+        history_dir: The task history directory
+        job_id: The job ID
+
+    Returns:
+        dict: The rollups document ({'job_id', 'days': {'YYYY-mm-dd': rollup}})
+    """
+    try:
+        with open(Path(history_dir) / ROLLUPS_DIR / f"{job_id}.json", 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {'job_id': job_id, 'days': {}}
+
+def summarize_rollups(rollups: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    Summarize daily rollups for display, newest day first.
+
+    Args:
+        rollups: The rollups document
+
+    Returns:
+        list: One dictionary per day with the counts, totals and p50/p95 durations
+    """
+    summary = []
+    for date, day in sorted(rollups.get('days', {}).items(), reverse=True):
+        summary.append({
+            'date': date,
+            'runs': day['runs'],
+            'failures': day['failures'],
+            'skipped': day['skipped'],
+            'total_execution_time': day['total_execution_time'],
+            'total_cpu_seconds': day['total_cpu_seconds'],
+            'peak_rss_mb': day['peak_rss_mb'],
+            'p50': sketch_quantile(day['duration_sketch'], 0.5),
+            'p95': sketch_quantile(day['duration_sketch'], 0.95)
+        })
+    return summary
+
+def get_retention_status(state_dir) -> Optional[Dict[str, Any]]:
+    """
+    Get the outcome of the last retention pass.
+
+    Args:
+        state_dir: The state directory
+
+    Returns:
+        dict: The retention state, or None if no pass has run yet
+    """
+    try:
+        with open(Path(state_dir) / STATE_FILE, 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def _write_json(path: Path, data: Dict[str, Any]) -> None:
+    """Write a JSON file atomically."""
+    tmp_path = path.with_suffix('.tmp')
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+class RetentionWorker:
+    """
+    Applies the history retention policy from a background thread.
+
+    Every pass folds expired history files into daily rollups and deletes
+    them, drops expired rollup days and deletes expired run files. Work is
+    done in slices of at most HISTORY_RETENTION_SLICE_SECONDS, with a pause
+    between slices.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.stopping = threading.Event()
+        self.thread = threading.Thread(target=self._run, name="HistoryRetention", daemon=True)
+
+    def start(self):
+        """Start the retention thread."""
+        self.thread.start()
+        atexit.register(self.stop)
+
+    def stop(self, timeout=10):
+        """Stop the retention thread, finishing the current slice."""
+        self.stopping.set()
+        if self.thread.is_alive():
+            self.thread.join(timeout)
+
+    def _run(self):
+        if self.stopping.wait(STARTUP_DELAY):
+            return
+        while True:
+            try:
+                with self.app.app_context():
+                    self.run_pass()
+            except Exception as e:
+                logger.error(f"Error applying history retention: {str(e)}")
+            if self.stopping.wait(self.app.config.get('HISTORY_RETENTION_INTERVAL_MINUTES', 60) * 60):
+                return
+
+    def run_pass(self) -> Dict[str, Any]:
+        """
+        Apply the retention policy once.
+
+        Returns:
+            dict: The pass statistics, as recorded in the retention state
+        """
+        from app.task_manager import get_all_tasks
+        from app.search_index import remove_runs
+
+        config = self.app.config
+        history_dir = Path(config['TASK_HISTORY_DIR'])
+        rollups_dir = history_dir / ROLLUPS_DIR
+        os.makedirs(rollups_dir, exist_ok=True)
+        budget = config.get('HISTORY_RETENTION_SLICE_SECONDS', 0.2)
+
+        previous = get_retention_status(config['STATE_DIR']) or {}
+        stats = {
+            'started_at': datetime.now().isoformat(),
+            'files_scanned': 0,
+            'files_removed': 0,
+            'bytes_reclaimed': 0,
+            'rollup_days_dropped': 0,
+            'run_files_removed': 0,
+            'slices': 1,
+            'total_files_removed': previous.get('total_files_removed', 0),
+            'total_bytes_reclaimed': previous.get('total_bytes_reclaimed', 0)
+        }
+
+        tasks = {task.get('job_id'): task for task in get_all_tasks()}
+        policies = {}
+        rollups = {}  # job_id -> rollups document changed in the current slice
+        expired = []  # (path, size) of files rolled up in the current slice
+        now = datetime.now()
+
+        def commit():
+            # Rollups first: a file is only deleted once its run is in a rollup
+            for job_id, document in rollups.items():
+                _write_json(rollups_dir / f"{job_id}.json", document)
+            rollups.clear()
+            removed = []
+            for path, size in expired:
+                try:
+                    os.unlink(path)
+                    removed.append(path)
+                    stats['files_removed'] += 1
+                    stats['bytes_reclaimed'] += size
+                except OSError as e:
+                    logger.warning(f"Could not delete history file {path}: {str(e)}")
+            expired.clear()
+            # Deleted runs are no longer searchable either
+            remove_runs(config['STATE_DIR'], [os.path.basename(path) for path in removed])
+
+        slice_started = time.monotonic()
+        with os.scandir(history_dir) as entries:
+            for entry in entries:
+                if self.stopping.is_set():
+                    break
+                job_id, run_time = parse_history_file_name(entry.name)
+                if not job_id:
+                    continue
+                stats['files_scanned'] += 1
+
+                if job_id not in policies:
+                    policies[job_id] = get_retention_policy(tasks.get(job_id), config)
+                policy = policies[job_id]
+                if not policy['retention_days'] or run_time >= now - timedelta(days=policy['retention_days']):
+                    continue
+
+                if policy['rollup_days']:
+                    try:
+                        record = load_json_file(entry.path)
+                    except (OSError, ValueError) as e:
+                        logger.warning(f"Skipping unreadable history file {entry.name}: {str(e)}")
+                        continue
+                    if job_id not in rollups:
+                        rollups[job_id] = load_rollups(history_dir, job_id)
+                    day = rollups[job_id]['days'].setdefault(run_time.strftime("%Y-%m-%d"), new_rollup_day())
+                    add_to_rollup_day(day, record)
+                expired.append((entry.path, entry.stat().st_size))
+
+                if time.monotonic() - slice_started >= budget:
+                    commit()
+                    if self.stopping.wait(SLICE_PAUSE):
+                        break
+                    stats['slices'] += 1
+                    slice_started = time.monotonic()
+        commit()
+
+        # Drop rollup days past their task's rollup period
+        for path in rollups_dir.glob("*.json"):
+            job_id = path.stem
+            if job_id not in policies:
+                policies[job_id] = get_retention_policy(tasks.get(job_id), config)
+            cutoff = (now - timedelta(days=policies[job_id]['rollup_days'])).strftime("%Y-%m-%d")
+            document = load_rollups(history_dir, job_id)
+            kept = {date: day for date, day in document['days'].items() if date >= cutoff}
+            if len(kept) == len(document['days']):
+                continue
+            stats['rollup_days_dropped'] += len(document['days']) - len(kept)
+            size = path.stat().st_size
+            if kept:
+                document['days'] = kept
+                _write_json(path, document)
+                stats['bytes_reclaimed'] += max(0, size - path.stat().st_size)
+            else:
+                path.unlink()
+                stats['bytes_reclaimed'] += size
+
+        self._expire_run_files(stats, now, budget)
+
+        stats['finished_at'] = datetime.now().isoformat()
+        stats['total_files_removed'] += stats['files_removed'] + stats['run_files_removed']
+        stats['total_bytes_reclaimed'] += stats['bytes_reclaimed']
+        _write_json(Path(config['STATE_DIR']) / STATE_FILE, stats)
+        if stats['files_removed'] or stats['rollup_days_dropped'] or stats['run_files_removed']:
+            logger.info(f"History retention removed {stats['files_removed']} history files, {stats['rollup_days_dropped']} rollup days and {stats['run_files_removed']} run files, reclaiming {stats['bytes_reclaimed']} bytes")
+        return stats
+
+    def _expire_run_files(self, stats: Dict[str, Any], now: datetime, budget: float) -> None:
+        """
+        Delete files in the runs directory older than HISTORY_RETENTION_DAYS.
+
+        Files of runs whose result has not been collected yet are kept, as the
+        run may still be going.
+
+        Args:
+            stats: The pass statistics (updated in place)
+            now: The time of the pass
+            budget: Seconds of work per slice
+        """
+        from app.utils.run_supervisor import list_uncollected_runs
+
+        config = self.app.config
+        runs_dir = config.get('RUNS_DIR')
+        retention_days = config.get('HISTORY_RETENTION_DAYS', 14)
+        if not retention_days or not runs_dir or not os.path.isdir(runs_dir):
+            return
+
+        cutoff = (now - timedelta(days=retention_days)).timestamp()
+        pending = {state.get('run_key') for state in list_uncollected_runs(runs_dir)}
+        slice_started = time.monotonic()
+        with os.scandir(runs_dir) as entries:
+            for entry in entries:
+                if self.stopping.is_set():
+                    break
+                # Run files are named '<run key>.<kind>'
+                if entry.name.split('.', 1)[0] in pending or not entry.is_file():
+                    continue
+                try:
+                    stat = entry.stat()
+                    if stat.st_mtime >= cutoff:
+                        continue
+                    os.unlink(entry.path)
+                except OSError as e:
+                    logger.warning(f"Could not delete run file {entry.name}: {str(e)}")
+                    continue
+                stats['run_files_removed'] += 1
+                stats['bytes_reclaimed'] += stat.st_size
+
+                if time.monotonic() - slice_started >= budget:
+                    if self.stopping.wait(SLICE_PAUSE):
+                        break
+                    stats['slices'] += 1
+                    slice_started = time.monotonic()
+
+_worker = None
+_worker_lock = threading.Lock()
+
+def start_retention_worker(app) -> Optional[RetentionWorker]:
+    """
+    Start the process-wide history retention worker, if retention is enabled.
+
+    Args:
+        app: The Flask application
+
+    Returns:
+        RetentionWorker: The worker, or None if retention is disabled
+    """
+    global _worker
+    if not app.config.get('HISTORY_RETENTION_ENABLED', False):
+        return None
+    with _worker_lock:
+        if _worker is None:
+            _worker = RetentionWorker(app)
+            _worker.start()
+        return _worker
@@ -0,0 +1,465 @@
+"""
+Logging pipeline for EzTaskRunner.
+
+Log records are put on an in-memory queue by the thread that logs them and
+written out by a single listener thread, so request handlers, scheduler jobs
+and task runs never wait on log file writes or handler locks.
+
+Records keep their original routing: each logger that had file handlers gets
+a queue handler tagging records with a route, and the listener passes each
+record to the handlers of its route only.
+
+Log files rotate by size (or at a time interval) and rotated files can be
+gzipped. Only one process may rotate a file, so web processes (RUN_MODE=web)
+write through handlers that follow the worker's rotations instead.
+
+Repetitive records can be rate-limited or sampled per logger. Records are
+counted per logging call site, so one noisy line does not silence the rest of
+a logger; warnings and errors are never dropped.
+
+Records emitted while a run is handled are stamped with its run ID (see
+run_context). Logs are written as text, with the run ID in front of the
+message, or as JSON lines (LOG_FORMAT=json) with run_id and job_id fields.
+"""
+import atexit
+import gzip
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import shutil
+import threading
+from datetime import datetime
+from typing import Dict, Any, Optional, Tuple
+
+from app.run_context import get_run_context
+
+logger = logging.getLogger("EzTaskRunner")
+
+# Loggers whose level can be changed from the settings page
+CONFIGURABLE_LOGGERS = ['EzTaskRunner', 'EzTaskRunner.Tasks', 'EzTaskRunner.Tools', 'werkzeug', 'apscheduler']
+
+VALID_LEVELS = ['DEBUG', 'INFO', 'WARNING', 'ERROR', 'CRITICAL']
+
+_listener = None
+_queue_handlers = []
+_repeat_filter = None
+_pipeline_lock = threading.Lock()
+
+def parse_log_levels(spec: str) -> Dict[str, str]:
+    """
+    Parse per-logger levels ('EzTaskRunner.Tasks=DEBUG,werkzeug=INFO').
+
+    Args:
+        spec: Comma-separated logger=LEVEL pairs
+
+    Returns:
+        dict: Level names by logger name; invalid entries are ignored
+    """
+    levels = {}
+    for item in (spec or '').split(','):
+        name, _, level = item.partition('=')
+        name, level = name.strip(), level.strip().upper()
+        if name and level in VALID_LEVELS:
+            levels[name] = level
+    return levels
+
+def format_log_levels(levels: Dict[str, str]) -> str:
+    """Format per-logger levels the way parse_log_levels reads them."""
+    return ','.join(f"{name}={level}" for name, level in sorted(levels.items()))
+
+def parse_rate_limits(spec: str) -> Dict[str, Tuple[str, float, float]]:
+    """
+    Parse per-logger limits for repetitive records.
+
+    Two forms are accepted, comma-separated:
+    - 'EzTaskRunner=20/60': at most 20 records per call site every 60 seconds
+    - 'EzTaskRunner.Tools=10%': keep one in ten records per call site
+
+    A limit applies to the named logger and the loggers below it.
+
+    Args:
+        spec: The limits
+
+    Returns:
+        dict: ('rate', count, seconds) or ('sample', every, 0) by logger name
+
+    Raises:
+        ValueError: If an entry cannot be parsed
+    """
+    limits = {}
+    for item in (spec or '').split(','):
+        if not item.strip():
+            continue
+        name, _, rule = item.partition('=')
+        name, rule = name.strip(), rule.strip()
+        if not name or not rule:
+            raise ValueError(f"Invalid log rate limit '{item.strip()}', expected logger=count/seconds or logger=percent%")
+        try:
+            if rule.endswith('%'):
+                percent = float(rule[:-1])
+                if not 0 < percent <= 100:
+                    raise ValueError
+                limits[name] = ('sample', max(1, round(100 / percent)), 0)
+            else:
+                count, _, seconds = rule.partition('/')
+                count, seconds = int(count), float(seconds or 60)
+                if count < 1 or seconds <= 0:
+                    raise ValueError
+                limits[name] = ('rate', count, seconds)
+        except ValueError:
+            raise ValueError(f"Invalid log rate limit '{item.strip()}', expected logger=count/seconds or logger=percent%")
+    return limits
+
+def format_rate_limits(limits: Dict[str, Tuple[str, float, float]]) -> str:
+    """Format limits the way parse_rate_limits reads them."""
+    items = []
+    for name, (kind, amount, seconds) in sorted(limits.items()):
+        if kind == 'sample':
+            items.append(f"{name}={100 / amount:g}%")
+        else:
+            items.append(f"{name}={amount}/{seconds:g}")
+    return ','.join(items)
+
+class RepeatFilter(logging.Filter):
+    """Rate-limit or sample repetitive records below WARNING, per logging call site."""
+
+    def __init__(self, limits: Optional[Dict[str, Tuple[str, float, float]]] = None):
+        super().__init__()
+        self._lock = threading.Lock()
+        self.configure(limits or {})
+
+    def configure(self, limits: Dict[str, Tuple[str, float, float]]) -> None:
+        """Replace the limits and reset all counters."""
+        with self._lock:
+            self.limits = dict(limits)
+            self._rules = {}
+            self._sites = {}
+
+    def _rule(self, name: str):
+        """Get the limit of the closest configured logger at or above a logger."""
+        if name not in self._rules:
+            rule, probe = None, name
+            while True:
+                if probe in self.limits:
+                    rule = self.limits[probe]
+                    break
+                if '.' not in probe:
+                    break
+                probe = probe.rsplit('.', 1)[0]
+            self._rules[name] = rule
+        return self._rules[name]
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        # A record reaches one queue handler per routed logger it propagates
+        # through; decide once and reuse the verdict
+        verdict = getattr(record, 'repeat_verdict', None)
+        if verdict is not None:
+            return verdict
+        verdict = self._decide(record)
+        record.repeat_verdict = verdict
+        return verdict
+
+    def _decide(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING or not self.limits:
+            return True
+        with self._lock:
+            rule = self._rule(record.name)
+            if rule is None:
+                return True
+            kind, amount, seconds = rule
+            site = (record.name, record.pathname, record.lineno)
+            state = self._sites.setdefault(site, [record.created, 0, 0])  # window start, kept, dropped
+
+            if kind == 'sample':
+                state[1] += 1
+                return (state[1] - 1) % amount == 0
+
+            if record.created - state[0] >= seconds:
+                dropped = state[2]
+                self._sites[site] = [record.created, 1, 0]
+                if dropped:
+                    record.msg = f"{record.getMessage()} ({dropped} similar messages suppressed in the last {seconds:g} seconds)"
+                    record.args = None
+                return True
+            if state[1] < amount:
+                state[1] += 1
+                return True
+            state[2] += 1
+            return False
+
+class RunTextFormatter(logging.Formatter):
+    """Text formatter that puts the run ID of a record in front of its message."""
+
+    def formatMessage(self, record: logging.LogRecord) -> str:
+        run_id = getattr(record, 'run_id', None)
+        record.run_tag = f"[run {run_id}] " if run_id else ""
+        return super().formatMessage(record)
+
+class JsonFormatter(logging.Formatter):
+    """Formatter writing each record as one JSON object per line."""
+
+    def __init__(self, detailed: bool = False):
+        super().__init__()
+        self.detailed = detailed
+
+    def format(self, record: logging.LogRecord) -> str:
+        # The time comes first so log readers find it at the start of the line
+        entry = {
+            "ts": datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds'),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        if getattr(record, 'run_id', None):
+            entry["run_id"] = record.run_id
+        if getattr(record, 'job_id', None):
+            entry["job_id"] = record.job_id
+        if self.detailed:
+            entry["path"] = record.pathname
+            entry["line"] = record.lineno
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+def _formatters(log_format: str) -> Tuple[logging.Formatter, logging.Formatter]:
+    """Get the standard and detailed (errors.log) formatters of a log format."""
+    if log_format == 'json':
+        return JsonFormatter(), JsonFormatter(detailed=True)
+    return (
+        RunTextFormatter('%(asctime)s - %(name)s - %(levelname)s - %(run_tag)s%(message)s'),
+        RunTextFormatter('%(asctime)s - %(name)s - %(levelname)s - %(pathname)s:%(lineno)d - %(run_tag)s%(message)s')
+    )
+
+class RoutedQueueHandler(logging.handlers.QueueHandler):
+    """
+    Queue handler that tags records with the route of the logger it is
+    attached to, and with the run being handled by the logging thread.
+    """
+
+    def __init__(self, log_queue, route: str):
+        super().__init__(log_queue)
+        self.route = route
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Runs on the logging thread, where the run context is set; an ID
+        # passed explicitly with extra={'run_id': ...} is kept
+        if getattr(record, 'run_id', None) is None:
+            record.run_id, context_job_id = get_run_context()
+            if getattr(record, 'job_id', None) is None:
+                record.job_id = context_job_id
+        record = super().prepare(record)
+        record.log_route = self.route
+        return record
+
+class RoutingQueueListener(logging.handlers.QueueListener):
+    """Queue listener that passes each record to the handlers of its route."""
+
+    def __init__(self, log_queue, routes: Dict[str, list]):
+        super().__init__(log_queue)
+        self.routes = routes
+
+    def handle(self, record: logging.LogRecord) -> None:
+        for handler in self.routes.get(getattr(record, 'log_route', ''), ()):
+            if record.levelno >= handler.level:
+                handler.handle(record)
+
+    def close_handlers(self) -> None:
+        """Close every handler of every route."""
+        for handler in {handler for handlers in self.routes.values() for handler in handlers}:
+            handler.close()
+
+def _gzip_namer(name: str) -> str:
+    return name + '.gz'
+
+def _gzip_rotator(source: str, dest: str) -> None:
+    """Gzip a rotated log file (runs on the listener thread)."""
+    with open(source, 'rb') as f_in, gzip.open(dest, 'wb') as f_out:
+        shutil.copyfileobj(f_in, f_out)
+    os.remove(source)
+
+def _file_handler(path, config) -> logging.Handler:
+    """
+    Create the handler of a log file, rotating it as configured.
+
+    Args:
+        path: Path of the log file
+        config: The Flask application config
+
+    Returns:
+        logging.Handler: The file handler
+    """
+    if config.get('RUN_MODE') == 'web':
+        # The worker rotates the shared log files; reopen them when it does
+        return logging.handlers.WatchedFileHandler(path)
+
+    backup_count = config.get('LOG_BACKUP_COUNT', 10)
+    when = config.get('LOG_ROTATE_WHEN')
+    max_bytes = int(config.get('LOG_MAX_MB', 50) * 1024 * 1024)
+    if when:
+        handler = logging.handlers.TimedRotatingFileHandler(path, when=when, backupCount=backup_count)
+    elif max_bytes > 0:
+        handler = logging.handlers.RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backup_count)
+    else:
+        return logging.FileHandler(path)
+
+    if config.get('LOG_COMPRESS_ROTATED', True):
+        handler.namer = _gzip_namer
+        handler.rotator = _gzip_rotator
+    return handler
+
+def start_logging_pipeline(config, log_level: int) -> None:
+    """
+    Configure the application loggers to log through the queue pipeline.
+
+    Routes (and the files they write):
+    - root: eztaskrunner.log, the console and errors.log (ERROR and above)
+    - EzTaskRunner: tools.log
+    - EzTaskRunner.Tasks: tasks.log
+    - EzTaskRunner.Tools: tools.log, without propagating to the root
+
+    Calling this again replaces the running pipeline.
+
+    Args:
+        config: The Flask application config
+        log_level: Level of the root and application loggers
+    """
+    global _listener, _queue_handlers, _repeat_filter
+
+    log_dir = config['LOG_DIR']
+
+    # Set up formatting; the console is always written as text
+    standard_formatter, detailed_formatter = _formatters(config.get('LOG_FORMAT', 'text'))
+    console_formatter = _formatters('text')[0]
+
+    main_handler = _file_handler(log_dir / 'eztaskrunner.log', config)
+    main_handler.setFormatter(standard_formatter)
+
+    console_handler = logging.StreamHandler()
+    console_handler.setFormatter(console_formatter)
+
+    tools_handler = _file_handler(log_dir / 'tools.log', config)
+    tools_handler.setFormatter(standard_formatter)
+
+    # Errors get more detailed formatting
+    errors_handler = _file_handler(log_dir / 'errors.log', config)
+    errors_handler.setLevel(logging.ERROR)
+    errors_handler.setFormatter(detailed_formatter)
+
+    tasks_handler = _file_handler(log_dir / 'tasks.log', config)
+    tasks_handler.setFormatter(standard_formatter)
+
+    routes = {
+        '': [main_handler, console_handler, errors_handler],
+        'EzTaskRunner': [tools_handler],
+        'EzTaskRunner.Tasks': [tasks_handler],
+        'EzTaskRunner.Tools': [tools_handler],
+    }
+
+    with _pipeline_lock:
+        stop_logging_pipeline()
+
+        _repeat_filter = RepeatFilter(config.get('LOG_RATE_LIMITS') or {})
+        log_queue = queue.SimpleQueue()
+        _queue_handlers = []
+        for route in routes:
+            route_logger = logging.getLogger(route or None)
+            handler = RoutedQueueHandler(log_queue, route)
+            handler.addFilter(_repeat_filter)
+            route_logger.addHandler(handler)
+            _queue_handlers.append((route_logger, handler))
+
+        _listener = RoutingQueueListener(log_queue, routes)
+        _listener.start()
+
+    logging.getLogger().setLevel(log_level)
+    logging.getLogger('EzTaskRunner').setLevel(log_level)
+    # The tasks and tools loggers follow the application level unless overridden
+    logging.getLogger('EzTaskRunner.Tasks').setLevel(logging.NOTSET)
+    tools_logger = logging.getLogger('EzTaskRunner.Tools')
+    tools_logger.setLevel(logging.NOTSET)
+    tools_logger.propagate = False  # Don't propagate to root logger
+
+    # Reduce verbosity of some loggers
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+    logging.getLogger('apscheduler').setLevel(logging.WARNING)
+    set_log_levels(config.get('LOG_LEVELS') or {})
+
+def stop_logging_pipeline() -> None:
+    """Detach the queue handlers and write out the records still queued."""
+    global _listener, _queue_handlers
+
+    for route_logger, handler in _queue_handlers:
+        route_logger.removeHandler(handler)
+    _queue_handlers = []
+    if _listener is not None:
+        _listener.stop()
+        _listener.close_handlers()
+        _listener = None
+
+# Records still queued at exit are written out before the process ends
+atexit.register(stop_logging_pipeline)
+
+def set_log_levels(levels: Dict[str, str]) -> Dict[str, str]:
+    """
+    Change logger levels of the running process.
+
+    Args:
+        levels: Level names by logger name; an empty level resets a logger to
+            follow its parent
+
+    Returns:
+        dict: The levels applied
+    """
+    applied = {}
+    for name, level in levels.items():
+        if name not in CONFIGURABLE_LOGGERS:
+            continue
+        level = (level or '').upper()
+        if level and level not in VALID_LEVELS:
+            continue
+        logging.getLogger(name).setLevel(getattr(logging, level) if level else logging.NOTSET)
+        applied[name] = level
+    return applied
+
+def get_log_levels() -> Dict[str, str]:
+    """
+    Get the levels of the configurable loggers.
+
+    Returns:
+        dict: Level names by logger name; '' for a logger following its parent
+    """
+    return {
+        name: logging.getLevelName(logging.getLogger(name).level) if logging.getLogger(name).level else ''
+        for name in CONFIGURABLE_LOGGERS
+    }
+
+def set_rate_limits(limits: Dict[str, Tuple[str, float, float]]) -> None:
+    """Replace the limits for repetitive records of the running process."""
+    if _repeat_filter is not None:
+        _repeat_filter.configure(limits)
+
+def apply_logging_settings(settings: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Apply logging settings changed on the settings page to this process.
+
+    Args:
+        settings: 'log_level' (root and application level), 'log_levels'
+            (per-logger levels) and 'rate_limits' (limits spec)
+
+    Returns:
+        dict: Result with success flag and error
+    """
+    try:
+        limits = parse_rate_limits(settings.get('rate_limits', ''))
+        if settings.get('log_level') in VALID_LEVELS:
+            level = getattr(logging, settings['log_level'])
+            logging.getLogger().setLevel(level)
+            logging.getLogger('EzTaskRunner').setLevel(level)
+        set_log_levels(settings.get('log_levels') or {})
+        set_rate_limits(limits)
+        return {"success": True, "error": None}
+    except Exception as e:
+        logger.error(f"Error applying logging settings: {str(e)}")
+        return {"success": False, "error": str(e)}
@@ -0,0 +1,306 @@
+"""
+Log reader for EzTaskRunner.
+
+Reads parts of the application log files (tail, byte ranges, lines from an
+offset or from a point in time) without loading whole files, so logs of any
+size can be browsed from the monitoring page. Files are memory-mapped and
+scanned for line breaks around the requested position only.
+
+To find a point in time, each log has a sparse offset index: one entry
+(log line timestamp, byte offset of the line) per INDEX_INTERVAL bytes of log.
+Indexes are kept in the 'log_index' directory of the state directory and are
+extended incrementally, scanning only the part of the log written since the
+last update, by a system job and before every time-based read. A log that was
+truncated or replaced is indexed again from the start.
+"""
+import bisect
+import json
+import mmap
+import os
+import re
+import logging
+import threading
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Any, Optional, List, Tuple
+
+logger = logging.getLogger("EzTaskRunner")
+
+# Log bytes between index entries
+INDEX_INTERVAL = 256 * 1024
+
+# Lines and bytes returned by a single read at most
+MAX_LINES = 5000
+MAX_BYTES = 1024 * 1024
+
+# Lines without a timestamp (e.g. traceback lines) skipped when indexing
+MAX_UNTIMED_LINES = 1000
+
+INDEX_DIR = "log_index"
+
+# Timestamp near the start of a log line ('2024-01-31 12:00:00,123 - ...' or a JSON field)
+_TIMESTAMP = re.compile(rb'(\d{4}-\d{2}-\d{2})[ T](\d{2}:\d{2}:\d{2})')
+_TIMESTAMP_SEARCH_BYTES = 80
+
+_index_lock = threading.Lock()
+
+def line_time_key(line: bytes) -> Optional[bytes]:
+    """
+    Get the timestamp of a log line in a form that sorts by time.
+
+    Args:
+        line: The start of the line
+
+    Returns:
+        bytes: b'YYYY-mm-dd HH:MM:SS', or None if the line does not start with a timestamp
+    """
+    match = _TIMESTAMP.search(line[:_TIMESTAMP_SEARCH_BYTES])
+    return match.group(1) + b' ' + match.group(2) if match else None
+
+def line_timestamp(line: bytes) -> Optional[float]:
+    """
+    Get the timestamp of a log line.
+
+    Args:
+        line: The start of the line
+
+    Returns:
+        float: Epoch time, or None if the line does not start with a timestamp
+    """
+    key = line_time_key(line)
+    if key is None:
+        return None
+    try:
+        return datetime.strptime(key.decode(), "%Y-%m-%d %H:%M:%S").timestamp()
+    except ValueError:
+        return None
+
+def resolve_log_path(log_dir, filename: str) -> Optional[Path]:
+    """
+    Get the path of a log file, refusing names outside the log directory.
+
+    Args:
+        log_dir: The log directory
+        filename: The log file name
+
+    Returns:
+        Path: The log file, or None if there is no such log
+    """
+    if not filename or Path(filename).name != filename or not filename.endswith('.log'):
+        return None
+    path = Path(log_dir) / filename
+    return path if path.is_file() else None
+
+class _MappedLog:
+    """A read-only memory map of a log file (empty files cannot be mapped)."""
+
+    def __init__(self, path):
+        self.file = open(path, 'rb')
+        self.size = os.fstat(self.file.fileno()).st_size
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ) if self.size else b''
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        if self.size:
+            self.data.close()
+        self.file.close()
+
+    def line_start(self, offset: int) -> int:
+        """Get the start of the first line at or after an offset."""
+        if offset <= 0:
+            return 0
+        if offset >= self.size:
+            return self.size
+        if self.data[offset - 1:offset] == b'\n':
+            return offset
+        newline = self.data.find(b'\n', offset)
+        return self.size if newline < 0 else newline + 1
+
+    def time_key_at(self, offset: int) -> Optional[bytes]:
+        """Get the sortable timestamp of the line starting at an offset."""
+        return line_time_key(self.data[offset:offset + _TIMESTAMP_SEARCH_BYTES].split(b'\n', 1)[0])
+
+    def timestamp_at(self, offset: int) -> Optional[float]:
+        """Get the timestamp of the line starting at an offset."""
+        return line_timestamp(self.data[offset:offset + _TIMESTAMP_SEARCH_BYTES].split(b'\n', 1)[0])
+
+    def lines_from(self, offset: int, limit: int) -> Tuple[List[str], int]:
+        """Read up to `limit` complete lines from a line start; returns the lines and the end offset."""
+        lines = []
+        position = offset
+        while len(lines) < limit and position < self.size and position - offset < MAX_BYTES:
+            newline = self.data.find(b'\n', position)
+            if newline < 0:
+                break  # The last line is still being written
+            lines.append(self.data[position:newline].decode('utf-8', errors='replace'))
+            position = newline + 1
+        return lines, position
+
+    def lines_before(self, offset: int, limit: int) -> Tuple[List[str], int, int]:
+        """Read up to `limit` complete lines ending at a line start; returns the lines and their start and end offsets."""
+        end = offset
+        # Leave out a last line that is still being written
+        if end == self.size and end and self.data[end - 1:end] != b'\n':
+            end = self.data.rfind(b'\n', 0, end) + 1
+        start = end
+        for _ in range(limit):
+            if start == 0 or end - start >= MAX_BYTES:
+                break
+            start = self.data.rfind(b'\n', 0, start - 1) + 1
+        text = self.data[start:end].decode('utf-8', errors='replace')
+        return (text[:-1].split('\n') if text else []), start, end
+
+def _index_path(state_dir, filename: str) -> Path:
+    return Path(state_dir) / INDEX_DIR / f"{filename}.json"
+
+def load_log_index(state_dir, filename: str) -> Dict[str, Any]:
+    """
+    Load the offset index of a log.
+
+    Args:
+        state_dir: The state directory
+        filename: The log file name
+
+    Returns:
+        dict: 'inode', 'size' (bytes indexed) and 'entries' ([epoch time, offset] pairs)
+    """
+    try:
+        with open(_index_path(state_dir, filename), 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {'inode': None, 'size': 0, 'entries': []}
+
+def update_log_index(log_path, state_dir) -> Dict[str, Any]:
+    """
+    Extend the offset index of a log with the part written since the last update.
+
+    Args:
+        log_path: Path of the log file
+        state_dir: The state directory
+
+    Returns:
+        dict: The updated index
+    """
+    log_path = Path(log_path)
+    with _index_lock:
+        index = load_log_index(state_dir, log_path.name)
+        stat = log_path.stat()
+        if index.get('inode') != stat.st_ino or stat.st_size < index.get('size', 0):
+            # New or truncated log: index it from the start
+            index = {'inode': stat.st_ino, 'size': 0, 'entries': []}
+        if stat.st_size == index['size']:
+            return index
+
+        entries = index['entries']
+        with _MappedLog(log_path) as log:
+            position = entries[-1][1] + INDEX_INTERVAL if entries else 0
+            while position < log.size:
+                position = log.line_start(position)
+                timestamp = None
+                for _ in range(MAX_UNTIMED_LINES):
+                    newline = log.data.find(b'\n', position)
+                    if newline < 0:
+                        break
+                    timestamp = log.timestamp_at(position)
+                    if timestamp is not None:
+                        break
+                    position = newline + 1
+                if newline < 0:
+                    break  # Resume here once more lines are written
+                if timestamp is not None:
+                    entries.append([timestamp, position])
+                position += INDEX_INTERVAL
+            index['size'] = log.size
+
+        path = _index_path(state_dir, log_path.name)
+        os.makedirs(path.parent, exist_ok=True)
+        tmp_path = path.with_suffix('.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump(index, f)
+        os.replace(tmp_path, path)
+        return index
+
+def update_log_indexes(log_dir, state_dir) -> int:
+    """
+    Extend the offset indexes of all logs in the log directory.
+
+    Returns:
+        int: Number of logs indexed
+    """
+    updated = 0
+    for log_path in Path(log_dir).glob('*.log'):
+        try:
+            update_log_index(log_path, state_dir)
+            updated += 1
+        except Exception as e:
+            logger.warning(f"Could not index log {log_path.name}: {str(e)}")
+    return updated
+
+def read_log(log_path, state_dir=None, tail: Optional[int] = None, before: Optional[int] = None,
+             offset: Optional[int] = None, since: Optional[datetime] = None, limit: int = 200,
+             start: Optional[int] = None, end: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Read part of a log file.
+
+    Exactly one way of reading is used, in this order:
+    - start/end: the raw bytes in a range (at most MAX_BYTES)
+    - since: `limit` lines from the first line logged at or after a time
+    - offset: `limit` lines from the first line at or after a byte offset
+    - tail: the last `tail` lines, or the last lines before the byte offset `before`
+
+    Args:
+        log_path: Path of the log file
+        state_dir: The state directory, needed to read by time
+        tail: Number of lines to read from the end
+        before: Byte offset the tail ends at (for paging back)
+        offset: Byte offset to read lines from (for paging forward)
+        since: Time to read lines from
+        limit: Number of lines to read from an offset or time
+        start: First byte of a range
+        end: Byte after the last byte of a range
+
+    Returns:
+        dict: 'size' (file size), 'start' and 'end' (byte offsets of the part
+        read, for paging), and 'lines', or 'text' for a byte range
+    """
+    limit = max(1, min(limit or 200, MAX_LINES))
+    with _MappedLog(log_path) as log:
+        result = {'size': log.size}
+
+        if start is not None or end is not None:
+            start = max(0, min(start or 0, log.size))
+            end = max(start, min(log.size if end is None else end, log.size, start + MAX_BYTES))
+            result.update(start=start, end=end, text=log.data[start:end].decode('utf-8', errors='replace'))
+            return result
+
+        if since is not None:
+            target = since.timestamp()
+            target_key = since.strftime("%Y-%m-%d %H:%M:%S").encode()
+            index = update_log_index(log_path, state_dir) if state_dir else {'entries': []}
+            entries = index['entries']
+            # Start from the entry before the target; entries are not strictly
+            # ordered when several processes write the same log
+            position = entries[max(0, bisect.bisect_left([entry[0] for entry in entries], target) - 2)][1] if entries else 0
+            position = min(position, log.size)
+            while position < log.size:
+                newline = log.data.find(b'\n', position)
+                if newline < 0:
+                    break
+                key = log.time_key_at(position)
+                if key is not None and key >= target_key:
+                    break
+                position = newline + 1
+            offset = position
+
+        if offset is not None:
+            first = log.line_start(max(0, offset))
+            lines, last = log.lines_from(first, limit)
+            result.update(start=first, end=last, lines=lines)
+            return result
+
+        last = log.size if before is None else log.line_start(max(0, min(before, log.size)))
+        lines, first, last = log.lines_before(last, max(1, min(tail or limit, MAX_LINES)))
+        result.update(start=first, end=last, lines=lines)
+        return result
@@ -0,0 +1,204 @@
+"""
+Metrics module for EzTaskRunner.
+
+Low-overhead in-process counters, gauges and histograms, rendered in the
+Prometheus text exposition format by the /metrics endpoint. Implemented
+here so no client library has to be installed.
+"""
+import math
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+# Histogram buckets in seconds
+DURATION_BUCKETS = (0.1, 0.5, 1, 5, 10, 30, 60, 120, 300, 600, 1800, 3600)
+WAIT_BUCKETS = (0.01, 0.05, 0.1, 0.5, 1, 2.5, 5, 10, 15, 30, 60, 300)
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1)
+
+_registry: List["_Metric"] = []
+_registry_lock = threading.Lock()
+
+def _format_value(value: float) -> str:
+    """Format a sample value as the exposition format expects."""
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: Optional[Tuple[str, str]] = None) -> str:
+    """Format a label set, escaping values."""
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    escaped = (str(v).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"') for _, v in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+class _Metric:
+    """Base class for metrics with a fixed set of label names."""
+
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        with _registry_lock:
+            _registry.append(self)
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self._samples())
+        return "\n".join(lines)
+
+class Counter(_Metric):
+    """A monotonically increasing counter."""
+
+    kind = "counter"
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def _samples(self):
+        with self._lock:
+            values = dict(self._values)
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(v)}" for key, v in sorted(values.items())]
+
+class Gauge(_Metric):
+    """A value that goes up and down, or is computed when scraped."""
+
+    kind = "gauge"
+
+    def __init__(self, name, documentation, labelnames=(), function: Optional[Callable[[], object]] = None):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._function = function
+
+    def set(self, value: float, **labels) -> None:
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels) -> None:
+        self.inc(-amount, **labels)
+
+    def set_function(self, function: Callable[[], object]) -> None:
+        """
+        Compute the gauge when scraped.
+
+        Args:
+            function: Callable returning a number, or a list of
+                (labels dict, value) tuples for labelled gauges
+        """
+        self._function = function
+
+    def _samples(self):
+        if self._function is not None:
+            try:
+                result = self._function()
+            except Exception:
+                return []
+            if isinstance(result, (int, float)):
+                values = {(): result}
+            else:
+                values = {self._key(labels): value for labels, value in result}
+        else:
+            with self._lock:
+                values = dict(self._values)
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(v)}" for key, v in sorted(values.items())]
+
+class Histogram(_Metric):
+    """Counts observations in cumulative buckets, with their sum and count."""
+
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets: Sequence[float] = DURATION_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        self._values: Dict[Tuple[str, ...], List[float]] = {}  # bucket counts..., sum, count
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[i] += 1
+                    break
+            state[-2] += value
+            state[-1] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the duration of the with-block."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def _samples(self):
+        with self._lock:
+            values = {key: list(state) for key, state in self._values.items()}
+        lines = []
+        for key, state in sorted(values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, state):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, ('le', _format_value(bound)))} {_format_value(cumulative)}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(state[-2])}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {_format_value(state[-1])}")
+        return lines
+
+def render_metrics() -> str:
+    """
+    Render every registered metric in the text exposition format.
+
+    Returns:
+        str: The metrics page
+    """
+    with _registry_lock:
+        metrics = list(_registry)
+    return "\n".join(metric.render() for metric in metrics) + "\n"
+
+# Runs
+RUNS_TOTAL = Counter("eztaskrunner_runs_total", "Finished task runs.", ("status", "script_type"))
+RUN_DURATION = Histogram("eztaskrunner_run_duration_seconds", "Script execution time of task runs.", ("script_type",), DURATION_BUCKETS)
+RUNTIME_REGRESSIONS = Counter("eztaskrunner_runtime_regressions_total", "Runs flagged for exceeding their task's runtime baseline.", ("measure",))
+
+# Waiting before a run starts
+QUEUE_WAIT = Histogram("eztaskrunner_queue_wait_seconds", "Time runs spent in the run queue before being claimed or leased.", ("target",), WAIT_BUCKETS)
+ADMISSION_WAIT = Histogram("eztaskrunner_admission_wait_seconds", "Time runs spent in the resource-check buffer before the script started.", (), WAIT_BUCKETS)
+SCHEDULER_LAG = Histogram("eztaskrunner_scheduler_lag_seconds", "Delay between a job's planned fire time and its actual start.", (), WAIT_BUCKETS)
+
+# Executor and queue
+EXECUTOR_BUSY = Gauge("eztaskrunner_executor_busy_workers", "Task executor workers executing a run.")
+EXECUTOR_MAX_WORKERS = Gauge("eztaskrunner_executor_max_workers", "Task executor worker limit.")
+EXECUTOR_BACKLOG = Gauge("eztaskrunner_executor_backlog", "Runs submitted to the task executor and waiting for a worker.")
+RUN_QUEUE_DEPTH = Gauge("eztaskrunner_run_queue_runs", "Runs in the run queue that are not done.", ("status", "target"))
+
+# Storage
+STORE_WRITE_LATENCY = Histogram("eztaskrunner_task_store_write_seconds", "Time to write a task definition to the task store.", ("operation",), LATENCY_BUCKETS)
+HISTORY_WRITE_LATENCY = Histogram("eztaskrunner_history_write_seconds", "Time to write a run to the task history.", (), LATENCY_BUCKETS)
@@ -0,0 +1,124 @@
+"""
+Retry engine for EzTaskRunner.
+
+Decides whether and when a failed run is retried. Delays grow exponentially
+from the task's retry interval, are capped and spread with random jitter,
+and a run is not retried once its attempt chain has been going on for longer
+than the task's maximum elapsed time. Retry budgets per task and for the
+whole application stop a failing upstream from flooding the executor.
+
+Attempts are tracked per run in the run queue: every retry is a new queued
+run pointing at the run it retries.
+"""
+import random
+import time
+from typing import Dict, Any, Optional
+
+from flask import current_app
+
+from app import run_queue
+from app.circuit_breaker import CIRCUIT_OPEN
+
+# Defaults for tasks that predate the backoff settings
+DEFAULT_RETRY_ATTEMPTS = 3
+DEFAULT_RETRY_INTERVAL_MINUTES = 5
+DEFAULT_BACKOFF_MULTIPLIER = 2.0
+DEFAULT_MAX_INTERVAL_MINUTES = 60
+
+def compute_retry_delay(task: Dict[str, Any], attempt: int, jitter: float = 0.0) -> float:
+    """
+    Compute the delay before a retry.
+
+    Args:
+        task: The task dictionary
+        attempt: The attempt number of the retry (2 for the first retry)
+        jitter: Fraction by which the delay is randomly spread (0.2 = +/-20%)
+
+    Returns:
+        float: The delay in seconds
+    """
+    base = task.get("retry_interval", DEFAULT_RETRY_INTERVAL_MINUTES) * 60
+    multiplier = task.get("retry_backoff_multiplier", DEFAULT_BACKOFF_MULTIPLIER)
+    max_delay = task.get("retry_max_interval", DEFAULT_MAX_INTERVAL_MINUTES) * 60
+
+    delay = min(base * multiplier ** max(0, attempt - 2), max_delay)
+    if jitter:
+        delay *= random.uniform(1 - jitter, 1 + jitter)
+    return max(1.0, delay)
+
+def plan_retry(job_id: str, task: Dict[str, Any], run_id: Optional[str], now: Optional[float] = None) -> Dict[str, Any]:
+    """
+    Decide whether a failed run is retried.
+
+    Args:
+        job_id: The job ID
+        task: The task dictionary
+        run_id: The run queue ID of the failed run
+        now: Optional current epoch time
+
+    Returns:
+        dict: 'retry' (bool) and 'reason'; when retrying also 'attempt',
+        'delay' (seconds) and 'not_before' (epoch time)
+    """
+    now = now or time.time()
+    config = current_app.config
+
+    if not task.get("auto_retry_enabled", False):
+        return {"retry": False, "reason": "Auto-retry is disabled"}
+
+    if task.get("circuit", {}).get("state") == CIRCUIT_OPEN:
+        return {"retry": False, "reason": "Circuit breaker is open"}
+
+    chain = run_queue.get_attempt_chain(run_id) if run_id else []
+    attempt = next((r["attempt"] for r in chain if r["run_id"] == run_id), 1)
+    max_attempts = task.get("retry_attempts", DEFAULT_RETRY_ATTEMPTS)
+    if attempt > max_attempts:
+        return {"retry": False, "reason": f"Maximum retry attempts ({max_attempts}) reached"}
+
+    next_attempt = attempt + 1
+    delay = compute_retry_delay(task, next_attempt, config.get("RETRY_JITTER", 0.0))
+
+    # Give up when the retry would start after the maximum elapsed time
+    max_elapsed = task.get("retry_max_elapsed", 0)
+    if max_elapsed and chain:
+        elapsed = now + delay - chain[0]["enqueued_at"]
+        if elapsed > max_elapsed * 60:
+            return {"retry": False, "reason": f"Retry would exceed the maximum elapsed time of {max_elapsed} minutes"}
+
+    # Retry budgets over a sliding window
+    window_start = now - config.get("RETRY_BUDGET_WINDOW_MINUTES", 60) * 60
+    task_budget = config.get("RETRY_BUDGET_PER_TASK", 0)
+    if task_budget and run_queue.count_retries_since(window_start, job_id) >= task_budget:
+        return {"retry": False, "reason": f"Task retry budget exhausted ({task_budget} retries per window)"}
+    global_budget = config.get("RETRY_BUDGET_GLOBAL", 0)
+    if global_budget and run_queue.count_retries_since(window_start) >= global_budget:
+        return {"retry": False, "reason": f"Global retry budget exhausted ({global_budget} retries per window)"}
+
+    return {
+        "retry": True,
+        "reason": f"Retry {attempt} of {max_attempts}",
+        "attempt": next_attempt,
+        "delay": delay,
+        "not_before": now + delay
+    }
+
+def describe_attempt_chain(run_id: Optional[str]) -> Dict[str, Any]:
+    """
+    Summarize a run's place in its attempt chain for the run history.
+
+    Args:
+        run_id: The run queue ID
+
+    Returns:
+        dict: 'attempt', 'root_run_id', 'retry_of' and the 'attempts' so far
+    """
+    chain = run_queue.get_attempt_chain(run_id) if run_id else []
+    run = next((r for r in chain if r["run_id"] == run_id), None)
+    if not run:
+        return {"attempt": 1, "root_run_id": run_id, "retry_of": None, "attempts": []}
+    return {
+        "attempt": run["attempt"],
+        "root_run_id": run["root_run_id"] or run_id,
+        "retry_of": run["retry_of"],
+        "attempts": [r["run_id"] for r in chain if r["attempt"] <= run["attempt"]]
+    }
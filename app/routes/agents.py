@@ -0,0 +1,109 @@
+"""
+Worker agent routes for EzTaskRunner.
+Handles registration of remote worker agents, run leasing and result reporting.
+"""
+import logging
+from pathlib import Path
+from flask import Blueprint, request, jsonify, current_app
+
+from app import run_queue
+from app.run_context import run_context
+
+# Create blueprint
+agents_bp = Blueprint('agents', __name__, url_prefix='/api/agents')
+
+@agents_bp.before_request
+def check_agent_token():
+    """Reject agent requests without the configured shared token."""
+    token = current_app.config.get('AGENT_TOKEN')
+    if token and request.headers.get('X-Agent-Token') != token:
+        logging.getLogger("EzTaskRunner").warning(f"Rejected agent request from {request.remote_addr}: invalid token")
+        return jsonify({"success": False, "error": "Invalid agent token"}), 403
+    return None
+
+@agents_bp.route("", methods=["GET"])
+def list_agents():
+    """Return the registered agents and the number of runs each holds."""
+    return jsonify({"agents": run_queue.list_agents()})
+
+@agents_bp.route("/register", methods=["POST"])
+def register_agent():
+    """Register a worker agent and return its ID and lease settings."""
+    data = request.get_json(silent=True) or {}
+    name = data.get('name') or request.remote_addr
+    try:
+        capacity = max(1, int(data.get('capacity', 1)))
+    except (TypeError, ValueError):
+        return jsonify({"success": False, "error": "Capacity must be a number"}), 400
+
+    agent_id = run_queue.register_agent(name, data.get('labels'), capacity)
+    return jsonify({
+        "success": True,
+        "agent_id": agent_id,
+        "lease_seconds": current_app.config['AGENT_LEASE_SECONDS']
+    })
+
+@agents_bp.route("/<agent_id>/heartbeat", methods=["POST"])
+def heartbeat(agent_id: str):
+    """Renew the leases on the runs an agent is still executing."""
+    if not run_queue.get_agent(agent_id, touch=True):
+        return jsonify({"success": False, "error": "Unknown agent, please register again"}), 404
+
+    data = request.get_json(silent=True) or {}
+    result = run_queue.renew_leases(agent_id, data.get('run_ids', []), current_app.config['AGENT_LEASE_SECONDS'])
+    return jsonify({"success": True, **result})
+
+@agents_bp.route("/<agent_id>/lease", methods=["POST"])
+def lease(agent_id: str):
+    """Lease queued runs matching the agent's labels, up to its free capacity."""
+    from app.task_manager import start_agent_run, requeue_expired_agent_runs
+
+    agent = run_queue.get_agent(agent_id, touch=True)
+    if not agent:
+        return jsonify({"success": False, "error": "Unknown agent, please register again"}), 404
+
+    # Recover runs from agents that died before handing out new work
+    requeue_expired_agent_runs()
+
+    data = request.get_json(silent=True) or {}
+    try:
+        requested = int(data.get('max_runs', 1))
+    except (TypeError, ValueError):
+        requested = 1
+    active_runs = next((a['active_runs'] for a in run_queue.list_agents() if a['agent_id'] == agent_id), 0)
+    max_runs = min(requested, agent['capacity'] - active_runs)
+
+    runs = run_queue.lease_runs(agent_id, agent['labels'], max_runs, current_app.config['AGENT_LEASE_SECONDS'])
+    for run in runs:
+        with run_context(run['run_id'], run['job_id']):
+            start_agent_run(run)
+
+    return jsonify({
+        "success": True,
+        "runs": [{"run_id": run['run_id'], "job_id": run['job_id'], "payload": run['payload']} for run in runs]
+    })
+
+@agents_bp.route("/runs/<run_id>/output", methods=["POST"])
+def append_output(run_id: str):
+    """Append a chunk of streamed output to the run's log file."""
+    data = request.get_json(silent=True) or {}
+    run = run_queue.get_run(run_id)
+    if not run or run['status'] != run_queue.RUN_LEASED or run['lease_owner'] != data.get('agent_id'):
+        return jsonify({"success": False, "error": "Run is not leased by this agent"}), 409
+
+    runs_dir = Path(current_app.config['RUNS_DIR'])
+    with open(runs_dir / f"{run_id}.log", 'a', encoding='utf-8') as f:
+        f.write(data.get('output', ''))
+    return jsonify({"success": True})
+
+@agents_bp.route("/runs/<run_id>/complete", methods=["POST"])
+def complete(run_id: str):
+    """Record the result of a run executed by an agent."""
+    from app.task_manager import complete_agent_run
+
+    data = request.get_json(silent=True) or {}
+    with run_context(run_id):
+        completed = complete_agent_run(run_id, data.get('agent_id'), data.get('result'))
+    if not completed:
+        return jsonify({"success": False, "error": "Run is not leased by this agent"}), 409
+    return jsonify({"success": True})
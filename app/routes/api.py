@@ -0,0 +1,387 @@
+"""
+JSON API routes for EzTaskRunner.
+
+Version 1 of the API for automation: tasks can be listed, created, read,
+updated and deleted, and their runs queued, listed and read, without going
+through the HTML forms.
+
+Responses carry strong ETags. A task's ETag is derived from its version,
+which every saved change raises, so clients polling with If-None-Match get
+a 304 until the task changes, and updates and deletes sent with If-Match get
+a 412 instead of overwriting a change made in between.
+"""
+import hashlib
+import json
+import logging
+import uuid
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Any, Optional
+
+from flask import Blueprint, request, jsonify, current_app, url_for
+from werkzeug.datastructures import MultiDict
+
+from app.routes.tasks import read_task_settings, read_schedule_settings
+from app.utils.task_helpers import validate_script_path, get_script_type, run_task
+from app.utils.constants import STATUS_PENDING
+from app.utils.compression import load_json_file
+
+# Create blueprint
+api_bp = Blueprint('api', __name__, url_prefix='/api/v1')
+
+# True/false task settings; in the task form these are checkboxes
+BOOLEAN_FIELDS = ('enabled', 'email_notifications_enabled', 'auto_retry_enabled',
+                  'circuit_breaker_enabled', 'profile_next_run')
+
+# Task settings stored under a different name than their task form field
+FORM_FIELDS = {'email_notifications_enabled': 'email_notifications'}
+
+# Fields making up a task's schedule
+SCHEDULE_FIELDS = ('trigger_type', 'schedule_time', 'interval_hours', 'interval_minutes',
+                   'interval_seconds', 'cron_expression')
+
+# Fields set by the application rather than by clients
+READ_ONLY_FIELDS = ('job_id', 'script_path', 'script_type', 'created_at', 'status', 'version')
+
+# Fields of a run record left out of run lists; read a single run for them
+RUN_DETAIL_FIELDS = ('output', 'error', 'profile')
+
+# Default and largest number of runs in a run list
+DEFAULT_RUN_LIMIT = 50
+MAX_RUN_LIMIT = 500
+
+@api_bp.before_request
+def check_api_token():
+    """Reject API requests without the configured token."""
+    token = current_app.config.get('API_TOKEN')
+    if token and request.headers.get('X-API-Token') != token:
+        logging.getLogger("EzTaskRunner").warning(f"Rejected API request from {request.remote_addr}: invalid token")
+        return _error("Invalid API token", 401)
+    return None
+
+def _error(message: str, status: int):
+    """Build an error response."""
+    return jsonify({"success": False, "error": message}), status
+
+def _task_etag(task: Dict[str, Any]) -> str:
+    """Get the ETag of a task, derived from its version."""
+    return f"v{task.get('version', 0)}"
+
+def _digest_etag(value: Any) -> str:
+    """Get an ETag for a response made up of several parts."""
+    return hashlib.sha1(json.dumps(value, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+def _conditional(payload: Dict[str, Any], etag: str, status: int = 200):
+    """Build a JSON response with an ETag, or a 304 if the client's copy is current."""
+    response = jsonify(payload)
+    response.status_code = status
+    response.set_etag(etag)
+    return response.make_conditional(request)
+
+def _precondition_failed(task: Dict[str, Any]) -> bool:
+    """Check whether the request's If-Match header rules out changing the task."""
+    return bool(request.if_match) and not request.if_match.contains(_task_etag(task))
+
+def _read_json() -> Optional[Dict[str, Any]]:
+    """Get the request's JSON object, or None if the body is not one."""
+    data = request.get_json(silent=True)
+    return data if isinstance(data, dict) else None
+
+def _check_fields(data: Dict[str, Any]) -> Optional[str]:
+    """
+    Check the types of the task fields in a request.
+
+    Args:
+        data: The request's JSON object
+
+    Returns:
+        An error message, or None if the fields are valid
+    """
+    for field in BOOLEAN_FIELDS:
+        if field in data and not isinstance(data[field], bool):
+            return f"'{field}' must be true or false"
+    for field in ('task_name', 'description', 'script_type'):
+        if field in data and not isinstance(data[field], str):
+            return f"'{field}' must be a string"
+    for field in ('labels', 'tags'):
+        if field in data and not isinstance(data[field], (list, str)):
+            return f"'{field}' must be a list or a comma-separated string"
+    return None
+
+def _form_values(task: Dict[str, Any], data: Dict[str, Any]) -> MultiDict:
+    """
+    Express a task's settings, overlaid with the fields of a request, as
+    submitted task form values, so they are validated by the same readers
+    as the task forms.
+
+    Args:
+        task: The stored task (empty for a new task)
+        data: The request's JSON object
+
+    Returns:
+        MultiDict: The form values
+    """
+    values = MultiDict()
+    for field, value in {**task, **data}.items():
+        field = FORM_FIELDS.get(field, field)
+        if isinstance(value, bool):
+            # Checkboxes are only submitted when ticked
+            if value:
+                values[field] = 'on'
+        elif isinstance(value, list):
+            values[field] = ','.join(str(item) for item in value)
+        elif isinstance(value, (str, int, float)):
+            values[field] = str(value)
+    return values
+
+def _run_summary(record: Dict[str, Any]) -> Dict[str, Any]:
+    """Get a run record without its output, error and profile."""
+    return {key: value for key, value in record.items() if key not in RUN_DETAIL_FIELDS}
+
+def _history_files(job_id: str):
+    """Get the history files of a task, oldest first."""
+    history_dir = Path(current_app.config['TASK_HISTORY_DIR'])
+    return sorted(history_dir.glob(f"{job_id}_*.json*"), key=lambda path: path.name)
+
+@api_bp.route("/tasks", methods=["GET"])
+def list_tasks():
+    """
+    List tasks a page at a time.
+
+    Takes the query parameters of the dashboard task list: search, status,
+    script_type, tag, enabled, sort, order, limit and cursor.
+    """
+    from app.views.dashboard import search_tasks
+
+    try:
+        _, results = search_tasks(request.args)
+    except ValueError as e:
+        return _error(str(e), 400)
+
+    payload = {
+        "success": True,
+        "tasks": results['tasks'],
+        "total": results['total'],
+        "next_cursor": results['next_cursor']
+    }
+    etag = _digest_etag([[task.get('job_id'), task.get('version', 0)] for task in results['tasks']]
+                        + [results['total'], results['next_cursor']])
+    return _conditional(payload, etag)
+
+@api_bp.route("/tasks", methods=["POST"])
+def create_task():
+    """Create a task from a JSON object with the fields of the task form."""
+    from app.task_manager import add_task_to_store
+    logger = logging.getLogger("EzTaskRunner")
+
+    data = _read_json()
+    if data is None:
+        return _error("Expected a JSON object", 400)
+    error = _check_fields(data)
+    if error:
+        return _error(error, 400)
+
+    try:
+        validated_script = validate_script_path(str(data.get('script_path') or ''))
+    except ValueError as e:
+        return _error(str(e), 400)
+
+    # New tasks are enabled and notify by email unless the request says otherwise
+    values = _form_values({'enabled': True, 'email_notifications_enabled': True}, data)
+    try:
+        trigger, schedule = read_schedule_settings(values)
+    except ValueError as e:
+        return _error(str(e), 400)
+
+    job_id = str(uuid.uuid4())
+    task_data: Dict[str, Any] = {
+        "job_id": job_id,
+        "task_name": data.get('task_name') or f"Task-{Path(validated_script).stem}",
+        "description": data.get('description') or "",
+        "script_path": validated_script,
+        "script_type": data.get('script_type') or get_script_type(validated_script),
+        "created_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "status": STATUS_PENDING
+    }
+    task_data.update(schedule)
+    task_data.update(read_task_settings(values))
+
+    # In web mode the worker schedules the task when add_task_to_store notifies it
+    scheduler = current_app.config.get('SCHEDULER')
+    if scheduler and task_data['enabled']:
+        scheduler.add_job(func=run_task, trigger=trigger, args=[job_id], id=job_id)
+    add_task_to_store(job_id, task_data)
+    logger.info(f"Task '{task_data['task_name']}' (ID: {job_id}) created through the API")
+
+    response = _conditional({"success": True, "task": task_data}, _task_etag(task_data), 201)
+    response.headers['Location'] = url_for('api.get_task', job_id=job_id)
+    return response
+
+@api_bp.route("/tasks/<job_id>", methods=["GET"])
+def get_task(job_id: str):
+    """Get a task."""
+    from app.task_manager import get_task as get_stored_task
+
+    task = get_stored_task(job_id)
+    if not task:
+        return _error(f"Task {job_id} not found", 404)
+    return _conditional({"success": True, "task": task}, _task_etag(task))
+
+@api_bp.route("/tasks/<job_id>", methods=["PATCH"])
+def update_task(job_id: str):
+    """
+    Change some of a task's settings; fields not in the request keep their
+    values. The script path cannot be changed.
+    """
+    from app.task_manager import get_task as get_stored_task, update_task as update_stored_task
+
+    task = get_stored_task(job_id)
+    if not task:
+        return _error(f"Task {job_id} not found", 404)
+    if _precondition_failed(task):
+        return _error("The task was changed since it was read", 412)
+
+    data = _read_json()
+    if data is None:
+        return _error("Expected a JSON object", 400)
+    read_only = [field for field in READ_ONLY_FIELDS if field in data]
+    if read_only:
+        return _error(f"Fields cannot be changed: {', '.join(read_only)}", 400)
+    error = _check_fields(data)
+    if error:
+        return _error(error, 400)
+
+    values = _form_values(task, data)
+    changes = read_task_settings(values)
+    for field in ('task_name', 'description'):
+        if field in data:
+            changes[field] = data[field]
+    if any(field in data for field in SCHEDULE_FIELDS):
+        try:
+            _, schedule = read_schedule_settings(values)
+        except ValueError as e:
+            return _error(str(e), 400)
+        changes.update(schedule)
+
+    # Checked again under the task store's lock, against updates racing this one
+    version = task.get('version', 0) if request.if_match else None
+    if not update_stored_task(job_id, changes, expected_version=version):
+        current = get_stored_task(job_id)
+        if current and version is not None and current.get('version', 0) != version:
+            return _error("The task was changed since it was read", 412)
+        return _error("Failed to update the task", 500)
+
+    task = get_stored_task(job_id)
+    return _conditional({"success": True, "task": task}, _task_etag(task))
+
+@api_bp.route("/tasks/<job_id>", methods=["DELETE"])
+def delete_task(job_id: str):
+    """Delete a task."""
+    from app.task_manager import get_task as get_stored_task, delete_task_from_store
+
+    task = get_stored_task(job_id)
+    if not task:
+        return _error(f"Task {job_id} not found", 404)
+    if _precondition_failed(task):
+        return _error("The task was changed since it was read", 412)
+
+    if not delete_task_from_store(job_id):
+        return _error("Failed to delete the task", 500)
+    return "", 204
+
+@api_bp.route("/tasks/<job_id>/runs", methods=["POST"])
+def create_run(job_id: str):
+    """Queue a run of a task now."""
+    from app.task_manager import get_task as get_stored_task, queue_task_run
+
+    if not get_stored_task(job_id):
+        return _error(f"Task {job_id} not found", 404)
+
+    result = queue_task_run(job_id)
+    if not result.get("success"):
+        if result.get("running"):
+            return _error(result["error"], 409)
+        return _error(result.get("error") or "Failed to queue the run", 500)
+
+    run_id = result.get("run_id")
+    response = jsonify({"success": True, "run_id": run_id})
+    response.status_code = 202
+    if run_id:
+        response.headers['Location'] = url_for('api.get_run', job_id=job_id, run_id=run_id)
+    return response
+
+@api_bp.route("/tasks/<job_id>/runs", methods=["GET"])
+def list_runs(job_id: str):
+    """
+    List a task's finished runs, newest first, without their output.
+
+    Query parameters: limit (up to MAX_RUN_LIMIT).
+    """
+    from app.task_manager import get_task as get_stored_task
+
+    if not get_stored_task(job_id):
+        return _error(f"Task {job_id} not found", 404)
+    limit = max(1, min(MAX_RUN_LIMIT, request.args.get('limit', DEFAULT_RUN_LIMIT, type=int)))
+
+    # History files are written once, so their names identify the list; a
+    # current client copy is confirmed without reading them
+    history_files = _history_files(job_id)
+    etag = _digest_etag([path.name for path in history_files] + [limit])
+    if request.if_none_match.contains(etag):
+        return _conditional({}, etag)
+
+    records = []
+    for history_file in history_files:
+        try:
+            records.append(load_json_file(history_file))
+        except Exception as e:
+            logging.getLogger("EzTaskRunner").error(f"Error reading history file {history_file}: {str(e)}")
+    records.sort(key=lambda record: record.get('timestamp', ''), reverse=True)
+
+    payload = {
+        "success": True,
+        "runs": [_run_summary(record) for record in records[:limit]],
+        "total": len(records)
+    }
+    return _conditional(payload, etag)
+
+@api_bp.route("/tasks/<job_id>/runs/<run_id>", methods=["GET"])
+def get_run(job_id: str, run_id: str):
+    """
+    Get a run of a task with its output and error.
+
+    Runs that have not finished yet are reported with their run queue status
+    and without an ETag.
+    """
+    from app.task_manager import get_task as get_stored_task
+    from app.run_queue import get_run as get_queued_run
+
+    if not get_stored_task(job_id):
+        return _error(f"Task {job_id} not found", 404)
+
+    # Newest first: recent runs are the ones usually asked for
+    for history_file in reversed(_history_files(job_id)):
+        try:
+            record = load_json_file(history_file)
+        except Exception as e:
+            logging.getLogger("EzTaskRunner").error(f"Error reading history file {history_file}: {str(e)}")
+            continue
+        if record.get('run_id') == run_id:
+            # A finished run's record does not change
+            return _conditional({"success": True, "run": record}, run_id)
+
+    run = get_queued_run(run_id)
+    if not run or run.get('job_id') != job_id:
+        return _error(f"Run {run_id} not found", 404)
+
+    response = jsonify({
+        "success": True,
+        "run": {
+            "run_id": run_id,
+            "status": run['status'],
+            "enqueued_at": run.get('enqueued_at'),
+            "attempt": run.get('attempt')
+        }
+    })
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
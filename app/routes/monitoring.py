@@ -9,6 +9,10 @@ from flask import Blueprint, send_from_directory, request, flash, redirect, url_
 # Create blueprint
 monitoring_bp = Blueprint('monitoring', __name__, url_prefix='')
 
+# Longest wait of a status feed long poll, and the most time between messages on a stream
+EVENT_POLL_SECONDS = 30
+EVENT_KEEPALIVE_SECONDS = 15
+
 @monitoring_bp.route("/monitoring", methods=["GET"])
 def monitoring_dashboard():
     """Show monitoring dashboard with system metrics and logs."""
@@ -28,6 +32,106 @@ def download_log(filename: str):
         flash(f"Error downloading log file: {str(e)}", "danger")
         return redirect(url_for('monitoring.monitoring_dashboard'))
 
+def _log_read_args(args):
+    """
+    Get the log_reader.read_log arguments from request query parameters.
+    
+    Raises:
+        ValueError: If 'since' is not an ISO date and time
+    """
+    from datetime import datetime
+    
+    since = args.get('since')
+    return {
+        'tail': args.get('tail', type=int),
+        'before': args.get('before', type=int),
+        'offset': args.get('offset', type=int),
+        'since': datetime.fromisoformat(since) if since else None,
+        'limit': args.get('limit', 200, type=int),
+        'start': args.get('start', type=int),
+        'end': args.get('end', type=int)
+    }
+
+@monitoring_bp.route("/api/logs/<filename>")
+def read_log_part(filename: str):
+    """
+    Return part of a log file as JSON.
+    
+    Query parameters: 'tail' (last lines, optionally 'before' a byte offset),
+    'offset' or 'since' (an ISO date and time) with 'limit' (lines from there),
+    or 'start'/'end' (a byte range). The 'start' and 'end' offsets in the reply
+    are used to page back ('before') and forward ('offset').
+    """
+    logger = logging.getLogger("EzTaskRunner")
+    from app.log_reader import resolve_log_path, read_log
+    
+    log_path = resolve_log_path(current_app.config['LOG_DIR'], filename)
+    if not log_path:
+        return jsonify({'success': False, 'error': f"Log file not found: {filename}"}), 404
+    try:
+        read_args = _log_read_args(request.args)
+    except ValueError as e:
+        return jsonify({'success': False, 'error': f"Invalid 'since' time: {str(e)}"}), 400
+    
+    try:
+        part = read_log(log_path, current_app.config['STATE_DIR'], **read_args)
+        return jsonify({'success': True, 'file': filename, **part})
+    except Exception as e:
+        logger.error(f"Error reading log file {filename}: {str(e)}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@monitoring_bp.route("/view_log/<filename>")
+def view_log(filename: str):
+    """Show part of a log file, by default its last lines."""
+    logger = logging.getLogger("EzTaskRunner")
+    from app.log_reader import resolve_log_path, read_log
+    from app.views.monitoring import render_log_viewer
+    
+    log_path = resolve_log_path(current_app.config['LOG_DIR'], filename)
+    if not log_path:
+        flash(f"Log file not found: {filename}", "danger")
+        return redirect(url_for('monitoring.monitoring_dashboard'))
+    
+    try:
+        read_args = _log_read_args(request.args)
+        read_args['start'] = read_args['end'] = None  # The viewer shows whole lines
+        part = read_log(log_path, current_app.config['STATE_DIR'], **read_args)
+        return render_log_viewer(filename, part, read_args)
+    except Exception as e:
+        logger.error(f"Error reading log file {filename}: {str(e)}")
+        flash(f"Error reading log file: {str(e)}", "danger")
+        return redirect(url_for('monitoring.monitoring_dashboard'))
+
+@monitoring_bp.route("/api/search")
+def search_json():
+    """
+    Search run output and the application logs, newest first.
+    
+    Query parameters: 'q' (the text to find), 'kind' ('run' or 'log'),
+    'job_id' and 'limit'.
+    """
+    logger = logging.getLogger("EzTaskRunner")
+    from app.search_index import search
+    
+    try:
+        result = search(
+            current_app.config['STATE_DIR'],
+            request.args.get('q', ''),
+            kind=request.args.get('kind') or None,
+            job_id=request.args.get('job_id') or None,
+            limit=request.args.get('limit', 50, type=int)
+        )
+        return jsonify(result), 200 if result['success'] else 400
+    except Exception as e:
+        logger.error(f"Error searching: {str(e)}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@monitoring_bp.route("/search")
+def search_page():
+    """Search run output and the application logs."""
+    from app.views.monitoring import render_search_page
+    return render_search_page()
+
 @monitoring_bp.route("/purge_logs", methods=["POST"])
 def purge_logs():
     """Purge old log files."""
@@ -55,7 +159,7 @@ def purge_logs():
         
         # Flash result
         if result['success']:
-            flash(f"Successfully purged {result['purged_count']} log files older than {days_to_keep} days", "success")
+            flash(f"Successfully purged {result['purged_count']} log files older than {days_to_keep} days ({result['reclaimed_bytes'] / (1024 * 1024):.1f} MB reclaimed)", "success")
         else:
             flash(f"Error purging logs: {result['error']}", "danger")
         
@@ -76,15 +180,15 @@ def get_metrics_json():
     try:
         # Import necessary functions
         from app.utils import get_system_metrics
-        from app.task_manager import get_all_tasks
+        from app.task_index import get_task_index
         from datetime import datetime
         
         # Get system metrics
         metrics = get_system_metrics()
         
-        # Get running tasks
-        all_tasks = get_all_tasks()
-        running_tasks = [task for task in all_tasks if task.get('status') == 'RUNNING']
+        # Get all running tasks from the task index rather than reading every task file
+        task_index = get_task_index(current_app.config['TASKS_DIR'])
+        running_tasks = task_index.tasks_with('status', 'RUNNING')
         
         # Format active tasks for JSON response
         active_tasks = []
@@ -120,4 +224,121 @@ def get_metrics_json():
         return jsonify(metrics)
     except Exception as e:
         logger.error(f"Error getting metrics JSON: {str(e)}")
-        return jsonify({'error': str(e)}), 500 
\ No newline at end of file
+        return jsonify({'error': str(e)}), 500 
+
+@monitoring_bp.route("/api/events")
+def status_events():
+    """
+    Status feed of task state transitions and system metric samples.
+    
+    Subscribers pass the ID of the last event they have seen ('last_event_id',
+    or the Last-Event-ID header EventSource sends when it reconnects) and
+    receive only the events after it. Clients accepting text/event-stream get
+    a stream of server-sent events; others a JSON long-poll reply, sent when
+    an event arrives or after 'timeout' seconds (at most EVENT_POLL_SECONDS).
+    """
+    import json
+    import time
+    from flask import Response, stream_with_context
+    from app.event_bus import get_events
+    
+    event_id = request.args.get('last_event_id') or request.headers.get('Last-Event-ID') or None
+    
+    if request.accept_mimetypes.best_match(['application/json', 'text/event-stream']) == 'text/event-stream':
+        def stream(event_id):
+            # Reconnect after 3 seconds if the connection drops
+            yield "retry: 3000\n\n"
+            while True:
+                reply = get_events(event_id, EVENT_KEEPALIVE_SECONDS)
+                if not reply.get('success'):
+                    # End the stream; the client reconnects and resumes from its last event
+                    yield f": {reply.get('error')}\n\n"
+                    return
+                if reply['reset']:
+                    yield f"id: {reply['last_event_id']}\nevent: reset\ndata: {{}}\n\n"
+                for event in reply['events']:
+                    yield f"id: {event['id']}\nevent: {event['type']}\ndata: {json.dumps(event, default=str)}\n\n"
+                if not reply['events'] and not reply['reset']:
+                    # Keeps proxies from closing an idle connection
+                    yield ": keepalive\n\n"
+                event_id = reply['last_event_id']
+        
+        return Response(stream_with_context(stream(event_id)), mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    
+    # Long poll: in web mode the worker answers within its command timeout, so ask again until the deadline
+    timeout = max(0.0, min(EVENT_POLL_SECONDS, request.args.get('timeout', 0, type=float)))
+    deadline = time.time() + timeout
+    while True:
+        reply = get_events(event_id, max(0.0, deadline - time.time()))
+        if not reply.get('success'):
+            return jsonify(reply), 503
+        if reply['events'] or reply['reset'] or time.time() >= deadline:
+            return jsonify(reply)
+        event_id = reply['last_event_id']
+
+@monitoring_bp.route("/metrics")
+def prometheus_metrics():
+    """
+    Return run, queue, scheduler and storage metrics in the Prometheus text format.
+    In web mode the metrics are fetched from the worker, which executes the runs.
+    """
+    from flask import Response
+    from app.metrics import render_metrics
+    
+    content_type = "text/plain; version=0.0.4; charset=utf-8"
+    if current_app.config.get('RUN_MODE') == 'web':
+        from app.worker import notify_worker
+        reply = notify_worker('metrics')
+        if not reply.get('success'):
+            return Response(f"# {reply.get('error', 'Worker is not reachable')}\n", status=503, content_type=content_type)
+        return Response(reply['text'], content_type=content_type)
+    
+    return Response(render_metrics(), content_type=content_type)
+
+@monitoring_bp.route("/api/history/export", methods=["POST"])
+def export_history_columns():
+    """
+    Export the task history runs added since the last export to columnar part files.
+    Returns the export summary as JSON.
+    """
+    from app.history_export import export_history
+    
+    result = export_history(current_app.config['TASK_HISTORY_DIR'], current_app.config['EXPORT_DIR'])
+    return jsonify(result), 200 if result['success'] else 500
+
+@monitoring_bp.route("/api/history/analytics")
+def history_analytics():
+    """
+    Return aggregates over the exported task history as JSON.
+    
+    Brings the export up to date first. Query parameters: 'days' limits the
+    runs to the last number of days, 'job_id' to one task.
+    """
+    logger = logging.getLogger("EzTaskRunner")
+    
+    try:
+        import time
+        from app.history_export import export_history, load_history_columns, compute_history_analytics
+        
+        export = export_history(current_app.config['TASK_HISTORY_DIR'], current_app.config['EXPORT_DIR'])
+        if not export['success']:
+            return jsonify(export), 500
+        
+        days = request.args.get('days', type=float)
+        analytics = compute_history_analytics(
+            load_history_columns(current_app.config['EXPORT_DIR']),
+            since=time.time() - days * 86400 if days else None,
+            job_id=request.args.get('job_id') or None
+        )
+        analytics['export'] = {key: export[key] for key in ('format', 'total_rows', 'rows_exported')}
+        return jsonify(analytics)
+    except Exception as e:
+        logger.error(f"Error computing history analytics: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@monitoring_bp.route("/download_history_export/<filename>")
+def download_history_export(filename: str):
+    """Download a part file of the columnar history export."""
+    return send_from_directory(current_app.config['EXPORT_DIR'], filename, as_attachment=True)
+
@@ -7,6 +7,11 @@ import json
 import logging
 from flask import Blueprint, request, render_template, flash, redirect, url_for, current_app, jsonify
 
+from app.log_pipeline import (
+    CONFIGURABLE_LOGGERS, VALID_LEVELS, apply_logging_settings, format_log_levels,
+    format_rate_limits, get_log_levels, parse_rate_limits
+)
+
 # Create blueprint
 settings_bp = Blueprint('settings', __name__, url_prefix='')
 
@@ -28,6 +33,11 @@ def settings():
             
             # Get logging settings
             log_level = request.form.get('log_level', 'INFO')
+            log_levels = {
+                name: request.form.get(f'log_level_{name}', '')
+                for name in CONFIGURABLE_LOGGERS if name != 'EzTaskRunner'
+            }
+            rate_limits_spec = request.form.get('log_rate_limits', '').strip()
             
             # Validate settings
             try:
@@ -38,10 +48,15 @@ def settings():
                 flash("Invalid SMTP port. Please enter a valid port number.", "error")
                 return redirect(url_for('settings.settings'))
             
-            # Validate log level
-            valid_log_levels = ['DEBUG', 'INFO', 'WARNING', 'ERROR', 'CRITICAL']
-            if log_level not in valid_log_levels:
+            # Validate log levels
+            if log_level not in VALID_LEVELS:
                 log_level = 'INFO'  # Default to INFO if invalid
+            log_levels = {name: level for name, level in log_levels.items() if level in VALID_LEVELS}
+            try:
+                rate_limits = parse_rate_limits(rate_limits_spec)
+            except ValueError as e:
+                flash(str(e), "error")
+                return redirect(url_for('settings.settings'))
             
             # Save settings to environment variables (these will be lost on application restart)
             # In a production app, you'd want to save these to a config file
@@ -53,6 +68,8 @@ def settings():
             os.environ['EMAIL_SENDER'] = email_sender
             os.environ['EMAIL_RECIPIENTS'] = email_recipients
             os.environ['LOG_LEVEL'] = log_level
+            os.environ['LOG_LEVELS'] = format_log_levels(log_levels)
+            os.environ['LOG_RATE_LIMITS'] = format_rate_limits(rate_limits)
             
             # Update application config
             current_app.config['EMAIL_NOTIFICATIONS_ENABLED'] = enable_email
@@ -63,17 +80,23 @@ def settings():
             current_app.config['EMAIL_SENDER'] = email_sender
             current_app.config['EMAIL_RECIPIENTS'] = email_recipients.split(',')
             current_app.config['LOG_LEVEL'] = log_level
+            current_app.config['LOG_LEVELS'] = log_levels
+            current_app.config['LOG_RATE_LIMITS'] = rate_limits
             
-            # Reconfigure logging with the new log level
-            log_level_const = getattr(logging, log_level, logging.INFO)
-            
-            # Update root logger
-            logging.getLogger().setLevel(log_level_const)
+            # Apply the logging settings live; loggers left blank follow their parent
+            logging_settings = {
+                'log_level': log_level,
+                'log_levels': {name: log_levels.get(name, '') for name in CONFIGURABLE_LOGGERS if name != 'EzTaskRunner'},
+                'rate_limits': format_rate_limits(rate_limits),
+            }
+            apply_logging_settings(logging_settings)
             
-            # Update app loggers
-            logging.getLogger('EzTaskRunner').setLevel(log_level_const)
-            logging.getLogger('EzTaskRunner.Tasks').setLevel(log_level_const)
-            logging.getLogger('EzTaskRunner.Tools').setLevel(log_level_const)
+            # The worker process logs on its own; send it the same settings
+            if current_app.config.get('RUN_MODE') == 'web':
+                from app.worker import notify_worker
+                reply = notify_worker('logging_settings', settings=logging_settings)
+                if not reply.get('success'):
+                    flash(f"Logging settings were not applied to the worker: {reply.get('error')}", "warning")
             
             logger.info(f"Settings updated. Log level set to {log_level}")
             flash("Settings updated successfully.", "success")
@@ -87,6 +110,8 @@ def settings():
     return render_template(
         'settings.html',
         config=current_app.config,
+        log_levels=get_log_levels(),
+        log_rate_limits=format_rate_limits(current_app.config.get('LOG_RATE_LIMITS') or {}),
         title="Settings"
     )
 
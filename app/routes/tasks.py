@@ -9,25 +9,305 @@ import logging
 import traceback
 from datetime import datetime
 from pathlib import Path
-from typing import Dict, Any
+from typing import Dict, Any, Tuple
 
 from flask import Blueprint, request, render_template, redirect, url_for, flash, jsonify, current_app
 from apscheduler.triggers.date import DateTrigger
 from apscheduler.triggers.interval import IntervalTrigger
 from apscheduler.triggers.cron import CronTrigger
 
-from app.utils.task_helpers import parse_datetime, validate_script_path, run_task
+from app.utils.task_helpers import parse_datetime, validate_script_path, get_script_type, run_task
 from app.utils.constants import STATUS_PENDING
+from app.run_queue import normalize_labels
 
 # Create blueprint
 tasks_bp = Blueprint('tasks', __name__, url_prefix='')
 
+def read_retry_backoff_settings(form) -> Dict[str, Any]:
+    """
+    Read the retry backoff settings from a submitted task form.
+    
+    Args:
+        form: The request form
+        
+    Returns:
+        dict: Backoff multiplier, maximum retry interval and maximum elapsed time
+    """
+    settings = {}
+    
+    # Multiplier applied to the retry interval after each failed attempt (1-10)
+    try:
+        settings['retry_backoff_multiplier'] = max(1.0, min(10.0, float(form.get('retry_backoff_multiplier', 2))))
+    except ValueError:
+        settings['retry_backoff_multiplier'] = 2.0
+    
+    # Longest delay between attempts in minutes (1-1440)
+    retry_max_interval = form.get('retry_max_interval')
+    if retry_max_interval and retry_max_interval.isdigit():
+        settings['retry_max_interval'] = max(1, min(1440, int(retry_max_interval)))
+    else:
+        settings['retry_max_interval'] = 60
+    
+    # Minutes after the first attempt when no more retries are started (0 = no limit)
+    retry_max_elapsed = form.get('retry_max_elapsed')
+    if retry_max_elapsed and retry_max_elapsed.isdigit():
+        settings['retry_max_elapsed'] = int(retry_max_elapsed)
+    else:
+        settings['retry_max_elapsed'] = 0
+    
+    return settings
+
+def read_circuit_breaker_settings(form) -> Dict[str, Any]:
+    """
+    Read the circuit breaker settings from a submitted task form.
+    
+    Args:
+        form: The request form
+        
+    Returns:
+        dict: Whether the breaker is enabled and its thresholds
+    """
+    settings = {'circuit_breaker_enabled': 'circuit_breaker_enabled' in form}
+    
+    # (field, default, minimum, maximum); a threshold of 0 disables that check
+    for field, default, minimum, maximum in (
+        ('circuit_failure_threshold', 5, 0, 100),   # Consecutive failures
+        ('circuit_error_rate', 50, 0, 100),         # Percent of runs in the window
+        ('circuit_min_runs', 10, 1, 1000),          # Runs needed before the error rate counts
+        ('circuit_window_minutes', 60, 1, 10080),
+        ('circuit_cooldown_minutes', 15, 1, 10080)  # Time open before a probe run
+    ):
+        value = form.get(field)
+        if value and value.isdigit():
+            settings[field] = max(minimum, min(maximum, int(value)))
+        else:
+            settings[field] = default
+    
+    return settings
+
+def read_runtime_regression_settings(form) -> Dict[str, Any]:
+    """
+    Read the runtime regression settings from a submitted task form.
+    
+    Args:
+        form: The request form
+        
+    Returns:
+        dict: Regression factor and the runs needed before runs are compared
+    """
+    settings = {}
+    
+    # Runs slower than this multiple of the baseline median are flagged (0 = off, otherwise 1.1-100)
+    try:
+        factor = float(form.get('runtime_regression_factor', 2))
+        settings['runtime_regression_factor'] = 0 if factor <= 0 else max(1.1, min(100.0, factor))
+    except ValueError:
+        settings['runtime_regression_factor'] = 2.0
+    
+    # Successful runs in the baseline before runs are compared (1-1000)
+    min_runs = form.get('runtime_baseline_min_runs')
+    if min_runs and min_runs.isdigit():
+        settings['runtime_baseline_min_runs'] = max(1, min(1000, int(min_runs)))
+    else:
+        settings['runtime_baseline_min_runs'] = 10
+    
+    return settings
+
+def read_history_retention_settings(form) -> Dict[str, Any]:
+    """
+    Read the task's history retention overrides from a submitted task form.
+    
+    Args:
+        form: The request form
+        
+    Returns:
+        dict: Days to keep full history records and daily rollups; None uses
+        the global setting
+    """
+    settings = {}
+    for field in ('history_retention_days', 'history_rollup_days'):
+        value = form.get(field, '').strip()
+        settings[field] = min(36500, int(value)) if value.isdigit() else None
+    return settings
+
+def read_profiling_settings(form) -> Dict[str, Any]:
+    """
+    Read the profiling settings from a submitted task form.
+    
+    Args:
+        form: The request form
+        
+    Returns:
+        dict: Profiling mode, whether the next run is profiled and the profiling interval
+    """
+    from app.utils.profile_runner import PROFILE_CPROFILE, PROFILE_MODES
+    
+    profile_mode = form.get('profile_mode', PROFILE_CPROFILE)
+    settings = {
+        'profile_mode': profile_mode if profile_mode in PROFILE_MODES else PROFILE_CPROFILE,
+        'profile_next_run': 'profile_next_run' in form
+    }
+    
+    # Profile every Nth run (0 = off)
+    profile_every_n = form.get('profile_every_n')
+    if profile_every_n and profile_every_n.isdigit():
+        settings['profile_every_n'] = min(10000, int(profile_every_n))
+    else:
+        settings['profile_every_n'] = 0
+    
+    return settings
+
+def read_task_settings(form) -> Dict[str, Any]:
+    """
+    Read the settings of a new task from a submitted task form.
+    
+    Args:
+        form: The request form
+    
+    Returns:
+        dict: Enabled flags, runtime limit, retry, circuit breaker, regression,
+        profiling and retention settings, tags and labels
+    """
+    settings: Dict[str, Any] = {
+        "enabled": 'enabled' in form,
+        "email_notifications_enabled": 'email_notifications' in form
+    }
+    
+    # Get max runtime in minutes
+    max_runtime = form.get('max_runtime')
+    if max_runtime and max_runtime.isdigit():
+        settings['max_runtime'] = int(max_runtime)
+    else:
+        settings['max_runtime'] = 60  # Default to 60 minutes
+    
+    # Auto-retry settings
+    settings['auto_retry_enabled'] = 'auto_retry_enabled' in form
+    
+    # Get retry attempts
+    retry_attempts = form.get('retry_attempts')
+    if retry_attempts and retry_attempts.isdigit():
+        retry_attempts = int(retry_attempts)
+        # Ensure value is between 1-5
+        settings['retry_attempts'] = max(1, min(5, retry_attempts))
+    else:
+        settings['retry_attempts'] = 3  # Default to 3 attempts
+    
+    # Get retry interval
+    retry_interval = form.get('retry_interval')
+    if retry_interval and retry_interval.isdigit():
+        retry_interval = int(retry_interval)
+        # Ensure value is between 1-60
+        settings['retry_interval'] = max(1, min(60, retry_interval))
+    else:
+        settings['retry_interval'] = 5  # Default to 5 minutes
+    
+    # Exponential backoff between retries
+    settings.update(read_retry_backoff_settings(form))
+    
+    # Circuit breaker for chronically failing tasks
+    settings.update(read_circuit_breaker_settings(form))
+    
+    # Flag runs that are slower than the task's runtime baseline
+    settings.update(read_runtime_regression_settings(form))
+    
+    # Opt-in profiling of Python scripts
+    settings.update(read_profiling_settings(form))
+    
+    # Per-task history retention
+    settings.update(read_history_retention_settings(form))
+    
+    # Tags organise the dashboard; they do not affect where the task runs
+    settings['tags'] = normalize_labels(form.get('tags', ''))
+    
+    # Label selector: tasks with labels run on matching worker agents
+    settings['labels'] = normalize_labels(form.get('labels', ''))
+    
+    return settings
+
+def read_schedule_settings(form) -> Tuple[Any, Dict[str, Any]]:
+    """
+    Read a task's schedule from a submitted task form.
+    
+    Args:
+        form: The request form
+    
+    Returns:
+        tuple: The APScheduler trigger and the schedule settings to store
+        with the task
+    
+    Raises:
+        ValueError: If the schedule is missing or invalid
+    """
+    trigger_type = form.get("trigger_type")
+    settings: Dict[str, Any] = {"trigger_type": trigger_type}
+    
+    if trigger_type == "date":
+        schedule_time = form.get("schedule_time")
+        if not schedule_time:
+            raise ValueError("Schedule time is required for one-time tasks.")
+        run_time = parse_datetime(schedule_time)
+        if run_time <= datetime.now():
+            raise ValueError("Schedule time must be in the future.")
+        trigger = DateTrigger(run_date=run_time)
+        settings["schedule_time"] = schedule_time
+        # The run date is what the task is rescheduled from (see build_trigger)
+        settings["run_date"] = schedule_time
+    
+    elif trigger_type == "interval":
+        try:
+            hours = int(form.get("interval_hours") or 0)
+            minutes = int(form.get("interval_minutes") or 0)
+            seconds = int(form.get("interval_seconds") or 0)
+        except ValueError:
+            raise ValueError("Invalid interval values. Please enter valid numbers.")
+        
+        if hours == 0 and minutes == 0 and seconds == 0:
+            raise ValueError("At least one interval value must be greater than 0.")
+        
+        if hours < 0 or minutes < 0 or seconds < 0:
+            raise ValueError("Interval values cannot be negative.")
+        
+        if minutes >= 60 or seconds >= 60:
+            raise ValueError("Minutes and seconds must be less than 60.")
+        
+        trigger = IntervalTrigger(hours=hours, minutes=minutes, seconds=seconds)
+        settings["interval_hours"] = hours
+        settings["interval_minutes"] = minutes
+        settings["interval_seconds"] = seconds
+        settings["schedule_time"] = f"Every {hours}h {minutes}m {seconds}s"
+    
+    elif trigger_type == "cron":
+        cron_expression = form.get("cron_expression")
+        if not cron_expression:
+            raise ValueError("Cron expression is required.")
+        
+        parts = cron_expression.split()
+        if len(parts) != 5:
+            raise ValueError("Invalid cron expression format. Must have exactly 5 parts.")
+        
+        try:
+            trigger = CronTrigger.from_crontab(cron_expression)
+            settings["cron_expression"] = cron_expression
+            settings["schedule_time"] = f"Cron: {cron_expression}"
+        except Exception as e:
+            raise ValueError(f"Invalid cron expression: {str(e)}")
+    else:
+        raise ValueError(f"Unsupported trigger type: {trigger_type}")
+    
+    return trigger, settings
+
 @tasks_bp.route("/", methods=["GET"])
 def index():
     """Render the main dashboard."""
     from app.views.dashboard import render_dashboard
     return render_dashboard()
 
+@tasks_bp.route("/api/tasks", methods=["GET"])
+def task_list_api():
+    """Return a page of the task list, sorted and filtered, as JSON."""
+    from app.views.dashboard import render_task_list
+    return render_task_list()
+
 @tasks_bp.route("/add_task", methods=["GET", "POST"])
 def add_task():
     """Add a new scheduled task."""
@@ -54,18 +334,7 @@ def add_task():
             trigger_type = request.form.get("trigger_type")
             
             # Get script type or determine it from file extension
-            script_type = request.form.get("script_type")
-            if not script_type:
-                # Determine script type from file extension if not provided
-                file_ext = Path(validated_script).suffix.lower()
-                if file_ext == '.py':
-                    script_type = 'python'
-                elif file_ext == '.ps1':
-                    script_type = 'powershell'
-                elif file_ext in ['.bat', '.cmd']:
-                    script_type = 'batch'
-                else:
-                    script_type = 'unknown'
+            script_type = request.form.get("script_type") or get_script_type(validated_script)
             
             if not trigger_type:
                 flash("Please select a trigger type (One-time, Interval, or Cron).", "error")
@@ -80,104 +349,30 @@ def add_task():
                 "script_type": script_type,  # Store the script type
                 "trigger_type": trigger_type,
                 "created_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                "status": STATUS_PENDING,
-                "enabled": 'enabled' in request.form,  # Get enabled value from form
-                "email_notifications_enabled": 'email_notifications' in request.form  # Get email notifications value from form
+                "status": STATUS_PENDING
             }
-
-            # Get max runtime in minutes
-            max_runtime = request.form.get('max_runtime')
-            if max_runtime and max_runtime.isdigit():
-                task_data['max_runtime'] = int(max_runtime)
-            else:
-                task_data['max_runtime'] = 60  # Default to 60 minutes
-                
-            # Auto-retry settings
-            task_data['auto_retry_enabled'] = 'auto_retry_enabled' in request.form
             
-            # Get retry attempts
-            retry_attempts = request.form.get('retry_attempts')
-            if retry_attempts and retry_attempts.isdigit():
-                retry_attempts = int(retry_attempts)
-                # Ensure value is between 1-5
-                task_data['retry_attempts'] = max(1, min(5, retry_attempts))
-            else:
-                task_data['retry_attempts'] = 3  # Default to 3 attempts
-                
-            # Get retry interval
-            retry_interval = request.form.get('retry_interval')
-            if retry_interval and retry_interval.isdigit():
-                retry_interval = int(retry_interval)
-                # Ensure value is between 1-60
-                task_data['retry_interval'] = max(1, min(60, retry_interval))
-            else:
-                task_data['retry_interval'] = 5  # Default to 5 minutes
-                
-            # Initialize current retry count
-            task_data['current_retry_count'] = 0
+            # Enabled flags, runtime limit, retry, circuit breaker, regression,
+            # profiling and retention settings, tags and labels
+            task_data.update(read_task_settings(request.form))
 
-            scheduler = current_app.config['SCHEDULER']
+            scheduler = current_app.config.get('SCHEDULER')
             
             try:
-                if trigger_type == "date":
-                    schedule_time = request.form.get("schedule_time")
-                    if not schedule_time:
-                        raise ValueError("Schedule time is required for one-time tasks.")
-                    run_time = parse_datetime(schedule_time)
-                    if run_time <= datetime.now():
-                        raise ValueError("Schedule time must be in the future.")
-                    trigger = DateTrigger(run_date=run_time)
-                    task_data["schedule_time"] = schedule_time
-
-                elif trigger_type == "interval":
-                    try:
-                        hours = int(request.form.get("interval_hours") or 0)
-                        minutes = int(request.form.get("interval_minutes") or 0)
-                        seconds = int(request.form.get("interval_seconds") or 0)
-                    except ValueError:
-                        raise ValueError("Invalid interval values. Please enter valid numbers.")
-
-                    if hours == 0 and minutes == 0 and seconds == 0:
-                        raise ValueError("At least one interval value must be greater than 0.")
-                    
-                    if hours < 0 or minutes < 0 or seconds < 0:
-                        raise ValueError("Interval values cannot be negative.")
-
-                    if minutes >= 60 or seconds >= 60:
-                        raise ValueError("Minutes and seconds must be less than 60.")
-
-                    trigger = IntervalTrigger(hours=hours, minutes=minutes, seconds=seconds)
-                    task_data["interval_hours"] = hours
-                    task_data["interval_minutes"] = minutes
-                    task_data["interval_seconds"] = seconds
-                    task_data["schedule_time"] = f"Every {hours}h {minutes}m {seconds}s"
-
-                elif trigger_type == "cron":
-                    cron_expression = request.form.get("cron_expression")
-                    if not cron_expression:
-                        raise ValueError("Cron expression is required.")
-
-                    parts = cron_expression.split()
-                    if len(parts) != 5:
-                        raise ValueError("Invalid cron expression format. Must have exactly 5 parts.")
-
-                    try:
-                        trigger = CronTrigger.from_crontab(cron_expression)
-                        task_data["cron_expression"] = cron_expression
-                        task_data["schedule_time"] = f"Cron: {cron_expression}"
-                    except Exception as e:
-                        raise ValueError(f"Invalid cron expression: {str(e)}")
-                else:
-                    raise ValueError(f"Unsupported trigger type: {trigger_type}")
+                trigger, schedule = read_schedule_settings(request.form)
+                task_data.update(schedule)
 
                 # Important: Use a function reference instead of a lambda to avoid memory leaks
-                logger.info(f"Adding job {job_id} to scheduler with trigger {trigger}")
-                scheduler.add_job(
-                    func=run_task,
-                    trigger=trigger,
-                    args=[job_id],
-                    id=job_id
-                )
+                # In web mode there is no local scheduler; the worker schedules the
+                # task when add_task_to_store notifies it
+                if scheduler:
+                    logger.info(f"Adding job {job_id} to scheduler with trigger {trigger}")
+                    scheduler.add_job(
+                        func=run_task,
+                        trigger=trigger,
+                        args=[job_id],
+                        id=job_id
+                    )
                 
                 # Add task to task manager
                 from app.task_manager import add_task_to_store
@@ -253,6 +448,25 @@ def edit_task(job_id: str):
             else:
                 task['retry_interval'] = 5  # Default to 5 minutes
             
+            # Exponential backoff between retries
+            task.update(read_retry_backoff_settings(request.form))
+            
+            # Circuit breaker for chronically failing tasks
+            task.update(read_circuit_breaker_settings(request.form))
+            
+            # Flag runs that are slower than the task's runtime baseline
+            task.update(read_runtime_regression_settings(request.form))
+            
+            # Opt-in profiling of Python scripts
+            task.update(read_profiling_settings(request.form))
+            
+            # Per-task history retention
+            task.update(read_history_retention_settings(request.form))
+            
+            # Tags for the dashboard, and the label selector for worker agents
+            task['tags'] = normalize_labels(request.form.get('tags', ''))
+            task['labels'] = normalize_labels(request.form.get('labels', ''))
+            
             # Update in store
             update_task(job_id, task)
             
@@ -296,32 +510,20 @@ def run_task_now(job_id: str):
     logger = logging.getLogger("EzTaskRunner")
     
     try:
-        from app.task_manager import get_task, update_task, task_executor
+        from app.task_manager import get_task, queue_task_run
         task = get_task(job_id)
         
         if not task:
             flash(f"Task with ID {job_id} not found.", "error")
             return redirect(url_for("tasks.index"))
         
-        # Check if task is already running
-        if task.get("status") == "RUNNING" and task.get("process_id"):
-            try:
-                import psutil
-                process_id = task.get("process_id")
-                if process_id and psutil.pid_exists(int(process_id)):
-                    flash(f"Task '{task['task_name']}' is already running.", "warning")
-                    return redirect(url_for("tasks.index"))
-            except Exception as e:
-                logger.error(f"Error checking process status: {str(e)}")
-                # Continue with execution as if the task is not running
-        
-        # Update task status to indicate it's being queued
-        task["status"] = "QUEUED"
-        update_task(job_id, task)
-        
-        # Use task_executor to run the task as a background job
-        from app.utils.task_helpers import run_task
-        task_executor.submit(run_task, job_id)
+        result = queue_task_run(job_id)
+        if result.get("running"):
+            flash(f"Task '{task['task_name']}' is already running.", "warning")
+            return redirect(url_for("tasks.index"))
+        if not result.get("success"):
+            flash(f"Could not queue task '{task['task_name']}': {result.get('error')}", "error")
+            return redirect(url_for("tasks.index"))
         
         flash(f"Task '{task['task_name']}' queued for execution!", "success")
         return redirect(url_for("tasks.index"))
@@ -415,6 +617,86 @@ def toggle_task(job_id: str):
         flash(f"Error toggling task status: {error_msg}", "error")
         return redirect(url_for("tasks.index"))
 
+@tasks_bp.route("/reset_circuit/<job_id>", methods=["POST"])
+def reset_circuit(job_id: str):
+    """Close a task's circuit breaker so its scheduled runs resume."""
+    logger = logging.getLogger("EzTaskRunner")
+    
+    try:
+        from app.task_manager import get_task, update_task
+        from app.circuit_breaker import reset_circuit as reset_task_circuit
+        task = get_task(job_id)
+        
+        if not task:
+            flash(f"Task with ID {job_id} not found.", "error")
+            return redirect(url_for("tasks.index"))
+        
+        reset_task_circuit(task)
+        if update_task(job_id, task):
+            flash(f"Circuit breaker for task '{task.get('task_name', job_id)}' reset.", "success")
+        else:
+            flash("Failed to reset the circuit breaker.", "error")
+            
+        return redirect(url_for("tasks.index"))
+    except Exception as e:
+        error_msg = str(e)
+        logger.error(f"Error resetting circuit breaker: {error_msg}")
+        flash(f"Error resetting circuit breaker: {error_msg}", "error")
+        return redirect(url_for("tasks.index"))
+
+@tasks_bp.route("/profile_next_run/<job_id>", methods=["POST"])
+def profile_next_run(job_id: str):
+    """Profile the next run of a Python task."""
+    logger = logging.getLogger("EzTaskRunner")
+    
+    try:
+        from app.task_manager import get_task, update_task
+        task = get_task(job_id)
+        
+        if not task:
+            flash(f"Task with ID {job_id} not found.", "error")
+            return redirect(url_for("tasks.index"))
+        
+        if Path(task.get("script_path", "")).suffix.lower() != ".py":
+            flash("Profiling is only supported for Python scripts.", "error")
+            return redirect(url_for("tasks.index"))
+        
+        task["profile_next_run"] = True
+        if update_task(job_id, task):
+            flash(f"The next run of task '{task.get('task_name', job_id)}' will be profiled.", "success")
+        else:
+            flash("Failed to update the task.", "error")
+            
+        return redirect(url_for("tasks.index"))
+    except Exception as e:
+        error_msg = str(e)
+        logger.error(f"Error requesting profiled run: {error_msg}")
+        flash(f"Error requesting profiled run: {error_msg}", "error")
+        return redirect(url_for("tasks.index"))
+
+@tasks_bp.route("/task_history/<job_id>/profile/<run_key>")
+def download_profile(job_id: str, run_key: str):
+    """
+    Download the profile of a run.
+    
+    cProfile runs download as a pstats file (snakeviz, flameprof); sampled
+    runs as collapsed stacks (flamegraph.pl, speedscope).
+    """
+    from flask import send_from_directory, abort
+    from app.utils import load_run_profile
+    
+    runs_dir = current_app.config['RUNS_DIR']
+    profile = load_run_profile(runs_dir, run_key)
+    if not profile or not profile.get('artifact'):
+        abort(404)
+    
+    return send_from_directory(
+        runs_dir,
+        profile['artifact'],
+        as_attachment=True,
+        download_name=f"{job_id}_{profile['artifact']}"
+    )
+
 def save_task():
     """Save a task."""
     try:
@@ -0,0 +1,50 @@
+"""
+Run correlation for EzTaskRunner.
+
+Every run gets a run ID when it is fired, which becomes its run queue ID.
+While a run is being handled, its ID is kept in a context variable and log
+records emitted meanwhile are stamped with it (see log_pipeline), so all
+lines of one run can be found by its ID across the log files.
+
+Context variables are not inherited by other threads: each place a run is
+handed to another thread (the task executor, the notification dispatcher)
+sets the run context again.
+"""
+import contextvars
+import uuid
+from contextlib import contextmanager
+from typing import Optional, Tuple
+
+_current_run = contextvars.ContextVar('eztaskrunner_run', default=(None, None))
+
+def new_run_id() -> str:
+    """Create a new run ID."""
+    return str(uuid.uuid4())
+
+def get_run_context() -> Tuple[Optional[str], Optional[str]]:
+    """
+    Get the run being handled by the current thread.
+
+    Returns:
+        A (run_id, job_id) tuple; both None outside of a run
+    """
+    return _current_run.get()
+
+def get_run_id() -> Optional[str]:
+    """Get the ID of the run being handled by the current thread."""
+    return _current_run.get()[0]
+
+@contextmanager
+def run_context(run_id: Optional[str], job_id: Optional[str] = None):
+    """
+    Stamp log records emitted within the block with a run ID.
+
+    Args:
+        run_id: The run ID
+        job_id: The job ID of the run's task, if known
+    """
+    token = _current_run.set((run_id, job_id))
+    try:
+        yield run_id
+    finally:
+        _current_run.reset(token)
@@ -0,0 +1,655 @@
+"""
+Run queue module for EzTaskRunner.
+
+A durable queue of task runs stored in SQLite. Every run the application
+dispatches is recorded here before it is executed, so queued and
+pending-retry runs survive a restart. Runs are claimed by an owner: this
+process for local runs, or a remote worker agent, which holds a time-limited
+lease that is put back on the queue if it is not renewed.
+"""
+import json
+import logging
+import sqlite3
+import time
+import uuid
+from pathlib import Path
+from typing import Dict, Any, List, Optional, Iterable
+
+from flask import current_app
+
+logger = logging.getLogger("EzTaskRunner")
+
+# Run queue statuses
+RUN_QUEUED = "queued"
+RUN_LEASED = "leased"
+RUN_DONE = "done"
+
+# Run targets: executed by this server's task executor or by a worker agent
+TARGET_LOCAL = "local"
+TARGET_AGENT = "agent"
+
+# Default number of seconds a lease is valid without a heartbeat
+DEFAULT_LEASE_SECONDS = 30
+
+# Number of queued runs considered per lease request when matching labels
+LEASE_SCAN_LIMIT = 100
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id TEXT PRIMARY KEY,
+    job_id TEXT NOT NULL,
+    status TEXT NOT NULL,
+    target TEXT NOT NULL DEFAULT 'agent',
+    dedupe_key TEXT,
+    not_before REAL,
+    labels TEXT NOT NULL DEFAULT '',
+    payload TEXT NOT NULL DEFAULT '{}',
+    enqueued_at REAL NOT NULL,
+    lease_owner TEXT,
+    lease_expires REAL,
+    lease_count INTEGER NOT NULL DEFAULT 0,
+    finished_at REAL,
+    attempt INTEGER NOT NULL DEFAULT 1,
+    retry_of TEXT,
+    root_run_id TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_runs_status ON runs (status, enqueued_at);
+CREATE INDEX IF NOT EXISTS idx_runs_root ON runs (root_run_id, attempt);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_runs_dedupe_key ON runs (dedupe_key);
+CREATE TABLE IF NOT EXISTS agents (
+    agent_id TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    labels TEXT NOT NULL DEFAULT '',
+    capacity INTEGER NOT NULL DEFAULT 1,
+    registered_at REAL NOT NULL,
+    last_seen REAL NOT NULL
+);
+"""
+
+def normalize_labels(labels) -> List[str]:
+    """
+    Normalize a label list or comma-separated label string.
+
+    Args:
+        labels: A list of labels or a comma-separated string
+
+    Returns:
+        A sorted list of unique, lower-case labels
+    """
+    if not labels:
+        return []
+    if isinstance(labels, str):
+        labels = labels.split(',')
+    return sorted({str(label).strip().lower() for label in labels if str(label).strip()})
+
+def _get_db_path(db_path=None) -> Path:
+    """Get the queue database path from the argument or the app config."""
+    if db_path is None:
+        db_path = current_app.config['RUN_QUEUE_DB']
+    return Path(db_path)
+
+def _connect(db_path=None) -> sqlite3.Connection:
+    """Open a connection to the queue database in autocommit mode."""
+    conn = sqlite3.connect(str(_get_db_path(db_path)), timeout=30, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+def _row_to_run(row: sqlite3.Row) -> Dict[str, Any]:
+    """Convert a runs table row into a run dictionary."""
+    run = dict(row)
+    run['labels'] = normalize_labels(run.get('labels'))
+    run['payload'] = json.loads(run.get('payload') or '{}')
+    return run
+
+def _add_missing_columns(conn: sqlite3.Connection) -> None:
+    """Upgrade a runs table created by an earlier version of the schema."""
+    columns = {row['name'] for row in conn.execute("PRAGMA table_info(runs)")}
+    if not columns:
+        return  # Fresh database, the schema creates the table
+    for name, definition in (
+        ('target', "TEXT NOT NULL DEFAULT 'agent'"),
+        ('dedupe_key', "TEXT"),
+        ('not_before', "REAL"),
+        ('attempt', "INTEGER NOT NULL DEFAULT 1"),
+        ('retry_of', "TEXT"),
+        ('root_run_id', "TEXT")
+    ):
+        if name not in columns:
+            conn.execute(f"ALTER TABLE runs ADD COLUMN {name} {definition}")
+
+def init_run_queue(app) -> None:
+    """
+    Create the queue database if needed and store its path in the app config.
+
+    Args:
+        app: The Flask application instance
+    """
+    db_path = Path(app.config['STATE_DIR']) / 'run_queue.db'
+    app.config['RUN_QUEUE_DB'] = db_path
+
+    conn = _connect(db_path)
+    try:
+        conn.execute("PRAGMA journal_mode=WAL")
+        _add_missing_columns(conn)
+        conn.executescript(SCHEMA)
+    finally:
+        conn.close()
+    logger.info(f"Run queue initialized at {db_path}")
+
+def enqueue_run(job_id: str, labels=None, payload: Optional[Dict[str, Any]] = None, target: str = TARGET_AGENT,
+                dedupe_key: Optional[str] = None, not_before: Optional[float] = None, retry_of: Optional[str] = None,
+                run_id: Optional[str] = None, db_path=None) -> Optional[str]:
+    """
+    Add a run to the queue.
+
+    Args:
+        job_id: The job ID of the task to run
+        labels: Labels an agent must have to lease the run
+        payload: Data needed to execute the run
+        target: TARGET_LOCAL or TARGET_AGENT
+        dedupe_key: Optional key identifying the logical run; a second run
+            with the same key is not queued
+        not_before: Optional epoch time before which the run is not dispatched
+        retry_of: Optional ID of the failed run this run retries; the new run
+            continues that run's attempt chain
+        run_id: Optional ID given to the run when it was fired (defaults to a new ID)
+        db_path: Optional queue database path (defaults to the app config)
+
+    Returns:
+        The new run ID, or None if a run with the same dedupe key exists
+    """
+    run_id = run_id or str(uuid.uuid4())
+    attempt, root_run_id = 1, run_id
+    conn = _connect(db_path)
+    try:
+        if retry_of:
+            previous = conn.execute("SELECT attempt, root_run_id FROM runs WHERE run_id = ?", (retry_of,)).fetchone()
+            if previous:
+                attempt = previous['attempt'] + 1
+                root_run_id = previous['root_run_id'] or retry_of
+        conn.execute(
+            "INSERT INTO runs (run_id, job_id, status, target, dedupe_key, not_before, labels, payload, enqueued_at, "
+            "attempt, retry_of, root_run_id) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (run_id, job_id, RUN_QUEUED, target, dedupe_key, not_before,
+             ','.join(normalize_labels(labels)), json.dumps(payload or {}), time.time(),
+             attempt, retry_of, root_run_id)
+        )
+    except sqlite3.IntegrityError:
+        logger.info(f"Run for task {job_id} with dedupe key {dedupe_key} is already queued, skipping")
+        return None
+    finally:
+        conn.close()
+    logger.info(f"Run {run_id} for task {job_id} added to the run queue ({target})")
+    return run_id
+
+def get_run(run_id: str, db_path=None) -> Optional[Dict[str, Any]]:
+    """
+    Get a run from the queue.
+
+    Args:
+        run_id: The run ID
+        db_path: Optional queue database path (defaults to the app config)
+
+    Returns:
+        The run dictionary or None if not found
+    """
+    conn = _connect(db_path)
+    try:
+        row = conn.execute("SELECT * FROM runs WHERE run_id = ?", (run_id,)).fetchone()
+    finally:
+        conn.close()
+    return _row_to_run(row) if row else None
+
+def lease_runs(owner: str, labels: Iterable[str], max_runs: int = 1,
+               lease_seconds: int = DEFAULT_LEASE_SECONDS, db_path=None) -> List[Dict[str, Any]]:
+    """
+    Lease queued runs whose required labels are all offered by the owner.
+
+    Args:
+        owner: The lease owner (agent ID)
+        labels: The labels the owner advertises
+        max_runs: Maximum number of runs to lease
+        lease_seconds: How long the lease is valid without renewal
+        db_path: Optional queue database path (defaults to the app config)
+
+    Returns:
+        List of leased run dictionaries (oldest first)
+    """
+    offered = set(normalize_labels(list(labels)))
+    leased = []
+    if max_runs < 1:
+        return leased
+
+    conn = _connect(db_path)
+    try:
+        # Take the write lock up front so two agents cannot lease the same run
+        conn.execute("BEGIN IMMEDIATE")
+        now = time.time()
+        rows = conn.execute(
+            "SELECT * FROM runs WHERE status = ? AND target = ? AND (not_before IS NULL OR not_before <= ?) "
+            "ORDER BY enqueued_at LIMIT ?",
+            (RUN_QUEUED, TARGET_AGENT, now, LEASE_SCAN_LIMIT)
+        ).fetchall()
+        for row in rows:
+            run = _row_to_run(row)
+            if not set(run['labels']).issubset(offered):
+                continue
+            conn.execute(
+                "UPDATE runs SET status = ?, lease_owner = ?, lease_expires = ?, lease_count = lease_count + 1 WHERE run_id = ?",
+                (RUN_LEASED, owner, now + lease_seconds, run['run_id'])
+            )
+            run.update(status=RUN_LEASED, lease_owner=owner, lease_expires=now + lease_seconds)
+            leased.append(run)
+            if len(leased) >= max_runs:
+                break
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    finally:
+        conn.close()
+
+    for run in leased:
+        logger.info(f"Run {run['run_id']} for task {run['job_id']} leased by {owner}")
+    return leased
+
+def claim_run(run_id: str, owner: str, db_path=None) -> bool:
+    """
+    Claim a queued run for execution by this process.
+
+    Local claims have no expiry; runs claimed by a process that has since
+    died are recovered with requeue_orphaned_runs.
+
+    Args:
+        run_id: The run ID
+        owner: The claiming owner
+        db_path: Optional queue database path (defaults to the app config)
+
+    Returns:
+        bool: False if the run was not queued (already claimed or finished)
+    """
+    conn = _connect(db_path)
+    try:
+        cursor = conn.execute(
+            "UPDATE runs SET status = ?, lease_owner = ?, lease_expires = NULL, lease_count = lease_count + 1 "
+            "WHERE run_id = ? AND status = ?",
+            (RUN_LEASED, owner, run_id, RUN_QUEUED)
+        )
+        return cursor.rowcount > 0
+    finally:
+        conn.close()
+
+def transfer_run(run_id: str, owner: str, previous_owner: str, db_path=None) -> bool:
+    """
+    Take over a claimed run from its previous owner.
+
+    Used when a restarted server reattaches to a run that is still executing.
+
+    Args:
+        run_id: The run ID
+        owner: The new owner
+        previous_owner: The owner expected to hold the claim
+        db_path: Optional queue database path (defaults to the app config)
+
+    Returns:
+        bool: False if the run is no longer claimed by the previous owner
+    """
+    conn = _connect(db_path)
+    try:
+        cursor = conn.execute(
+            "UPDATE runs SET lease_owner = ? WHERE run_id = ? AND status = ? AND lease_owner = ?",
+            (owner, run_id, RUN_LEASED, previous_owner)
+        )
+        return cursor.rowcount > 0
+    finally:
+        conn.close()
+
+def list_due_runs(target: str = TARGET_LOCAL, limit: int = 100, db_path=None) -> List[Dict[str, Any]]:
+    """
+    List queued runs that are ready to be dispatched.
+
+    Args:
+        target: The run target to list
+        limit: Maximum number of runs
+        db_path: Optional queue database path (defaults to the app config)
+
+    Returns:
+        List of run dictionaries (oldest first)
+    """
+    conn = _connect(db_path)
+    try:
+        rows = conn.execute(
+            "SELECT * FROM runs WHERE status = ? AND target = ? AND (not_before IS NULL OR not_before <= ?) "
+            "ORDER BY enqueued_at LIMIT ?",
+            (RUN_QUEUED, target, time.time(), limit)
+        ).fetchall()
+    finally:
+        conn.close()
+    return [_row_to_run(row) for row in rows]
+
+def requeue_orphaned_runs(is_orphaned, target: str = TARGET_LOCAL, db_path=None) -> List[Dict[str, Any]]:
+    """
+    Put claimed runs whose owner is gone back on the queue.
+
+    Args:
+        is_orphaned: Callable receiving a lease owner and returning True if it is gone
+        target: The run target to check
+        db_path: Optional queue database path (defaults to the app config)
+
+    Returns:
+        List of re-queued run dictionaries
+    """
+    conn = _connect(db_path)
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        rows = [
+            row for row in conn.execute(
+                "SELECT * FROM runs WHERE status = ? AND target = ?", (RUN_LEASED, target)
+            ).fetchall()
+            if is_orphaned(row['lease_owner'])
+        ]
+        for row in rows:
+            conn.execute(
+                "UPDATE runs SET status = ?, lease_owner = NULL, lease_expires = NULL WHERE run_id = ?",
+                (RUN_QUEUED, row['run_id'])
+            )
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    finally:
+        conn.close()
+
+    requeued = [_row_to_run(row) for row in rows]
+    for run in requeued:
+        logger.warning(f"Owner {run['lease_owner']} of run {run['run_id']} is gone, run re-queued")
+    return requeued
+
+def renew_leases(owner: str, run_ids: Iterable[str], lease_seconds: int = DEFAULT_LEASE_SECONDS,
+                 db_path=None) -> Dict[str, List[str]]:
+    """
+    Extend the leases an owner still holds.
+
+    Args:
+        owner: The lease owner (agent ID)
+        run_ids: The runs the owner is still executing
+        lease_seconds: How long the renewed lease is valid
+        db_path: Optional queue database path (defaults to the app config)
+
+    Returns:
+        dict: 'renewed' and 'lost' run ID lists. Lost runs were re-queued or
+        completed elsewhere and should be abandoned by the owner.
+    """
+    result = {"renewed": [], "lost": []}
+    conn = _connect(db_path)
+    try:
+        expires = time.time() + lease_seconds
+        for run_id in run_ids:
+            cursor = conn.execute(
+                "UPDATE runs SET lease_expires = ? WHERE run_id = ? AND status = ? AND lease_owner = ?",
+                (expires, run_id, RUN_LEASED, owner)
+            )
+            result["renewed" if cursor.rowcount else "lost"].append(run_id)
+    finally:
+        conn.close()
+    return result
+
+def complete_run(run_id: str, owner: str, db_path=None) -> bool:
+    """
+    Mark a claimed or leased run as done.
+
+    Args:
+        run_id: The run ID
+        owner: The lease owner reporting completion
+        db_path: Optional queue database path (defaults to the app config)
+
+    Returns:
+        bool: False if the owner no longer holds the lease
+    """
+    conn = _connect(db_path)
+    try:
+        cursor = conn.execute(
+            "UPDATE runs SET status = ?, finished_at = ?, lease_expires = NULL WHERE run_id = ? AND status = ? AND lease_owner = ?",
+            (RUN_DONE, time.time(), run_id, RUN_LEASED, owner)
+        )
+        completed = cursor.rowcount > 0
+    finally:
+        conn.close()
+
+    if completed:
+        logger.info(f"Run {run_id} completed by {owner}")
+    else:
+        logger.warning(f"Ignoring completion of run {run_id} from {owner}: lease not held")
+    return completed
+
+def prune_done_runs(finished_before: float, batch_size: int = 1000, db_path=None) -> int:
+    """
+    Delete done runs that finished before a point in time.
+
+    Rows are deleted in batches, so writers are never blocked for long.
+
+    Args:
+        finished_before: Epoch time; done runs that finished earlier are deleted
+        batch_size: Rows deleted per statement
+        db_path: Optional queue database path (defaults to the app config)
+
+    Returns:
+        int: The number of runs deleted
+    """
+    conn = _connect(db_path)
+    deleted = 0
+    try:
+        while True:
+            cursor = conn.execute(
+                "DELETE FROM runs WHERE run_id IN (SELECT run_id FROM runs WHERE status = ? AND finished_at < ? LIMIT ?)",
+                (RUN_DONE, finished_before, batch_size)
+            )
+            deleted += cursor.rowcount
+            if cursor.rowcount < batch_size:
+                break
+    finally:
+        conn.close()
+
+    if deleted:
+        logger.info(f"Pruned {deleted} done runs from the run queue")
+    return deleted
+
+def requeue_expired_leases(db_path=None) -> List[Dict[str, Any]]:
+    """
+    Put runs whose lease has expired back on the queue.
+
+    Args:
+        db_path: Optional queue database path (defaults to the app config)
+
+    Returns:
+        List of re-queued run dictionaries
+    """
+    conn = _connect(db_path)
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        rows = conn.execute(
+            "SELECT * FROM runs WHERE status = ? AND lease_expires < ?",
+            (RUN_LEASED, time.time())
+        ).fetchall()
+        for row in rows:
+            conn.execute(
+                "UPDATE runs SET status = ?, lease_owner = NULL, lease_expires = NULL WHERE run_id = ?",
+                (RUN_QUEUED, row['run_id'])
+            )
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    finally:
+        conn.close()
+
+    requeued = [_row_to_run(row) for row in rows]
+    for run in requeued:
+        logger.warning(f"Lease on run {run['run_id']} held by {run['lease_owner']} expired, run re-queued")
+    return requeued
+
+def get_active_run_for_task(job_id: str, db_path=None) -> Optional[Dict[str, Any]]:
+    """
+    Get the queued or leased run for a task, if any.
+
+    Args:
+        job_id: The job ID
+        db_path: Optional queue database path (defaults to the app config)
+
+    Returns:
+        The run dictionary or None
+    """
+    conn = _connect(db_path)
+    try:
+        row = conn.execute(
+            "SELECT * FROM runs WHERE job_id = ? AND status IN (?, ?) ORDER BY enqueued_at LIMIT 1",
+            (job_id, RUN_QUEUED, RUN_LEASED)
+        ).fetchone()
+    finally:
+        conn.close()
+    return _row_to_run(row) if row else None
+
+def get_attempt_chain(run_id: str, db_path=None) -> List[Dict[str, Any]]:
+    """
+    Get every attempt of the logical run a run belongs to.
+
+    Args:
+        run_id: The ID of any run in the chain
+        db_path: Optional queue database path (defaults to the app config)
+
+    Returns:
+        List of run dictionaries ordered by attempt
+    """
+    conn = _connect(db_path)
+    try:
+        row = conn.execute("SELECT root_run_id FROM runs WHERE run_id = ?", (run_id,)).fetchone()
+        if not row:
+            return []
+        root_run_id = row['root_run_id'] or run_id
+        rows = conn.execute(
+            "SELECT * FROM runs WHERE root_run_id = ? OR run_id = ? ORDER BY attempt",
+            (root_run_id, root_run_id)
+        ).fetchall()
+    finally:
+        conn.close()
+    return [_row_to_run(row) for row in rows]
+
+def count_retries_since(since: float, job_id: Optional[str] = None, db_path=None) -> int:
+    """
+    Count retry runs queued since a point in time.
+
+    Args:
+        since: Epoch time to count from
+        job_id: Optional job ID to count the retries of one task only
+        db_path: Optional queue database path (defaults to the app config)
+
+    Returns:
+        int: The number of retry runs
+    """
+    query = "SELECT COUNT(*) FROM runs WHERE attempt > 1 AND enqueued_at >= ?"
+    params = [since]
+    if job_id:
+        query += " AND job_id = ?"
+        params.append(job_id)
+    conn = _connect(db_path)
+    try:
+        return conn.execute(query, params).fetchone()[0]
+    finally:
+        conn.close()
+
+def count_pending_runs(db_path=None) -> List[Dict[str, Any]]:
+    """
+    Count the runs that are not done, by status and target.
+
+    Args:
+        db_path: Optional queue database path (defaults to the app config)
+
+    Returns:
+        List of dictionaries with 'status', 'target' and 'count'
+    """
+    conn = _connect(db_path)
+    try:
+        rows = conn.execute(
+            "SELECT status, target, COUNT(*) AS count FROM runs WHERE status != ? GROUP BY status, target",
+            (RUN_DONE,)
+        ).fetchall()
+    finally:
+        conn.close()
+    return [dict(row) for row in rows]
+
+def register_agent(name: str, labels=None, capacity: int = 1, db_path=None) -> str:
+    """
+    Register a worker agent.
+
+    Args:
+        name: A human-readable agent name (e.g. the host name)
+        labels: Labels the agent advertises
+        capacity: Number of runs the agent executes concurrently
+        db_path: Optional queue database path (defaults to the app config)
+
+    Returns:
+        The new agent ID
+    """
+    agent_id = str(uuid.uuid4())
+    now = time.time()
+    conn = _connect(db_path)
+    try:
+        conn.execute(
+            "INSERT INTO agents (agent_id, name, labels, capacity, registered_at, last_seen) VALUES (?, ?, ?, ?, ?, ?)",
+            (agent_id, name, ','.join(normalize_labels(labels)), max(1, int(capacity)), now, now)
+        )
+    finally:
+        conn.close()
+    logger.info(f"Worker agent {name} registered as {agent_id} with labels {normalize_labels(labels)}, capacity {capacity}")
+    return agent_id
+
+def get_agent(agent_id: str, touch: bool = False, db_path=None) -> Optional[Dict[str, Any]]:
+    """
+    Get a registered agent.
+
+    Args:
+        agent_id: The agent ID
+        touch: Whether to record that the agent was seen just now
+        db_path: Optional queue database path (defaults to the app config)
+
+    Returns:
+        The agent dictionary or None if not registered
+    """
+    conn = _connect(db_path)
+    try:
+        if touch:
+            conn.execute("UPDATE agents SET last_seen = ? WHERE agent_id = ?", (time.time(), agent_id))
+        row = conn.execute("SELECT * FROM agents WHERE agent_id = ?", (agent_id,)).fetchone()
+    finally:
+        conn.close()
+    if not row:
+        return None
+    agent = dict(row)
+    agent['labels'] = normalize_labels(agent['labels'])
+    return agent
+
+def list_agents(db_path=None) -> List[Dict[str, Any]]:
+    """
+    List registered agents with the number of runs each currently holds.
+
+    Args:
+        db_path: Optional queue database path (defaults to the app config)
+
+    Returns:
+        List of agent dictionaries, most recently seen first
+    """
+    conn = _connect(db_path)
+    try:
+        rows = conn.execute(
+            "SELECT a.*, (SELECT COUNT(*) FROM runs r WHERE r.lease_owner = a.agent_id AND r.status = ?) AS active_runs "
+            "FROM agents a ORDER BY last_seen DESC",
+            (RUN_LEASED,)
+        ).fetchall()
+    finally:
+        conn.close()
+    agents = []
+    for row in rows:
+        agent = dict(row)
+        agent['labels'] = normalize_labels(agent['labels'])
+        agents.append(agent)
+    return agents
@@ -0,0 +1,114 @@
+"""
+Incremental run statistics for EzTaskRunner.
+
+Every finished (or skipped) run updates a small set of running aggregates
+stored on the task under the 'run_stats' key, so a task's health can be shown
+without reading its history files:
+
+- counts of runs by status (success, failed, skipped)
+- an exponentially weighted moving average of the execution time
+- a quantile sketch of execution times (see app.runtime_baseline) for p50/p95
+- the outcomes of the last RECENT_RUNS runs as a bit ring
+
+Each update is O(1) in the number of runs recorded.
+"""
+import time
+from typing import Dict, Any, Optional
+
+from app.runtime_baseline import new_sketch, add_to_sketch, sketch_quantile
+
+# Outcomes kept in the bit ring (bit 0 is the latest run, set for a success)
+RECENT_RUNS = 30
+
+# Weight of the latest run in the moving average of the execution time
+EWMA_ALPHA = 0.2
+
+# Run statuses counted
+STAT_SUCCESS = "success"
+STAT_FAILED = "failed"
+STAT_SKIPPED = "skipped"
+
+def get_run_stats(task: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Get a task's run statistics, creating empty statistics if needed.
+
+    Args:
+        task: The task dictionary
+
+    Returns:
+        dict: The statistics stored on the task
+    """
+    return task.setdefault("run_stats", {
+        "counts": {STAT_SUCCESS: 0, STAT_FAILED: 0, STAT_SKIPPED: 0},
+        "ewma_duration": None,
+        "duration_sketch": new_sketch(),
+        "recent_bits": 0,
+        "recent_count": 0,
+        "updated_at": None
+    })
+
+def record_run_stats(task: Dict[str, Any], result: Dict[str, Any], now: Optional[float] = None) -> None:
+    """
+    Add a run to a task's statistics.
+
+    Skipped runs are only counted; the duration aggregates and the recent
+    outcomes cover runs that executed.
+
+    Args:
+        task: The task dictionary (its statistics are updated)
+        result: The run result
+        now: Optional current epoch time
+    """
+    from app.utils.constants import STATUS_SKIPPED
+
+    stats = get_run_stats(task)
+    stats["updated_at"] = now or time.time()
+
+    if result.get("status") == STATUS_SKIPPED:
+        stats["counts"][STAT_SKIPPED] = stats["counts"].get(STAT_SKIPPED, 0) + 1
+        return
+
+    success = bool(result.get("success"))
+    status = STAT_SUCCESS if success else STAT_FAILED
+    stats["counts"][status] = stats["counts"].get(status, 0) + 1
+
+    # Shift the outcome into the bit ring
+    stats["recent_bits"] = ((stats.get("recent_bits", 0) << 1) | int(success)) & ((1 << RECENT_RUNS) - 1)
+    stats["recent_count"] = min(RECENT_RUNS, stats.get("recent_count", 0) + 1)
+
+    duration = result.get("execution_time")
+    if duration is not None:
+        previous = stats.get("ewma_duration")
+        stats["ewma_duration"] = duration if previous is None else EWMA_ALPHA * duration + (1 - EWMA_ALPHA) * previous
+        # No decay: the quantiles cover all runs
+        add_to_sketch(stats.setdefault("duration_sketch", new_sketch()), duration, decay=1.0)
+
+def summarize_run_stats(task: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """
+    Summarize a task's run statistics for display.
+
+    Args:
+        task: The task dictionary
+
+    Returns:
+        dict: runs, success_rate (percent of executed runs), skipped, ewma_duration,
+        p50 and p95 durations and recent outcomes (oldest first, True for a
+        success), or None if no run has been recorded
+    """
+    stats = task.get("run_stats")
+    if not stats:
+        return None
+
+    counts = stats.get("counts", {})
+    executed = counts.get(STAT_SUCCESS, 0) + counts.get(STAT_FAILED, 0)
+    sketch = stats.get("duration_sketch", {})
+    bits = stats.get("recent_bits", 0)
+    return {
+        "runs": executed,
+        "success_rate": counts.get(STAT_SUCCESS, 0) * 100 / executed if executed else None,
+        "skipped": counts.get(STAT_SKIPPED, 0),
+        "ewma_duration": stats.get("ewma_duration"),
+        "p50": sketch_quantile(sketch, 0.5),
+        "p95": sketch_quantile(sketch, 0.95),
+        "recent": [bool(bits >> i & 1) for i in reversed(range(stats.get("recent_count", 0)))]
+    }
@@ -0,0 +1,176 @@
+"""
+Runtime regression detection for EzTaskRunner.
+
+Keeps a rolling baseline of each task's execution time (and peak memory,
+where the run reports it) and flags runs that exceed the baseline median by
+a configurable factor, so scripts that slow down as their data grows are
+noticed before they hit their maximum runtime.
+
+Each baseline is a quantile sketch: a histogram with logarithmically sized
+buckets, so any quantile is known within SKETCH_ACCURACY relative error from
+a small, bounded number of buckets. Every successful run updates the sketch
+in place, with earlier runs decayed so the baseline follows the recent runs.
+History is never rescanned.
+
+The baselines are stored on the task under the 'runtime_baseline' key so they
+are persisted with the task, and the last flag under 'runtime_regression' so
+it is shown on the dashboard.
+"""
+import math
+import time
+from typing import Dict, Any, Optional, List
+
+# Relative error of the quantiles estimated from a sketch
+SKETCH_ACCURACY = 0.02
+
+# Weight kept by earlier runs at every update (a run's weight halves after about 70 runs)
+SKETCH_DECAY = 0.99
+
+# Most buckets kept per sketch; the lowest buckets are merged beyond this
+SKETCH_MAX_BUCKETS = 256
+
+# Smallest value tracked; shorter runtimes count in the lowest bucket
+SKETCH_MIN_VALUE = 0.001
+
+# Defaults for the per-task settings
+DEFAULT_REGRESSION_FACTOR = 2.0
+DEFAULT_BASELINE_MIN_RUNS = 10
+
+# Measures tracked per run: (result field, unit, least excess over the baseline that is flagged)
+MEASURES = (
+    ("execution_time", "s", 1.0),
+    ("peak_rss_mb", "MB", 10.0)
+)
+
+_GAMMA = (1 + SKETCH_ACCURACY) / (1 - SKETCH_ACCURACY)
+
+def new_sketch() -> Dict[str, Any]:
+    """
+    Create an empty quantile sketch.
+
+    Returns:
+        dict: The sketch (JSON serializable)
+    """
+    return {"runs": 0, "buckets": {}}
+
+def add_to_sketch(sketch: Dict[str, Any], value: float, decay: float = SKETCH_DECAY) -> None:
+    """
+    Add a value to a sketch, decaying the weight of earlier values.
+
+    Args:
+        sketch: The sketch (updated in place)
+        value: The value
+        decay: Weight kept by the earlier values
+    """
+    buckets = sketch["buckets"]
+    for key in list(buckets):
+        buckets[key] *= decay
+        # Drop buckets whose runs have all but faded out
+        if buckets[key] < 1e-3:
+            del buckets[key]
+
+    key = str(math.ceil(math.log(max(value, SKETCH_MIN_VALUE), _GAMMA)))
+    buckets[key] = buckets.get(key, 0.0) + 1.0
+
+    if len(buckets) > SKETCH_MAX_BUCKETS:
+        ordered = sorted(buckets, key=int)
+        merged = sum(buckets.pop(k) for k in ordered[:len(buckets) - SKETCH_MAX_BUCKETS + 1])
+        buckets[ordered[len(ordered) - SKETCH_MAX_BUCKETS]] = merged
+
+    sketch["runs"] = sketch.get("runs", 0) + 1
+
+def sketch_quantile(sketch: Dict[str, Any], q: float) -> Optional[float]:
+    """
+    Estimate a quantile from a sketch.
+
+    Args:
+        sketch: The sketch
+        q: The quantile (0-1)
+
+    Returns:
+        The estimated value, or None for an empty sketch
+    """
+    buckets = sketch.get("buckets")
+    if not buckets:
+        return None
+
+    rank = q * sum(buckets.values())
+    seen = 0.0
+    for key in sorted(buckets, key=int):
+        seen += buckets[key]
+        if seen >= rank:
+            break
+    # The middle of the bucket, which is within SKETCH_ACCURACY of every value in it
+    return 2 * _GAMMA ** int(key) / (_GAMMA + 1)
+
+def record_runtime(task: Dict[str, Any], result: Dict[str, Any], now: Optional[float] = None) -> Optional[Dict[str, Any]]:
+    """
+    Compare a finished run with the task's baseline and add it to the baseline.
+
+    Only successful runs are compared and counted, since failures often end
+    early. A run is flagged once the baseline holds enough runs and one of
+    its measures exceeds the baseline median by the task's regression factor.
+
+    Args:
+        task: The task dictionary (its baseline and last flag are updated)
+        result: The run result
+        now: Optional current epoch time
+
+    Returns:
+        dict: The regression flag if the run is flagged, otherwise None
+    """
+    if not result.get("success"):
+        return None
+
+    factor = task.get("runtime_regression_factor", DEFAULT_REGRESSION_FACTOR)
+    min_runs = task.get("runtime_baseline_min_runs", DEFAULT_BASELINE_MIN_RUNS)
+    baselines = task.setdefault("runtime_baseline", {})
+
+    exceeded = []
+    for measure, unit, min_excess in MEASURES:
+        value = result.get(measure)
+        if value is None:
+            continue
+        sketch = baselines.setdefault(measure, new_sketch())
+
+        # Compare before adding the run, so the run does not mask its own regression
+        median = sketch_quantile(sketch, 0.5)
+        if factor and median and sketch.get("runs", 0) >= min_runs:
+            if value > median * factor and value - median >= min_excess:
+                exceeded.append({
+                    "measure": measure,
+                    "value": value,
+                    "baseline_p50": median,
+                    "ratio": value / median,
+                    "unit": unit
+                })
+        add_to_sketch(sketch, value)
+
+    if not exceeded:
+        task.pop("runtime_regression", None)
+        return None
+
+    flag = {
+        "flagged_at": now or time.time(),
+        "run_id": result.get("run_id"),
+        "factor": factor,
+        "exceeded": exceeded,
+        "reason": describe_regression(exceeded)
+    }
+    task["runtime_regression"] = flag
+    return flag
+
+def describe_regression(exceeded: List[Dict[str, Any]]) -> str:
+    """
+    Describe the measures a run exceeded its baseline by.
+
+    Args:
+        exceeded: The exceeded measures of a regression flag
+
+    Returns:
+        str: e.g. "execution_time 42.0s is 3.1x the baseline median of 13.5s"
+    """
+    return "; ".join(
+        f"{e['measure']} {e['value']:.1f}{e['unit']} is {e['ratio']:.1f}x the baseline median of {e['baseline_p50']:.1f}{e['unit']}"
+        for e in exceeded
+    )
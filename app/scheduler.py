@@ -3,8 +3,45 @@ Scheduler module for EzTaskRunner.
 Handles the background scheduler and job management.
 """
 import logging
+from contextvars import ContextVar
 from apscheduler.schedulers.background import BackgroundScheduler
 from apscheduler.jobstores.memory import MemoryJobStore
+from apscheduler.executors.base import run_job
+from apscheduler.executors.pool import ThreadPoolExecutor
+
+# Planned fire time of the scheduler job running in the current thread
+_scheduled_run_time = ContextVar('scheduled_run_time', default=None)
+
+def get_scheduled_run_time():
+    """
+    Get the time the currently running scheduler job was planned to fire at.
+    
+    Returns:
+        The timezone-aware planned run time, or None outside of a scheduler job
+    """
+    return _scheduled_run_time.get()
+
+def _run_job_with_schedule(job, jobstore_alias, run_times, logger_name):
+    """Run a scheduler job with its planned fire time available to the job function."""
+    token = _scheduled_run_time.set(run_times[-1] if run_times else None)
+    try:
+        return run_job(job, jobstore_alias, run_times, logger_name)
+    finally:
+        _scheduled_run_time.reset(token)
+
+class ScheduleAwareThreadPoolExecutor(ThreadPoolExecutor):
+    """Thread pool executor that exposes each job's planned fire time via get_scheduled_run_time."""
+    
+    def _do_submit_job(self, job, run_times):
+        def callback(f):
+            exc = f.exception()
+            if exc:
+                self._run_job_error(job.id, exc, getattr(exc, '__traceback__', None))
+            else:
+                self._run_job_success(job.id, f.result())
+        
+        f = self._pool.submit(_run_job_with_schedule, job, job._jobstore_alias, run_times, self._logger.name)
+        f.add_done_callback(callback)
 
 def init_scheduler(app=None):
     """
@@ -27,6 +64,7 @@ def init_scheduler(app=None):
     # Create scheduler with 1 second check interval
     scheduler = BackgroundScheduler(
         jobstores=job_stores,
+        executors={'default': ScheduleAwareThreadPoolExecutor()},
         job_defaults={
             'coalesce': True,  # Combine multiple executions into one
             'max_instances': 1  # Only one instance of each job can run at a time
@@ -0,0 +1,518 @@
+"""
+Search index for EzTaskRunner.
+
+A full-text index over run output and the application logs, stored in SQLite
+(FTS5 with the trigram tokenizer, so any part of a word or error message of
+at least three characters can be searched, without regard to case).
+
+Documents are:
+- runs: the output and error of a run, read from its task history file
+- log blocks: up to BLOCK_LINES consecutive lines of an application log
+
+A background indexer adds each run as its history is saved, and every
+LOG_INDEX_INTERVAL seconds indexes the lines written to the logs since the
+last pass. On startup it catches up with history files saved while it was not
+running.
+
+The index is bounded: runs are removed with their history files by the
+retention worker, log blocks older than HISTORY_RETENTION_DAYS are dropped,
+and the oldest documents are evicted when the indexed text exceeds
+SEARCH_INDEX_MAX_MB.
+"""
+import os
+import queue
+import sqlite3
+import time
+import atexit
+import logging
+import threading
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Any, List, Optional, Iterable
+
+logger = logging.getLogger("EzTaskRunner")
+
+DOC_RUN = "run"
+DOC_LOG = "log"
+
+# Lines per log block document
+BLOCK_LINES = 50
+
+# Text of a run kept in the index (the start and the end of longer output)
+MAX_RUN_TEXT = 64 * 1024
+
+# Log bytes indexed per log per pass
+MAX_LOG_BYTES_PER_PASS = 4 * 1024 * 1024
+
+# Seconds between passes over the logs
+LOG_INDEX_INTERVAL = 30
+
+# Snippet lines returned per result, and their length
+MAX_SNIPPETS = 3
+SNIPPET_CHARS = 240
+
+MIN_QUERY_LENGTH = 3
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    doc_id INTEGER PRIMARY KEY,
+    kind TEXT NOT NULL,
+    source TEXT NOT NULL,
+    job_id TEXT,
+    position INTEGER,
+    ts REAL NOT NULL,
+    size INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_documents_ts ON documents (ts);
+CREATE INDEX IF NOT EXISTS idx_documents_source ON documents (kind, source);
+CREATE VIRTUAL TABLE IF NOT EXISTS documents_text USING fts5(text, tokenize='trigram');
+CREATE TABLE IF NOT EXISTS log_positions (
+    name TEXT PRIMARY KEY,
+    inode INTEGER,
+    position INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+def get_index_path(state_dir) -> Path:
+    """Get the path of the search index database."""
+    return Path(state_dir) / 'search_index.db'
+
+def _connect(state_dir) -> sqlite3.Connection:
+    """Open a connection to the search index in autocommit mode, creating it if needed."""
+    conn = sqlite3.connect(str(get_index_path(state_dir)), timeout=30, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.executescript(SCHEMA)
+    return conn
+
+def _history_source(path) -> str:
+    """Get the source name of a run: its history file name without a compression suffix."""
+    from app.utils.compression import strip_compression_suffix
+    return strip_compression_suffix(Path(path).name)
+
+def _run_text(entry: Dict[str, Any]) -> str:
+    """Get the searchable text of a run: its output and error, shortened to MAX_RUN_TEXT."""
+    text = "\n".join(part for part in (entry.get('output'), entry.get('error')) if part)
+    if len(text) > MAX_RUN_TEXT:
+        half = MAX_RUN_TEXT // 2
+        text = text[:half] + "\n...\n" + text[-half:]
+    return text
+
+def _add_document(conn, kind: str, source: str, text: str, ts: float, job_id: Optional[str] = None,
+                  position: Optional[int] = None) -> None:
+    cursor = conn.execute(
+        "INSERT INTO documents (kind, source, job_id, position, ts, size) VALUES (?, ?, ?, ?, ?, ?)",
+        (kind, source, job_id, position, ts, len(text))
+    )
+    conn.execute("INSERT INTO documents_text (rowid, text) VALUES (?, ?)", (cursor.lastrowid, text))
+
+def _delete_documents(conn, where: str, params: Iterable = ()) -> int:
+    doc_ids = [row['doc_id'] for row in conn.execute(f"SELECT doc_id FROM documents WHERE {where}", tuple(params))]
+    for start in range(0, len(doc_ids), 500):
+        batch = doc_ids[start:start + 500]
+        marks = ",".join("?" * len(batch))
+        conn.execute(f"DELETE FROM documents_text WHERE rowid IN ({marks})", batch)
+        conn.execute(f"DELETE FROM documents WHERE doc_id IN ({marks})", batch)
+    return len(doc_ids)
+
+def index_history_files(state_dir, paths: Iterable) -> int:
+    """
+    Add runs to the index from their task history files.
+
+    Args:
+        state_dir: The state directory
+        paths: Paths of history files
+
+    Returns:
+        int: Number of runs indexed (runs without output are skipped)
+    """
+    from app.utils.compression import load_json_file
+    from app.history_retention import parse_history_file_name
+
+    indexed = 0
+    conn = _connect(state_dir)
+    try:
+        conn.execute("BEGIN")
+        for path in paths:
+            source = _history_source(path)
+            job_id, run_time = parse_history_file_name(source)
+            if not job_id:
+                continue
+            try:
+                text = _run_text(load_json_file(path))
+            except (OSError, ValueError) as e:
+                logger.warning(f"Could not index history file {path}: {str(e)}")
+                continue
+            _delete_documents(conn, "kind = ? AND source = ?", (DOC_RUN, source))
+            if text:
+                _add_document(conn, DOC_RUN, source, text, run_time.timestamp(), job_id=job_id)
+                indexed += 1
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    finally:
+        conn.close()
+    return indexed
+
+def remove_runs(state_dir, history_names: Iterable[str]) -> int:
+    """
+    Remove runs from the index, e.g. when their history files are deleted.
+
+    Args:
+        state_dir: The state directory
+        history_names: Names of the runs' history files
+
+    Returns:
+        int: Number of documents removed
+    """
+    sources = sorted({_history_source(name) for name in history_names})
+    if not sources or not get_index_path(state_dir).exists():
+        return 0
+    conn = _connect(state_dir)
+    try:
+        removed = 0
+        for start in range(0, len(sources), 500):
+            batch = sources[start:start + 500]
+            removed += _delete_documents(conn, f"kind = '{DOC_RUN}' AND source IN ({','.join('?' * len(batch))})", batch)
+        return removed
+    finally:
+        conn.close()
+
+def index_logs(log_dir, state_dir) -> int:
+    """
+    Add the lines written to the application logs since the last pass to the index.
+
+    Only complete lines are indexed. A rotated log is indexed from the start
+    again, keeping the blocks of the rotated part; a truncated log is indexed
+    again from the start, and logs that no longer exist are removed.
+
+    Args:
+        log_dir: The log directory
+        state_dir: The state directory
+
+    Returns:
+        int: Number of log blocks indexed
+    """
+    from app.log_reader import line_timestamp
+
+    indexed = 0
+    conn = _connect(state_dir)
+    try:
+        positions = {row['name']: row for row in conn.execute("SELECT name, inode, position FROM log_positions")}
+        logs = {path.name: path for path in Path(log_dir).glob('*.log') if path.is_file()}
+
+        for name in set(positions) - set(logs):
+            conn.execute("BEGIN")
+            _delete_documents(conn, "kind = ? AND source = ?", (DOC_LOG, name))
+            conn.execute("DELETE FROM log_positions WHERE name = ?", (name,))
+            conn.execute("COMMIT")
+
+        for name, path in logs.items():
+            stat = path.stat()
+            known = positions.get(name)
+            position = known['position'] if known else 0
+            conn.execute("BEGIN")
+            if known and known['inode'] != stat.st_ino:
+                position = 0
+            elif stat.st_size < position:
+                _delete_documents(conn, "kind = ? AND source = ?", (DOC_LOG, name))
+                position = 0
+
+            with open(path, 'rb') as f:
+                f.seek(position)
+                chunk = f.read(MAX_LOG_BYTES_PER_PASS)
+            complete = chunk[:chunk.rfind(b'\n') + 1]  # Leave a line still being written for later
+            lines = complete.split(b'\n')[:-1]
+            offset = position
+            for start in range(0, len(lines), BLOCK_LINES):
+                block = lines[start:start + BLOCK_LINES]
+                ts = next((t for t in map(line_timestamp, block) if t is not None), None) or stat.st_mtime
+                _add_document(conn, DOC_LOG, name, b'\n'.join(block).decode('utf-8', errors='replace'), ts, position=offset)
+                offset += sum(len(line) + 1 for line in block)
+                indexed += 1
+
+            conn.execute(
+                "INSERT INTO log_positions (name, inode, position) VALUES (?, ?, ?) "
+                "ON CONFLICT(name) DO UPDATE SET inode = excluded.inode, position = excluded.position",
+                (name, stat.st_ino, position + len(complete))
+            )
+            conn.execute("COMMIT")
+    finally:
+        conn.close()
+    return indexed
+
+def enforce_index_limits(state_dir, max_bytes: int, max_log_age_days: int = 0) -> int:
+    """
+    Drop log blocks past the retention period and evict the oldest documents
+    while the indexed text exceeds the size limit.
+
+    Args:
+        state_dir: The state directory
+        max_bytes: Maximum bytes of indexed text (0 = unlimited)
+        max_log_age_days: Days log blocks are kept (0 = forever)
+
+    Returns:
+        int: Number of documents removed
+    """
+    conn = _connect(state_dir)
+    try:
+        conn.execute("BEGIN")
+        removed = 0
+        if max_log_age_days:
+            removed += _delete_documents(conn, "kind = ? AND ts < ?", (DOC_LOG, time.time() - max_log_age_days * 86400))
+        if max_bytes:
+            excess = (conn.execute("SELECT COALESCE(SUM(size), 0) FROM documents").fetchone()[0]) - max_bytes
+            if excess > 0:
+                # Oldest first, until the excess is covered
+                cutoff = conn.execute(
+                    "SELECT ts FROM (SELECT ts, SUM(size) OVER (ORDER BY ts, doc_id) AS total FROM documents) "
+                    "WHERE total >= ? ORDER BY ts LIMIT 1", (excess,)
+                ).fetchone()
+                if cutoff:
+                    removed += _delete_documents(conn, "ts <= ?", (cutoff['ts'],))
+        conn.execute("COMMIT")
+        return removed
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    finally:
+        conn.close()
+
+def _snippets(text: str, query: str) -> List[str]:
+    """Get the lines of a document containing the query, shortened around the match."""
+    needle = query.lower()
+    snippets = []
+    for line in text.split('\n'):
+        at = line.lower().find(needle)
+        if at < 0:
+            continue
+        if len(line) > SNIPPET_CHARS:
+            start = max(0, at - SNIPPET_CHARS // 3)
+            line = ("..." if start else "") + line[start:start + SNIPPET_CHARS] + "..."
+        snippets.append(line)
+        if len(snippets) == MAX_SNIPPETS:
+            break
+    return snippets
+
+def search(state_dir, query: str, kind: Optional[str] = None, job_id: Optional[str] = None,
+           limit: int = 50) -> Dict[str, Any]:
+    """
+    Search run output and application logs, newest first.
+
+    The query is matched as a literal string, without regard to case.
+
+    Args:
+        state_dir: The state directory
+        query: The text to search for (at least MIN_QUERY_LENGTH characters)
+        kind: Optional document kind ('run' or 'log')
+        job_id: Optional job ID to limit the search to one task's runs
+        limit: Maximum number of results
+
+    Returns:
+        dict: 'success' and 'results' (kind, source, job_id, position, timestamp
+        and the matching lines as 'snippets'), or 'error'
+    """
+    query = (query or '').strip()
+    if len(query) < MIN_QUERY_LENGTH:
+        return {'success': False, 'error': f"Search for at least {MIN_QUERY_LENGTH} characters"}
+    if not get_index_path(state_dir).exists():
+        return {'success': True, 'results': []}
+
+    conditions, params = ["documents_text MATCH ?"], ['"' + query.replace('"', '""') + '"']
+    if kind:
+        conditions.append("d.kind = ?")
+        params.append(kind)
+    if job_id:
+        conditions.append("d.job_id = ?")
+        params.append(job_id)
+    params.append(max(1, min(limit, 500)))
+
+    conn = _connect(state_dir)
+    try:
+        rows = conn.execute(
+            "SELECT d.kind, d.source, d.job_id, d.position, d.ts, t.text FROM documents_text t "
+            f"JOIN documents d ON d.doc_id = t.rowid WHERE {' AND '.join(conditions)} "
+            "ORDER BY d.ts DESC, d.doc_id DESC LIMIT ?", params
+        ).fetchall()
+    finally:
+        conn.close()
+
+    return {
+        'success': True,
+        'results': [{
+            'kind': row['kind'],
+            'source': row['source'],
+            'job_id': row['job_id'],
+            'position': row['position'],
+            'timestamp': datetime.fromtimestamp(row['ts']).isoformat(timespec='seconds'),
+            'snippets': _snippets(row['text'], query)
+        } for row in rows]
+    }
+
+def get_index_status(state_dir) -> Dict[str, Any]:
+    """
+    Get the size of the search index.
+
+    Returns:
+        dict: 'documents', 'runs', 'log_blocks' and 'text_bytes'
+    """
+    if not get_index_path(state_dir).exists():
+        return {'documents': 0, 'runs': 0, 'log_blocks': 0, 'text_bytes': 0}
+    conn = _connect(state_dir)
+    try:
+        counts = {row['kind']: row['count'] for row in conn.execute("SELECT kind, COUNT(*) AS count FROM documents GROUP BY kind")}
+        text_bytes = conn.execute("SELECT COALESCE(SUM(size), 0) FROM documents").fetchone()[0]
+    finally:
+        conn.close()
+    return {
+        'documents': sum(counts.values()),
+        'runs': counts.get(DOC_RUN, 0),
+        'log_blocks': counts.get(DOC_LOG, 0),
+        'text_bytes': text_bytes
+    }
+
+def _get_meta(state_dir, key: str) -> Optional[str]:
+    conn = _connect(state_dir)
+    try:
+        row = conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row['value'] if row else None
+    finally:
+        conn.close()
+
+def _set_meta(state_dir, key: str, value: str) -> None:
+    conn = _connect(state_dir)
+    try:
+        conn.execute("INSERT INTO meta (key, value) VALUES (?, ?) ON CONFLICT(key) DO UPDATE SET value = excluded.value", (key, value))
+    finally:
+        conn.close()
+
+class SearchIndexer:
+    """
+    Keeps the search index up to date from a background thread.
+
+    Runs are indexed as their history files are saved; the logs every
+    LOG_INDEX_INTERVAL seconds.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.pending = queue.Queue()
+        self.stopping = threading.Event()
+        self.thread = threading.Thread(target=self._run, name="SearchIndexer", daemon=True)
+
+    def start(self):
+        """Start the indexer thread."""
+        self.thread.start()
+        atexit.register(self.stop)
+
+    def stop(self, timeout=10):
+        """Stop the indexer thread."""
+        self.stopping.set()
+        self.pending.put(None)
+        if self.thread.is_alive():
+            self.thread.join(timeout)
+
+    def add_history_file(self, path):
+        """Queue a saved history file for indexing."""
+        self.pending.put(str(path))
+
+    def catch_up(self) -> int:
+        """
+        Index history files saved since the newest one indexed.
+
+        Returns:
+            int: Number of history files queued
+        """
+        config = self.app.config
+        watermark = int(_get_meta(config['STATE_DIR'], 'history_mtime_ns') or 0)
+        paths = []
+        with os.scandir(config['TASK_HISTORY_DIR']) as entries:
+            for entry in entries:
+                if '_' in entry.name and entry.is_file() and entry.stat().st_mtime_ns > watermark:
+                    paths.append((entry.stat().st_mtime_ns, entry.path))
+        for _, path in sorted(paths):
+            self.pending.put(path)
+        return len(paths)
+
+    def _index_pending(self, first):
+        config = self.app.config
+        paths = [first]
+        while len(paths) < 500:
+            try:
+                path = self.pending.get_nowait()
+            except queue.Empty:
+                break
+            if path is None:
+                break
+            paths.append(path)
+        existing = [path for path in paths if os.path.exists(path)]
+        index_history_files(config['STATE_DIR'], existing)
+        if existing:
+            newest = max(os.stat(path).st_mtime_ns for path in existing)
+            if newest > int(_get_meta(config['STATE_DIR'], 'history_mtime_ns') or 0):
+                _set_meta(config['STATE_DIR'], 'history_mtime_ns', str(newest))
+
+    def _index_logs(self):
+        config = self.app.config
+        index_logs(config['LOG_DIR'], config['STATE_DIR'])
+        enforce_index_limits(
+            config['STATE_DIR'],
+            int(config.get('SEARCH_INDEX_MAX_MB', 100) * 1024 * 1024),
+            config.get('HISTORY_RETENTION_DAYS', 14)
+        )
+
+    def _run(self):
+        try:
+            self.catch_up()
+        except Exception as e:
+            logger.error(f"Error catching up with the task history in the search index: {str(e)}")
+
+        next_log_pass = 0
+        while not self.stopping.is_set():
+            try:
+                path = self.pending.get(timeout=max(0.1, next_log_pass - time.monotonic()))
+                if path is not None:
+                    self._index_pending(path)
+            except queue.Empty:
+                pass
+            except Exception as e:
+                logger.error(f"Error indexing runs for search: {str(e)}")
+
+            if time.monotonic() >= next_log_pass and not self.stopping.is_set():
+                try:
+                    self._index_logs()
+                except Exception as e:
+                    logger.error(f"Error indexing logs for search: {str(e)}")
+                next_log_pass = time.monotonic() + LOG_INDEX_INTERVAL
+
+_indexer = None
+_indexer_lock = threading.Lock()
+
+def start_search_indexer(app) -> Optional[SearchIndexer]:
+    """
+    Start the process-wide search indexer, if search is enabled.
+
+    Args:
+        app: The Flask application
+
+    Returns:
+        SearchIndexer: The indexer, or None if search is disabled
+    """
+    global _indexer
+    if not app.config.get('SEARCH_INDEX_ENABLED', True):
+        return None
+    with _indexer_lock:
+        if _indexer is None:
+            _indexer = SearchIndexer(app)
+            _indexer.start()
+        return _indexer
+
+def queue_history_file(path) -> None:
+    """Queue a saved history file for the search index, if the indexer runs in this process."""
+    if _indexer is not None:
+        _indexer.add_history_file(path)
@@ -0,0 +1,377 @@
+"""
+Task search index for EzTaskRunner.
+
+Keeps an in-memory index of all tasks so the dashboard can search and filter
+them without re-reading every task file and scanning every task per request.
+
+- Text (task name, description and script path) is indexed by trigram. A
+  search finds the tasks whose name, description or script path contains the
+  whole search text; the candidates of its trigrams are checked against the
+  text, so results match exactly like a substring scan. Searches shorter than
+  a trigram scan the text of the tasks left by the filters.
+- Status, script type, tags and the enabled flag are indexed as sets of job
+  IDs per value.
+
+A query is answered by intersecting the sets of its filters, smallest first,
+then the tasks containing the search text, and its results are returned a
+page at a time in the requested sort order, continued by cursor. The index is
+updated when a task is added, updated or deleted in this process, and picks
+up changes written by other processes (such as the worker updating a task's
+status) by comparing task file modification times, at most every
+REFRESH_SECONDS.
+"""
+import base64
+import bisect
+import json
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Any, Optional, List, Set, Tuple
+
+logger = logging.getLogger("EzTaskRunner")
+
+# Seconds between checks of the task files for changes made by other processes
+REFRESH_SECONDS = 2.0
+
+# Default and largest number of tasks in a page of results
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+# Fields results can be sorted by
+SORT_FIELDS = ('name', 'status', 'last_run', 'next_run', 'failure_rate')
+
+def _task_text(task: Dict[str, Any]) -> str:
+    """Get the searchable text of a task; fields are separated so no match spans two."""
+    return '\0'.join(str(task.get(field) or '') for field in ('task_name', 'description', 'script_path')).lower()
+
+def _trigrams(text: str) -> Set[str]:
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+def _facets(task: Dict[str, Any]) -> List[Tuple[str, str]]:
+    """Get the (field, value) pairs a task can be filtered by."""
+    facets = [
+        ('status', str(task.get('status') or 'PENDING')),
+        ('script_type', str(task.get('script_type') or 'unknown')),
+        ('enabled', 'false' if task.get('enabled', True) is False else 'true'),
+    ]
+    facets.extend(('tag', tag) for tag in task.get('tags') or [])
+    return facets
+
+def failure_rate(task: Dict[str, Any]) -> Optional[float]:
+    """Get the percentage of a task's executed runs that failed, or None if none ran."""
+    counts = (task.get('run_stats') or {}).get('counts', {})
+    executed = counts.get('success', 0) + counts.get('failed', 0)
+    return counts.get('failed', 0) * 100 / executed if executed else None
+
+class _Descending:
+    """Wraps a sort value so that it sorts in reverse."""
+
+    __slots__ = ('value',)
+
+    def __init__(self, value):
+        self.value = value
+
+    def __lt__(self, other):
+        return other.value < self.value
+
+    def __eq__(self, other):
+        return self.value == other.value
+
+def _sort_key(value, job_id: str, order: str) -> tuple:
+    """Get the key giving tasks their place in a sort order; missing values sort last."""
+    missing = value is None
+    if missing:
+        value = ''
+    return (missing, _Descending(value) if order == 'desc' else value, job_id)
+
+def _encode_cursor(key: tuple, sort: str, order: str) -> str:
+    """Encode the sort key of the last task of a page as an opaque cursor."""
+    missing, value, job_id = key
+    value = None if missing else (value.value if isinstance(value, _Descending) else value)
+    return base64.urlsafe_b64encode(json.dumps([sort, order, value, job_id]).encode()).decode().rstrip('=')
+
+def _decode_cursor(cursor: str, sort: str, order: str) -> tuple:
+    """Decode a cursor into the sort key to continue after."""
+    try:
+        cursor_sort, cursor_order, value, job_id = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except (ValueError, TypeError):
+        raise ValueError("Invalid cursor")
+    if (cursor_sort, cursor_order) != (sort, order):
+        raise ValueError("The cursor belongs to a different sort order")
+    if value is not None and not isinstance(value, str if sort in ('name', 'status', 'last_run') else (int, float)):
+        raise ValueError("Invalid cursor")
+    return _sort_key(value, str(job_id), order)
+
+class TaskIndex:
+    """In-memory search index over the tasks of a task directory."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self._clear()
+
+    def _clear(self) -> None:
+        self.tasks_dir = None
+        self.tasks = {}       # job_id -> task dictionary (a copy)
+        self.texts = {}       # job_id -> searchable text
+        self.sort_keys = {}   # job_id -> sort key
+        self.file_stats = {}  # job_id -> (mtime_ns, size) of the task file indexed
+        self.trigrams = {}    # trigram -> job IDs
+        self.facets = {}      # (field, value) -> job IDs
+        self.last_refresh = 0.0
+
+    def _add(self, job_id: str, task: Dict[str, Any]) -> None:
+        self._remove(job_id)
+        text = _task_text(task)
+        self.tasks[job_id] = dict(task)
+        self.texts[job_id] = text
+        self.sort_keys[job_id] = (str(task.get('task_name') or '').lower(), job_id)
+        for gram in _trigrams(text):
+            self.trigrams.setdefault(gram, set()).add(job_id)
+        for facet in _facets(task):
+            self.facets.setdefault(facet, set()).add(job_id)
+
+    def _remove(self, job_id: str) -> None:
+        task = self.tasks.pop(job_id, None)
+        if task is None:
+            return
+        text = self.texts.pop(job_id)
+        self.sort_keys.pop(job_id, None)
+        for postings, keys in ((self.trigrams, _trigrams(text)), (self.facets, _facets(task))):
+            for key in keys:
+                ids = postings.get(key)
+                if ids is not None:
+                    ids.discard(job_id)
+                    if not ids:
+                        del postings[key]
+
+    def _file_stat(self, job_id: str) -> Optional[Tuple[int, int]]:
+        try:
+            stat = os.stat(Path(self.tasks_dir) / f"{job_id}.json")
+            return (stat.st_mtime_ns, stat.st_size)
+        except (OSError, TypeError):
+            return None
+
+    def put(self, job_id: str, task: Dict[str, Any]) -> None:
+        """Index a task that was added or updated in this process."""
+        with self.lock:
+            self._add(job_id, task)
+            self.file_stats[job_id] = self._file_stat(job_id)
+
+    def remove(self, job_id: str) -> None:
+        """Drop a deleted task from the index."""
+        with self.lock:
+            self._remove(job_id)
+            self.file_stats.pop(job_id, None)
+
+    def refresh(self, tasks_dir, force: bool = False) -> int:
+        """
+        Re-index the task files that changed since they were last indexed.
+
+        Args:
+            tasks_dir: The task directory
+            force: Check the files even if they were checked within REFRESH_SECONDS
+
+        Returns:
+            int: Number of tasks added, updated or removed
+        """
+        from app.task_manager import load_task_file
+
+        with self.lock:
+            tasks_dir = str(tasks_dir)
+            if tasks_dir != self.tasks_dir:
+                self._clear()
+                self.tasks_dir = tasks_dir
+            elif not force and time.monotonic() - self.last_refresh < REFRESH_SECONDS:
+                return 0
+
+            changed = 0
+            seen = set()
+            try:
+                entries = list(os.scandir(tasks_dir))
+            except OSError:
+                entries = []
+            for entry in entries:
+                if not entry.name.endswith('.json') or not entry.is_file():
+                    continue
+                job_id = entry.name[:-len('.json')]
+                seen.add(job_id)
+                try:
+                    stat = entry.stat()
+                    file_stat = (stat.st_mtime_ns, stat.st_size)
+                    if self.file_stats.get(job_id) == file_stat:
+                        continue
+                    task = load_task_file(entry.path)
+                except Exception as e:
+                    # Possibly caught mid-write; retried on the next refresh
+                    logger.warning(f"Could not index task file {entry.name}: {str(e)}")
+                    continue
+                task.setdefault('job_id', job_id)
+                self._add(job_id, task)
+                self.file_stats[job_id] = file_stat
+                changed += 1
+
+            for job_id in set(self.tasks) - seen:
+                self._remove(job_id)
+                self.file_stats.pop(job_id, None)
+                changed += 1
+
+            self.last_refresh = time.monotonic()
+            return changed
+
+    def _text_matches(self, text: str, candidates: Optional[Set[str]] = None) -> Set[str]:
+        """
+        Get the tasks whose name, description or script path contains a search text.
+
+        Args:
+            text: The lower-case search text
+            candidates: Tasks to search among, or None for all tasks
+        """
+        if len(text) >= 3:
+            grams = sorted((self.trigrams.get(gram, set()) for gram in _trigrams(text)), key=len)
+            if candidates is not None:
+                grams.insert(0, candidates)
+            candidates = set(grams[0]).intersection(*grams[1:])
+        elif candidates is None:
+            # Too short for trigrams: scan the text of every task
+            candidates = self.tasks.keys()
+        # Trigrams may come from different places in the text; confirm the substring
+        return {job_id for job_id in candidates if text in self.texts[job_id]}
+
+    def _sort_value(self, job_id: str, sort: str, next_runs: Dict[str, float]):
+        """Get the value a task is sorted by; None sorts last."""
+        task = self.tasks[job_id]
+        if sort == 'name':
+            return self.sort_keys[job_id][0]
+        if sort == 'status':
+            return str(task.get('status') or 'PENDING')
+        if sort == 'last_run':
+            return task.get('last_run') or None
+        if sort == 'next_run':
+            return next_runs.get(job_id)
+        if sort == 'failure_rate':
+            return failure_rate(task)
+        raise ValueError(f"Unknown sort field: {sort}")
+
+    def search(self, query: str = '', status: Optional[str] = None, script_type: Optional[str] = None,
+               tag: Optional[str] = None, enabled: Optional[bool] = None,
+               sort: str = 'name', order: str = 'asc', cursor: Optional[str] = None,
+               limit: int = DEFAULT_PAGE_SIZE, next_runs: Optional[Dict[str, float]] = None) -> Dict[str, Any]:
+        """
+        Find tasks matching a search query and filters, one page at a time.
+
+        The query is found anywhere in the task name, description or script
+        path, as a whole (so 'backup task' does not match 'Task backup').
+
+        Pages are continued with the cursor returned by the previous page. The
+        cursor holds the sort value and job ID of the last task returned, so
+        tasks added or removed meanwhile do not shift the following pages.
+
+        Args:
+            query: Search text
+            status: Only tasks with this status
+            script_type: Only tasks with this script type
+            tag: Only tasks with this tag
+            enabled: Only enabled (True) or disabled (False) tasks
+            sort: One of SORT_FIELDS; ties are ordered by job ID
+            order: 'asc' or 'desc'; tasks without a value sort last either way
+            cursor: The next_cursor of the previous page, or None for the first page
+            limit: Tasks per page
+            next_runs: Next run times (epoch) by job ID, to sort by next_run
+
+        Returns:
+            dict: 'tasks' (copies of the tasks on the page), 'total' (tasks
+            matching), 'next_cursor' (None on the last page), 'sort', 'order'
+            and 'limit'
+
+        Raises:
+            ValueError: If the sort field, order or cursor is invalid
+        """
+        if sort not in SORT_FIELDS:
+            raise ValueError(f"Unknown sort field: {sort}")
+        if order not in ('asc', 'desc'):
+            raise ValueError(f"Unknown sort order: {order}")
+        limit = max(1, min(limit or DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE))
+        next_runs = next_runs or {}
+        after = _decode_cursor(cursor, sort, order) if cursor else None
+
+        with self.lock:
+            sets = []
+            for field, value in (('status', status), ('script_type', script_type), ('tag', tag)):
+                if value:
+                    sets.append(self.facets.get((field, value), set()))
+            if enabled is not None:
+                sets.append(self.facets.get(('enabled', 'true' if enabled else 'false'), set()))
+
+            # Intersect the smallest sets first; the search text is only
+            # looked for in the tasks left by the filters
+            sets.sort(key=len)
+            matches = set(sets[0]).intersection(*sets[1:]) if sets else None
+            text = query.strip().lower().replace('\0', '')
+            if text and (matches is None or matches):
+                matches = self._text_matches(text, matches)
+            if matches is None:
+                matches = self.tasks.keys()
+
+            # Keys end with the job ID, so each task has a unique place to continue after
+            keys = sorted(_sort_key(self._sort_value(job_id, sort, next_runs), job_id, order) for job_id in matches)
+            start = bisect.bisect_right(keys, after) if after is not None else 0
+            window = keys[start:start + limit]
+            has_more = start + limit < len(keys)
+            return {
+                'tasks': [dict(self.tasks[key[2]]) for key in window],
+                'total': len(keys),
+                'next_cursor': _encode_cursor(window[-1], sort, order) if window and has_more else None,
+                'sort': sort,
+                'order': order,
+                'limit': limit,
+            }
+
+    def tasks_with(self, field: str, value: str) -> List[Dict[str, Any]]:
+        """
+        Get every task with a filter value, unpaged (e.g. all RUNNING tasks).
+
+        Args:
+            field: 'status', 'script_type', 'tag' or 'enabled'
+            value: The value
+
+        Returns:
+            list: Copies of the tasks
+        """
+        with self.lock:
+            return [dict(self.tasks[job_id]) for job_id in self.facets.get((field, value), ())]
+
+    def facet_values(self) -> Dict[str, List[str]]:
+        """Get the statuses, script types and tags present, for filter choices."""
+        with self.lock:
+            values = {'status': [], 'script_type': [], 'tag': []}
+            for field, value in self.facets:
+                if field in values:
+                    values[field].append(value)
+            return {field: sorted(items) for field, items in values.items()}
+
+_task_index = TaskIndex()
+
+def get_task_index(tasks_dir) -> TaskIndex:
+    """
+    Get the task index, bringing it up to date with the task files.
+
+    Args:
+        tasks_dir: The task directory
+
+    Returns:
+        TaskIndex: The index
+    """
+    _task_index.refresh(tasks_dir)
+    return _task_index
+
+def index_task(job_id: str, task: Dict[str, Any]) -> None:
+    """Update the index after a task was saved by this process."""
+    if _task_index.tasks_dir is not None:
+        _task_index.put(job_id, task)
+
+def unindex_task(job_id: str) -> None:
+    """Update the index after a task was deleted by this process."""
+    if _task_index.tasks_dir is not None:
+        _task_index.remove(job_id)
@@ -7,6 +7,7 @@ import os
 import json
 import logging
 import importlib
+import socket
 from pathlib import Path
 from datetime import datetime, timedelta
 import time
@@ -15,14 +16,24 @@ from threading import Lock
 from concurrent.futures import ThreadPoolExecutor
 from flask import current_app
 
+from app import metrics
+from app.utils.compression import load_json_file, get_configured_codec
+from app.run_context import get_run_id, run_context
+from app.task_index import index_task, unindex_task
+from app.event_bus import event_bus
+
 # Get loggers
 logger = logging.getLogger("EzTaskRunner")
 tasks_logger = logging.getLogger("EzTaskRunner.Tasks")
 tools_logger = logging.getLogger("EzTaskRunner.Tools")
 
+# Owner name for runs claimed from the run queue by this process
+LOCAL_OWNER = f"local:{socket.gethostname()}:{os.getpid()}"
+
 # Constants
 MAX_WORKERS = min(os.cpu_count() or 4, 8)  # Use CPU count up to a maximum of 8 workers
 MAX_MEMORY_PERCENT = 85.0  # Maximum memory usage percentage
+DONE_RUN_MARGIN_SECONDS = 24 * 3600  # Done runs are kept this long beyond the retry budget window
 
 # Locks and executors
 task_executor = ThreadPoolExecutor(
@@ -31,6 +42,21 @@ task_executor = ThreadPoolExecutor(
 )
 task_lock = Lock()
 
+# Run queue IDs submitted to the task executor and not finished yet, so the
+# dispatch sweep does not submit runs still waiting in the executor again
+submitted_runs = set()
+submitted_runs_lock = Lock()
+
+# Executor occupancy is read when /metrics is scraped
+metrics.EXECUTOR_MAX_WORKERS.set(MAX_WORKERS)
+metrics.EXECUTOR_BACKLOG.set_function(lambda: task_executor._work_queue.qsize())
+
+def _pending_run_counts():
+    from app.run_queue import count_pending_runs
+    return [({"status": r["status"], "target": r["target"]}, r["count"]) for r in count_pending_runs()]
+
+metrics.RUN_QUEUE_DEPTH.set_function(_pending_run_counts)
+
 # In-memory task store
 tasks = {}
 
@@ -44,6 +70,8 @@ def add_task_to_store(job_id: str, task_data: Dict[str, Any]) -> None:
     """
     logger = logging.getLogger("EzTaskRunner")
     with task_lock:
+        # Every saved change raises the task's version (see update_task)
+        task_data['version'] = 1
         tasks[job_id] = task_data
     
     # Save to disk if task storage is enabled
@@ -52,9 +80,17 @@ def add_task_to_store(job_id: str, task_data: Dict[str, Any]) -> None:
         if tasks_dir:
             os.makedirs(tasks_dir, exist_ok=True)
             task_file = Path(tasks_dir) / f"{job_id}.json"
-            with open(task_file, 'w') as f:
+            with metrics.STORE_WRITE_LATENCY.time(operation="add"), open(task_file, 'w') as f:
                 json.dump(task_data, f, indent=2)
             logger.info(f"Task {job_id} saved to disk")
+            index_task(job_id, task_data)
+        
+        # In web mode the worker process owns the scheduler and the event bus
+        if current_app.config.get('RUN_MODE') == 'web':
+            from app.worker import notify_worker
+            notify_worker('reload_task', job_id=job_id)
+        else:
+            event_bus.publish_task_status(job_id, task_data)
     except Exception as e:
         logger.error(f"Error saving task to disk: {str(e)}")
 
@@ -68,22 +104,26 @@ def get_task(job_id: str) -> Optional[Dict[str, Any]]:
     Returns:
         The task data dictionary or None if not found
     """
-    # Check in-memory store first
-    with task_lock:
-        if job_id in tasks:
-            return tasks[job_id]
-    
-    # Try to load from disk
     try:
         from flask import current_app
         
         try:
             tasks_dir = current_app.config.get('TASKS_DIR')
+            run_mode = current_app.config.get('RUN_MODE')
         except RuntimeError:  # Working outside of application context
             from app import app
             with app.app_context():
                 tasks_dir = current_app.config.get('TASKS_DIR')
-                
+                run_mode = current_app.config.get('RUN_MODE')
+        
+        # Check in-memory store first. Web processes always re-read the task
+        # file because the worker process owns the task state.
+        if run_mode != 'web':
+            with task_lock:
+                if job_id in tasks:
+                    return tasks[job_id]
+        
+        # Try to load from disk
         if tasks_dir:
             task_file = Path(tasks_dir) / f"{job_id}.json"
             if task_file.exists():
@@ -97,13 +137,17 @@ def get_task(job_id: str) -> Optional[Dict[str, Any]]:
     
     return None
 
-def update_task(job_id: str, task_data: Dict[str, Any]) -> bool:
+def update_task(job_id: str, task_data: Dict[str, Any], expected_version: Optional[int] = None) -> bool:
     """
     Update a task in the task store.
     
+    Each update raises the task's version by one, so a task's version
+    identifies its current state (the API derives its ETags from it).
+    
     Args:
         job_id: The job ID
         task_data: The updated task data dictionary
+        expected_version: Only update the task if it is still at this version
         
     Returns:
         bool: Whether the update was successful
@@ -116,15 +160,22 @@ def update_task(job_id: str, task_data: Dict[str, Any]) -> bool:
             logger.warning(f"Attempted to update non-existent task: {job_id}")
             return False
         
+        # Refuse the update if the task was changed since the caller read it
+        version = tasks[job_id].get('version', 0)
+        if expected_version is not None and version != expected_version:
+            logger.info(f"Task {job_id} not updated: it is at version {version}, not {expected_version}")
+            return False
+        
         # Update the task
         tasks[job_id].update(task_data)
+        tasks[job_id]['version'] = version + 1
     
     # Save to disk if task storage is enabled
     try:
         tasks_dir = current_app.config.get('TASKS_DIR')
         if tasks_dir:
             task_file = Path(tasks_dir) / f"{job_id}.json"
-            with open(task_file, 'w') as f:
+            with metrics.STORE_WRITE_LATENCY.time(operation="update"), open(task_file, 'w') as f:
                 with task_lock:
                     json.dump(tasks[job_id], f, indent=2)
             logger.info(f"Task {job_id} updated and saved to disk")
@@ -132,117 +183,16 @@ def update_task(job_id: str, task_data: Dict[str, Any]) -> bool:
             # Update the task in the scheduler if enabled
             with task_lock:
                 task_info = tasks[job_id]
-                
-            # Update the scheduler if the task is enabled
-            if task_info.get('enabled', True):
-                try:
-                    # Get the scheduler
-                    scheduler = current_app.config.get('SCHEDULER')
-                    if not scheduler:
-                        logger.warning("Scheduler not found in app config, task will not be scheduled")
-                        return True
-                    
-                    # Remove the existing job if it exists
-                    try:
-                        scheduler.remove_job(job_id)
-                        logger.info(f"Removed existing job from scheduler: {job_id}")
-                    except:
-                        # Job may not exist in the scheduler yet, which is fine
-                        pass
-                    
-                    # Create the appropriate trigger based on the task's trigger type
-                    trigger_type = task_info.get('trigger_type')
-                    if not trigger_type:
-                        logger.warning(f"No trigger type for task {job_id}, not scheduling")
-                        return True
-                    
-                    if trigger_type == 'date':
-                        from apscheduler.triggers.date import DateTrigger
-                        run_date_str = task_info.get('run_date')
-                        if not run_date_str:
-                            logger.warning(f"No run date for date trigger in task {job_id}")
-                            return True
-                            
-                        # Parse the date string
-                        from datetime import datetime
-                        for fmt in ("%Y-%m-%dT%H:%M", "%Y-%m-%d %H:%M:%S"):
-                            try:
-                                run_date = datetime.strptime(run_date_str, fmt)
-                                break
-                            except ValueError:
-                                continue
-                        else:
-                            logger.warning(f"Invalid date format for task {job_id}: {run_date_str}")
-                            return True
-                            
-                        trigger = DateTrigger(run_date=run_date)
-                        
-                    elif trigger_type == 'interval':
-                        from apscheduler.triggers.interval import IntervalTrigger
-                        interval_days = int(task_info.get('interval_days', 0))
-                        interval_hours = int(task_info.get('interval_hours', 0))
-                        interval_minutes = int(task_info.get('interval_minutes', 0))
-                        
-                        if interval_days == 0 and interval_hours == 0 and interval_minutes == 0:
-                            logger.warning(f"Invalid interval for task {job_id}")
-                            return True
-                            
-                        trigger = IntervalTrigger(
-                            days=interval_days,
-                            hours=interval_hours,
-                            minutes=interval_minutes
-                        )
-                        
-                    elif trigger_type == 'cron':
-                        from apscheduler.triggers.cron import CronTrigger
-                        cron_expr = task_info.get('cron_expression')
-                        if not cron_expr:
-                            logger.warning(f"No cron expression for task {job_id}")
-                            return True
-                            
-                        try:
-                            # Try to parse as a proper cron expression
-                            minute, hour, day, month, day_of_week = cron_expr.split()
-                            trigger = CronTrigger(
-                                minute=minute,
-                                hour=hour,
-                                day=day,
-                                month=month,
-                                day_of_week=day_of_week
-                            )
-                        except ValueError:
-                            logger.warning(f"Invalid cron expression for task {job_id}: {cron_expr}")
-                            return True
-                    else:
-                        logger.warning(f"Unsupported trigger type for task {job_id}: {trigger_type}")
-                        return True
-                    
-                    # Register the task with the scheduler
-                    from app.utils.task_helpers import run_task
-                    logger.info(f"Registering updated task {job_id} with the scheduler using trigger type {trigger_type}")
-                    scheduler.add_job(
-                        func=run_task,
-                        trigger=trigger,
-                        args=[job_id],
-                        id=job_id
-                    )
-                    
-                    logger.info(f"Task {job_id} successfully registered with scheduler")
-                except Exception as e:
-                    logger.error(f"Error updating task in scheduler: {str(e)}")
+                index_task(job_id, task_info)
+            
+            if current_app.config.get('RUN_MODE') == 'web':
+                # The worker process owns the scheduler; ask it to pick up the change
+                from app.worker import notify_worker
+                notify_worker('reload_task', job_id=job_id)
             else:
-                # If task is disabled, remove it from the scheduler
-                try:
-                    scheduler = current_app.config.get('SCHEDULER')
-                    if scheduler:
-                        try:
-                            scheduler.remove_job(job_id)
-                            logger.info(f"Removed disabled task from scheduler: {job_id}")
-                        except:
-                            # Job may not exist in the scheduler, which is fine
-                            pass
-                except Exception as e:
-                    logger.error(f"Error removing disabled task from scheduler: {str(e)}")
+                sync_task_with_scheduler(job_id, task_info)
+                # Tell status feed subscribers about state transitions
+                event_bus.publish_task_status(job_id, task_info)
                     
     except Exception as e:
         logger.error(f"Error updating task: {str(e)}")
@@ -268,6 +218,9 @@ def delete_task_from_store(job_id: str) -> bool:
         if scheduler:
             scheduler.remove_job(job_id)
             logger.info(f"Removed job {job_id} from scheduler")
+        elif current_app.config.get('RUN_MODE') == 'web':
+            from app.worker import notify_worker
+            notify_worker('remove_task', job_id=job_id)
     except Exception as e:
         logger.warning(f"Error removing job from scheduler: {str(e)}")
     
@@ -284,11 +237,41 @@ def delete_task_from_store(job_id: str) -> bool:
             if task_file.exists():
                 task_file.unlink()
                 logger.info(f"Deleted task file for {job_id}")
+        unindex_task(job_id)
+        if current_app.config.get('RUN_MODE') != 'web':
+            event_bus.forget_task(job_id)
         return True
     except Exception as e:
         logger.error(f"Error deleting task file: {str(e)}")
         return False
 
+def load_task_file(task_file) -> Dict[str, Any]:
+    """
+    Read a task file, filling in the script type of tasks saved without one.
+    
+    Args:
+        task_file: Path of the task file
+        
+    Returns:
+        The task data dictionary
+    """
+    with open(task_file, 'r') as f:
+        task_data = json.load(f)
+    
+    # Ensure script_type is populated for existing tasks
+    if 'script_type' not in task_data and 'script_path' in task_data:
+        file_ext = Path(task_data['script_path']).suffix.lower()
+        if file_ext == '.py':
+            task_data['script_type'] = 'python'
+        elif file_ext == '.ps1':
+            task_data['script_type'] = 'powershell'
+        elif file_ext in ['.bat', '.cmd']:
+            task_data['script_type'] = 'batch'
+        else:
+            task_data['script_type'] = 'unknown'
+    
+    return task_data
+
 def get_all_tasks() -> List[Dict[str, Any]]:
     """
     Get all tasks.
@@ -303,24 +286,7 @@ def get_all_tasks() -> List[Dict[str, Any]]:
     tasks = []
     for task_file in tasks_dir.glob('*.json'):
         try:
-            with open(task_file, 'r') as f:
-                task_data = json.load(f)
-                
-                # Ensure script_type is populated for existing tasks
-                if 'script_type' not in task_data and 'script_path' in task_data:
-                    from pathlib import Path
-                    script_path = task_data['script_path']
-                    file_ext = Path(script_path).suffix.lower()
-                    if file_ext == '.py':
-                        task_data['script_type'] = 'python'
-                    elif file_ext == '.ps1':
-                        task_data['script_type'] = 'powershell'
-                    elif file_ext in ['.bat', '.cmd']:
-                        task_data['script_type'] = 'batch'
-                    else:
-                        task_data['script_type'] = 'unknown'
-                
-                tasks.append(task_data)
+            tasks.append(load_task_file(task_file))
         except Exception as e:
             logger.error(f"Error loading task from {task_file}: {e}")
     
@@ -367,6 +333,11 @@ def load_tasks_from_disk() -> None:
         
         logger.info(f"Loaded {files_loaded} tasks from disk")
         
+        # Resume following runs that kept running detached during the restart,
+        # then re-queue runs interrupted by the restart and dispatch queued runs
+        reattach_detached_runs()
+        replay_run_queue()
+        
         # Check for tasks that might be stuck in RUNNING state
         try:
             cleanup_running_tasks()
@@ -379,6 +350,168 @@ def load_tasks_from_disk() -> None:
         logger.error(f"Error loading tasks from disk: {str(e)}")
         # Don't raise the exception to avoid app startup failures
 
+def build_trigger(job_id: str, task_data: Dict[str, Any]):
+    """
+    Build an APScheduler trigger from a task's stored schedule settings.
+    
+    Args:
+        job_id: The job ID (used for log messages)
+        task_data: The task data dictionary
+        
+    Returns:
+        The trigger, or None if the task has no valid schedule
+    """
+    logger = logging.getLogger("EzTaskRunner")
+    
+    trigger_type = task_data.get('trigger_type')
+    if not trigger_type:
+        logger.warning(f"No trigger type for task {job_id}, not scheduling")
+        return None
+    
+    if trigger_type == 'date':
+        from apscheduler.triggers.date import DateTrigger
+        # Parse the run_date string into a datetime object
+        run_date_str = task_data.get('run_date')
+        if not run_date_str:
+            logger.warning(f"No run date for date trigger in task {job_id}")
+            return None
+        
+        # Try different formats
+        for fmt in ("%Y-%m-%dT%H:%M", "%Y-%m-%d %H:%M:%S"):
+            try:
+                run_date = datetime.strptime(run_date_str, fmt)
+                break
+            except ValueError:
+                continue
+        else:
+            logger.warning(f"Invalid date format for task {job_id}: {run_date_str}")
+            return None
+        
+        return DateTrigger(run_date=run_date)
+    
+    if trigger_type == 'interval':
+        from apscheduler.triggers.interval import IntervalTrigger
+        # Get interval parameters
+        interval_days = int(task_data.get('interval_days', 0))
+        interval_hours = int(task_data.get('interval_hours', 0))
+        interval_minutes = int(task_data.get('interval_minutes', 0))
+        interval_seconds = int(task_data.get('interval_seconds', 0))
+        
+        if interval_days == 0 and interval_hours == 0 and interval_minutes == 0 and interval_seconds == 0:
+            logger.warning(f"Invalid interval for task {job_id}")
+            return None
+        
+        return IntervalTrigger(
+            days=interval_days,
+            hours=interval_hours,
+            minutes=interval_minutes,
+            seconds=interval_seconds
+        )
+    
+    if trigger_type == 'cron':
+        from apscheduler.triggers.cron import CronTrigger
+        # Get cron parameters
+        cron_expr = task_data.get('cron_expression')
+        if not cron_expr:
+            logger.warning(f"No cron expression for task {job_id}")
+            return None
+        
+        try:
+            # Try to parse as a proper cron expression
+            minute, hour, day, month, day_of_week = cron_expr.split()
+            return CronTrigger(
+                minute=minute,
+                hour=hour,
+                day=day,
+                month=month,
+                day_of_week=day_of_week
+            )
+        except ValueError:
+            logger.warning(f"Invalid cron expression for task {job_id}: {cron_expr}")
+            return None
+    
+    logger.warning(f"Unsupported trigger type for task {job_id}: {trigger_type}")
+    return None
+
+def sync_task_with_scheduler(job_id: str, task_data: Dict[str, Any], scheduler=None) -> bool:
+    """
+    Make the scheduler job for a task match its current settings.
+    
+    Enabled tasks are (re-)registered with a freshly built trigger, disabled
+    tasks are removed from the scheduler.
+    
+    Args:
+        job_id: The job ID
+        task_data: The task data dictionary
+        scheduler: Optional scheduler instance (defaults to the app's scheduler)
+        
+    Returns:
+        bool: True if the task is now registered with the scheduler
+    """
+    logger = logging.getLogger("EzTaskRunner")
+    
+    try:
+        if scheduler is None:
+            scheduler = current_app.config.get('SCHEDULER')
+        if not scheduler:
+            logger.warning("Scheduler not found in app config, task will not be scheduled")
+            return False
+        
+        # Remove the existing job if it exists
+        try:
+            scheduler.remove_job(job_id)
+            logger.info(f"Removed existing job from scheduler: {job_id}")
+        except Exception:
+            # Job may not exist in the scheduler yet, which is fine
+            pass
+        
+        # If task is disabled, leave it out of the scheduler
+        if not task_data.get('enabled', True):
+            logger.info(f"Task {job_id} is disabled, not scheduling")
+            return False
+        
+        trigger = build_trigger(job_id, task_data)
+        if trigger is None:
+            return False
+        
+        # Register the task with the scheduler
+        from app.utils.task_helpers import run_task
+        logger.info(f"Registering task {job_id} with the scheduler using trigger type {task_data.get('trigger_type')}")
+        scheduler.add_job(
+            func=run_task,
+            trigger=trigger,
+            args=[job_id],
+            id=job_id
+        )
+        logger.info(f"Task {job_id} successfully registered with scheduler")
+        return True
+    except Exception as e:
+        logger.error(f"Error registering task {job_id} with scheduler: {str(e)}")
+        return False
+
+def get_next_run_times() -> Dict[str, float]:
+    """
+    Get the next scheduled run time of every scheduled task.
+    
+    Web processes have no scheduler and ask the worker.
+    
+    Returns:
+        dict: Epoch times by job ID
+    """
+    scheduler = current_app.config.get('SCHEDULER')
+    if scheduler:
+        return {
+            job.id: job.next_run_time.timestamp()
+            for job in scheduler.get_jobs()
+            if job.next_run_time and not job.id.startswith('__system_')
+        }
+    if current_app.config.get('RUN_MODE') == 'web':
+        from app.worker import notify_worker
+        reply = notify_worker('next_run_times')
+        if reply.get('success'):
+            return reply['next_runs']
+    return {}
+
 def register_tasks_with_scheduler():
     """Register all enabled tasks with the scheduler."""
     logger = logging.getLogger("EzTaskRunner")
@@ -403,102 +536,81 @@ def register_tasks_with_scheduler():
         
         # Register each enabled task
         with task_lock:
-            for job_id, task_data in tasks.items():
-                # Skip disabled tasks
-                if not task_data.get('enabled', True):
-                    logger.info(f"Skipping disabled task: {job_id}")
-                    continue
-                
-                try:
-                    # Create the appropriate trigger based on the task's trigger type
-                    trigger_type = task_data.get('trigger_type')
-                    if not trigger_type:
-                        logger.warning(f"No trigger type for task {job_id}, skipping")
-                        continue
-                    
-                    if trigger_type == 'date':
-                        from apscheduler.triggers.date import DateTrigger
-                        # Parse the run_date string into a datetime object
-                        run_date_str = task_data.get('run_date')
-                        if not run_date_str:
-                            logger.warning(f"No run date for date trigger in task {job_id}, skipping")
-                            continue
-                            
-                        from datetime import datetime
-                        # Try different formats
-                        for fmt in ("%Y-%m-%dT%H:%M", "%Y-%m-%d %H:%M:%S"):
-                            try:
-                                run_date = datetime.strptime(run_date_str, fmt)
-                                break
-                            except ValueError:
-                                continue
-                        else:
-                            logger.warning(f"Invalid date format for task {job_id}: {run_date_str}, skipping")
-                            continue
-                            
-                        trigger = DateTrigger(run_date=run_date)
-                        
-                    elif trigger_type == 'interval':
-                        from apscheduler.triggers.interval import IntervalTrigger
-                        # Get interval parameters
-                        interval_days = int(task_data.get('interval_days', 0))
-                        interval_hours = int(task_data.get('interval_hours', 0))
-                        interval_minutes = int(task_data.get('interval_minutes', 0))
-                        
-                        if interval_days == 0 and interval_hours == 0 and interval_minutes == 0:
-                            logger.warning(f"Invalid interval for task {job_id}, skipping")
-                            continue
-                            
-                        trigger = IntervalTrigger(
-                            days=interval_days,
-                            hours=interval_hours,
-                            minutes=interval_minutes
-                        )
-                        
-                    elif trigger_type == 'cron':
-                        from apscheduler.triggers.cron import CronTrigger
-                        # Get cron parameters
-                        cron_expr = task_data.get('cron_expression')
-                        if not cron_expr:
-                            logger.warning(f"No cron expression for task {job_id}, skipping")
-                            continue
-                            
-                        try:
-                            # Try to parse as a proper cron expression
-                            minute, hour, day, month, day_of_week = cron_expr.split()
-                            trigger = CronTrigger(
-                                minute=minute,
-                                hour=hour,
-                                day=day,
-                                month=month,
-                                day_of_week=day_of_week
-                            )
-                        except ValueError:
-                            logger.warning(f"Invalid cron expression for task {job_id}: {cron_expr}, skipping")
-                            continue
-                    else:
-                        logger.warning(f"Unsupported trigger type for task {job_id}: {trigger_type}, skipping")
-                        continue
-                    
-                    # Register the task with the scheduler
-                    from app.utils.task_helpers import run_task
-                    logger.info(f"Registering task {job_id} with the scheduler using trigger type {trigger_type}")
-                    scheduler.add_job(
-                        func=run_task,
-                        trigger=trigger,
-                        args=[job_id],
-                        id=job_id
-                    )
-                    registered_count += 1
-                    
-                except Exception as e:
-                    logger.error(f"Error registering task {job_id} with scheduler: {str(e)}")
+            task_items = list(tasks.items())
+        
+        for job_id, task_data in task_items:
+            # Skip disabled tasks
+            if not task_data.get('enabled', True):
+                logger.info(f"Skipping disabled task: {job_id}")
+                continue
+            
+            if sync_task_with_scheduler(job_id, task_data, scheduler=scheduler):
+                registered_count += 1
                     
         logger.info(f"Registered {registered_count} tasks with the scheduler")
         
+        register_system_jobs(scheduler)
     except Exception as e:
         logger.error(f"Error registering tasks with scheduler: {str(e)}")
 
+def register_system_jobs(scheduler) -> None:
+    """
+    Register the application's own maintenance jobs with the scheduler.
+    
+    Args:
+        scheduler: The scheduler instance
+    """
+    logger = logging.getLogger("EzTaskRunner")
+    from apscheduler.triggers.interval import IntervalTrigger
+    
+    scheduler.add_job(
+        func=requeue_expired_agent_runs,
+        trigger=IntervalTrigger(seconds=10),
+        id="__system_requeue_expired_agent_runs",
+        replace_existing=True
+    )
+    scheduler.add_job(
+        func=dispatch_due_runs,
+        trigger=IntervalTrigger(seconds=5),
+        id="__system_dispatch_due_runs",
+        replace_existing=True
+    )
+    scheduler.add_job(
+        func=update_log_offset_indexes,
+        trigger=IntervalTrigger(seconds=60),
+        id="__system_update_log_indexes",
+        replace_existing=True
+    )
+    scheduler.add_job(
+        func=prune_done_runs,
+        trigger=IntervalTrigger(hours=1),
+        id="__system_prune_done_runs",
+        replace_existing=True
+    )
+    logger.info("Registered system maintenance jobs with the scheduler")
+
+def update_log_offset_indexes() -> None:
+    """Extend the offset indexes of the application logs with the lines written since the last update."""
+    from app.log_reader import update_log_indexes
+    from app import app
+    
+    with app.app_context():
+        update_log_indexes(current_app.config['LOG_DIR'], current_app.config['STATE_DIR'])
+
+def prune_done_runs() -> int:
+    """
+    Delete done runs from the run queue once the retry budgets no longer count them.
+    
+    Returns:
+        int: Number of runs deleted
+    """
+    from app.run_queue import prune_done_runs as prune_queue
+    from app import app
+    
+    with app.app_context():
+        window = current_app.config.get("RETRY_BUDGET_WINDOW_MINUTES", 60) * 60
+        return prune_queue(time.time() - window - DONE_RUN_MARGIN_SECONDS)
+
 def cleanup_running_tasks() -> None:
     """Check for tasks that are stuck in RUNNING or QUEUED state and fix their status."""
     import logging
@@ -530,6 +642,13 @@ def cleanup_running_tasks() -> None:
                 else:  # QUEUED
                     queued_tasks_count += 1
                     
+                # Runs still queued, or executing on worker agents, are tracked by the run queue
+                from app.run_queue import get_active_run_for_task
+                active_run = get_active_run_for_task(job_id)
+                if active_run:
+                    logger.info(f"Not cleaning up task {job_id} as its run {active_run['run_id']} is {active_run['status']} in the run queue")
+                    continue
+                
                 process_id = task.get("process_id")
                 
                 # Check if the task was just started (within the last 5 seconds)
@@ -626,10 +745,10 @@ def get_task_history(job_id: str) -> List[Dict[str, Any]]:
         if not history_dir_path.exists():
             return history
             
-        for history_file in history_dir_path.glob(f"{job_id}_*.json"):
+        # History files are compressed (.json.gz, .json.zst) or plain (.json)
+        for history_file in history_dir_path.glob(f"{job_id}_*.json*"):
             try:
-                with open(history_file, 'r') as f:
-                    history.append(json.load(f))
+                history.append(load_json_file(history_file))
             except Exception as e:
                 logger.error(f"Error reading history file {history_file}: {str(e)}")
                 
@@ -652,12 +771,13 @@ def parse_datetime_str(dt_str: str) -> datetime:
     """
     return datetime.strptime(dt_str, "%Y-%m-%d %H:%M:%S")
 
-def run_task(job_id: str) -> Dict[str, Any]:
+def run_task(job_id: str, run_id: Optional[str] = None) -> Dict[str, Any]:
     """
     Run a task.
     
     Args:
         job_id: The job ID
+        run_id: Optional run queue ID of this run
         
     Returns:
         The execution result
@@ -669,6 +789,8 @@ def run_task(job_id: str) -> Dict[str, Any]:
     from datetime import datetime, timedelta
     import time
     
+    dequeued_at = time.time()
+    
     # Get the Flask application instance
     from app import app
     
@@ -692,8 +814,17 @@ def run_task(job_id: str) -> Dict[str, Any]:
         # Get max runtime
         max_runtime = task.get("max_runtime", 60)  # Default to 60 minutes if not specified
         
-        # Check if this is a retry attempt
-        current_retry_count = task.get("current_retry_count", 0)
+        # Retry attempts are tracked per run in the run queue, as is the
+        # timeline recorded before the run was queued
+        attempt = 1
+        timeline = {}
+        if run_id:
+            from app.run_queue import get_run
+            queued_run = get_run(run_id)
+            if queued_run:
+                attempt = queued_run["attempt"]
+                timeline = dict(queued_run["payload"].get("timeline", {}))
+        timeline["dequeued_at"] = dequeued_at
         
         # Check if the task is already running (to prevent duplicate runs)
         if task.get("status") == "RUNNING" and task.get("process_id"):
@@ -719,16 +850,19 @@ def run_task(job_id: str) -> Dict[str, Any]:
         task["last_run"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         
         # If this is a retry, log it
-        if current_retry_count > 0:
-            tasks_logger.info(f"This is retry attempt {current_retry_count} for task {job_id}")
+        if attempt > 1:
+            tasks_logger.info(f"This is attempt {attempt} for task {job_id}")
         
         # Clear any previous error if this is the first attempt (not a retry)
-        if current_retry_count == 0 and "last_error" in task:
+        if attempt == 1 and "last_error" in task:
             task.pop("last_error", None)
             
         # Clear process ID to start fresh
         task["process_id"] = None
         
+        # Decide whether this run is profiled (clears a one-off "profile next run" request)
+        profile_mode = _select_profile_mode(task)
+        
         # Update task in store to show as RUNNING during the buffer period
         update_task(job_id, task)
         
@@ -744,14 +878,15 @@ def run_task(job_id: str) -> Dict[str, Any]:
         }
         
         # Sleep for 10 seconds, checking system resources
+        buffer_started = time.monotonic()
         buffer_end_time = datetime.now() + timedelta(seconds=10)
         while datetime.now() < buffer_end_time:
             # Check system metrics
-            metrics = get_system_metrics()
+            system_metrics = get_system_metrics()
             
             # Log current resource usage
-            cpu_percent = metrics.get('cpu_percent', 100)  # Default to 100% if not available
-            memory_percent = metrics.get('memory_percent', 100)  # Default to 100% if not available
+            cpu_percent = system_metrics.get('cpu_percent', 100)  # Default to 100% if not available
+            memory_percent = system_metrics.get('memory_percent', 100)  # Default to 100% if not available
             
             tasks_logger.info(f"Buffer check for task {job_id}: CPU: {cpu_percent}%, Memory: {memory_percent}%")
             
@@ -765,6 +900,8 @@ def run_task(job_id: str) -> Dict[str, Any]:
             time.sleep(2)
         
         # Check final resource status
+        metrics.ADMISSION_WAIT.observe(time.monotonic() - buffer_started)
+        timeline["admitted_at"] = time.time()
         resource_check["buffer_time_end"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         if not resource_check["cpu_percent_ok"]:
             tasks_logger.warning(f"CPU usage too high ({resource_check['cpu_percent']}%) for task {job_id}, but proceeding anyway")
@@ -776,37 +913,87 @@ def run_task(job_id: str) -> Dict[str, Any]:
         resource_check["can_proceed"] = True
         tasks_logger.info(f"Buffer period complete for task {job_id}. CPU: {resource_check['cpu_percent']}%, Memory: {resource_check['memory_percent']}%")
         
+        def record_process_id(process_id):
+            # Store the process ID while the script runs so it can be stopped
+            running_task = get_task(job_id)
+            if running_task and running_task.get("status") == "RUNNING":
+                running_task["process_id"] = process_id
+                update_task(job_id, running_task)
+        
         # Run the script
         tasks_logger.info(f"Task running script - Job ID: {job_id} - Script: {script_path}")
         result = run_script(
             script_path, 
             job_id=job_id,
-            history_dir=current_app.config["TASK_HISTORY_DIR"],
             max_runtime_minutes=max_runtime,  # Pass the max runtime to the run_script function
-            buffer_metrics=resource_check  # Pass the buffer metrics
+            buffer_metrics=resource_check,  # Pass the buffer metrics
+            run_id=run_id,
+            runs_dir=current_app.config["RUNS_DIR"],  # Run detached so the script survives a restart
+            on_start=record_process_id,
+            profile=profile_mode
         )
         
         # Add resource metrics to result
         result["buffer_resource_check"] = resource_check
+        result["timeline"] = {**timeline, **result.get("timeline", {})}
+        
+    return finish_run(job_id, result)
+
+def finish_run(job_id: str, result: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Record the outcome of a task run on the task.
+    
+    Updates the task status, schedules auto-retries, sends failure
+    notifications and saves the run to the task history. Used for runs
+    executed locally and for runs completed by remote worker agents.
+    
+    Args:
+        job_id: The job ID
+        result: The run_script result dictionary
+        
+    Returns:
+        The execution result
+    """
+    from flask import current_app
+    from datetime import datetime
+    from app.retry_engine import plan_retry, describe_attempt_chain
+    from app.circuit_breaker import record_outcome
+    from app.runtime_baseline import record_runtime
+    from app.run_stats import record_run_stats
+    
+    # Get the Flask application instance
+    from app import app
+    
+    with app.app_context():
+        # Ensure the result has valid fields
+        if result is None:
+            tasks_logger.error(f"Run script returned None for task {job_id}")
+            result = {"success": False, "error": "Script execution returned no result"}
+        
+        # The run's files in the runs directory, deleted once the run is saved
+        run_key = result.pop("run_key", None)
+        
+        # Record the run's place in its attempt chain in the history
+        result.update(describe_attempt_chain(result.get("run_id")))
         
         # Get the task again to ensure we have the latest version
         # This is important because another process might have updated the task status
         task = get_task(job_id)
         if not task:
             tasks_logger.error(f"Task not found after execution - Job ID: {job_id}")
+            _record_run_metrics(None, result)
+            _save_run_history(job_id, result, run_key)
             return result
         
-        # Ensure the result has valid fields
-        if result is None:
-            tasks_logger.error(f"Run script returned None for task {job_id}")
-            result = {"success": False, "error": "Script execution returned no result"}
-        
         # Make sure we have the success field defined
         if "success" not in result:
             tasks_logger.warning(f"Success field missing in result for task {job_id}")
             # Default to True if the result exists but has no success field
             result["success"] = True
             
+        # Add the run to the task's running statistics; saved with the task below
+        record_run_stats(task, result)
+        
         # Only update the status if the task is still in RUNNING state
         # This prevents overwriting potential changes made by other processes
         if task.get("status") == "RUNNING":
@@ -816,56 +1003,61 @@ def run_task(job_id: str) -> Dict[str, Any]:
                 update_task(job_id, task)
                 tasks_logger.info(f"Task process ID stored - Job ID: {job_id} - Process ID: {result['process_id']}")
             
+            # Feed the outcome to the task's circuit breaker
+            circuit_change = record_outcome(task, result.get("success", False))
+            if circuit_change:
+                tasks_logger.warning(f"Circuit breaker for task {job_id} is now {circuit_change}: {task['circuit'].get('reason') or 'run succeeded'}")
+                result["circuit"] = circuit_change
+            
+            # Compare the run with the task's runtime baseline
+            regression = record_runtime(task, result)
+            if regression:
+                tasks_logger.warning(f"Task {job_id} ran slower than its baseline: {regression['reason']}")
+                result["runtime_regression"] = regression
+                for exceeded in regression["exceeded"]:
+                    metrics.RUNTIME_REGRESSIONS.inc(measure=exceeded["measure"])
+                try:
+                    if current_app.config.get('EMAIL_NOTIFICATIONS_ENABLED', False) and task.get('email_notifications_enabled', True):
+                        from app.utils.email_notifier import send_task_regression_email
+                        send_task_regression_email(task, regression)
+                except Exception as e:
+                    tasks_logger.error(f"Error sending regression notification for task {job_id}: {str(e)}")
+            
             # Handle auto-retry logic if the task failed
             if not result.get("success", False):
                 error_message = result.get("error", "Unknown error")[:500]  # Limit size of error message
                 task["last_error"] = error_message
                 
-                # Check if auto-retry is enabled
-                auto_retry_enabled = task.get("auto_retry_enabled", False)
-                max_retry_attempts = task.get("retry_attempts", 3)
-                retry_interval = task.get("retry_interval", 5)
+                # Ask the retry engine whether, and when, to retry this run
+                retry = plan_retry(job_id, task, result.get("run_id"))
                 
-                if auto_retry_enabled and current_retry_count < max_retry_attempts:
-                    # Increment retry count
-                    task["current_retry_count"] = current_retry_count + 1
-                    tasks_logger.info(f"Task {job_id} failed, scheduling retry {task['current_retry_count']} of {max_retry_attempts}")
-                    
-                    # Calculate retry time (current time + retry interval in minutes)
-                    retry_time = datetime.now() + timedelta(minutes=retry_interval)
+                if retry["retry"]:
+                    retry_time = datetime.fromtimestamp(retry["not_before"])
                     task["next_retry_time"] = retry_time.strftime("%Y-%m-%d %H:%M:%S")
+                    tasks_logger.info(f"Task {job_id} failed, scheduling attempt {retry['attempt']} in {retry['delay']:.0f} seconds ({retry['reason']})")
                     
                     # Set task status to indicate it's waiting for retry
                     task["status"] = "FAILED"  # Still mark as failed for now
                     
                     try:
-                        # Get the scheduler
-                        scheduler = current_app.config.get('SCHEDULER')
-                        if scheduler:
-                            # Create a one-time trigger for the retry
-                            from apscheduler.triggers.date import DateTrigger
-                            trigger = DateTrigger(run_date=retry_time)
-                            
-                            # Add the job to the scheduler
-                            retry_job_id = f"{job_id}_retry_{task['current_retry_count']}"
-                            from app.utils.task_helpers import run_task as schedule_task
-                            scheduler.add_job(
-                                func=schedule_task,
-                                trigger=trigger,
-                                args=[job_id],
-                                id=retry_job_id,
-                                replace_existing=True
-                            )
-                            tasks_logger.info(f"Retry job {retry_job_id} added to scheduler")
-                            
+                        # Persist the retry in the run queue so it survives a restart
+                        retry_key = f"{result['root_run_id']}:attempt:{retry['attempt']}"
+                        if task.get("labels"):
+                            retry_run_id = enqueue_agent_run(job_id, dedupe_key=retry_key, not_before=retry["not_before"], retry_of=result.get("run_id"))
+                        else:
+                            retry_run_id = enqueue_local_run(job_id, dedupe_key=retry_key, not_before=retry["not_before"], retry_of=result.get("run_id"))
+                        result["next_attempt"] = {"run_id": retry_run_id, "attempt": retry["attempt"], "not_before": task["next_retry_time"]}
+                        tasks_logger.info(f"Retry run {retry_run_id} queued for {task['next_retry_time']}")
                     except Exception as e:
                         tasks_logger.error(f"Error scheduling retry for task {job_id}: {str(e)}")
                     
                     # Update task in store
                     update_task(job_id, task)
                 else:
-                    if auto_retry_enabled and current_retry_count >= max_retry_attempts:
-                        tasks_logger.info(f"Task {job_id} failed, maximum retry attempts ({max_retry_attempts}) reached")
+                    if task.get("auto_retry_enabled", False):
+                        tasks_logger.info(f"Task {job_id} failed, not retrying: {retry['reason']}")
+                        result["retry_skipped"] = retry["reason"]
+                    task.pop("next_retry_time", None)
                     
                     # Mark as failed if retry is disabled or max retries reached
                     task["status"] = "FAILED"
@@ -887,9 +1079,8 @@ def run_task(job_id: str) -> Dict[str, Any]:
                 if "last_error" in task:
                     task.pop("last_error", None)
                 
-                # Reset retry count for next run
-                if "current_retry_count" in task:
-                    task["current_retry_count"] = 0
+                # No retry is pending after a success
+                task.pop("next_retry_time", None)
                 
                 # Clear process ID when task is complete
                 task["process_id"] = None
@@ -911,8 +1102,9 @@ def run_task(job_id: str) -> Dict[str, Any]:
                 # Clear any error messages
                 if "last_error" in task:
                     task.pop("last_error", None)
-                # Update the task
-                update_task(job_id, task)
+            
+            # Update the task (and its run statistics)
+            update_task(job_id, task)
         
         # Log the completion status
         if result.get("success", False):
@@ -920,8 +1112,564 @@ def run_task(job_id: str) -> Dict[str, Any]:
         else:
             tasks_logger.error(f"Task failed - Job ID: {job_id} - Error: {result.get('error', 'Unknown error')[:200]}...")
         
+        _record_run_metrics(task, result)
+        _save_run_history(job_id, result, run_key)
         return result
 
+def _save_run_history(job_id: str, result: Dict[str, Any], run_key: Optional[str]) -> None:
+    """
+    Save a finished run to the task history.
+    
+    Once the run's result is in the history, the run's state and log files are
+    no longer needed and are deleted from the runs directory.
+    """
+    from app.utils import save_task_history
+    from app.utils.run_supervisor import remove_run_files
+    
+    result.setdefault("timeline", {})["persisted_at"] = time.time()
+    history_file = save_task_history(current_app.config["TASK_HISTORY_DIR"], job_id, result)
+    if history_file and run_key:
+        try:
+            remove_run_files(current_app.config["RUNS_DIR"], run_key)
+        except OSError as e:
+            tasks_logger.warning(f"Could not delete the files of run {run_key}: {str(e)}")
+
+def _record_run_metrics(task: Optional[Dict[str, Any]], result: Dict[str, Any]) -> None:
+    """Count a finished run and observe its duration."""
+    script_type = (task or {}).get("script_type", "unknown")
+    metrics.RUNS_TOTAL.inc(status="success" if result.get("success") else "failed", script_type=script_type)
+    metrics.RUN_DURATION.observe(result.get("execution_time") or 0, script_type=script_type)
+
+def _select_profile_mode(task: Dict[str, Any]) -> Optional[str]:
+    """
+    Decide whether a run of a Python task is profiled.
+    
+    A run is profiled when "profile next run" was requested or, with
+    profile_every_n set, on every Nth run. Updates the task's profiling
+    fields; the caller saves the task.
+    
+    Args:
+        task: The task data dictionary
+        
+    Returns:
+        The profiling mode, or None if the run is not profiled
+    """
+    from app.utils.profile_runner import PROFILE_CPROFILE, PROFILE_MODES
+    
+    if Path(task.get("script_path", "")).suffix.lower() != ".py":
+        return None
+    
+    profile = task.get("profile_next_run", False)
+    every_n = task.get("profile_every_n", 0)
+    if every_n:
+        task["profile_run_count"] = task.get("profile_run_count", 0) + 1
+        profile = profile or task["profile_run_count"] % every_n == 0
+    if not profile:
+        return None
+    
+    task["profile_next_run"] = False
+    mode = task.get("profile_mode")
+    return mode if mode in PROFILE_MODES else PROFILE_CPROFILE
+
+def allow_scheduled_run(job_id: str) -> bool:
+    """
+    Check a task's circuit breaker before a scheduled fire.
+    
+    Skipped fires are recorded in the task history with status SKIPPED.
+    
+    Args:
+        job_id: The job ID
+        
+    Returns:
+        bool: True if the fire may run
+    """
+    from app.circuit_breaker import check_circuit
+    from app.run_stats import record_run_stats
+    from app.utils import save_task_history
+    from app.utils.constants import STATUS_SKIPPED
+    
+    # Get the Flask application instance
+    from app import app
+    
+    with app.app_context():
+        task = get_task(job_id)
+        if not task:
+            return True
+        
+        previous_circuit = dict(task.get("circuit", {}))
+        allowed, reason = check_circuit(task)
+        if task.get("circuit", {}) != previous_circuit:
+            # Moved to half-open, or a new probe started
+            tasks_logger.info(f"Circuit breaker for task {job_id} is half-open, running a probe")
+            update_task(job_id, task)
+        
+        if allowed:
+            return True
+        
+        tasks_logger.info(f"Task execution skipped - Job ID: {job_id} - {reason}")
+        metrics.RUNS_TOTAL.inc(status="skipped", script_type=task.get("script_type", "unknown"))
+        skipped_run = {
+            "success": False,
+            "status": STATUS_SKIPPED,
+            "error": reason,
+            "output": "",
+            "execution_time": 0,
+            "timestamp": datetime.now().isoformat(),
+            "run_id": get_run_id()
+        }
+        record_run_stats(task, skipped_run)
+        update_task(job_id, task)
+        save_task_history(current_app.config["TASK_HISTORY_DIR"], job_id, skipped_run)
+        return False
+
+def enqueue_local_run(job_id: str, dedupe_key: Optional[str] = None, not_before: Optional[float] = None,
+                      retry_of: Optional[str] = None, timeline: Optional[Dict[str, float]] = None,
+                      run_id: Optional[str] = None) -> Optional[str]:
+    """
+    Queue a run of a task for this server's task executor.
+    
+    The run is recorded in the durable run queue first and then dispatched,
+    so it is not lost if the server stops before or while it executes.
+    
+    Args:
+        job_id: The job ID
+        dedupe_key: Optional key identifying the logical run (e.g. a scheduled fire time)
+        not_before: Optional epoch time before which the run must not start
+        retry_of: Optional ID of the failed run this run retries
+        timeline: Optional run timeline points recorded so far
+        run_id: Optional ID given to the run when it was fired
+        
+    Returns:
+        The run ID, or None if no run was queued
+    """
+    from app.run_queue import enqueue_run, TARGET_LOCAL
+    
+    # Get the Flask application instance
+    from app import app
+    
+    with app.app_context():
+        payload = {"timeline": timeline} if timeline else None
+        run_id = enqueue_run(job_id, payload=payload, target=TARGET_LOCAL, dedupe_key=dedupe_key, not_before=not_before,
+                             retry_of=retry_of, run_id=run_id)
+        # Web processes leave execution to the worker's dispatch sweep
+        if run_id and not_before is None and current_app.config.get('RUN_MODE') != 'web':
+            submit_queued_run(run_id)
+        return run_id
+
+def submit_queued_run(run_id: str) -> bool:
+    """
+    Submit a queued local run to the task executor, unless it is already waiting there.
+    
+    Args:
+        run_id: The run queue ID
+        
+    Returns:
+        bool: True if the run was submitted
+    """
+    with submitted_runs_lock:
+        if run_id in submitted_runs:
+            return False
+        submitted_runs.add(run_id)
+    try:
+        task_executor.submit(execute_queued_run, run_id)
+    except Exception:
+        with submitted_runs_lock:
+            submitted_runs.discard(run_id)
+        raise
+    return True
+
+def execute_queued_run(run_id: str) -> Optional[Dict[str, Any]]:
+    """
+    Claim a queued local run and execute it.
+    
+    Args:
+        run_id: The run queue ID
+        
+    Returns:
+        The execution result, or None if the run was claimed elsewhere
+    """
+    from app.run_queue import claim_run, complete_run, get_run
+    
+    # Get the Flask application instance
+    from app import app
+    
+    try:
+        with app.app_context():
+            if not claim_run(run_id, LOCAL_OWNER):
+                return None
+            run = get_run(run_id)
+        
+        metrics.QUEUE_WAIT.observe(max(0, time.time() - max(run["enqueued_at"], run["not_before"] or 0)), target=run["target"])
+        metrics.EXECUTOR_BUSY.inc()
+        # The executor thread takes over the run's log context
+        with run_context(run_id, run["job_id"]):
+            try:
+                return run_task(run["job_id"], run_id=run_id)
+            finally:
+                metrics.EXECUTOR_BUSY.dec()
+                with app.app_context():
+                    complete_run(run_id, LOCAL_OWNER)
+    finally:
+        with submitted_runs_lock:
+            submitted_runs.discard(run_id)
+
+def dispatch_due_runs() -> int:
+    """
+    Submit queued local runs that are due (including delayed retries) to the task executor.
+    
+    Runs already waiting in the executor are skipped.
+    
+    Returns:
+        int: Number of runs submitted
+    """
+    from app.run_queue import list_due_runs, TARGET_LOCAL
+    
+    # Get the Flask application instance
+    from app import app
+    
+    with app.app_context():
+        due_runs = list_due_runs(TARGET_LOCAL)
+    return sum(1 for run in due_runs if submit_queued_run(run["run_id"]))
+
+def _is_orphaned_local_owner(owner: Optional[str]) -> bool:
+    """Check whether a local run owner is a process on this host that is no longer running."""
+    if owner == LOCAL_OWNER:
+        return False
+    prefix = f"local:{socket.gethostname()}:"
+    if not owner or not owner.startswith(prefix):
+        return False  # Owned by another host sharing the queue
+    try:
+        import psutil
+        return not psutil.pid_exists(int(owner[len(prefix):]))
+    except (ValueError, ImportError):
+        return True
+
+def replay_run_queue() -> None:
+    """
+    Recover the run queue after a restart.
+    
+    Runs claimed by a previous, no longer running server process are put
+    back on the queue (at-least-once execution), then every due run is
+    dispatched.
+    """
+    logger = logging.getLogger("EzTaskRunner")
+    from app.run_queue import requeue_orphaned_runs
+    
+    try:
+        requeued = requeue_orphaned_runs(_is_orphaned_local_owner)
+        dispatched = dispatch_due_runs()
+        logger.info(f"Run queue replayed: {len(requeued)} interrupted runs re-queued, {dispatched} runs dispatched")
+    except Exception as e:
+        logger.error(f"Error replaying run queue: {str(e)}")
+
+def reattach_detached_runs() -> int:
+    """
+    Reattach to detached runs left behind by a previous server process.
+    
+    Runs whose script is still alive are followed to completion in the task
+    executor; runs that finished while the server was down have their exit
+    status collected straight away. The run queue claim is taken over so the
+    run is not re-queued as interrupted.
+    
+    Returns:
+        int: Number of runs reattached
+    """
+    logger = logging.getLogger("EzTaskRunner")
+    from app.run_queue import get_run, transfer_run, RUN_LEASED, RUN_QUEUED
+    from app.utils.run_supervisor import list_uncollected_runs, mark_run_collected, remove_run_files
+    
+    # Get the Flask application instance
+    from app import app
+    
+    reattached = 0
+    with app.app_context():
+        runs_dir = current_app.config.get('RUNS_DIR')
+        if not runs_dir or not os.path.exists(runs_dir):
+            return 0
+        
+        for state in list_uncollected_runs(runs_dir):
+            try:
+                run = get_run(state['run_id']) if state.get('run_id') else None
+                if run and run['status'] == RUN_QUEUED:
+                    # Re-queued; the next attempt reuses the run's files
+                    mark_run_collected(state['state_path'])
+                    continue
+                if not run or run['status'] != RUN_LEASED:
+                    # Already completed; nothing left to collect
+                    remove_run_files(runs_dir, state['run_key'])
+                    continue
+                previous_owner = run['lease_owner']
+                if not _is_orphaned_local_owner(previous_owner):
+                    continue  # Still followed by a live process (possibly this one)
+                if not transfer_run(run['run_id'], LOCAL_OWNER, previous_owner):
+                    continue
+                
+                logger.info(f"Reattaching to run {run['run_id']} of task {state.get('job_id')} (process {state.get('pid')})")
+                task_executor.submit(resume_detached_run, state['state_path'])
+                reattached += 1
+            except Exception as e:
+                logger.error(f"Error reattaching to run {state.get('run_key')}: {str(e)}")
+    
+    if reattached:
+        logger.info(f"Reattached to {reattached} detached runs")
+    return reattached
+
+def resume_detached_run(state_path: str) -> Dict[str, Any]:
+    """
+    Follow a reattached detached run to completion and record its result.
+    
+    Args:
+        state_path: Path of the run-state file
+        
+    Returns:
+        The execution result
+    """
+    from app.run_queue import complete_run, get_run
+    from app.utils.run_supervisor import follow_detached_run, build_run_result, mark_run_collected, compress_run_logs
+    from app.utils import load_run_profile
+    
+    # Get the Flask application instance
+    from app import app
+    
+    metrics.EXECUTOR_BUSY.inc()
+    try:
+        state = follow_detached_run(state_path)
+    finally:
+        metrics.EXECUTOR_BUSY.dec()
+    
+    # Runs started before a restart may have no run queue ID; use their run key
+    with run_context(state.get("run_id") or state.get("run_key"), state.get("job_id")):
+        result = build_run_result(state)
+        result["timestamp"] = state.get("started_at") or state.get("launched_at")
+        result["execution_time"] = (
+            datetime.fromisoformat(state["finished_at"]) - datetime.fromisoformat(state["started_at"])
+        ).total_seconds() if state.get("finished_at") and state.get("started_at") else 0
+        result["reattached"] = True
+        result["run_key"] = state["run_key"]
+        mark_run_collected(state_path)
+        with app.app_context():
+            compress_run_logs(state_path, get_configured_codec())
+        
+        # A profiled run left its profile next to the run-state file
+        profile = load_run_profile(Path(state_path).parent, state["run_key"])
+        if profile:
+            result["profile"] = profile
+        
+        # Points recorded before the restart are only known from the run queue
+        if state.get("run_id"):
+            with app.app_context():
+                queued_run = get_run(state["run_id"])
+            if queued_run:
+                result["timeline"] = {**queued_run["payload"].get("timeline", {}), **result["timeline"]}
+        
+        job_id = state.get("job_id")
+        try:
+            return finish_run(job_id, result)
+        finally:
+            if state.get("run_id"):
+                with app.app_context():
+                    complete_run(state["run_id"], LOCAL_OWNER)
+
+def enqueue_agent_run(job_id: str, dedupe_key: Optional[str] = None, not_before: Optional[float] = None,
+                      retry_of: Optional[str] = None, timeline: Optional[Dict[str, float]] = None,
+                      run_id: Optional[str] = None) -> Optional[str]:
+    """
+    Queue a run of a task for the remote worker agents.
+    
+    Tasks with a label selector are not executed locally; they are put on the
+    run queue and leased by an agent advertising all of the task's labels.
+    
+    Args:
+        job_id: The job ID
+        dedupe_key: Optional key identifying the logical run (e.g. a scheduled fire time)
+        not_before: Optional epoch time before which the run must not be leased
+        retry_of: Optional ID of the failed run this run retries
+        timeline: Optional run timeline points recorded so far
+        run_id: Optional ID given to the run when it was fired
+        
+    Returns:
+        The run ID, or None if no run was queued
+    """
+    from app.run_queue import enqueue_run, get_active_run_for_task, TARGET_AGENT
+    
+    # Get the Flask application instance
+    from app import app
+    
+    with app.app_context():
+        task = get_task(job_id)
+        if not task:
+            tasks_logger.error(f"Task enqueue failed - Job ID: {job_id} - Task not found")
+            return None
+        
+        if task.get("enabled", True) is False:
+            tasks_logger.info(f"Task enqueue skipped - Job ID: {job_id} - Task is disabled")
+            return None
+        
+        # Only one run per task may be queued or executing at a time
+        active_run = get_active_run_for_task(job_id)
+        if active_run:
+            tasks_logger.warning(f"Task enqueue skipped - Job ID: {job_id} - Run {active_run['run_id']} is already {active_run['status']}")
+            return None
+        
+        script_path = task.get("script_path", "")
+        try:
+            script_relpath = str(Path(script_path).resolve().relative_to(current_app.config['SCRIPTS_DIR'].resolve()))
+        except ValueError:
+            script_relpath = None
+        
+        payload = {
+            "task_name": task.get("task_name"),
+            "script_path": script_path,
+            "script_relpath": script_relpath,
+            "max_runtime": task.get("max_runtime", 60)
+        }
+        if timeline:
+            payload["timeline"] = timeline
+        run_id = enqueue_run(job_id, task.get("labels"), payload, target=TARGET_AGENT,
+                             dedupe_key=dedupe_key, not_before=not_before, retry_of=retry_of, run_id=run_id)
+        if not run_id:
+            return None
+        
+        task["status"] = "QUEUED"
+        task["agent_run_id"] = run_id
+        update_task(job_id, task)
+        tasks_logger.info(f"Task queued for worker agents - Job ID: {job_id} - Run ID: {run_id} - Labels: {task.get('labels')}")
+        return run_id
+
+def start_agent_run(run: Dict[str, Any]) -> None:
+    """
+    Mark a task as running once an agent has leased its run.
+    
+    Args:
+        run: The leased run dictionary from the run queue
+    """
+    job_id = run["job_id"]
+    metrics.QUEUE_WAIT.observe(max(0, time.time() - max(run["enqueued_at"], run.get("not_before") or 0)), target=run.get("target", "agent"))
+    task = get_task(job_id)
+    if not task:
+        tasks_logger.error(f"Leased run {run['run_id']} refers to missing task {job_id}")
+        return
+    
+    tasks_logger.info(f"Transitioning task from state '{task.get('status', 'UNKNOWN')}' to 'RUNNING' on agent {run['lease_owner']}")
+    task["status"] = "RUNNING"
+    task["last_run"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    task["agent_run_id"] = run["run_id"]
+    task["agent_id"] = run["lease_owner"]
+    task["process_id"] = None
+    
+    # Clear any previous error if this is the first attempt (not a retry)
+    if run.get("attempt", 1) == 1:
+        task.pop("last_error", None)
+    
+    update_task(job_id, task)
+
+def complete_agent_run(run_id: str, agent_id: str, result: Dict[str, Any]) -> bool:
+    """
+    Record the result of a run executed by a remote worker agent.
+    
+    Args:
+        run_id: The run ID
+        agent_id: The agent reporting the result
+        result: The run_script result dictionary produced by the agent
+        
+    Returns:
+        bool: False if the agent no longer held the lease (the result is discarded)
+    """
+    from app.run_queue import complete_run, get_run
+    
+    if not complete_run(run_id, agent_id):
+        return False
+    
+    run = get_run(run_id)
+    job_id = run["job_id"]
+    
+    # The process ID belongs to the agent's host and must not be checked locally
+    result = dict(result or {})
+    result["agent_process_id"] = result.pop("process_id", None)
+    result["agent_id"] = agent_id
+    result["run_id"] = run_id
+    result["timeline"] = {**run["payload"].get("timeline", {}), **(result.get("timeline") or {})}
+    
+    # The agent streamed the run's output to a log in the runs directory, named
+    # by the run ID; it is deleted once the result is saved
+    result["run_key"] = run_id
+    
+    task = get_task(job_id)
+    if task:
+        task.pop("agent_run_id", None)
+        task.pop("agent_id", None)
+        update_task(job_id, task)
+    
+    finish_run(job_id, result)
+    return True
+
+def requeue_expired_agent_runs() -> int:
+    """
+    Re-queue runs whose agent stopped renewing its lease.
+    
+    Returns:
+        int: Number of runs re-queued
+    """
+    from app.run_queue import requeue_expired_leases
+    
+    # Get the Flask application instance
+    from app import app
+    
+    with app.app_context():
+        requeued = requeue_expired_leases()
+        for run in requeued:
+            task = get_task(run["job_id"])
+            if task and task.get("agent_run_id") == run["run_id"]:
+                task["status"] = "QUEUED"
+                task.pop("agent_id", None)
+                update_task(run["job_id"], task)
+        return len(requeued)
+
+def queue_task_run(job_id: str) -> Dict[str, Any]:
+    """
+    Queue a run of a task now, outside of its schedule.
+    
+    Args:
+        job_id: The job ID of the task to run
+        
+    Returns:
+        dict: Results of the operation, with the run_id of the queued run;
+        running is set when the task was not queued because it is still running
+    """
+    task = get_task(job_id)
+    if not task:
+        return {"success": False, "error": f"Task {job_id} not found"}
+    
+    # Check if task is already running
+    if task.get("status") == "RUNNING" and task.get("process_id"):
+        try:
+            import psutil
+            process_id = task.get("process_id")
+            if process_id and psutil.pid_exists(int(process_id)):
+                return {"success": False, "running": True, "error": f"Task {job_id} is already running"}
+        except Exception as e:
+            logger.error(f"Error checking process status: {str(e)}")
+            # Continue with execution as if the task is not running
+    
+    # Update task status to indicate it's being queued
+    previous_status = task.get("status")
+    task["status"] = "QUEUED"
+    update_task(job_id, task)
+    
+    if current_app.config.get('RUN_MODE') == 'web':
+        # Hand the run to the worker process
+        from app.worker import notify_worker
+        reply = notify_worker('run_task', job_id=job_id)
+        if not reply.get("success"):
+            task["status"] = previous_status
+            update_task(job_id, task)
+            return {"success": False, "error": reply.get("error")}
+        return {"success": True, "run_id": reply.get("run_id")}
+    
+    # Queue the run; it is executed by task_executor as a background job
+    from app.utils.task_helpers import run_task
+    return {"success": True, "run_id": run_task(job_id)}
+
 def stop_task(job_id: str) -> Dict[str, Any]:
     """
     Stop a running task.
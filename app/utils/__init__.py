@@ -8,10 +8,12 @@ import json
 import os
 import time
 import traceback
+import uuid
 import importlib.util
 import sys
 import subprocess
 import signal
+import threading
 import psutil  # Add this import for process management
 import platform
 import shutil  # Add this import for alternate disk usage measurement
@@ -34,10 +36,17 @@ from app.utils.constants import (
     STATUS_FAILED
 )
 
-def get_system_metrics():
+# Import from compression
+from app.utils.compression import load_json_file, dump_json_file, get_configured_codec
+
+def get_system_metrics(cpu_interval=0.1):
     """
     Get system resource metrics.
     
+    Args:
+        cpu_interval: Seconds to measure CPU usage over; None compares with
+            the previous call instead of blocking
+    
     Returns:
         Dictionary with CPU, memory and disk usage information
     """
@@ -56,7 +65,7 @@ def get_system_metrics():
     # Get each metric in separate try blocks to identify the specific failing component
     try:
         # Get CPU usage
-        metrics['cpu_percent'] = psutil.cpu_percent(interval=0.1)  # Reduced interval time
+        metrics['cpu_percent'] = psutil.cpu_percent(interval=cpu_interval)
         logger.debug(f"Got CPU metrics: {metrics['cpu_percent']}%")
     except Exception as e:
         logger.error("Error getting CPU metrics: " + repr(e))
@@ -219,10 +228,10 @@ def get_task_history(job_id, history_dir=None):
             logger.warning(f"History directory does not exist: {history_dir_path}")
             return history
             
-        for file in history_dir_path.glob(f"{job_id}_*.json"):
+        # History files are compressed (.json.gz, .json.zst) or plain (.json)
+        for file in history_dir_path.glob(f"{job_id}_*.json*"):
             try:
-                with open(file, 'r') as f:
-                    history.append(json.load(f))
+                history.append(load_json_file(file))
             except Exception as e:
                 logger.error(f"Error reading history file {file}: {str(e)}")
                 
@@ -284,7 +293,100 @@ def load_script(script_path):
         logger.error(f"Error loading script {script_path}: {str(e)}")
         raise
 
-def run_script(script_path, job_id=None, history_dir=None, max_runtime_minutes=60, buffer_metrics=None, **kwargs):
+def save_task_history(history_dir, job_id, result):
+    """
+    Write a run result to the task history directory.
+    
+    Args:
+        history_dir: Directory with task execution history
+        job_id: The job ID
+        result: The run result dictionary
+        
+    Returns:
+        Path of the history file, or None if it could not be written
+    """
+    logger = logging.getLogger("EzTaskRunner")
+    from app.metrics import HISTORY_WRITE_LATENCY
+    try:
+        os.makedirs(history_dir, exist_ok=True)
+        history_file = Path(history_dir) / f"{job_id}_{datetime.now().strftime('%Y%m%d%H%M%S')}.json"
+        with HISTORY_WRITE_LATENCY.time():
+            history_file = dump_json_file(history_file, result, get_configured_codec())
+        logger.info(f"Task history saved to {history_file}")
+        
+        from app.search_index import queue_history_file
+        queue_history_file(history_file)
+        return history_file
+    except Exception as e:
+        logger.error(f"Error saving task history: {str(e)}")
+        return None
+
+def _noting_first_output(on_output, timeline):
+    """Wrap an output callback so the time of the first output line is recorded in the timeline."""
+    def callback(line):
+        if 'first_output_at' not in timeline:
+            timeline['first_output_at'] = time.time()
+        return on_output(line)
+    return callback
+
+def _communicate_streaming(process, timeout, on_output):
+    """
+    Wait for a process like Popen.communicate, passing stdout lines to a callback as they arrive.
+    
+    Args:
+        process: The subprocess.Popen instance (text mode, piped stdout/stderr)
+        timeout: Timeout in seconds
+        on_output: Callable receiving each stdout line
+        
+    Returns:
+        Tuple of (stdout, stderr) strings
+        
+    Raises:
+        subprocess.TimeoutExpired: If the process does not exit within the timeout
+    """
+    stdout_lines, stderr_lines = [], []
+    
+    def pump(stream, lines, callback):
+        for line in iter(stream.readline, ''):
+            lines.append(line)
+            if callback:
+                try:
+                    callback(line)
+                except Exception:
+                    pass  # A failing consumer must not break the run
+        stream.close()
+    
+    readers = [
+        threading.Thread(target=pump, args=(process.stdout, stdout_lines, on_output), daemon=True),
+        threading.Thread(target=pump, args=(process.stderr, stderr_lines, None), daemon=True)
+    ]
+    for reader in readers:
+        reader.start()
+    
+    process.wait(timeout=timeout)
+    for reader in readers:
+        reader.join()
+    
+    return ''.join(stdout_lines), ''.join(stderr_lines)
+
+def load_run_profile(runs_dir, run_key):
+    """
+    Load the profile summary of a profiled run.
+    
+    Args:
+        runs_dir: Directory for run state and log files
+        run_key: The run key
+        
+    Returns:
+        dict: The profile summary with the run key, or None if the run wrote no profile
+    """
+    from app.utils.profile_runner import load_profile_summary
+    summary = load_profile_summary(Path(runs_dir) / f"{run_key}.profile")
+    if summary:
+        summary['run_key'] = run_key
+    return summary
+
+def run_script(script_path, job_id=None, history_dir=None, max_runtime_minutes=60, buffer_metrics=None, on_output=None, run_id=None, runs_dir=None, on_start=None, profile=None, **kwargs):
     """
     Run a script and capture its output.
     Supports Python (.py), PowerShell (.ps1), and Batch (.bat, .cmd) files.
@@ -295,6 +397,13 @@ def run_script(script_path, job_id=None, history_dir=None, max_runtime_minutes=6
         history_dir: Directory to store task execution history
         max_runtime_minutes: Maximum allowed runtime in minutes (default: 60)
         buffer_metrics: Optional metrics from the buffer period
+        on_output: Optional callable receiving stdout lines while the script runs
+        run_id: Optional run queue ID, recorded in the result
+        runs_dir: Optional directory for run state and log files; when given, the
+            script runs detached and survives a server restart
+        on_start: Optional callable receiving the process ID once the script has started
+        profile: Optional profiling mode ('cprofile' or 'sample') for Python scripts;
+            the profile is written to runs_dir next to the run's log files
         **kwargs: Additional arguments to pass to the script's main function (Python only)
         
     Returns:
@@ -308,7 +417,9 @@ def run_script(script_path, job_id=None, history_dir=None, max_runtime_minutes=6
         'error': '',
         'execution_time': 0,
         'timestamp': datetime.now().isoformat(),
-        'process_id': None
+        'process_id': None,
+        'run_id': run_id,
+        'timeline': {}
     }
     
     # Add buffer metrics if provided
@@ -344,67 +455,124 @@ def run_script(script_path, job_id=None, history_dir=None, max_runtime_minutes=6
         else:
             raise ValueError(f"Unsupported script type: {script_type}")
         
-        # Create subprocess with process isolation
-        # Use BELOW_NORMAL_PRIORITY_CLASS on Windows or nice on Unix to lower process priority
-        process_kwargs = {
-            'stdout': subprocess.PIPE,
-            'stderr': subprocess.PIPE,
-            'text': True,
-            'bufsize': 1,  # Line buffered for better real-time logging
-            'close_fds': True  # Ensure file descriptors aren't shared with parent process
-        }
-        
-        # For Windows batch scripts, we need to use shell=True
-        if script_type in ['.bat', '.cmd'] and platform.system() == "Windows":
-            process_kwargs['shell'] = True
-        
-        # Set process priority based on platform
-        if platform.system() == "Windows":
-            # BELOW_NORMAL_PRIORITY_CLASS = 0x00004000
-            process_kwargs['creationflags'] = 0x00004000
-        else:
-            # On Unix-like systems, use preexec_fn with nice
-            def lower_priority():
-                try:
-                    os.nice(10)  # Lower priority (higher nice value)
-                except Exception:
-                    pass  # Ignore if we can't set priority
-            
-            process_kwargs['preexec_fn'] = lower_priority
-        
-        # Run the subprocess with modified priority
-        process = subprocess.Popen(cmd, **process_kwargs)
-        
-        # Store the process ID
-        result['process_id'] = process.pid
-        logger.info(f"Started process ID {process.pid} for task {job_id}")
-        
-        # Wait for the process to complete (with timeout based on max_runtime_minutes)
-        try:
-            # Convert minutes to seconds for the timeout
-            timeout_seconds = max_runtime_minutes * 60
-            stdout, stderr = process.communicate(timeout=timeout_seconds)
-            # Store the output and error
-            result['output'] = stdout
+        # Profile Python scripts on request; the profile is kept with the run's files
+        run_key = run_id or str(uuid.uuid4())
+        profile_base = None
+        if profile:
+            if script_type != '.py' or not runs_dir:
+                logger.warning(f"Profiling is only supported for Python scripts run with a runs directory. Ignoring: {profile}")
+            else:
+                from app.utils.profile_runner import build_profile_command
+                profile_base = Path(runs_dir) / f"{run_key}.profile"
+                cmd = build_profile_command(cmd, profile, profile_base)
+                logger.info(f"Profiling run {run_key} of task {job_id} with {profile}")
+        
+        # With a runs directory, launch the script detached under a run supervisor
+        # so it keeps running, and its result is kept, across a server restart
+        if runs_dir:
+            from app.utils.run_supervisor import launch_detached_run, follow_detached_run, build_run_result, mark_run_collected, compress_run_logs
+            state = launch_detached_run(
+                cmd,
+                runs_dir,
+                run_key=run_key,
+                job_id=job_id,
+                run_id=run_id,
+                max_runtime_minutes=max_runtime_minutes,
+                shell=script_type in ['.bat', '.cmd'] and platform.system() == "Windows"
+            )
+            result['process_id'] = state.get('pid')
+            logger.info(f"Started detached process ID {state.get('pid')} for task {job_id} (run {state['run_key']})")
+            if on_start and state.get('pid'):
+                on_start(state['pid'])
             
-            # Check if the process completed successfully
-            if process.returncode == 0:
-                result['success'] = True
-                # Log successful completion
+            state_path = state['state_path']
+            state = follow_detached_run(state_path, on_output=on_output)
+            result.update(build_run_result(state))
+            # Lets the caller delete the run's files once the result is saved
+            result['run_key'] = state['run_key']
+            mark_run_collected(state_path)
+            compress_run_logs(state_path, get_configured_codec())
+            if profile_base:
+                result['profile'] = load_run_profile(runs_dir, run_key)
+            if result['success']:
                 logger.info(f"Script {script_path} completed successfully with exit code 0")
-                # Even if there's stderr output with returncode 0, we consider it successful
-                # but we'll include the stderr in the output for reference
-                if stderr and stderr.strip():
-                    result['output'] += f"\n\nSTDERR Output:\n{stderr}"
             else:
-                result['error'] = stderr or f"Process exited with code {process.returncode}"
-                logger.error(f"Script {script_path} exited with code {process.returncode}")
-        except subprocess.TimeoutExpired:
-            # Kill the process if it times out
-            process.kill()
-            stdout, stderr = process.communicate()
-            result['error'] = f"Process timed out after {max_runtime_minutes} minutes and was terminated"
-            logger.error(f"Script {script_path} timed out after {max_runtime_minutes} minutes and was terminated")
+                logger.error(f"Script {script_path} failed: {result['error'][:200]}")
+        else:
+            # Create subprocess with process isolation
+            # Use BELOW_NORMAL_PRIORITY_CLASS on Windows or nice on Unix to lower process priority
+            process_kwargs = {
+                'stdout': subprocess.PIPE,
+                'stderr': subprocess.PIPE,
+                'text': True,
+                'bufsize': 1,  # Line buffered for better real-time logging
+                'close_fds': True  # Ensure file descriptors aren't shared with parent process
+            }
+        
+            # For Windows batch scripts, we need to use shell=True
+            if script_type in ['.bat', '.cmd'] and platform.system() == "Windows":
+                process_kwargs['shell'] = True
+        
+            # Set process priority based on platform
+            if platform.system() == "Windows":
+                # BELOW_NORMAL_PRIORITY_CLASS = 0x00004000
+                process_kwargs['creationflags'] = 0x00004000
+            else:
+                # On Unix-like systems, use preexec_fn with nice
+                def lower_priority():
+                    try:
+                        os.nice(10)  # Lower priority (higher nice value)
+                    except Exception:
+                        pass  # Ignore if we can't set priority
+            
+                process_kwargs['preexec_fn'] = lower_priority
+        
+            # Run the subprocess with modified priority
+            process = subprocess.Popen(cmd, **process_kwargs)
+            result['timeline']['spawned_at'] = time.time()
+            if on_output is not None:
+                on_output = _noting_first_output(on_output, result['timeline'])
+        
+            # Store the process ID
+            result['process_id'] = process.pid
+            logger.info(f"Started process ID {process.pid} for task {job_id}")
+            if on_start:
+                on_start(process.pid)
+        
+            # Wait for the process to complete (with timeout based on max_runtime_minutes)
+            try:
+                # Convert minutes to seconds for the timeout
+                timeout_seconds = max_runtime_minutes * 60
+                if on_output is None:
+                    stdout, stderr = process.communicate(timeout=timeout_seconds)
+                else:
+                    stdout, stderr = _communicate_streaming(process, timeout_seconds, on_output)
+                result['timeline']['exited_at'] = time.time()
+                # Store the output and error
+                result['output'] = stdout
+            
+                # Check if the process completed successfully
+                if process.returncode == 0:
+                    result['success'] = True
+                    # Log successful completion
+                    logger.info(f"Script {script_path} completed successfully with exit code 0")
+                    # Even if there's stderr output with returncode 0, we consider it successful
+                    # but we'll include the stderr in the output for reference
+                    if stderr and stderr.strip():
+                        result['output'] += f"\n\nSTDERR Output:\n{stderr}"
+                else:
+                    result['error'] = stderr or f"Process exited with code {process.returncode}"
+                    logger.error(f"Script {script_path} exited with code {process.returncode}")
+            except subprocess.TimeoutExpired:
+                # Kill the process if it times out
+                process.kill()
+                if on_output is None:
+                    stdout, stderr = process.communicate()
+                else:
+                    process.wait()
+                result['timeline']['exited_at'] = time.time()
+                result['error'] = f"Process timed out after {max_runtime_minutes} minutes and was terminated"
+                logger.error(f"Script {script_path} timed out after {max_runtime_minutes} minutes and was terminated")
             
     except Exception as e:
         error_msg = str(e)
@@ -418,14 +586,7 @@ def run_script(script_path, job_id=None, history_dir=None, max_runtime_minutes=6
     
     # Store result in task history if directory is provided
     if history_dir:
-        try:
-            os.makedirs(history_dir, exist_ok=True)
-            history_file = Path(history_dir) / f"{job_id}_{datetime.now().strftime('%Y%m%d%H%M%S')}.json"
-            with open(history_file, 'w') as f:
-                json.dump(result, f, indent=2)
-                logger.info(f"Task history saved to {history_file}")
-        except Exception as e:
-            logger.error(f"Error saving task history: {str(e)}")
+        save_task_history(history_dir, job_id, result)
     
     # Log the final result for debugging
     if result['success']:
@@ -518,12 +679,15 @@ def purge_logs(log_dir=None, days_to_keep=30, keep_files=None):
         keep_files: List of filenames to always keep (default: None)
     
     Returns:
-        dict: Results of the purge operation
+        dict: Results of the purge operation: success, purged_files,
+        purged_count, reclaimed_bytes and error
     """
     logger = logging.getLogger("EzTaskRunner")
     result = {
         "success": True,
         "purged_files": [],
+        "purged_count": 0,
+        "reclaimed_bytes": 0,
         "error": None
     }
     
@@ -555,8 +719,8 @@ def purge_logs(log_dir=None, days_to_keep=30, keep_files=None):
         # Calculate cutoff date
         cutoff_date = datetime.now() - timedelta(days=days_to_keep)
         
-        # Process all log files
-        for file_path in log_dir_path.glob("*.log"):
+        # Process all log files, including rotated ones (tasks.log.1, tasks.log.1.gz, ...)
+        for file_path in sorted(set(log_dir_path.glob("*.log")) | set(log_dir_path.glob("*.log.*"))):
             if file_path.name in keep_files:
                 logger.info(f"Skipping purge for protected file: {file_path.name}")
                 continue
@@ -565,13 +729,16 @@ def purge_logs(log_dir=None, days_to_keep=30, keep_files=None):
             mtime = datetime.fromtimestamp(file_path.stat().st_mtime)
             if mtime < cutoff_date:
                 try:
+                    size = file_path.stat().st_size
                     file_path.unlink()
                     logger.info(f"Purged old log file: {file_path.name}")
                     result["purged_files"].append(file_path.name)
+                    result["reclaimed_bytes"] += size
                 except Exception as e:
                     logger.error(f"Error deleting log file {file_path.name}: {str(e)}")
         
-        logger.info(f"Log purge completed. Removed {len(result['purged_files'])} files.")
+        result["purged_count"] = len(result["purged_files"])
+        logger.info(f"Log purge completed. Removed {result['purged_count']} files ({result['reclaimed_bytes']} bytes).")
     except Exception as e:
         error_msg = f"Error purging logs: {str(e)}"
         logger.error(error_msg)
@@ -0,0 +1,424 @@
+"""
+Compressed Storage Module
+
+Task history and run output are stored compressed: with zstd when the
+'zstandard' package is installed, and with gzip otherwise.
+
+Data is written as a sequence of independently compressed frames of at most
+FRAME_SIZE bytes each (zstd frames or gzip members), so the files remain
+readable with the standard tools (zstd -d, zcat). For files written with a
+frame index, the index is kept in a sidecar file ('<file>.idx') listing the
+compressed and uncompressed offset of every frame. It lets readers decompress
+only the frames covering the range they need, e.g. the tail of a large log,
+and lets writers append frames to an existing file.
+
+This module only imports the standard library at module level.
+"""
+import bisect
+import gzip
+import json
+import os
+import time
+import logging
+import threading
+import zlib
+from pathlib import Path
+from typing import Dict, Any, Optional
+
+logger = logging.getLogger("EzTaskRunner")
+
+CODEC_ZSTD = "zstd"
+CODEC_GZIP = "gzip"
+CODEC_NONE = "none"
+
+# File name suffix of each codec
+SUFFIXES = {CODEC_ZSTD: ".zst", CODEC_GZIP: ".gz"}
+
+# Uncompressed bytes per frame
+FRAME_SIZE = 1024 * 1024
+
+GZIP_LEVEL = 6
+ZSTD_LEVEL = 3
+
+INDEX_SUFFIX = ".idx"
+
+def get_codec(setting: str = "auto") -> str:
+    """
+    Get the codec to compress new data with.
+
+    Args:
+        setting: 'auto' (zstd if available, else gzip), 'zstd', 'gzip' or 'none'
+
+    Returns:
+        str: 'zstd', 'gzip' or 'none'
+    """
+    setting = (setting or "auto").lower()
+    if setting == CODEC_NONE:
+        return CODEC_NONE
+    if setting in ("auto", CODEC_ZSTD):
+        try:
+            import zstandard  # noqa: F401
+            return CODEC_ZSTD
+        except ImportError:
+            if setting == CODEC_ZSTD:
+                logger.warning("zstd compression requested but the 'zstandard' package is not installed; using gzip")
+    return CODEC_GZIP
+
+def get_configured_codec() -> str:
+    """Get the codec set by STORAGE_COMPRESSION in the application config."""
+    try:
+        from flask import current_app
+        return get_codec(current_app.config.get("STORAGE_COMPRESSION", "auto"))
+    except RuntimeError:  # Working outside of application context
+        return get_codec()
+
+def codec_for_path(path) -> str:
+    """
+    Get the codec a file was written with, from its name.
+
+    Returns:
+        str: 'zstd', 'gzip' or 'none'
+    """
+    name = str(path)
+    for codec, suffix in SUFFIXES.items():
+        if name.endswith(suffix):
+            return codec
+    return CODEC_NONE
+
+def strip_compression_suffix(name: str) -> str:
+    """Remove the compression suffix from a file name, if it has one."""
+    codec = codec_for_path(name)
+    return name[:-len(SUFFIXES[codec])] if codec != CODEC_NONE else name
+
+def compressed_path(path, codec: str) -> Path:
+    """Get the path of the compressed version of a file."""
+    return Path(f"{path}{SUFFIXES[codec]}") if codec != CODEC_NONE else Path(path)
+
+def compress_frame(data: bytes, codec: str) -> bytes:
+    """Compress data as a single frame."""
+    if codec == CODEC_ZSTD:
+        import zstandard
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(data)
+    return gzip.compress(data, compresslevel=GZIP_LEVEL, mtime=0)
+
+def decompress(data: bytes, codec: str) -> bytes:
+    """
+    Decompress data made of one or more frames.
+
+    Raises:
+        ValueError: If the data is truncated or corrupt
+    """
+    if codec == CODEC_NONE:
+        return data
+    if codec == CODEC_GZIP:
+        try:
+            return gzip.decompress(data)
+        except (EOFError, zlib.error) as e:
+            raise ValueError(f"Corrupt gzip data: {str(e)}")
+
+    import zstandard
+    chunks = []
+    try:
+        while data:
+            decompressor = zstandard.ZstdDecompressor().decompressobj()
+            chunks.append(decompressor.decompress(data))
+            if not decompressor.eof:
+                raise ValueError("Truncated zstd data")
+            data = decompressor.unused_data
+    except zstandard.ZstdError as e:
+        raise ValueError(f"Corrupt zstd data: {str(e)}")
+    return b"".join(chunks)
+
+def read_index(path) -> Optional[Dict[str, Any]]:
+    """
+    Read the frame index of a compressed file.
+
+    Returns:
+        dict: 'frames' ([compressed offset, uncompressed offset] per frame) and
+        'size' (uncompressed size), or None if the file has no index
+    """
+    try:
+        with open(f"{path}{INDEX_SUFFIX}", "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def _write_index(path, index: Dict[str, Any]) -> None:
+    """Atomically write the frame index of a compressed file."""
+    index_path = f"{path}{INDEX_SUFFIX}"
+    tmp_path = f"{index_path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(index, f)
+    os.replace(tmp_path, index_path)
+
+def write_compressed(path, data: bytes, indexed: bool = False, append: bool = False) -> Path:
+    """
+    Write data to a compressed file, frame by frame.
+
+    Args:
+        path: Path of the compressed file; the codec is taken from its suffix
+        data: The uncompressed data
+        indexed: Whether to keep a frame index next to the file
+        append: Whether to add the data after the file's existing frames
+
+    Returns:
+        Path: The path written
+    """
+    path = Path(path)
+    codec = codec_for_path(path)
+    append = append and path.exists()
+    index = {"frames": [], "size": 0}
+    if append and indexed:
+        existing = read_index(path)
+        if existing is None:
+            # No index to extend: rewrite the file with one
+            data = read_compressed(path) + data
+            append = False
+        else:
+            index = existing
+
+    with open(path, "ab" if append else "wb") as f:
+        for start in range(0, len(data), FRAME_SIZE):
+            index["frames"].append([f.tell(), index["size"] + start])
+            f.write(compress_frame(data[start:start + FRAME_SIZE], codec))
+        if not data and not append:
+            f.write(compress_frame(b"", codec))  # An empty file is still a valid stream
+        index["size"] += len(data)
+
+    if indexed:
+        _write_index(path, index)
+    return path
+
+def read_compressed(path) -> bytes:
+    """
+    Read a whole file, decompressing it if needed.
+
+    Args:
+        path: The file path; the codec is taken from its suffix
+
+    Returns:
+        bytes: The uncompressed data
+    """
+    with open(path, "rb") as f:
+        return decompress(f.read(), codec_for_path(path))
+
+def read_compressed_range(path, start: int = 0, end: Optional[int] = None) -> bytes:
+    """
+    Read a range of the uncompressed data of a file.
+
+    Only the frames covering the range are decompressed when the file has a
+    frame index; other compressed files are decompressed in full.
+
+    Args:
+        path: The file path
+        start: Uncompressed offset to read from; negative values count from the end
+        end: Uncompressed offset to read up to (exclusive), or None for the end
+
+    Returns:
+        bytes: The data in the range
+    """
+    codec = codec_for_path(path)
+    index = read_index(path) if codec != CODEC_NONE else None
+    if index is None:
+        if codec == CODEC_NONE:
+            with open(path, "rb") as f:
+                size = f.seek(0, os.SEEK_END)
+                start = max(0, size + start) if start < 0 else start
+                end = size if end is None else min(end, size)
+                f.seek(start)
+                return f.read(max(0, end - start))
+        data = read_compressed(path)
+        start = max(0, len(data) + start) if start < 0 else start
+        return data[start:end]
+
+    size = index["size"]
+    start = max(0, size + start) if start < 0 else min(start, size)
+    end = size if end is None else min(end, size)
+    if start >= end:
+        return b""
+
+    frames = index["frames"]
+    raw_offsets = [frame[1] for frame in frames]
+    first = bisect.bisect_right(raw_offsets, start) - 1
+    last = bisect.bisect_left(raw_offsets, end) - 1
+    with open(path, "rb") as f:
+        f.seek(frames[first][0])
+        if last + 1 < len(frames):
+            compressed = f.read(frames[last + 1][0] - frames[first][0])
+        else:
+            compressed = f.read()
+    data = decompress(compressed, codec)
+    offset = frames[first][1]
+    return data[start - offset:end - offset]
+
+def read_text(path, tail_bytes: Optional[int] = None) -> str:
+    """
+    Read a text file, decompressing it if needed.
+
+    Args:
+        path: The file path
+        tail_bytes: Optional number of bytes to read from the end of the file
+
+    Returns:
+        str: The file's text (decoding errors are replaced)
+    """
+    if tail_bytes is not None:
+        data = read_compressed_range(path, -tail_bytes)
+    else:
+        data = read_compressed(path)
+    return data.decode("utf-8", errors="replace")
+
+def load_json_file(path) -> Any:
+    """Load a JSON file, decompressing it if needed."""
+    return json.loads(read_compressed(path))
+
+def dump_json_file(path, data: Any, codec: str) -> Path:
+    """
+    Write a JSON file, compressed with the given codec.
+
+    Args:
+        path: Path of the uncompressed file; the codec's suffix is added
+        data: The data to write
+        codec: 'zstd', 'gzip' or 'none'
+
+    Returns:
+        Path: The path written
+    """
+    if codec == CODEC_NONE:
+        with open(path, "w") as f:
+            json.dump(data, f, indent=2)
+        return Path(path)
+    return write_compressed(compressed_path(path, codec), json.dumps(data).encode("utf-8"))
+
+def compress_file(path, codec: str, indexed: bool = False) -> Optional[Path]:
+    """
+    Replace an uncompressed file with its compressed version.
+
+    The compressed file keeps the original's modification time, so
+    incremental readers (such as the history export) do not see it as new.
+    When the compressed file already exists and is indexed, the data is
+    appended to it.
+
+    Args:
+        path: The uncompressed file
+        codec: 'zstd' or 'gzip'
+        indexed: Whether to keep a frame index next to the compressed file
+
+    Returns:
+        Path: The compressed file, or None if the file could not be compressed
+    """
+    path = Path(path)
+    if codec == CODEC_NONE:
+        return None
+    try:
+        stat = path.stat()
+        with open(path, "rb") as f:
+            data = f.read()
+        target = compressed_path(path, codec)
+        write_compressed(target, data, indexed=indexed, append=indexed)
+        os.utime(target, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+        path.unlink()
+        return target
+    except OSError as e:
+        logger.warning(f"Could not compress {path}: {str(e)}")
+        return None
+
+def recompress_stored_data(history_dir, runs_dir, codec: str, budget: float = 0.2, pause: float = 1.0,
+                           stopping: Optional[threading.Event] = None) -> Dict[str, int]:
+    """
+    Compress history files and collected run logs written uncompressed.
+
+    Work is done in slices of at most `budget` seconds with a pause between
+    slices, so existing data is converted without stalling the server.
+
+    Args:
+        history_dir: The task history directory
+        runs_dir: The runs directory
+        codec: 'zstd' or 'gzip'
+        budget: Seconds of work per slice
+        pause: Seconds to pause between slices
+        stopping: Optional event that stops the job when set
+
+    Returns:
+        dict: 'files' compressed, 'bytes_before' and 'bytes_after'
+    """
+    from app.utils.run_supervisor import list_collected_runs, compress_run_logs
+
+    stats = {"files": 0, "bytes_before": 0, "bytes_after": 0}
+    slice_started = time.monotonic()
+
+    def next_slice():
+        nonlocal slice_started
+        if time.monotonic() - slice_started < budget:
+            return True
+        if stopping is not None and stopping.wait(pause):
+            return False
+        if stopping is None:
+            time.sleep(pause)
+        slice_started = time.monotonic()
+        return True
+
+    if history_dir and os.path.isdir(history_dir):
+        with os.scandir(history_dir) as entries:
+            for entry in entries:
+                if not entry.name.endswith(".json") or "_" not in entry.name or not entry.is_file():
+                    continue
+                size = entry.stat().st_size
+                target = compress_file(entry.path, codec)
+                if target:
+                    stats["files"] += 1
+                    stats["bytes_before"] += size
+                    stats["bytes_after"] += target.stat().st_size
+                if not next_slice():
+                    return stats
+
+    if runs_dir and os.path.isdir(runs_dir):
+        for state in list_collected_runs(runs_dir):
+            compressed = compress_run_logs(state["state_path"], codec)
+            for before, after in compressed:
+                stats["files"] += 1
+                stats["bytes_before"] += before
+                stats["bytes_after"] += after
+            if not next_slice():
+                return stats
+
+    return stats
+
+_recompression_started = False
+_recompression_lock = threading.Lock()
+
+def start_recompression(app) -> bool:
+    """
+    Compress data stored uncompressed by earlier versions, once per process,
+    in a background thread.
+
+    Args:
+        app: The Flask application
+
+    Returns:
+        bool: True if the job was started
+    """
+    global _recompression_started
+    codec = get_codec(app.config.get("STORAGE_COMPRESSION", "auto"))
+    if codec == CODEC_NONE:
+        return False
+    with _recompression_lock:
+        if _recompression_started:
+            return False
+        _recompression_started = True
+
+    def run():
+        try:
+            stats = recompress_stored_data(
+                app.config["TASK_HISTORY_DIR"],
+                app.config["RUNS_DIR"],
+                codec,
+                budget=app.config.get("HISTORY_RETENTION_SLICE_SECONDS", 0.2)
+            )
+            if stats["files"]:
+                logger.info(f"Compressed {stats['files']} stored files with {codec}: {stats['bytes_before']} bytes to {stats['bytes_after']} bytes")
+        except Exception as e:
+            logger.error(f"Error compressing stored data: {str(e)}")
+
+    threading.Thread(target=run, name="StorageRecompression", daemon=True).start()
+    return True
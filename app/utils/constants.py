@@ -8,6 +8,7 @@ STATUS_RUNNING = "RUNNING"
 STATUS_SUCCESS = "SUCCESS"
 STATUS_FAILED = "FAILED"
 STATUS_MISSED = "MISSED"
+STATUS_SKIPPED = "SKIPPED"
 
 # Task trigger types
 TRIGGER_DATE = "date"
@@ -2,19 +2,331 @@
 Email notification module for EzTaskRunner.
 
 Handles sending email notifications for task failures and other events.
+Notifications are queued and sent by a background dispatcher that reuses
+its SMTP connection, rate-limits each recipient and collapses bursts of
+failures into digest emails.
 """
+import html
+import time
+import queue
+import atexit
 import smtplib
 import logging
+import threading
+from collections import deque
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from datetime import datetime
 from flask import url_for, current_app
 
+from app.run_context import get_run_id, run_context
+
 logger = logging.getLogger("EzTaskRunner")
 
+# Notifications sent at most this many times before they are dropped
+MAX_DELIVERY_ATTEMPTS = 3
+
+# Notifications held per recipient (e.g. by the rate limit); older ones are dropped
+MAX_PENDING_PER_RECIPIENT = 100
+
+def _build_failure_body(notification):
+    """Build the HTML section describing one task failure (or runtime regression)."""
+    regression = notification.get('kind') == 'regression'
+    html = f"""
+            <h3>Task Details:</h3>
+            <ul>
+                <li><strong>Task Name:</strong> {notification['task_name']}</li>
+                <li><strong>Job ID:</strong> {notification['job_id']}</li>
+                <li><strong>{'Run Time' if regression else 'Failure Time'}:</strong> {notification['timestamp']}</li>
+                <li><strong>Script:</strong> {notification['script_path']}</li>
+            </ul>
+            
+            <h3>{'Slower Than Baseline' if regression else 'Error Message'}:</h3>
+            <pre style="background-color: #f8d7da; padding: 10px; border-radius: 5px;">{notification['error_message']}</pre>
+        """
+    if notification.get('history_url'):
+        html += f"""
+            <p>
+                <a href="{notification['history_url']}" style="display: inline-block; padding: 10px 15px; background-color: #007bff; color: white; text-decoration: none; border-radius: 5px;">
+                    View Task History
+                </a>
+            </p>
+            """
+    return html
+
+def build_failure_message(notifications, sender, recipient, dropped=0):
+    """
+    Build a failure email for one recipient.
+    
+    A single notification gives the usual failure email; several are
+    collapsed into one digest.
+    
+    Args:
+        notifications: List of failure notifications
+        sender: The sender address
+        recipient: The recipient address
+        dropped: Number of older notifications dropped while they were held
+        
+    Returns:
+        MIMEMultipart: The email message
+    """
+    msg = MIMEMultipart()
+    msg['From'] = sender
+    msg['To'] = recipient
+    
+    if len(notifications) == 1 and not dropped:
+        notification = notifications[0]
+        if notification.get('kind') == 'regression':
+            msg['Subject'] = f"Task: {notification['task_name']} Ran Slower Than Usual - {notification['timestamp']}"
+            html_body = """
+        <html>
+        <body>
+            <h2>Task Runtime Regression</h2>
+            <p>A task run exceeded its runtime baseline in EzTaskRunner.</p>
+            """ + _build_failure_body(notification)
+        else:
+            msg['Subject'] = f"Task: {notification['task_name']} Failed - {notification['timestamp']}"
+            html_body = """
+        <html>
+        <body>
+            <h2>Task Failure Notification</h2>
+            <p>A task has failed in EzTaskRunner.</p>
+            """ + _build_failure_body(notification)
+    else:
+        task_names = sorted({n['task_name'] for n in notifications})
+        regressions = sum(1 for n in notifications if n.get('kind') == 'regression')
+        failures = len(notifications) - regressions
+        if regressions:
+            summary = f"{failures} task runs failed and {regressions} ran slower than usual"
+            msg['Subject'] = f"{failures} task failures, {regressions} slow runs ({len(task_names)} tasks) - {notifications[-1]['timestamp']}"
+        else:
+            summary = f"{len(notifications)} task runs failed"
+            msg['Subject'] = f"{len(notifications)} task failures ({len(task_names)} tasks) - {notifications[-1]['timestamp']}"
+        if dropped:
+            msg.replace_header('Subject', f"{msg['Subject']} (+{dropped} dropped)")
+        html_body = f"""
+        <html>
+        <body>
+            <h2>Task Failure Digest</h2>
+            <p>{summary} in EzTaskRunner between {notifications[0]['timestamp']} and {notifications[-1]['timestamp']}.</p>
+            <p><strong>Tasks:</strong> {', '.join(task_names)}</p>
+            """
+        if dropped:
+            html_body += f"""
+            <p>{dropped} older notifications were dropped while they were held back; the newest {len(notifications)} are listed below.</p>
+            """
+        html_body += '<hr>'.join(_build_failure_body(n) for n in notifications)
+    
+    html_body += """
+        </body>
+        </html>
+        """
+    msg.attach(MIMEText(html_body, 'html'))
+    return msg
+
+class NotificationDispatcher:
+    """
+    Sends queued email notifications from a background thread.
+    
+    Notifications arriving within the digest window are collapsed into one
+    digest email per recipient, each recipient is limited to a number of
+    emails per hour (held notifications go out in a later digest, keeping
+    the newest MAX_PENDING_PER_RECIPIENT), and the SMTP connection is kept
+    open and reused between emails.
+    """
+    
+    def __init__(self, app):
+        self.app = app
+        self.queue = queue.Queue()
+        self.pending = {}  # recipient -> list of notifications waiting to be sent
+        self.dropped = {}  # recipient -> older notifications dropped from pending
+        self.first_pending_at = None
+        self.sent_times = {}  # recipient -> deque of send times within the last hour
+        self.smtp = None
+        self.smtp_settings = None
+        self.smtp_last_used = 0
+        self.stopping = threading.Event()
+        self.thread = threading.Thread(target=self._run, name="NotificationDispatcher", daemon=True)
+    
+    def start(self):
+        """Start the sender thread."""
+        self.thread.start()
+        atexit.register(self.stop)
+    
+    def stop(self, timeout=10):
+        """Send what is still pending and stop the sender thread."""
+        self.stopping.set()
+        if self.thread.is_alive():
+            self.thread.join(timeout)
+    
+    def submit(self, notification, recipients):
+        """
+        Queue a notification for delivery.
+        
+        Args:
+            notification: The notification dictionary
+            recipients: List of recipient addresses
+        """
+        # Keep the run the notification is about for the dispatcher's log records
+        notification = dict(notification, run_id=notification.get('run_id') or get_run_id())
+        self.queue.put((notification, list(recipients)))
+    
+    def _settings(self):
+        """Read the current email settings from the app config."""
+        config = self.app.config
+        return {
+            'smtp_host': config.get('EMAIL_SMTP_HOST'),
+            'smtp_port': config.get('EMAIL_SMTP_PORT'),
+            'smtp_user': config.get('EMAIL_SMTP_USER'),
+            'smtp_pass': config.get('EMAIL_SMTP_PASS'),
+            'starttls': config.get('EMAIL_SMTP_STARTTLS', True),
+            'sender': config.get('EMAIL_SENDER'),
+            'digest_seconds': config.get('EMAIL_DIGEST_SECONDS', 30),
+            'rate_limit': config.get('EMAIL_RATE_LIMIT_PER_HOUR', 10),
+            'idle_seconds': config.get('EMAIL_SMTP_IDLE_SECONDS', 60)
+        }
+    
+    def _run(self):
+        while True:
+            # Collect everything queued so far, waiting briefly for the first item
+            try:
+                notification, recipients = self.queue.get(timeout=1)
+                while True:
+                    for recipient in recipients:
+                        self._hold(recipient, dict(notification, attempts=0))
+                    if self.first_pending_at is None:
+                        self.first_pending_at = time.time()
+                    notification, recipients = self.queue.get_nowait()
+            except queue.Empty:
+                pass
+            
+            try:
+                settings = self._settings()
+                stopping = self.stopping.is_set()
+                if self.pending and (stopping or time.time() - self.first_pending_at >= settings['digest_seconds']):
+                    self._flush(settings, ignore_rate_limit=stopping)
+                if self.smtp and (stopping or time.time() - self.smtp_last_used > settings['idle_seconds']):
+                    self._close()
+            except Exception as e:
+                logger.error(f"Error in notification dispatcher: {str(e)}")
+            
+            if self.stopping.is_set() and self.queue.empty():
+                break
+    
+    def _hold(self, recipient, notification):
+        """Add a notification to a recipient's pending list, dropping the oldest past the cap."""
+        pending = self.pending.setdefault(recipient, [])
+        pending.append(notification)
+        if len(pending) > MAX_PENDING_PER_RECIPIENT:
+            excess = len(pending) - MAX_PENDING_PER_RECIPIENT
+            del pending[:excess]
+            self.dropped[recipient] = self.dropped.get(recipient, 0) + excess
+    
+    def _allow(self, recipient, limit):
+        """Check and record the per-recipient rate limit."""
+        sent = self.sent_times.setdefault(recipient, deque())
+        now = time.time()
+        while sent and sent[0] < now - 3600:
+            sent.popleft()
+        if limit and len(sent) >= limit:
+            return False
+        sent.append(now)
+        return True
+    
+    def _flush(self, settings, ignore_rate_limit=False):
+        """Send pending notifications, one email or digest per recipient."""
+        for recipient in list(self.pending):
+            notifications = self.pending[recipient]
+            if not ignore_rate_limit and not self._allow(recipient, settings['rate_limit']):
+                dropped_note = f" ({self.dropped[recipient]} older dropped)" if self.dropped.get(recipient) else ""
+                logger.info(f"Email rate limit reached for {recipient}, holding {len(notifications)} notifications{dropped_note}")
+                continue
+            
+            dropped = self.dropped.get(recipient, 0)
+            msg = build_failure_message(notifications, settings['sender'], recipient, dropped)
+            # A single notification is logged under its run; a digest lists its runs
+            run_ids = [n['run_id'] for n in notifications if n.get('run_id')]
+            single_run = run_ids[0] if len(notifications) == 1 and run_ids else None
+            runs_note = f" (runs {', '.join(run_ids)})" if len(run_ids) > 1 else ""
+            with run_context(single_run, notifications[0].get('job_id') if single_run else None):
+                try:
+                    self._send(msg, settings)
+                    del self.pending[recipient]
+                    self.dropped.pop(recipient, None)
+                    logger.info(f"Sent failure notification email with {len(notifications)} failures to {recipient}{runs_note}")
+                except Exception as e:
+                    logger.error(f"Failed to send email notification to {recipient}{runs_note}: {str(e)}")
+                    for notification in notifications:
+                        notification['attempts'] += 1
+                    self.pending[recipient] = [n for n in notifications if n['attempts'] < MAX_DELIVERY_ATTEMPTS]
+                    if not self.pending[recipient]:
+                        del self.pending[recipient]
+                        self.dropped.pop(recipient, None)
+        
+        self.first_pending_at = time.time() if self.pending else None
+    
+    def _connect(self, settings):
+        """Open an SMTP connection, upgrading to TLS and logging in if configured."""
+        server = smtplib.SMTP(settings['smtp_host'], settings['smtp_port'], timeout=30)
+        if settings['starttls']:
+            server.starttls()
+        if settings['smtp_user']:
+            server.login(settings['smtp_user'], settings['smtp_pass'])
+        return server
+    
+    def _send(self, msg, settings):
+        """Send a message over the pooled connection, reconnecting once if it was dropped."""
+        connection_settings = tuple(settings[k] for k in ('smtp_host', 'smtp_port', 'smtp_user', 'smtp_pass', 'starttls'))
+        if self.smtp is not None and self.smtp_settings != connection_settings:
+            self._close()
+        
+        for attempt in range(2):
+            if self.smtp is None:
+                self.smtp = self._connect(settings)
+                self.smtp_settings = connection_settings
+            try:
+                self.smtp.send_message(msg)
+                self.smtp_last_used = time.time()
+                return
+            except (smtplib.SMTPServerDisconnected, smtplib.SMTPSenderRefused, OSError):
+                # The server closed the idle connection; reconnect and try again
+                self._close()
+                if attempt:
+                    raise
+    
+    def _close(self):
+        """Close the pooled SMTP connection."""
+        if self.smtp is not None:
+            try:
+                self.smtp.quit()
+            except Exception:
+                pass
+            self.smtp = None
+
+# Dispatcher shared by the whole process, started on first use
+_dispatcher = None
+_dispatcher_lock = threading.Lock()
+
+def get_dispatcher():
+    """
+    Get the process-wide notification dispatcher, starting it if needed.
+    
+    Returns:
+        NotificationDispatcher: The dispatcher
+    """
+    global _dispatcher
+    with _dispatcher_lock:
+        if _dispatcher is None:
+            _dispatcher = NotificationDispatcher(current_app._get_current_object())
+            _dispatcher.start()
+        return _dispatcher
+
 def send_task_failure_email(task, error_message, task_history_entry=None):
     """
-    Send an email notification when a task fails.
+    Queue an email notification for a task failure.
+    
+    The email is sent by the background notification dispatcher, so a slow
+    or unreachable SMTP server does not hold up the caller.
     
     Args:
         task: The task data dictionary
@@ -22,24 +334,13 @@ def send_task_failure_email(task, error_message, task_history_entry=None):
         task_history_entry: Optional task history entry with additional details
         
     Returns:
-        bool: True if the email was sent successfully, False otherwise
+        bool: True if the notification was queued, False otherwise
     """
     try:
-        # Get email configuration from app config
         config = current_app.config
         
-        email_config = {
-            'enabled': config.get('EMAIL_NOTIFICATIONS_ENABLED', False),
-            'smtp_host': config.get('EMAIL_SMTP_HOST', 'sandbox.smtp.mailtrap.io'),
-            'smtp_port': config.get('EMAIL_SMTP_PORT', 2525),
-            'smtp_user': config.get('EMAIL_SMTP_USER', '72c8025da81b94'),
-            'smtp_pass': config.get('EMAIL_SMTP_PASS', '0e03c13c3eba5c'),
-            'sender': config.get('EMAIL_SENDER', 'EzTaskRunner <eztaskrunner@example.com>'),
-            'recipients': config.get('EMAIL_RECIPIENTS', ['admin@example.com'])
-        }
-        
         # Check if global email notifications are enabled
-        if not email_config['enabled']:
+        if not config.get('EMAIL_NOTIFICATIONS_ENABLED', False):
             logger.info(f"Global email notifications are disabled. Would have sent notification for task: {task['job_id']}")
             return False
             
@@ -47,76 +348,80 @@ def send_task_failure_email(task, error_message, task_history_entry=None):
         if not task.get('email_notifications_enabled', True):  # Default to True for backward compatibility
             logger.info(f"Task-specific email notifications are disabled for task: {task['job_id']}")
             return False
-            
-        # Create task details
-        task_name = task.get('task_name', 'Unknown Task')
+        
         job_id = task.get('job_id', 'unknown')
-        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        notification = {
+            'task_name': task.get('task_name', 'Unknown Task'),
+            'job_id': job_id,
+            'timestamp': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            'script_path': task.get('script_path', 'N/A'),
+            'error_message': html.escape(error_message or ''),
+            'history_url': None
+        }
         
-        # Create email subject
-        subject = f"Task: {task_name} Failed - {timestamp}"
+        # Add history URL if in app context
+        try:
+            notification['history_url'] = url_for('tasks.view_task_history', job_id=job_id, _external=True)
+        except Exception as e:
+            logger.warning(f"Could not generate task history URL: {str(e)}")
         
-        # Create email recipients
         # If recipients is a string, convert to list
-        recipients = email_config['recipients']
+        recipients = config.get('EMAIL_RECIPIENTS', ['admin@example.com'])
         if isinstance(recipients, str):
             recipients = [recipients]
-            
-        # Create multipart message
-        msg = MIMEMultipart()
-        msg['Subject'] = subject
-        msg['From'] = email_config['sender']
-        msg['To'] = ', '.join(recipients)
+        recipients = [r.strip() for r in recipients if r.strip()]
         
-        # Create email body with HTML formatting
-        html_body = f"""
-        <html>
-        <body>
-            <h2>Task Failure Notification</h2>
-            <p>A task has failed in EzTaskRunner.</p>
-            
-            <h3>Task Details:</h3>
-            <ul>
-                <li><strong>Task Name:</strong> {task_name}</li>
-                <li><strong>Job ID:</strong> {job_id}</li>
-                <li><strong>Failure Time:</strong> {timestamp}</li>
-                <li><strong>Script:</strong> {task.get('script_path', 'N/A')}</li>
-            </ul>
-            
-            <h3>Error Message:</h3>
-            <pre style="background-color: #f8d7da; padding: 10px; border-radius: 5px;">{error_message}</pre>
-        """
+        get_dispatcher().submit(notification, recipients)
+        logger.info(f"Queued failure notification email for task {notification['task_name']} ({job_id})")
+        return True
+    
+    except Exception as e:
+        logger.error(f"Failed to queue email notification: {str(e)}")
+        return False
+
+def send_task_regression_email(task, regression):
+    """
+    Queue an email notification for a run that exceeded its task's runtime baseline.
+    
+    Sent through the notification dispatcher like failure emails, so it is
+    rate-limited and collapsed into digests with them.
+    
+    Args:
+        task: The task data dictionary
+        regression: The regression flag from app.runtime_baseline.record_runtime
         
-        # Add history URL if in app context
+    Returns:
+        bool: True if the notification was queued, False otherwise
+    """
+    try:
+        config = current_app.config
+        if not config.get('EMAIL_NOTIFICATIONS_ENABLED', False) or not task.get('email_notifications_enabled', True):
+            return False
+        
+        job_id = task.get('job_id', 'unknown')
+        notification = {
+            'kind': 'regression',
+            'task_name': task.get('task_name', 'Unknown Task'),
+            'job_id': job_id,
+            'timestamp': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            'script_path': task.get('script_path', 'N/A'),
+            'error_message': html.escape(regression.get('reason', '')),
+            'history_url': None
+        }
         try:
-            history_url = url_for('tasks.view_task_history', job_id=job_id, _external=True)
-            html_body += f"""
-            <p>
-                <a href="{history_url}" style="display: inline-block; padding: 10px 15px; background-color: #007bff; color: white; text-decoration: none; border-radius: 5px;">
-                    View Task History
-                </a>
-            </p>
-            """
+            notification['history_url'] = url_for('tasks.view_task_history', job_id=job_id, _external=True)
         except Exception as e:
             logger.warning(f"Could not generate task history URL: {str(e)}")
-            
-        html_body += """
-        </body>
-        </html>
-        """
         
-        # Attach HTML body
-        msg.attach(MIMEText(html_body, 'html'))
+        recipients = config.get('EMAIL_RECIPIENTS', ['admin@example.com'])
+        if isinstance(recipients, str):
+            recipients = [recipients]
+        recipients = [r.strip() for r in recipients if r.strip()]
         
-        # Send email via SMTP
-        with smtplib.SMTP(email_config['smtp_host'], email_config['smtp_port']) as server:
-            server.starttls()
-            server.login(email_config['smtp_user'], email_config['smtp_pass'])
-            server.send_message(msg)
-            
-        logger.info(f"Sent failure notification email for task {task_name} ({job_id})")
+        get_dispatcher().submit(notification, recipients)
+        logger.info(f"Queued runtime regression email for task {notification['task_name']} ({job_id})")
         return True
     
     except Exception as e:
-        logger.error(f"Failed to send email notification: {str(e)}")
-        return False 
\ No newline at end of file
+        logger.error(f"Failed to queue regression notification: {str(e)}")
+        return False
@@ -0,0 +1,255 @@
+"""
+Profile Runner Module
+
+Runs a Python task script under a profiler and writes the profile next to the
+run's log files.
+
+Two modes are supported:
+
+- 'cprofile': deterministic profiling with cProfile; writes a pstats file
+  (<base>.pstats) that can be opened with snakeviz, flameprof or pstats
+- 'sample': a low-overhead stack sampler; writes collapsed stacks
+  (<base>.collapsed), the input format of flamegraph.pl and speedscope
+
+Both modes also write a summary of the hottest functions (<base>.summary.json)
+that is shown in the task history.
+
+This file is executed by path in place of the script, so it only imports the
+standard library at module level.
+"""
+import json
+import os
+import runpy
+import sys
+import threading
+import time
+from collections import Counter
+
+# Profiling modes
+PROFILE_CPROFILE = "cprofile"
+PROFILE_SAMPLE = "sample"
+PROFILE_MODES = (PROFILE_CPROFILE, PROFILE_SAMPLE)
+
+# Seconds between stack samples in sampling mode
+SAMPLE_INTERVAL = 0.005
+
+# Number of functions kept in the summary
+TOP_FUNCTIONS = 20
+
+# Files of the frames that run the script rather than belong to it (runpy is frozen on newer Pythons)
+RUNNER_FILES = (__file__, runpy.__file__, '<frozen runpy>')
+
+def build_profile_command(cmd, mode, output_base):
+    """
+    Wrap a Python script command so the script runs under the profiler.
+
+    Args:
+        cmd: The script command ([python, script_path, *args])
+        mode: PROFILE_CPROFILE or PROFILE_SAMPLE
+        output_base: Path prefix for the profile files
+
+    Returns:
+        list: The profiling command
+    """
+    return [cmd[0], os.path.abspath(__file__), '--mode', mode, '--output', str(output_base), '--'] + list(cmd[1:])
+
+def get_profile_paths(output_base):
+    """
+    Get the profile file paths for an output base.
+
+    Args:
+        output_base: Path prefix for the profile files
+
+    Returns:
+        dict: Paths keyed by 'pstats', 'collapsed' and 'summary'
+    """
+    return {
+        'pstats': f"{output_base}.pstats",
+        'collapsed': f"{output_base}.collapsed",
+        'summary': f"{output_base}.summary.json"
+    }
+
+def load_profile_summary(output_base):
+    """
+    Load the summary of a finished profile.
+
+    Args:
+        output_base: Path prefix for the profile files
+
+    Returns:
+        dict: 'mode', 'artifact' (file name of the profile), 'top_functions'
+        and sample/duration totals, or None if no profile was written
+    """
+    try:
+        with open(get_profile_paths(output_base)['summary'], 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def _frame_label(code):
+    """Label of a code object in profiles: function (file:line)."""
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+def _script_stack(frame, in_main_thread):
+    """
+    Get the labels of a thread's stack, outermost first.
+
+    In the main thread only the frames the script runs in are kept; stacks
+    sampled before the script started (or after it returned) are dropped.
+    """
+    stack = []
+    while frame is not None:
+        if in_main_thread and frame.f_code.co_filename in RUNNER_FILES:
+            return stack[::-1] if frame.f_code.co_name == '_run_code' else []
+        stack.append(_frame_label(frame.f_code))
+        frame = frame.f_back
+    return [] if in_main_thread else stack[::-1]
+
+class StackSampler:
+    """Samples the stacks of all other threads at a fixed interval."""
+
+    def __init__(self, interval=SAMPLE_INTERVAL):
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="ProfileSampler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        own_id = threading.get_ident()
+        main_id = threading.main_thread().ident
+        while not self._stop.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = _script_stack(frame, thread_id == main_id)
+                if stack:
+                    self.stacks[';'.join(stack)] += 1
+            self.samples += 1
+
+    def write(self, path):
+        """Write the samples as collapsed stacks."""
+        with open(path, 'w') as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+    def top_functions(self, limit=TOP_FUNCTIONS):
+        """The functions with the most samples at the top of the stack."""
+        own, total = Counter(), Counter()
+        for stack, count in self.stacks.items():
+            frames = stack.split(';')
+            own[frames[-1]] += count
+            for function in set(frames):
+                total[function] += count
+        all_samples = sum(self.stacks.values()) or 1
+        return [
+            {
+                'function': function,
+                'self_samples': count,
+                'total_samples': total[function],
+                'self_percent': round(count * 100 / all_samples, 1)
+            }
+            for function, count in own.most_common(limit)
+        ]
+
+def _cprofile_top_functions(stats, limit=TOP_FUNCTIONS):
+    """The functions with the most time spent in themselves."""
+    rows = []
+    for (filename, line, name), (_, calls, self_time, cumulative, _) in stats.stats.items():
+        if filename in RUNNER_FILES:
+            continue
+        label = name if filename == '~' else f"{name} ({os.path.basename(filename)}:{line})"
+        rows.append({'function': label, 'calls': calls, 'self_seconds': self_time, 'cumulative_seconds': cumulative})
+    rows.sort(key=lambda row: row['self_seconds'], reverse=True)
+    return rows[:limit]
+
+def _run_script(script_path, args):
+    """Run a script as __main__, returning its exit code."""
+    sys.argv = [script_path] + args
+    sys.path.insert(0, os.path.dirname(os.path.abspath(script_path)))
+    try:
+        runpy.run_path(script_path, run_name='__main__')
+    except SystemExit as e:
+        if e.code is None or isinstance(e.code, int):
+            return e.code or 0
+        print(e.code, file=sys.stderr)
+        return 1
+    return 0
+
+def profile_script(mode, output_base, script_path, args):
+    """
+    Run a script under the profiler and write the profile files.
+
+    Args:
+        mode: PROFILE_CPROFILE or PROFILE_SAMPLE
+        output_base: Path prefix for the profile files
+        script_path: The script to run
+        args: The script's arguments
+
+    Returns:
+        int: The script's exit code
+    """
+    paths = get_profile_paths(output_base)
+    started = time.time()
+    exit_code = 1
+
+    if mode == PROFILE_CPROFILE:
+        import cProfile
+        import pstats
+        profiler = cProfile.Profile()
+        try:
+            exit_code = profiler.runcall(_run_script, script_path, args)
+        finally:
+            profiler.dump_stats(paths['pstats'])
+            stats = pstats.Stats(paths['pstats'])
+            summary = {
+                'mode': mode,
+                'artifact': os.path.basename(paths['pstats']),
+                'top_functions': _cprofile_top_functions(stats),
+                'total_seconds': stats.total_tt
+            }
+    else:
+        sampler = StackSampler()
+        sampler.start()
+        try:
+            exit_code = _run_script(script_path, args)
+        finally:
+            sampler.stop()
+            sampler.write(paths['collapsed'])
+            summary = {
+                'mode': mode,
+                'artifact': os.path.basename(paths['collapsed']),
+                'top_functions': sampler.top_functions(),
+                'samples': sampler.samples,
+                'sample_interval': sampler.interval
+            }
+
+    summary['duration_seconds'] = time.time() - started
+    with open(paths['summary'], 'w') as f:
+        json.dump(summary, f, indent=2)
+    return exit_code
+
+def _main(argv):
+    """Parse the runner's arguments: --mode MODE --output BASE -- SCRIPT [ARGS...]"""
+    separator = argv.index('--')
+    options = dict(zip(argv[:separator:2], argv[1:separator:2]))
+    script_path, args = argv[separator + 1], argv[separator + 2:]
+    mode = options.get('--mode', PROFILE_CPROFILE)
+    if mode not in PROFILE_MODES:
+        print(f"Unknown profiling mode: {mode}", file=sys.stderr)
+        return 2
+    return profile_script(mode, options['--output'], script_path, args)
+
+if __name__ == '__main__':
+    sys.stdout.flush()
+    code = _main(sys.argv[1:])
+    sys.stdout.flush()
+    sys.stderr.flush()
+    sys.exit(code)
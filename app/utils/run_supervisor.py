@@ -0,0 +1,560 @@
+"""
+Run Supervisor Module
+
+Launches task scripts detached from the server process and reattaches to
+them after a restart.
+
+A detached run is started through this file, executed as a standalone script
+in its own session. The supervisor sends the script's output to run log files
+and writes its exit status to a run-state file in the runs directory, so the
+run and its result survive a server restart. A restarted server rediscovers
+live runs by process ID plus process start time, resumes tailing their logs
+and collects their exit status.
+
+This file is executed by path, so it only imports the standard library at
+module level.
+"""
+import json
+import os
+import sys
+import time
+import signal
+import platform
+import subprocess
+import uuid
+from datetime import datetime
+from pathlib import Path
+
+# Seconds between polls of a run's log and state files
+POLL_INTERVAL = 0.5
+
+# Seconds to wait for the supervisor to report that the script has started
+START_TIMEOUT = 10
+
+# Seconds between the supervisor's checks for the script's first output
+OUTPUT_POLL_INTERVAL = 0.1
+
+# Processes started by this server, kept so they can be reaped
+_supervisors = {}
+
+def get_run_paths(runs_dir, run_key):
+    """
+    Get the state and log file paths of a detached run.
+
+    Args:
+        runs_dir: Directory holding run state and log files
+        run_key: The run's key (its run queue ID when it has one)
+
+    Returns:
+        dict: Paths keyed by 'state', 'stdout' and 'stderr'
+    """
+    runs_dir = Path(runs_dir)
+    return {
+        'state': runs_dir / f"{run_key}.state.json",
+        'stdout': runs_dir / f"{run_key}.log",
+        'stderr': runs_dir / f"{run_key}.err.log"
+    }
+
+def read_run_state(state_path):
+    """
+    Read a run-state file.
+
+    Args:
+        state_path: Path of the run-state file
+
+    Returns:
+        dict: The run state, or None if it cannot be read
+    """
+    try:
+        with open(state_path, 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def _write_run_state(state_path, state):
+    """Atomically replace a run-state file so readers never see a partial write."""
+    tmp_path = f"{state_path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(state, f, indent=2)
+    os.replace(tmp_path, state_path)
+
+def _process_create_time(pid):
+    """Get a process's start time, used with its PID as a fingerprint."""
+    try:
+        import psutil
+        return psutil.Process(pid).create_time()
+    except Exception:
+        return None
+
+def process_matches(pid, create_time):
+    """
+    Check whether a process is still running and is the one that was recorded.
+
+    Process IDs are reused, so the process start time must match as well.
+
+    Args:
+        pid: The recorded process ID
+        create_time: The recorded process start time
+
+    Returns:
+        bool: True if the recorded process is still alive
+    """
+    if not pid or create_time is None:
+        return False
+    try:
+        import psutil
+        process = psutil.Process(pid)
+        if process.status() == psutil.STATUS_ZOMBIE:
+            return False
+        return abs(process.create_time() - create_time) < 1.0
+    except Exception:
+        return False
+
+def launch_detached_run(cmd, runs_dir, run_key=None, job_id=None, run_id=None, max_runtime_minutes=60, shell=False):
+    """
+    Start a script under a detached supervisor process.
+
+    Args:
+        cmd: The command to run
+        runs_dir: Directory for run state and log files
+        run_key: Optional run key (a new one is generated if not given)
+        job_id: Optional job ID, recorded in the run state
+        run_id: Optional run queue ID, recorded in the run state
+        max_runtime_minutes: Runtime after which the supervisor kills the script
+        shell: Whether to run the command through the shell
+
+    Returns:
+        dict: The run state once the script has started (or failed to start)
+
+    Raises:
+        RuntimeError: If the supervisor does not report the script's start
+    """
+    run_key = run_key or str(uuid.uuid4())
+    os.makedirs(runs_dir, exist_ok=True)
+    paths = get_run_paths(runs_dir, run_key)
+
+    state = {
+        'run_key': run_key,
+        'job_id': job_id,
+        'run_id': run_id,
+        'cmd': cmd,
+        'shell': shell,
+        'max_runtime_minutes': max_runtime_minutes,
+        'stdout_path': str(paths['stdout']),
+        'stderr_path': str(paths['stderr']),
+        'launched_at': datetime.now().isoformat()
+    }
+    _write_run_state(paths['state'], state)
+
+    # Detach the supervisor from the server so it outlives a restart
+    popen_kwargs = {
+        'stdin': subprocess.DEVNULL,
+        'stdout': subprocess.DEVNULL,
+        'stderr': subprocess.DEVNULL,
+        'close_fds': True
+    }
+    if platform.system() == "Windows":
+        # DETACHED_PROCESS | CREATE_NEW_PROCESS_GROUP
+        popen_kwargs['creationflags'] = 0x00000008 | 0x00000200
+    else:
+        popen_kwargs['start_new_session'] = True
+
+    supervisor = subprocess.Popen([sys.executable, os.path.abspath(__file__), str(paths['state'])], **popen_kwargs)
+    _supervisors[run_key] = supervisor
+
+    deadline = time.time() + START_TIMEOUT
+    while time.time() < deadline:
+        state = read_run_state(paths['state']) or state
+        if state.get('pid') or state.get('finished_at'):
+            state['state_path'] = str(paths['state'])
+            return state
+        if supervisor.poll() is not None:
+            break
+        time.sleep(0.05)
+
+    raise RuntimeError(f"Run supervisor for {run_key} did not start the script")
+
+def follow_detached_run(state_path, on_output=None, poll_interval=POLL_INTERVAL):
+    """
+    Wait for a detached run to finish, tailing its output log.
+
+    Works both for runs started by this process and for runs reattached
+    after a restart.
+
+    Args:
+        state_path: Path of the run-state file
+        on_output: Optional callable receiving stdout lines as they are written
+        poll_interval: Seconds between polls
+
+    Returns:
+        dict: The final run state; 'interrupted' is set if the run ended
+        without its supervisor recording an exit status
+    """
+    state = read_run_state(state_path) or {}
+    # A re-queued run appends to its earlier log; only this attempt's output is passed on
+    offset = state.get('stdout_offset', 0)
+    partial = ''
+
+    def tail():
+        nonlocal offset, partial
+        if not on_output:
+            return
+        try:
+            with open(state['stdout_path'], 'r', encoding='utf-8', errors='replace') as f:
+                f.seek(offset)
+                chunk = f.read()
+                offset = f.tell()
+        except OSError:
+            return
+        lines = (partial + chunk).split('\n')
+        partial = lines.pop()
+        for line in lines:
+            try:
+                on_output(line + '\n')
+            except Exception:
+                pass  # A failing consumer must not break the run
+
+    while True:
+        state = read_run_state(state_path) or state
+        tail()
+        if state.get('finished_at'):
+            break
+
+        supervisor_alive = process_matches(state.get('supervisor_pid'), state.get('supervisor_create_time'))
+        script_alive = process_matches(state.get('pid'), state.get('pid_create_time'))
+        if not supervisor_alive:
+            # Re-read once: the supervisor may have finished since the last read
+            state = read_run_state(state_path) or state
+            if state.get('finished_at'):
+                tail()
+                break
+            if not script_alive:
+                state['interrupted'] = True
+                break
+            # The script outlived its supervisor; enforce the runtime limit here
+            started = state.get('started_at_epoch') or time.time()
+            if time.time() - started > state.get('max_runtime_minutes', 60) * 60:
+                _kill_process_tree(state['pid'])
+                state['timed_out'] = True
+        time.sleep(poll_interval)
+
+    if on_output and partial:
+        try:
+            on_output(partial)
+        except Exception:
+            pass
+
+    # Reap the supervisor if this process started it
+    supervisor = _supervisors.pop(state.get('run_key'), None)
+    if supervisor:
+        supervisor.wait()
+
+    return state
+
+def build_run_result(state):
+    """
+    Build a run_script style result from a finished run's state.
+
+    Args:
+        state: The final run state
+
+    Returns:
+        dict: Result fields (success, output, error, process_id, run_id, timeline,
+        and peak_rss_mb and cpu_seconds where known)
+    """
+    # Only the output of this attempt; a re-queued run appends to its earlier logs
+    stdout = read_run_log(state, 'stdout', offset=state.get('stdout_offset', 0))
+    stderr = read_run_log(state, 'stderr', offset=state.get('stderr_offset', 0))
+    exit_code = state.get('exit_code')
+    result = {
+        'success': False,
+        'output': stdout,
+        'error': '',
+        'process_id': state.get('pid'),
+        'run_id': state.get('run_id'),
+        'exit_code': exit_code,
+        'timeline': {
+            point: state[key]
+            for point, key in (('spawned_at', 'started_at_epoch'), ('first_output_at', 'first_output_at'), ('exited_at', 'finished_at_epoch'))
+            if state.get(key) is not None
+        }
+    }
+
+    for usage in ('peak_rss_mb', 'cpu_seconds'):
+        if state.get(usage) is not None:
+            result[usage] = state[usage]
+
+    if state.get('launch_error'):
+        result['error'] = state['launch_error']
+    elif state.get('timed_out'):
+        result['error'] = f"Process timed out after {state.get('max_runtime_minutes', 60)} minutes and was terminated"
+    elif state.get('interrupted'):
+        result['error'] = stderr or "Run was interrupted: the script and its supervisor are no longer running"
+    elif exit_code == 0:
+        result['success'] = True
+        if stderr.strip():
+            result['output'] += f"\n\nSTDERR Output:\n{stderr}"
+    else:
+        result['error'] = stderr or f"Process exited with code {exit_code}"
+
+    return result
+
+def read_run_log(state, stream='stdout', tail_bytes=None, offset=0):
+    """
+    Read a run's log, whether it is still plain or already compressed.
+
+    Args:
+        state: The run state
+        stream: 'stdout' or 'stderr'
+        tail_bytes: Optional number of bytes to read from the end of the log
+        offset: Uncompressed offset to read from when reading the whole log
+
+    Returns:
+        str: The log text, or '' if the log cannot be read
+    """
+    from app.utils.compression import read_text, read_compressed_range, SUFFIXES
+
+    path = state.get(f'{stream}_path')
+    if not path:
+        return ''
+    # The log may have been compressed since the state was read
+    for candidate in [path] + [f"{path}{suffix}" for suffix in SUFFIXES.values()]:
+        try:
+            if offset and tail_bytes is None:
+                return read_compressed_range(candidate, offset).decode('utf-8', errors='replace')
+            return read_text(candidate, tail_bytes=tail_bytes)
+        except OSError:
+            continue
+    return ''
+
+def compress_run_logs(state_path, codec):
+    """
+    Compress the logs of a collected run, with a frame index for tail reads.
+
+    Args:
+        state_path: Path of the run-state file
+        codec: 'zstd', 'gzip' or 'none'
+
+    Returns:
+        list: (uncompressed size, compressed size) of each log compressed
+    """
+    from app.utils.compression import compress_file, codec_for_path, CODEC_NONE
+
+    state = read_run_state(state_path)
+    if state is None or codec == CODEC_NONE:
+        return []
+
+    compressed = []
+    for stream in ('stdout', 'stderr'):
+        path = state.get(f'{stream}_path')
+        if not path or codec_for_path(path) != CODEC_NONE or not os.path.exists(path):
+            continue
+        size = os.path.getsize(path)
+        target = compress_file(path, codec, indexed=True)
+        if target:
+            state[f'{stream}_path'] = str(target)
+            compressed.append((size, target.stat().st_size))
+    if compressed:
+        _write_run_state(state_path, state)
+    return compressed
+
+def remove_run_files(runs_dir, run_key):
+    """
+    Delete the state, log and log index files of a run whose result has been saved.
+
+    Profile files are kept: the run's history entry links to them, and they
+    are expired with it by the history retention worker.
+
+    Args:
+        runs_dir: Directory holding run state and log files
+        run_key: The run's key
+
+    Returns:
+        int: Number of files deleted
+    """
+    from app.utils.compression import SUFFIXES, INDEX_SUFFIX
+
+    paths = get_run_paths(runs_dir, run_key)
+    candidates = [paths['state'], Path(f"{paths['state']}.tmp")]
+    for stream in ('stdout', 'stderr'):
+        # The logs may be plain or compressed, with or without a frame index
+        for suffix in [''] + list(SUFFIXES.values()):
+            log_path = f"{paths[stream]}{suffix}"
+            candidates += [Path(log_path), Path(f"{log_path}{INDEX_SUFFIX}")]
+
+    removed = 0
+    for path in candidates:
+        try:
+            path.unlink()
+            removed += 1
+        except FileNotFoundError:
+            continue
+    return removed
+
+def mark_run_collected(state_path):
+    """
+    Record that a finished run's result has been collected by the server.
+
+    Args:
+        state_path: Path of the run-state file
+    """
+    state = read_run_state(state_path)
+    if state is not None:
+        state['collected_at'] = datetime.now().isoformat()
+        _write_run_state(state_path, state)
+
+def list_uncollected_runs(runs_dir):
+    """
+    List detached runs whose result has not been collected yet.
+
+    Args:
+        runs_dir: Directory holding run state files
+
+    Returns:
+        list: Run states, each with its 'state_path'
+    """
+    runs = []
+    for state_path in Path(runs_dir).glob("*.state.json"):
+        state = read_run_state(state_path)
+        if state and not state.get('collected_at'):
+            state['state_path'] = str(state_path)
+            runs.append(state)
+    return runs
+
+def list_collected_runs(runs_dir):
+    """
+    List detached runs whose result has been collected.
+
+    Args:
+        runs_dir: Directory holding run state files
+
+    Returns:
+        list: Run states, each with its 'state_path'
+    """
+    runs = []
+    for state_path in Path(runs_dir).glob("*.state.json"):
+        state = read_run_state(state_path)
+        if state and state.get('collected_at'):
+            state['state_path'] = str(state_path)
+            runs.append(state)
+    return runs
+
+def _kill_process_tree(pid):
+    """Kill a script process and everything it started."""
+    try:
+        if platform.system() == "Windows":
+            subprocess.run(['taskkill', '/F', '/T', '/PID', str(pid)], capture_output=True)
+        else:
+            # The script leads its own process group (see _supervise)
+            os.killpg(pid, signal.SIGKILL)
+    except Exception:
+        try:
+            os.kill(pid, signal.SIGKILL)
+        except Exception:
+            pass
+
+def _child_resource_usage():
+    """
+    Resource usage of the finished script, where the platform reports it.
+
+    Returns:
+        tuple: (peak resident memory of the largest child process in MB,
+        CPU seconds of all finished child processes), or (None, None)
+    """
+    try:
+        import resource
+    except ImportError:  # Not available on Windows
+        return None, None
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    # Reported in bytes on macOS and in kilobytes elsewhere
+    peak_rss_mb = usage.ru_maxrss / (1024 * 1024) if platform.system() == "Darwin" else usage.ru_maxrss / 1024
+    return peak_rss_mb, usage.ru_utime + usage.ru_stime
+
+def _wait_noting_first_output(process, state, state_path, deadline):
+    """
+    Wait for the script to exit, recording when its first output appears.
+
+    Raises:
+        subprocess.TimeoutExpired: If the script is still running at the deadline
+    """
+    def has_output():
+        try:
+            return os.path.getsize(state['stdout_path']) > state.get('stdout_offset', 0)
+        except OSError:
+            return False
+
+    while True:
+        try:
+            exit_code = process.wait(timeout=max(0, min(OUTPUT_POLL_INTERVAL, deadline - time.time())))
+        except subprocess.TimeoutExpired:
+            if time.time() >= deadline:
+                raise
+            if has_output():
+                state['first_output_at'] = time.time()
+                _write_run_state(state_path, state)
+                return process.wait(timeout=max(0, deadline - time.time()))
+            continue
+        if has_output():
+            state['first_output_at'] = time.time()
+        return exit_code
+
+def _supervise(state_path):
+    """
+    Run a script to completion and record its exit status.
+
+    Args:
+        state_path: Path of the run-state file written by launch_detached_run
+    """
+    state = read_run_state(state_path)
+    popen_kwargs = {'stdin': subprocess.DEVNULL, 'close_fds': True, 'shell': state.get('shell', False)}
+
+    # Lower the script's priority, as for scripts run by the server directly
+    if platform.system() == "Windows":
+        # BELOW_NORMAL_PRIORITY_CLASS = 0x00004000
+        popen_kwargs['creationflags'] = 0x00004000
+    else:
+        def prepare_child():
+            os.setpgid(0, 0)
+            try:
+                os.nice(10)
+            except Exception:
+                pass
+        popen_kwargs['preexec_fn'] = prepare_child
+
+    state['supervisor_pid'] = os.getpid()
+    state['supervisor_create_time'] = _process_create_time(os.getpid())
+
+    with open(state['stdout_path'], 'ab') as stdout, open(state['stderr_path'], 'ab') as stderr:
+        # A re-queued run appends to its earlier logs; only new output belongs to this attempt
+        state['stdout_offset'] = stdout.tell()
+        state['stderr_offset'] = stderr.tell()
+        try:
+            process = subprocess.Popen(state['cmd'], stdout=stdout, stderr=stderr, **popen_kwargs)
+        except Exception as e:
+            state['launch_error'] = f"Could not start script: {str(e)}"
+            state['finished_at'] = datetime.now().isoformat()
+            state['finished_at_epoch'] = time.time()
+            _write_run_state(state_path, state)
+            return
+
+        state['pid'] = process.pid
+        state['pid_create_time'] = _process_create_time(process.pid)
+        state['started_at'] = datetime.now().isoformat()
+        state['started_at_epoch'] = time.time()
+        _write_run_state(state_path, state)
+
+        deadline = state['started_at_epoch'] + state.get('max_runtime_minutes', 60) * 60
+        try:
+            state['exit_code'] = _wait_noting_first_output(process, state, state_path, deadline)
+        except subprocess.TimeoutExpired:
+            _kill_process_tree(process.pid)
+            state['exit_code'] = process.wait()
+            state['timed_out'] = True
+
+    state['peak_rss_mb'], state['cpu_seconds'] = _child_resource_usage()
+    state['finished_at'] = datetime.now().isoformat()
+    state['finished_at_epoch'] = time.time()
+    _write_run_state(state_path, state)
+
+if __name__ == '__main__':
+    _supervise(sys.argv[1])
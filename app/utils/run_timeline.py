@@ -0,0 +1,96 @@
+"""
+Run timeline helpers for EzTaskRunner.
+
+Every run carries a timeline of the points it passed on its way from the
+scheduler to the task history, stored in the run's history entry under
+'timeline'. The points are epoch timestamps because a run crosses process
+boundaries (web process, worker, run supervisor, remote agents) and may be
+collected after a restart.
+"""
+from typing import Dict, Any, Iterable, List, Optional
+
+# Timeline points, in the order a run passes them
+TIMELINE_POINTS = [
+    "scheduled_at",      # Planned fire time (scheduled runs only)
+    "fired_at",          # The scheduler job, or a manual run, queued the run
+    "dequeued_at",       # The task executor picked the run up
+    "admitted_at",       # The resource-check buffer finished
+    "spawned_at",        # The script process was started
+    "first_output_at",   # The script wrote its first output
+    "exited_at",         # The script process exited
+    "persisted_at"       # The result was recorded and written to the history
+]
+
+# Phases between timeline points: (name, label, start point, end point)
+PHASES = [
+    ("fire", "Scheduler lag", "scheduled_at", "fired_at"),
+    ("queue", "Queue wait", "fired_at", "dequeued_at"),
+    ("admission", "Buffer", "dequeued_at", "admitted_at"),
+    ("spawn", "Process start", "admitted_at", "spawned_at"),
+    ("first_output", "Time to first output", "spawned_at", "first_output_at"),
+    ("execution", "Execution", "spawned_at", "exited_at"),
+    ("persist", "Recording", "exited_at", "persisted_at"),
+    ("total", "Total", "fired_at", "persisted_at")
+]
+
+# Percentiles shown on the monitoring page
+PERCENTILES = (50, 95, 99)
+
+def compute_phases(timeline: Optional[Dict[str, float]]) -> Dict[str, float]:
+    """
+    Compute phase durations from a run timeline.
+
+    Args:
+        timeline: The run's timeline points
+
+    Returns:
+        dict: Seconds per phase, for the phases whose two points are recorded
+    """
+    if not timeline:
+        return {}
+    phases = {}
+    for name, _, start, end in PHASES:
+        if timeline.get(start) is not None and timeline.get(end) is not None:
+            phases[name] = max(0.0, timeline[end] - timeline[start])
+    return phases
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    """
+    Get a percentile of sorted values (nearest rank).
+
+    Args:
+        sorted_values: Values in ascending order (not empty)
+        pct: The percentile (0-100)
+
+    Returns:
+        float: The value at the percentile
+    """
+    rank = max(1, -(-len(sorted_values) * pct // 100))
+    return sorted_values[int(rank) - 1]
+
+def summarize_phases(history_entries: Iterable[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Aggregate the phase durations of a set of runs.
+
+    Args:
+        history_entries: Task history entries
+
+    Returns:
+        list: One dictionary per phase with runs, label, 'count' and
+        'p50'/'p95'/'p99' in seconds; phases no run has recorded are left out
+    """
+    durations = {name: [] for name, _, _, _ in PHASES}
+    for entry in history_entries:
+        for name, seconds in compute_phases(entry.get("timeline")).items():
+            durations[name].append(seconds)
+
+    summary = []
+    for name, label, _, _ in PHASES:
+        values = sorted(durations[name])
+        if not values:
+            continue
+        row = {"phase": name, "label": label, "count": len(values)}
+        for pct in PERCENTILES:
+            row[f"p{pct}"] = percentile(values, pct)
+        summary.append(row)
+    return summary
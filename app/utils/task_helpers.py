@@ -4,11 +4,15 @@ Task helper functions for EzTaskRunner.
 This module contains utilities for handling tasks and script paths.
 """
 import os
+import time
 import logging
 from datetime import datetime
 from pathlib import Path
+from typing import Optional
 from flask import current_app
 
+from app.run_context import new_run_id, run_context
+
 # Get specialized loggers
 logger = logging.getLogger("EzTaskRunner")
 tools_logger = logging.getLogger("EzTaskRunner.Tools")
@@ -85,21 +89,71 @@ def validate_script_path(script_path: str) -> str:
             raise ValueError(f"Invalid script path: {str(e)}")
         raise
 
-def run_task(job_id: str) -> None:
+def get_script_type(script_path: str) -> str:
+    """
+    Determine the script type of a script from its file extension.
+
+    Args:
+        script_path: The path to the script
+
+    Returns:
+        'python', 'powershell', 'batch' or 'unknown'
+    """
+    file_ext = Path(script_path).suffix.lower()
+    if file_ext == '.py':
+        return 'python'
+    if file_ext == '.ps1':
+        return 'powershell'
+    if file_ext in ['.bat', '.cmd']:
+        return 'batch'
+    return 'unknown'
+
+def run_task(job_id: str) -> Optional[str]:
     """
     Run a task with the given job ID.
     
-    This function is called by the scheduler when a job is triggered.
+    This function is called by the scheduler when a job is triggered, and
+    for manual runs.
     
     Args:
         job_id: The job ID to run
+        
+    Returns:
+        The ID of the queued run, or None if no run was queued
     """
     # Import directly when needed to avoid circular imports
-    from app.task_manager import run_task as tm_run_task, task_executor
-    
-    # Submit the task to the ThreadPoolExecutor instead of creating a new thread
-    # This gives better control over thread management and ensures proper process isolation
-    task_executor.submit(tm_run_task, job_id)
+    from app.task_manager import get_task, enqueue_agent_run, enqueue_local_run, allow_scheduled_run
+    from app.scheduler import get_scheduled_run_time
     
-    # Return immediately, allowing the scheduler to continue processing other events
-    return 
\ No newline at end of file
+    # Log records about this run carry its ID from the fire on
+    with run_context(new_run_id(), job_id) as run_id:
+        fired_at = time.time()
+        
+        # A scheduled fire is identified by its planned time, so the same fire is
+        # never queued twice; manual runs have no dedupe key
+        scheduled_run_time = get_scheduled_run_time()
+        dedupe_key = f"{job_id}:{scheduled_run_time.isoformat()}" if scheduled_run_time else None
+        
+        if scheduled_run_time:
+            from app.metrics import SCHEDULER_LAG
+            lag = (datetime.now(scheduled_run_time.tzinfo) - scheduled_run_time).total_seconds()
+            SCHEDULER_LAG.observe(max(0, lag))
+        
+        # The run's timeline starts here and is completed as the run progresses
+        timeline = {"fired_at": fired_at}
+        if scheduled_run_time:
+            timeline["scheduled_at"] = scheduled_run_time.timestamp()
+        
+        # Scheduled fires of a task whose circuit breaker is open are skipped
+        if scheduled_run_time and not allow_scheduled_run(job_id):
+            return None
+        
+        # Tasks with a label selector are executed by remote worker agents
+        task = get_task(job_id)
+        if task and task.get("labels"):
+            return enqueue_agent_run(job_id, dedupe_key=dedupe_key, timeline=timeline, run_id=run_id)
+        
+        # Record the run in the durable run queue; it is then submitted to the
+        # ThreadPoolExecutor, which gives better control over thread management
+        # Return immediately, allowing the scheduler to continue processing other events
+        return enqueue_local_run(job_id, dedupe_key=dedupe_key, timeline=timeline, run_id=run_id)
@@ -2,53 +2,141 @@
 Dashboard views for EzTaskRunner.
 Renders the main dashboard with task list.
 """
-from flask import render_template, current_app, request
+from datetime import datetime
 
-from app.task_manager import get_all_tasks
+from flask import render_template, current_app, request, jsonify
 
-def render_dashboard():
+from app.task_index import get_task_index, failure_rate, DEFAULT_PAGE_SIZE
+from app.task_manager import get_next_run_times
+from app.run_stats import summarize_run_stats
+
+def search_tasks(args, next_runs=None):
     """
-    Render the main dashboard with task list.
+    Search the task index with the search, filters, sort order and cursor
+    given in request arguments.
     
+    Args:
+        args: The request arguments
+        next_runs: Next run times by job ID, if already known
+        
     Returns:
-        Rendered template with task data
+        tuple: The task index and the search results
+        
+    Raises:
+        ValueError: If the sort order or cursor is invalid
     """
-    # Get search query if any
-    search_query = request.args.get('search', '').strip().lower()
-    
-    # Get all tasks
-    tasks = get_all_tasks()
+    enabled = {'true': True, 'false': False}.get(args.get('enabled'))
+    sort = args.get('sort') or 'name'
     
-    # Filter tasks if search query exists
-    if search_query:
-        filtered_tasks = []
-        for task in tasks:
-            # Check if search term exists in task name, description, or script path
-            task_name = task.get('task_name', '').lower()
-            description = task.get('description', '').lower()
-            script_path = task.get('script_path', '').lower()
-            
-            if (search_query in task_name or 
-                search_query in description or 
-                search_query in script_path):
-                filtered_tasks.append(task)
-        tasks = filtered_tasks
-    
-    # Get scheduler
-    scheduler = current_app.config.get('SCHEDULER')
-    
-    # Add job info to tasks
-    for task in tasks:
-        job_id = task.get('job_id')
-        if scheduler and job_id:
-            job = scheduler.get_job(job_id)
-            if job:
-                task['next_run'] = job.next_run_time.strftime("%Y-%m-%d %H:%M:%S") if job.next_run_time else "Not scheduled"
-            else:
-                task['next_run'] = "Not scheduled"
+    # Next run times come from the scheduler (the worker's, in web mode)
+    if sort == 'next_run' and next_runs is None:
+        next_runs = get_next_run_times()
     
+    # Search the task index rather than reading and scanning every task file
+    task_index = get_task_index(current_app.config['TASKS_DIR'])
+    results = task_index.search(
+        args.get('search', '').strip(),
+        status=args.get('status') or None,
+        script_type=args.get('script_type') or None,
+        tag=args.get('tag') or None,
+        enabled=enabled,
+        sort=sort,
+        order=args.get('order') or 'asc',
+        cursor=args.get('cursor') or None,
+        limit=args.get('limit', DEFAULT_PAGE_SIZE, type=int),
+        next_runs=next_runs if sort == 'next_run' else None
+    )
+    return task_index, results
+
+def _list_tasks(args):
+    """
+    Get a page of tasks for a search, filters, sort order and cursor.
+
+    Args:
+        args: The request arguments
+
+    Returns:
+        tuple: The task index and the search results, with display fields
+        (next_run, health) added to the tasks on the page
+
+    Raises:
+        ValueError: If the sort order or cursor is invalid
+    """
+    next_runs = get_next_run_times()
+    task_index, results = search_tasks(args, next_runs)
+
+    for task in results['tasks']:
+        next_run = next_runs.get(task.get('job_id'))
+        task['next_run_at'] = next_run
+        task['next_run'] = datetime.fromtimestamp(next_run).strftime("%Y-%m-%d %H:%M:%S") if next_run else "Not scheduled"
+
+        # Health from the task's running statistics, without reading history files
+        task['health'] = summarize_run_stats(task)
+
+    return task_index, results
+
+def render_dashboard():
+    """
+    Render the main dashboard with the first page of the task list; further
+    pages are fetched by the page as it is scrolled.
+
+    Returns:
+        Rendered template with task data
+    """
+    try:
+        task_index, results = _list_tasks(request.args)
+    except ValueError:
+        # A bad sort order or a stale cursor in the URL; start over
+        args = request.args.copy()
+        for key in ('sort', 'order', 'cursor'):
+            args.pop(key, None)
+        task_index, results = _list_tasks(args)
+
     return render_template(
         'dashboard/index.html',
-        tasks=tasks,
+        tasks=results['tasks'],
+        results=results,
+        facets=task_index.facet_values(),
         title="Task Dashboard"
-    ) 
\ No newline at end of file
+    )
+
+def render_task_list():
+    """
+    Return a page of the task list as JSON.
+
+    Query parameters: search, status, script_type, tag, enabled, sort
+    (name, status, last_run, next_run or failure_rate), order (asc or desc),
+    limit and cursor (the next_cursor of the previous page). With rows=1 the
+    reply also holds the page rendered as dashboard table rows.
+
+    Returns:
+        JSON response with tasks, total and next_cursor
+    """
+    try:
+        _, results = _list_tasks(request.args)
+    except ValueError as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+
+    reply = {
+        "success": True,
+        "tasks": [
+            {
+                "job_id": task.get('job_id'),
+                "task_name": task.get('task_name'),
+                "status": task.get('status'),
+                "enabled": task.get('enabled', True) is not False,
+                "script_type": task.get('script_type'),
+                "tags": task.get('tags') or [],
+                "labels": task.get('labels') or [],
+                "last_run": task.get('last_run'),
+                "next_run": datetime.fromtimestamp(task['next_run_at']).isoformat() if task['next_run_at'] else None,
+                "failure_rate": failure_rate(task)
+            }
+            for task in results['tasks']
+        ],
+        "total": results['total'],
+        "next_cursor": results['next_cursor']
+    }
+    if request.args.get('rows'):
+        reply["rows"] = render_template('dashboard/_task_rows.html', tasks=results['tasks'])
+    return jsonify(reply)
@@ -15,9 +15,13 @@ def render_task_history(task, history):
     Returns:
         Rendered template with task and history data
     """
+    from app.history_retention import load_rollups, summarize_rollups
+    rollups = summarize_rollups(load_rollups(current_app.config['TASK_HISTORY_DIR'], task.get('job_id')))
+    
     return render_template(
         'tasks/history.html',
         task=task,
         history=history,
+        rollups=rollups,
         title=f"History: {task.get('task_name', '')}"
     ) 
\ No newline at end of file
@@ -7,10 +7,12 @@ import re
 import time
 from pathlib import Path
 from datetime import datetime, timedelta
-from flask import render_template, current_app
+from flask import render_template, current_app, request
 import psutil
 
 from app.utils import get_system_metrics, get_task_history, get_system_info
+from app.utils.run_timeline import summarize_phases
+from app.history_retention import get_retention_status
 from app.task_manager import get_all_tasks
 
 def _human_readable_size(size_bytes):
@@ -82,6 +84,7 @@ def render_monitoring_dashboard():
 
     # Get task execution history for the last 7 days
     recent_executions = []
+    run_latency = []
     try:
         all_history = []
         for task in all_tasks:
@@ -112,6 +115,9 @@ def render_monitoring_dashboard():
             except (ValueError, TypeError) as e:
                 current_app.logger.error(f"Error parsing timestamp: {str(e)}")
                 
+        # Aggregate run timelines over all recent executions
+        run_latency = summarize_phases(recent_executions)
+        
         # Limit to most recent 50 executions to prevent overwhelming the page
         recent_executions = recent_executions[:50]
     except Exception as e:
@@ -139,6 +145,17 @@ def render_monitoring_dashboard():
             log_files.sort(key=lambda x: x['modified'], reverse=True)
     except Exception as e:
         current_app.logger.error(f"Error reading log files: {str(e)}")
+    
+    # Outcome of the last history retention pass
+    retention = get_retention_status(current_app.config['STATE_DIR'])
+    if retention:
+        retention['bytes_reclaimed_human'] = _human_readable_size(retention.get('bytes_reclaimed', 0))
+        retention['total_bytes_reclaimed_human'] = _human_readable_size(retention.get('total_bytes_reclaimed', 0))
+    retention_policy = {
+        'enabled': current_app.config.get('HISTORY_RETENTION_ENABLED', False),
+        'retention_days': current_app.config.get('HISTORY_RETENTION_DAYS', 14),
+        'rollup_days': current_app.config.get('HISTORY_ROLLUP_DAYS', 365)
+    }
 
     return render_template(
         'monitoring/dashboard.html',
@@ -149,5 +166,60 @@ def render_monitoring_dashboard():
         recent_failures_24h=recent_failures_24h,
         recent_failures_7d=recent_failures_7d,
         recent_executions=recent_executions,
+        run_latency=run_latency,
+        retention=retention,
+        retention_policy=retention_policy,
         now=now  # Pass current datetime to template
-    ) 
\ No newline at end of file
+    ) 
+
+def render_log_viewer(filename, part, read_args):
+    """
+    Render part of a log file.
+    
+    Args:
+        filename: The log file name
+        part: The part read by log_reader.read_log
+        read_args: The arguments it was read with
+        
+    Returns:
+        Rendered template with the log lines and paging offsets
+    """
+    return render_template(
+        'monitoring/log_viewer.html',
+        filename=filename,
+        part=part,
+        size_human=_human_readable_size(part['size']),
+        limit=read_args.get('tail') or read_args.get('limit') or 200,
+        since=request.args.get('since', ''),
+        title=f"Log: {filename}"
+    )
+
+def render_search_page():
+    """
+    Render the search page, with results when a query was submitted.
+    
+    Returns:
+        Rendered template with the search results and the index size
+    """
+    from app.search_index import search, get_index_status
+    
+    state_dir = current_app.config['STATE_DIR']
+    query = request.args.get('q', '').strip()
+    kind = request.args.get('kind') or None
+    result = search(state_dir, query, kind=kind) if query else None
+    
+    task_names = {task.get('job_id'): task.get('task_name') for task in get_all_tasks()}
+    for item in (result or {}).get('results', []):
+        item['task_name'] = task_names.get(item['job_id'])
+    
+    status = get_index_status(state_dir)
+    status['text_size_human'] = _human_readable_size(status['text_bytes'])
+    
+    return render_template(
+        'monitoring/search.html',
+        query=query,
+        kind=kind or '',
+        result=result,
+        index_status=status,
+        title="Search"
+    )
@@ -0,0 +1,237 @@
+"""
+Worker module for EzTaskRunner.
+
+Runs the scheduler and task execution in a process separate from the web UI.
+Web processes (RUN_MODE=web) send commands to the worker over a local socket;
+task definitions themselves are shared through the task store on disk.
+
+Commands and replies are JSON objects, one per line. A connection starts with
+a challenge the client must answer with an HMAC of it keyed with SECRET_KEY,
+so only processes sharing the secret key can send commands.
+"""
+import hashlib
+import hmac
+import json
+import logging
+import secrets
+import socket
+import threading
+from typing import Dict, Any, Optional, Tuple
+
+from flask import current_app
+
+logger = logging.getLogger("EzTaskRunner")
+
+# Seconds a web process waits for the worker to answer a command
+WORKER_TIMEOUT = 5
+
+# Commands sent over and over while a client is subscribed to the status feed;
+# logged at debug level only
+POLLING_COMMANDS = ('events',)
+
+def get_worker_address(config) -> Tuple[str, int]:
+    """
+    Get the address the worker listens on.
+
+    Args:
+        config: The Flask application config
+
+    Returns:
+        A (host, port) tuple
+    """
+    return (config.get('WORKER_HOST', '127.0.0.1'), int(config.get('WORKER_PORT', 5055)))
+
+# Largest command or reply accepted, in bytes
+MAX_MESSAGE_BYTES = 16 * 1024 * 1024
+
+def _get_authkey(config) -> bytes:
+    """Derive the IPC authentication key from the application secret key."""
+    return str(config.get('SECRET_KEY', '')).encode('utf-8')
+
+def _sign_challenge(config, challenge: str) -> str:
+    """Answer a connection challenge with an HMAC keyed with the secret key."""
+    return hmac.new(_get_authkey(config), challenge.encode('utf-8'), hashlib.sha256).hexdigest()
+
+def _send_message(stream, message: Dict[str, Any]) -> None:
+    """Write a message as one line of JSON."""
+    stream.write(json.dumps(message, default=str).encode('utf-8') + b'\n')
+    stream.flush()
+
+def _recv_message(stream) -> Optional[Dict[str, Any]]:
+    """
+    Read a message written by _send_message.
+
+    Returns:
+        The message, or None if the connection was closed
+
+    Raises:
+        ValueError: If the message is too large or not a JSON object
+    """
+    line = stream.readline(MAX_MESSAGE_BYTES + 1)
+    if not line:
+        return None
+    if len(line) > MAX_MESSAGE_BYTES:
+        raise ValueError("Message too large")
+    message = json.loads(line)
+    if not isinstance(message, dict):
+        raise ValueError("Message is not a JSON object")
+    return message
+
+def notify_worker(command: str, **payload) -> Dict[str, Any]:
+    """
+    Send a command to the worker process.
+
+    Args:
+        command: The command name (e.g. 'run_task', 'reload_task')
+        **payload: Command arguments
+
+    Returns:
+        dict: The worker's reply, or an error result if it could not be reached
+    """
+    config = current_app.config
+    address = get_worker_address(config)
+
+    try:
+        with socket.create_connection(address, timeout=WORKER_TIMEOUT) as sock, sock.makefile('rwb') as stream:
+            challenge = _recv_message(stream)
+            if not challenge or 'challenge' not in challenge:
+                raise ConnectionError("Worker did not send a challenge")
+            _send_message(stream, {'auth': _sign_challenge(config, str(challenge['challenge']))})
+            _send_message(stream, {'command': command, **payload})
+            reply = _recv_message(stream)
+            if reply is None:
+                raise ConnectionError("Worker closed the connection (is SECRET_KEY the same in all processes?)")
+        log = logger.debug if command in POLLING_COMMANDS else logger.info
+        log(f"Worker command '{command}' sent to {address[0]}:{address[1]}")
+        return reply
+    except Exception as e:
+        logger.error(f"Error sending command '{command}' to worker at {address[0]}:{address[1]}: {str(e)}")
+        return {"success": False, "error": f"Worker is not reachable: {str(e)}"}
+
+def _handle_command(app, message: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Execute a single command received from a web process.
+
+    Args:
+        app: The Flask application instance
+        message: The command message
+
+    Returns:
+        dict: The reply to send back
+    """
+    from app import task_manager
+
+    command = message.get('command')
+    job_id = message.get('job_id')
+
+    with app.app_context():
+        if command == 'ping':
+            return {"success": True, "message": "pong"}
+
+        if command == 'metrics':
+            from app.metrics import render_metrics
+            return {"success": True, "text": render_metrics()}
+
+        if command == 'next_run_times':
+            return {"success": True, "next_runs": task_manager.get_next_run_times()}
+
+        if command == 'events':
+            from app.event_bus import get_events
+            return get_events(message.get('event_id'), message.get('timeout') or 0)
+
+        if command == 'logging_settings':
+            from app.log_pipeline import apply_logging_settings
+            return apply_logging_settings(message.get('settings') or {})
+
+        if not job_id:
+            return {"success": False, "error": f"Command '{command}' requires a job_id"}
+
+        if command == 'reload_task':
+            # Drop the cached copy so the task is re-read from disk
+            with task_manager.task_lock:
+                task_manager.tasks.pop(job_id, None)
+            task = task_manager.get_task(job_id)
+            if not task:
+                return {"success": False, "error": f"Task {job_id} not found"}
+            task_manager.sync_task_with_scheduler(job_id, task)
+            # Publish state transitions made by the web process
+            from app.event_bus import event_bus
+            event_bus.publish_task_status(job_id, task)
+            return {"success": True}
+
+        if command == 'remove_task':
+            scheduler = app.config.get('SCHEDULER')
+            try:
+                if scheduler:
+                    scheduler.remove_job(job_id)
+            except Exception:
+                # Job may not exist in the scheduler, which is fine
+                pass
+            with task_manager.task_lock:
+                task_manager.tasks.pop(job_id, None)
+            from app.event_bus import event_bus
+            event_bus.forget_task(job_id)
+            return {"success": True}
+
+        if command == 'run_task':
+            from app.utils.task_helpers import run_task
+            return {"success": True, "run_id": run_task(job_id)}
+
+        if command == 'stop_task':
+            return task_manager.stop_task(job_id)
+
+    return {"success": False, "error": f"Unknown worker command: {command}"}
+
+def _serve_connection(app, sock, peer) -> None:
+    """Authenticate a client connection, then answer its commands until it closes."""
+    try:
+        with sock, sock.makefile('rwb') as stream:
+            # The client has WORKER_TIMEOUT to answer the challenge
+            sock.settimeout(WORKER_TIMEOUT)
+            challenge = secrets.token_hex(16)
+            _send_message(stream, {'challenge': challenge})
+            answer = _recv_message(stream)
+            expected = _sign_challenge(app.config, challenge)
+            if not answer or not hmac.compare_digest(str(answer.get('auth', '')), expected):
+                logger.warning(f"Rejected worker connection from {peer[0]}:{peer[1]}: authentication failed")
+                return
+            
+            # Long-polling commands may keep a connection idle for a while
+            sock.settimeout(None)
+            while True:
+                message = _recv_message(stream)
+                if message is None:
+                    break
+                try:
+                    reply = _handle_command(app, message)
+                except Exception as e:
+                    logger.error(f"Error handling worker command {message!r}: {str(e)}")
+                    reply = {"success": False, "error": str(e)}
+                _send_message(stream, reply)
+    except Exception as e:
+        # Bad messages and dropped connections end only this connection
+        logger.warning(f"Worker connection from {peer[0]}:{peer[1]} closed: {str(e)}")
+
+def serve_worker(app) -> None:
+    """
+    Accept commands from web processes until interrupted.
+
+    Args:
+        app: The Flask application instance (must own the scheduler)
+    """
+    address = get_worker_address(app.config)
+    with socket.create_server(address) as listener:
+        logger.info(f"Worker listening for commands on {address[0]}:{address[1]}")
+        while True:
+            try:
+                sock, peer = listener.accept()
+            except OSError as e:
+                # A failed accept must not stop the worker
+                logger.warning(f"Error accepting worker connection: {str(e)}")
+                continue
+            threading.Thread(
+                target=_serve_connection,
+                args=(app, sock, peer[:2]),
+                name="WorkerConnection",
+                daemon=True
+            ).start()
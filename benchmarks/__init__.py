@@ -0,0 +1,8 @@
+"""
+Benchmarks for EzTaskRunner.
+
+Measures the task store, scheduler registration, page rendering and run
+throughput against generated workspaces. Run with:
+
+    python -m benchmarks.run_benchmarks --sizes 1000,10000 --output results.json
+"""
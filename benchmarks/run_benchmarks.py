@@ -0,0 +1,260 @@
+#!/usr/bin/env python
+"""
+EzTaskRunner benchmark runner.
+
+Generates a workspace for each requested size and measures it in a fresh
+process, since the application is configured when it is imported:
+
+- cold start: importing the application, load_tasks_from_disk and
+  register_tasks_with_scheduler
+- get_all_tasks
+- dashboard and monitoring page render latency (Flask test client)
+- update_task throughput
+- end-to-end runs per second with no-op scripts
+
+Results are written as JSON so they can be compared between versions.
+"""
+import argparse
+import json
+import os
+import platform
+import runpy
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+
+def parse_args():
+    """Parse command line arguments."""
+    parser = argparse.ArgumentParser(description='Run the EzTaskRunner benchmarks')
+    parser.add_argument('--sizes', default='1000,10000,50000', help='Comma-separated workspace sizes (number of tasks)')
+    parser.add_argument('--history-per-task', type=int, default=20, help='History records generated per task')
+    parser.add_argument('--repeat', type=int, default=5, help='Repetitions of the store measurements')
+    parser.add_argument('--page-repeat', type=int, default=3, help='Repetitions of each page render')
+    parser.add_argument('--updates', type=int, default=500, help='Number of update_task calls for the throughput measurement')
+    parser.add_argument('--runs', type=int, default=8, help='Number of no-op runs for the end-to-end measurement (0 to skip)')
+    parser.add_argument('--workdir', default=None, help='Directory for generated workspaces (default: a temporary directory)')
+    parser.add_argument('--keep-workspace', action='store_true', help='Keep generated workspaces')
+    parser.add_argument('--output', default=None, help='File to write the JSON results to (default: stdout)')
+    parser.add_argument('--child', default=None, help=argparse.SUPPRESS)
+    parser.add_argument('--result-file', default=None, help=argparse.SUPPRESS)
+    return parser.parse_args()
+
+def summarize(samples):
+    """
+    Summarize timing samples.
+
+    Args:
+        samples: Durations in seconds
+
+    Returns:
+        dict: count, mean, min, p50, p95 and max in seconds
+    """
+    values = sorted(samples)
+    if not values:
+        return {"count": 0}
+
+    def pct(p):
+        return values[max(0, -(-len(values) * p // 100) - 1)]
+
+    return {
+        "count": len(values),
+        "mean": sum(values) / len(values),
+        "min": values[0],
+        "p50": pct(50),
+        "p95": pct(95),
+        "max": values[-1]
+    }
+
+def timed(fn, repeat=1):
+    """Call a function repeatedly and return the durations."""
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+def measure_workspace(args):
+    """
+    Measure the workspace the application is configured for.
+
+    Runs in the child process; the workspace directories are passed through
+    the environment.
+
+    Returns:
+        dict: The measurements
+    """
+    import psutil
+    results = {}
+
+    start = time.perf_counter()
+    from app import app
+    results["import_app_seconds"] = time.perf_counter() - start
+
+    from app import task_manager
+    from app.run_queue import count_pending_runs
+
+    with app.app_context():
+        # Cold start, measured again without import overhead
+        with task_manager.task_lock:
+            task_manager.tasks.clear()
+        load_samples = timed(task_manager.load_tasks_from_disk)
+        register_samples = timed(task_manager.register_tasks_with_scheduler)
+        results["cold_start"] = {
+            "load_tasks_from_disk_seconds": load_samples[0],
+            "register_tasks_with_scheduler_seconds": register_samples[0],
+            "scheduled_jobs": len(app.config['SCHEDULER'].get_jobs())
+        }
+        results["rss_mb_after_load"] = psutil.Process().memory_info().rss / (1024 * 1024)
+
+        results["get_all_tasks"] = summarize(timed(task_manager.get_all_tasks, args.repeat))
+
+        # Page renders through the full request stack
+        client = app.test_client()
+        for name, url in (("dashboard", "/"), ("monitoring", "/monitoring")):
+            statuses = set()
+
+            def render():
+                statuses.add(client.get(url).status_code)
+
+            results[f"render_{name}"] = summarize(timed(render, args.page_repeat))
+            results[f"render_{name}"]["status_codes"] = sorted(statuses)
+
+        # update_task throughput over distinct tasks
+        job_ids = list(task_manager.tasks.keys())
+        if job_ids and args.updates:
+            start = time.perf_counter()
+            for i in range(args.updates):
+                job_id = job_ids[i % len(job_ids)]
+                task_manager.update_task(job_id, {"description": f"Benchmark update {i}"})
+            elapsed = time.perf_counter() - start
+            results["update_task"] = {"count": args.updates, "seconds": elapsed, "per_second": args.updates / elapsed}
+
+        # End-to-end runs of no-op scripts, through the run queue and executor
+        if job_ids and args.runs:
+            runs = min(args.runs, len(job_ids))
+            start = time.perf_counter()
+            for job_id in job_ids[:runs]:
+                task_manager.enqueue_local_run(job_id)
+            deadline = time.time() + 600
+            while count_pending_runs() and time.time() < deadline:
+                time.sleep(0.2)
+            elapsed = time.perf_counter() - start
+            results["end_to_end_runs"] = {
+                "count": runs,
+                "seconds": elapsed,
+                "per_second": runs / elapsed,
+                "completed": not count_pending_runs(),
+                "max_workers": task_manager.MAX_WORKERS
+            }
+
+    return results
+
+def run_child(args):
+    """Measure one workspace and write the results file."""
+    results = measure_workspace(args)
+    with open(args.result_file, 'w') as f:
+        json.dump(results, f, indent=2)
+    # Skip interpreter shutdown of the scheduler and executor threads
+    os._exit(0)
+
+def run_size(args, size, workdir):
+    """
+    Generate a workspace of one size and measure it in a child process.
+
+    Returns:
+        dict: The size's results
+    """
+    from benchmarks.workspace import generate_workspace, get_workspace_dirs
+
+    workspace = Path(workdir) / f"workspace_{size}"
+    if workspace.exists():
+        shutil.rmtree(workspace)
+
+    print(f"Generating workspace with {size} tasks and {size * args.history_per_task} history records...", file=sys.stderr)
+    start = time.perf_counter()
+    generated = generate_workspace(workspace, size, args.history_per_task)
+    generate_seconds = time.perf_counter() - start
+
+    env = dict(os.environ)
+    env.update(get_workspace_dirs(workspace))
+    env.update({
+        'RUN_MODE': 'standalone',
+        'LOG_LEVEL': 'WARNING',
+        'EMAIL_NOTIFICATIONS_ENABLED': 'False',
+        'PYTHONPATH': os.pathsep.join(filter(None, [str(REPO_ROOT), env.get('PYTHONPATH')]))
+    })
+
+    result_file = workspace / "results.json"
+    cmd = [
+        sys.executable, '-m', 'benchmarks.run_benchmarks',
+        '--child', str(workspace),
+        '--result-file', str(result_file),
+        '--repeat', str(args.repeat),
+        '--page-repeat', str(args.page_repeat),
+        '--updates', str(args.updates),
+        '--runs', str(args.runs)
+    ]
+    print(f"Measuring workspace with {size} tasks...", file=sys.stderr)
+    completed = subprocess.run(cmd, cwd=str(REPO_ROOT), env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+
+    result = {"tasks": generated["tasks"], "history_records": generated["history_records"], "generate_seconds": generate_seconds}
+    if completed.returncode == 0 and result_file.exists():
+        with open(result_file, 'r') as f:
+            result.update(json.load(f))
+    else:
+        result["error"] = completed.stderr[-2000:] or f"Benchmark process exited with code {completed.returncode}"
+
+    if not args.keep_workspace:
+        shutil.rmtree(workspace, ignore_errors=True)
+    return result
+
+def main():
+    """Run the benchmarks for every requested size and emit the JSON results."""
+    args = parse_args()
+    if args.child:
+        run_child(args)
+        return
+
+    # Read the version without importing the app package, which would create the application
+    version = runpy.run_path(str(REPO_ROOT / 'app' / 'version.py'))['__version__']
+
+    sizes = [int(size) for size in args.sizes.split(',') if size.strip()]
+    workdir = args.workdir or tempfile.mkdtemp(prefix="eztaskrunner-bench-")
+    os.makedirs(workdir, exist_ok=True)
+
+    report = {
+        "version": version,
+        "timestamp": datetime.now().isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "settings": {
+            "history_per_task": args.history_per_task,
+            "repeat": args.repeat,
+            "page_repeat": args.page_repeat,
+            "updates": args.updates,
+            "runs": args.runs
+        },
+        "results": [run_size(args, size, workdir) for size in sizes]
+    }
+
+    if not args.workdir and not args.keep_workspace:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + "\n")
+        print(f"Results written to {args.output}", file=sys.stderr)
+    else:
+        print(output)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,326 @@
+#!/usr/bin/env python
+"""
+EzTaskRunner soak harness.
+
+Starts the real server against a generated workspace of short tasks that fire
+on tight intervals (no-op, sleeping and print-heavy scripts) and samples it
+for the given duration:
+
+- runs per second and dispatch latency (scheduler lag and queue wait), from /metrics
+- server RSS, open file descriptors and thread count
+- history directory growth
+
+A resource, or the run queue backlog, that grows in every window after the
+warm-up is reported and fails the soak (exit code 1). Run with:
+
+    python -m benchmarks.soak --tasks 20 --interval 5 --duration 7200 --output soak.json
+"""
+import argparse
+import json
+import os
+import re
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from datetime import datetime
+from pathlib import Path
+
+from benchmarks.workspace import get_workspace_dirs, write_task
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+
+# Scripts the soak tasks cycle through
+SOAK_SCRIPTS = {
+    "noop.py": "def main():\n    return 'ok'\n\nif __name__ == '__main__':\n    print(main())\n",
+    "sleep.py": "import time\n\nif __name__ == '__main__':\n    time.sleep(1)\n    print('slept')\n",
+    "print_heavy.py": "if __name__ == '__main__':\n    for i in range(20000):\n        print(f'line {i} ' + 'x' * 60)\n"
+}
+
+# Resources checked for growth, with the increase tolerated over the soak. A
+# growing run queue backlog means runs are fired faster than they complete.
+# The history directory is expected to grow with every run and is only reported.
+GROWTH_CHECKS = {
+    "rss_mb": 20.0,
+    "open_fds": 10,
+    "threads": 5,
+    "queued_runs": 100
+}
+
+# Number of windows the samples after the warm-up are split into for the growth check
+GROWTH_WINDOWS = 4
+
+_SAMPLE_LINE = re.compile(r'^([a-zA-Z_:][a-zA-Z0-9_:]*)(\{[^}]*\})?\s+(\S+)$')
+
+def parse_args():
+    """Parse command line arguments."""
+    parser = argparse.ArgumentParser(description='Soak test a running EzTaskRunner server')
+    parser.add_argument('--tasks', type=int, default=20, help='Number of tasks')
+    parser.add_argument('--interval', type=int, default=5, help='Seconds between fires of each task')
+    parser.add_argument('--duration', type=int, default=3600, help='Soak duration in seconds')
+    parser.add_argument('--sample-interval', type=int, default=30, help='Seconds between samples')
+    parser.add_argument('--warmup', type=int, default=300, help='Seconds excluded from the growth check')
+    parser.add_argument('--port', type=int, default=0, help='Server port (default: a free port)')
+    parser.add_argument('--workdir', default=None, help='Directory for the workspace (default: a temporary directory)')
+    parser.add_argument('--keep-workspace', action='store_true', help='Keep the workspace')
+    parser.add_argument('--output', default=None, help='File to write the JSON report to (default: stdout)')
+    return parser.parse_args()
+
+def build_workspace(root, task_count, interval):
+    """
+    Create a workspace of soak tasks firing every interval seconds.
+
+    Returns:
+        dict: Environment variables pointing the application at the workspace
+    """
+    dirs = get_workspace_dirs(root)
+    for path in dirs.values():
+        os.makedirs(path, exist_ok=True)
+
+    scripts = []
+    for name, source in SOAK_SCRIPTS.items():
+        script_path = Path(dirs['SCRIPTS_DIR']) / name
+        script_path.write_text(source)
+        scripts.append(script_path)
+
+    hours, rest = divmod(interval, 3600)
+    minutes, seconds = divmod(rest, 60)
+    schedule = {
+        "trigger_type": "interval",
+        "interval_hours": hours,
+        "interval_minutes": minutes,
+        "interval_seconds": seconds,
+        "schedule_time": f"Every {hours}h {minutes}m {seconds}s"
+    }
+    for i in range(task_count):
+        script_path = scripts[i % len(scripts)]
+        write_task(dirs['TASKS_DIR'], f"soak-{i:05d}", f"Soak {script_path.stem} {i}", script_path, schedule)
+    return dirs
+
+def parse_metrics(text):
+    """
+    Parse a /metrics page into totals per sample name (labels are summed).
+
+    Returns:
+        dict: Sample name to value
+    """
+    totals = {}
+    for line in text.splitlines():
+        if not line or line.startswith('#'):
+            continue
+        match = _SAMPLE_LINE.match(line)
+        if not match or 'le="' in (match.group(2) or ''):
+            continue
+        try:
+            value = float(match.group(3))
+        except ValueError:
+            continue
+        totals[match.group(1)] = totals.get(match.group(1), 0) + value
+    return totals
+
+def count_history(history_dir):
+    """Count the files and bytes in the history directory."""
+    files = size = 0
+    with os.scandir(history_dir) as entries:
+        for entry in entries:
+            if entry.is_file():
+                files += 1
+                size += entry.stat().st_size
+    return files, size
+
+def take_sample(process, base_url, history_dir, started):
+    """
+    Sample the server's resources and metrics.
+
+    Returns:
+        dict: The sample
+    """
+    with process.oneshot():
+        sample = {
+            "elapsed": time.time() - started,
+            "rss_mb": process.memory_info().rss / (1024 * 1024),
+            "threads": process.num_threads(),
+            "open_fds": process.num_fds() if hasattr(process, 'num_fds') else process.num_handles()
+        }
+    sample["history_files"], sample["history_bytes"] = count_history(history_dir)
+    try:
+        with urllib.request.urlopen(f"{base_url}/metrics", timeout=10) as response:
+            sample["metrics"] = parse_metrics(response.read().decode('utf-8'))
+        sample["queued_runs"] = sample["metrics"].get("eztaskrunner_run_queue_runs", 0)
+    except Exception as e:
+        sample["metrics"] = {}
+        sample["metrics_error"] = str(e)
+    return sample
+
+def _rate(current, previous, name):
+    """Per-second increase of a metric between two samples."""
+    elapsed = current["elapsed"] - previous["elapsed"]
+    if elapsed <= 0:
+        return None
+    return (current["metrics"].get(name, 0) - previous["metrics"].get(name, 0)) / elapsed
+
+def _mean_between(current, previous, name):
+    """Mean of a histogram's observations between two samples."""
+    count = current["metrics"].get(f"{name}_count", 0) - previous["metrics"].get(f"{name}_count", 0)
+    if count <= 0:
+        return None
+    return (current["metrics"].get(f"{name}_sum", 0) - previous["metrics"].get(f"{name}_sum", 0)) / count
+
+def add_rates(samples):
+    """Add per-interval throughput and dispatch latency to each sample after the first."""
+    for previous, current in zip(samples, samples[1:]):
+        current["runs_per_second"] = _rate(current, previous, "eztaskrunner_runs_total")
+        current["scheduler_lag_mean"] = _mean_between(current, previous, "eztaskrunner_scheduler_lag_seconds")
+        current["queue_wait_mean"] = _mean_between(current, previous, "eztaskrunner_queue_wait_seconds")
+
+def check_growth(samples, name, tolerance, warmup):
+    """
+    Check a resource for monotonic growth after the warm-up.
+
+    The samples after the warm-up are split into windows; the resource is
+    flagged when its mean rises from every window to the next and the total
+    rise exceeds the tolerance.
+
+    Returns:
+        dict: first and last window means, slope per hour, and whether it failed
+    """
+    points = [(s["elapsed"], s[name]) for s in samples if s["elapsed"] >= warmup and s.get(name) is not None]
+    if len(points) < GROWTH_WINDOWS * 2:
+        return {"checked": False, "reason": "Not enough samples after the warm-up"}
+
+    size = len(points) // GROWTH_WINDOWS
+    windows = [points[i * size:(i + 1) * size] for i in range(GROWTH_WINDOWS)]
+    means = [sum(v for _, v in window) / len(window) for window in windows]
+    monotonic = all(later > earlier for earlier, later in zip(means, means[1:]))
+
+    # Least-squares slope over all points after the warm-up
+    n = len(points)
+    mean_t = sum(t for t, _ in points) / n
+    mean_v = sum(v for _, v in points) / n
+    var_t = sum((t - mean_t) ** 2 for t, _ in points)
+    slope = sum((t - mean_t) * (v - mean_v) for t, v in points) / var_t if var_t else 0.0
+
+    growth = means[-1] - means[0]
+    return {
+        "checked": True,
+        "window_means": means,
+        "growth": growth,
+        "slope_per_hour": slope * 3600,
+        "monotonic": monotonic,
+        "failed": monotonic and growth > tolerance
+    }
+
+def summarize(samples, args):
+    """Build the report summary from the samples."""
+    rated = [s for s in samples if s.get("runs_per_second") is not None]
+    first, last = samples[0], samples[-1]
+    elapsed = last["elapsed"] - first["elapsed"]
+    runs = last["metrics"].get("eztaskrunner_runs_total", 0) - first["metrics"].get("eztaskrunner_runs_total", 0)
+    history_files = last["history_files"] - first["history_files"]
+
+    def mean_of(key):
+        values = [s[key] for s in rated if s.get(key) is not None]
+        return sum(values) / len(values) if values else None
+
+    growth = {name: check_growth(samples, name, tolerance, args.warmup) for name, tolerance in GROWTH_CHECKS.items()}
+    return {
+        "runs": runs,
+        "runs_per_second": runs / elapsed if elapsed > 0 else None,
+        "scheduler_lag_mean": mean_of("scheduler_lag_mean"),
+        "queue_wait_mean": mean_of("queue_wait_mean"),
+        "final_queued_runs": last.get("queued_runs"),
+        "history_files_added": history_files,
+        "history_bytes_added": last["history_bytes"] - first["history_bytes"],
+        "history_bytes_per_run": (last["history_bytes"] - first["history_bytes"]) / history_files if history_files else None,
+        "growth": growth,
+        "growing": [name for name, result in growth.items() if result.get("failed")],
+        "passed": not any(result.get("failed") for result in growth.values())
+    }
+
+def wait_for_server(base_url, server, timeout=60):
+    """Wait until the server answers /metrics."""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError(f"Server exited with code {server.returncode} during startup")
+        try:
+            with urllib.request.urlopen(f"{base_url}/metrics", timeout=2):
+                return
+        except Exception:
+            time.sleep(0.5)
+    raise RuntimeError(f"Server did not start within {timeout} seconds")
+
+def main():
+    """Run the soak and emit the JSON report."""
+    import psutil
+
+    args = parse_args()
+    workdir = Path(args.workdir or tempfile.mkdtemp(prefix="eztaskrunner-soak-"))
+    dirs = build_workspace(workdir, args.tasks, args.interval)
+
+    port = args.port
+    if not port:
+        with socket.socket() as s:
+            s.bind(('127.0.0.1', 0))
+            port = s.getsockname()[1]
+    base_url = f"http://127.0.0.1:{port}"
+
+    env = dict(os.environ)
+    env.update(dirs)
+    env.update({'RUN_MODE': 'standalone', 'LOG_LEVEL': 'WARNING', 'EMAIL_NOTIFICATIONS_ENABLED': 'False'})
+    server_log = open(workdir / "server.log", 'w')
+    # run.py creates its default directories relative to the working directory
+    server = subprocess.Popen(
+        [sys.executable, str(REPO_ROOT / 'run.py'), '--port', str(port)],
+        cwd=str(workdir), env={**env, 'PYTHONPATH': str(REPO_ROOT)},
+        stdout=server_log, stderr=subprocess.STDOUT
+    )
+
+    samples = []
+    try:
+        wait_for_server(base_url, server)
+        process = psutil.Process(server.pid)
+        started = time.time()
+        print(f"Soaking {args.tasks} tasks every {args.interval}s for {args.duration}s on {base_url}...", file=sys.stderr)
+        while True:
+            samples.append(take_sample(process, base_url, dirs['TASK_HISTORY_DIR'], started))
+            if server.poll() is not None or time.time() - started >= args.duration:
+                break
+            time.sleep(min(args.sample_interval, max(0, started + args.duration - time.time())))
+    finally:
+        server.terminate()
+        try:
+            server.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            server.kill()
+        server_log.close()
+
+    add_rates(samples)
+    report = {
+        "timestamp": datetime.now().isoformat(),
+        "settings": vars(args),
+        "server_exit_code": server.returncode,
+        "summary": summarize(samples, args) if len(samples) > 1 else {"passed": False, "error": "No samples taken"},
+        "samples": [{k: v for k, v in s.items() if k != "metrics"} for s in samples]
+    }
+
+    if not args.workdir and not args.keep_workspace:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + "\n")
+        print(f"Report written to {args.output}", file=sys.stderr)
+    else:
+        print(output)
+
+    if not report["summary"].get("passed"):
+        print(f"Soak failed, growing: {report['summary'].get('growing') or report['summary'].get('error')}", file=sys.stderr)
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,124 @@
+"""
+Synthetic workspace generator for the EzTaskRunner benchmarks.
+
+Writes task definitions, history records and a no-op script in the same
+layout the application uses, so the application can be pointed at the
+workspace through its directory environment variables.
+"""
+import json
+import os
+import random
+import uuid
+from datetime import datetime, timedelta
+from pathlib import Path
+
+# Script every generated task runs
+NOOP_SCRIPT = "noop.py"
+
+# Mix of schedules; all fire far enough apart that nothing runs during a benchmark
+SCHEDULES = [
+    {"trigger_type": "interval", "interval_hours": 23, "interval_minutes": 0, "interval_seconds": 0, "schedule_time": "Every 23h 0m 0s"},
+    {"trigger_type": "cron", "cron_expression": "0 3 * * *", "schedule_time": "Cron: 0 3 * * *"},
+    {"trigger_type": "cron", "cron_expression": "30 4 * * 1", "schedule_time": "Cron: 30 4 * * 1"}
+]
+
+def get_workspace_dirs(root):
+    """
+    Get the application directories of a workspace.
+
+    Args:
+        root: The workspace root directory
+
+    Returns:
+        dict: Environment variables pointing the application at the workspace
+    """
+    root = Path(root).resolve()
+    return {
+        'SCRIPTS_DIR': str(root / 'scripts'),
+        'TASKS_DIR': str(root / 'tasks'),
+        'TASK_HISTORY_DIR': str(root / 'task_history'),
+        'LOG_DIR': str(root / 'logs'),
+        'STATE_DIR': str(root / 'state')
+    }
+
+def write_task(tasks_dir, job_id, name, script_path, schedule, status="PENDING"):
+    """
+    Write a task definition as the application stores it.
+
+    Args:
+        tasks_dir: The tasks directory
+        job_id: The job ID
+        name: The task name
+        script_path: Absolute path of the task's script
+        schedule: Trigger settings (one of SCHEDULES or similar)
+        status: The task status
+    """
+    task = {
+        "job_id": job_id,
+        "task_name": name,
+        "description": "Generated by the benchmark suite",
+        "script_path": str(script_path),
+        "script_type": "python",
+        "created_at": (datetime.now() - timedelta(days=30)).strftime("%Y-%m-%d %H:%M:%S"),
+        "status": status,
+        "enabled": True,
+        "email_notifications_enabled": False,
+        "max_runtime": 60,
+        "auto_retry_enabled": False,
+        "retry_attempts": 3,
+        "retry_interval": 5,
+        "labels": []
+    }
+    task.update(schedule)
+    with open(Path(tasks_dir) / f"{job_id}.json", 'w') as f:
+        json.dump(task, f, indent=2)
+
+def generate_workspace(root, task_count, history_per_task=0, seed=0):
+    """
+    Generate a workspace with synthetic tasks and history records.
+
+    Args:
+        root: The workspace root directory
+        task_count: Number of tasks
+        history_per_task: Number of history records per task
+        seed: Random seed, so the same workspace is generated every time
+
+    Returns:
+        dict: The number of 'tasks' and 'history_records' written
+    """
+    rng = random.Random(seed)
+    dirs = get_workspace_dirs(root)
+    for path in dirs.values():
+        os.makedirs(path, exist_ok=True)
+
+    script_path = Path(dirs['SCRIPTS_DIR']) / NOOP_SCRIPT
+    script_path.write_text("def main():\n    return 'ok'\n\nif __name__ == '__main__':\n    print(main())\n")
+
+    now = datetime.now()
+    history_records = 0
+    for i in range(task_count):
+        job_id = str(uuid.UUID(int=rng.getrandbits(128)))
+        write_task(dirs['TASKS_DIR'], job_id, f"Benchmark task {i}", script_path, rng.choice(SCHEDULES),
+                   status=rng.choice(["PENDING", "SUCCESS", "SUCCESS", "SUCCESS", "FAILED"]))
+
+        for n in range(history_per_task):
+            # One run per hour going back in time; the file name carries the run time
+            run_time = now - timedelta(hours=n + 1, seconds=rng.randint(0, 3599))
+            success = rng.random() > 0.1
+            execution_time = rng.uniform(0.05, 30)
+            record = {
+                "success": success,
+                "output": "ok\n" if success else "",
+                "error": "" if success else "Process exited with code 1",
+                "execution_time": execution_time,
+                "timestamp": run_time.isoformat(),
+                "process_id": rng.randint(1000, 60000),
+                "run_id": str(uuid.UUID(int=rng.getrandbits(128))),
+                "attempt": 1
+            }
+            history_file = Path(dirs['TASK_HISTORY_DIR']) / f"{job_id}_{run_time.strftime('%Y%m%d%H%M%S')}.json"
+            with open(history_file, 'w') as f:
+                json.dump(record, f, indent=2)
+            history_records += 1
+
+    return {"tasks": task_count, "history_records": history_records}
@@ -0,0 +1,55 @@
+#!/usr/bin/env python
+"""
+EzTaskRunner worker runner script.
+
+This script starts the eztaskrunner-worker daemon, which owns task scheduling
+and execution. Run the web UI with RUN_MODE=web so it forwards work here.
+"""
+import os
+import argparse
+import logging
+
+def parse_args():
+    """Parse command line arguments."""
+    parser = argparse.ArgumentParser(description='Run the EzTaskRunner worker daemon')
+    parser.add_argument('--host', default=None, help='Host to accept web process commands on (default: WORKER_HOST or 127.0.0.1)')
+    parser.add_argument('--port', type=int, default=None, help='Port to accept web process commands on (default: WORKER_PORT or 5055)')
+    parser.add_argument('--version', action='store_true', help='Show version information and exit')
+    return parser.parse_args()
+
+if __name__ == '__main__':
+    # Parse command line arguments
+    args = parse_args()
+    
+    # The worker must be configured before anything is imported from the app package
+    os.environ['RUN_MODE'] = 'worker'
+    if args.host:
+        os.environ['WORKER_HOST'] = args.host
+    if args.port:
+        os.environ['WORKER_PORT'] = str(args.port)
+    
+    from app.version import __version__
+    
+    # Show version information if requested
+    if args.version:
+        print(f"eztaskrunner-worker v{__version__}")
+        exit(0)
+    
+    # Importing the application starts the scheduler and loads tasks from disk
+    from app import app
+    from app.worker import serve_worker
+    
+    if app.config['RUN_MODE'] != 'worker':
+        raise SystemExit(f"eztaskrunner-worker: application was created with RUN_MODE={app.config['RUN_MODE']}, expected worker")
+    
+    logger = logging.getLogger("EzTaskRunner")
+    logger.info(f"Starting eztaskrunner-worker v{__version__}")
+    print(f"eztaskrunner-worker v{__version__} starting on {app.config['WORKER_HOST']}:{app.config['WORKER_PORT']}")
+    
+    try:
+        serve_worker(app)
+    except KeyboardInterrupt:
+        logger.info("Worker shutting down")
+        scheduler = app.config.get('SCHEDULER')
+        if scheduler:
+            scheduler.shutdown(wait=False)